@@ -1,10 +1,348 @@
-from .timecode_generator import TimecodeData
+import logging
+import re
+from typing import List, NamedTuple, Optional, Set, Tuple
 
-def process_audio_file(file_path: str) -> TimecodeData:
-    """Placeholder for audio processing using librosa.
-    Extracts tempo, beats, and approximate lyric timings.
+import numpy as np
+
+from .audio_input import decode_audio_blocks
+from .beat_detector import SpectralFlux, detrend_onsets, estimate_period, tempo_lags
+from .config import ALIGN_CHUNK_FRAMES
+from .lyrics_text_parser import generate_basic_timecodes_from_text
+from .timecode_generator import TimecodeData, TimecodeEntry
+
+logger = logging.getLogger(__name__)
+
+# Silence (lead-in, tail, gaps between songs): within this much of the noise floor, and well below the loud passages
+_NOISE_FLOOR_DB = 6.0
+_SILENCE_DB = 20.0
+# Beat tracking: windows for local tempo, and how strongly beat spacing is held to that tempo
+_TEMPO_WINDOW_SECONDS = 20.0
+_TIGHTNESS = 100.0
+_MIN_PULSE_CONFIDENCE = 0.1
+# Without a detectable pulse, lines are placed on a grid of this spacing instead of beats
+_FALLBACK_GRID_SECONDS = 0.5
+# Line placement costs (see align_lines)
+_PHRASE_WEIGHT = 1.0
+_SECTION_WEIGHT = 1.0
+_DURATION_WEIGHT = 2.0
+_BAR_BONUS = 0.3
+_INSTRUMENTAL_COST = 0.02  # Per beat of intro, outro or break between stanzas
+_SECTION_BEATS = 8
+_MAX_BREAK_BEATS = 64  # Longest instrumental break (or gap between songs) considered before a stanza
+_SILENT_BEAT_COST = 2.0  # A line never starts on a silent beat if a sounding one will do
+# Candidate paces, as a share of "every beat is sung"; the pace may change between stanzas at a cost
+_PACE_FACTORS = np.geomspace(0.2, 1.0, 7)
+_PACE_SWITCH_COST = 0.5
+
+
+class AudioFeatures(NamedTuple):
+    duration: float  # Seconds of decoded audio
+    frame_rate: float  # Feature frames per second
+    offset: float  # Time of frame 0
+    onsets: np.ndarray  # Spectral-flux onset strength per frame
+    energy: np.ndarray  # RMS level per frame, dB
+
+
+class AudioAlignment(NamedTuple):
+    timecodes: TimecodeData
+    duration: float
+    bpm: Optional[float]  # None if no steady pulse was found
+    beats: np.ndarray  # Beat times in seconds (grid times without a pulse)
+
+
+def extract_features(file_path: str, chunk_frames: int = ALIGN_CHUNK_FRAMES) -> AudioFeatures:
+    """Decodes `file_path` chunk by chunk into per-frame onset strength and level.
+
+    Only the current chunk of audio is held in memory; the features are about
+    100 values per second, so a long recording costs a few MB rather than the
+    size of its decoded audio.
+    """
+    sample_rate, blocks = decode_audio_blocks(file_path, chunk_frames)
+    flux = SpectralFlux(sample_rate)
+    hop = flux.hop
+    onset_parts, energy_parts = [], []
+    pending = np.zeros(0, dtype=np.float32)
+    total = 0
+    for block in blocks:
+        total += len(block)
+        onset_parts.append(flux.process(block)[1].astype(np.float32))
+        # Level per hop-sized frame, carrying the remainder into the next chunk like SpectralFlux does
+        buf = np.concatenate((pending, block))
+        count = len(buf) // hop
+        frames = buf[:count * hop].reshape(count, hop)
+        energy_parts.append(np.sqrt(np.mean(frames * frames, axis=1)))
+        pending = buf[count * hop:]
+    onsets = np.concatenate(onset_parts) if onset_parts else np.zeros(0, dtype=np.float32)
+    energy = np.concatenate(energy_parts) if energy_parts else np.zeros(0, dtype=np.float32)
+    n = min(len(onsets), len(energy))
+    return AudioFeatures(total / sample_rate, sample_rate / hop, flux.n_fft / 2 / sample_rate,
+                         onsets[:n], 20 * np.log10(energy[:n] + 1e-5))
+
+
+def _local_periods(onsets: np.ndarray, frame_rate: float, lags: np.ndarray, prior: np.ndarray) -> Optional[np.ndarray]:
+    """Beat period (frames) at every frame, from overlapping windows; None if no window has a steady pulse.
+
+    Windows without a clear pulse (silence, rubato) take the period of the
+    confident windows around them, so a recording of several songs at different
+    tempos gets each song's own tempo (within one octave of the median).
+    """
+    window = int(_TEMPO_WINDOW_SECONDS * frame_rate)
+    step = window // 2
+    n = len(onsets)
+    centres, periods = [], []
+    for start in range(0, max(1, n - window + 1), step):
+        estimate = estimate_period(onsets[start:start + window], lags, prior)
+        if estimate and estimate[1] >= _MIN_PULSE_CONFIDENCE:
+            centres.append(start + min(window, n) / 2)
+            periods.append(estimate[0])
+    if not periods:
+        return None
+    periods = np.array(periods)
+    # Fold every window into the octave around the median, so one song read at half tempo doesn't count
+    # twice as many beats per line as its neighbours
+    reference = np.median(periods)
+    periods = periods * 2.0 ** np.round(np.log2(reference / periods))
+    if len(periods) >= 3:
+        # Median of three neighbours: a fill or a break doesn't get its own tempo
+        padded = np.concatenate((periods[:1], periods, periods[-1:]))
+        periods = np.median(np.lib.stride_tricks.sliding_window_view(padded, 3), axis=1)
+    return np.interp(np.arange(n), centres, periods)
+
+
+def track_beats(onsets: np.ndarray, frame_rate: float, bpm: Optional[float] = None) -> Optional[Tuple[np.ndarray, float]]:
+    """Beat frames of a whole onset envelope by dynamic programming, and the overall BPM.
+
+    Each frame's score is its onset strength plus the best score of a previous
+    beat between half and twice the local period back, penalized by how far that
+    spacing is from the period (Ellis, "Beat Tracking by Dynamic Programming").
+    Frames whose earliest predecessor is at least a block back are independent, so
+    they are scored a block at a time. A given `bpm` narrows the tempo prior to it.
+    Returns None if the audio has no steady pulse.
+    """
+    onsets = detrend_onsets(onsets.astype(np.float64), frame_rate)
+    spread = onsets.std()
+    if len(onsets) < 4 * frame_rate or spread == 0:
+        return None
+    onsets /= spread
+    if bpm:
+        lags, prior = tempo_lags(frame_rate, max(20.0, bpm / 1.5), bpm * 1.5, prior_bpm=bpm, prior_octaves=0.1)
+    else:
+        lags, prior = tempo_lags(frame_rate)
+    period = _local_periods(onsets, frame_rate, lags, prior)
+    if period is None:
+        return None
+
+    n = len(onsets)
+    score = onsets.copy()
+    back = np.full(n, -1, dtype=np.int64)
+    block = max(1, int(period.min() / 2) - 1)
+    for start in range(0, n, block):
+        t = np.arange(start, min(n, start + block))
+        p = period[start]
+        taus = np.arange(max(1, int(round(p / 2))), int(round(2 * p)) + 1)
+        previous = t[:, None] - taus[None, :]
+        candidates = np.where(previous >= 0, score[np.maximum(previous, 0)], -np.inf) - _TIGHTNESS * np.log(taus / p) ** 2
+        best = np.argmax(candidates, axis=1)
+        rows = np.arange(len(t))
+        value = candidates[rows, best]
+        linked = value > 0
+        score[t[linked]] += value[linked]
+        back[t[linked]] = previous[rows, best][linked]
+
+    tail = int(period[-1])
+    beat = n - tail + int(np.argmax(score[-tail:]))
+    beats = [beat]
+    while back[beat] >= 0:
+        beat = back[beat]
+        beats.append(beat)
+    beats = np.array(beats[::-1])
+    return beats, 60.0 * frame_rate / float(np.median(np.diff(beats)) if len(beats) > 1 else period[-1])
+
+
+def lyric_lines(text: str) -> Tuple[List[str], Set[int]]:
+    """Lyric lines of a plain-text file and the indices of lines that start a stanza (after a blank line)."""
+    lines, stanza_starts = [], {0}
+    blank = False
+    for raw in text.split('\n'):
+        line = raw.strip()
+        if not line:
+            blank = True
+            continue
+        if blank and lines:
+            stanza_starts.add(len(lines))
+        lines.append(line)
+        blank = False
+    return lines, stanza_starts
+
+
+def _syllables(line: str) -> int:
+    """Rough sung length of a line: vowel groups per word (at least one per word)."""
+    words = line.split()
+    return max(1, sum(max(1, len(re.findall(r"[aeiouyàâäéèêëïîôöùûü]+", word.lower()))) for word in words))
+
+
+def silence_threshold(energy: np.ndarray) -> float:
+    """Level (dB) below which a frame counts as silence: near the recording's noise floor, well under its loud parts."""
+    if not len(energy):
+        return -np.inf
+    return float(min(np.percentile(energy, 95) - _SILENCE_DB, np.percentile(energy, 5) + _NOISE_FLOOR_DB))
+
+
+def _beat_means(values: np.ndarray, beat_frames: np.ndarray) -> np.ndarray:
+    """Mean of `values` over each beat interval [beat i, beat i+1), the last one running to the end."""
+    sums = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    ends = np.append(beat_frames[1:], len(values))
+    return (sums[ends] - sums[beat_frames]) / np.maximum(1, ends - beat_frames)
+
+
+def _normalized(values: np.ndarray) -> np.ndarray:
+    scale = np.percentile(values, 95) if len(values) else 0.0
+    return np.clip(values / scale, 0.0, 2.0) if scale > 0 else np.zeros_like(values)
+
+
+def boundary_strengths(features: AudioFeatures, beat_frames: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(phrase, section) strength at each beat.
+
+    A phrase boundary is where the level rises into the beat (a voice or
+    instrument entering after a breath) with an onset on it; a section boundary
+    is where the level over the next few bars differs from the few bars before.
+    """
+    level = _beat_means(features.energy, beat_frames)
+    silent = level < silence_threshold(features.energy)
+    # Silent beats take the level of the music that follows, so the count-in after a silence (say, between
+    # two songs) isn't mistaken for the biggest entrance of the song
+    following = np.minimum.accumulate(np.where(silent, len(level), np.arange(len(level)))[::-1])[::-1]
+    level = level[np.minimum(following, len(level) - 1)]
+    rise = np.maximum(0.0, np.diff(level, prepend=level[:1]))
+    onsets = detrend_onsets(features.onsets.astype(np.float64), features.frame_rate)
+    near = np.clip(beat_frames[:, None] + np.arange(-2, 3)[None, :], 0, len(onsets) - 1)
+    phrase = _normalized(rise) + 0.3 * _normalized(onsets[near].max(axis=1))
+
+    sums = np.concatenate(([0.0], np.cumsum(level)))
+    c = np.arange(len(level))
+    after_end, before_start = np.minimum(len(level), c + _SECTION_BEATS), np.maximum(0, c - _SECTION_BEATS)
+    after = (sums[after_end] - sums[c]) / np.maximum(1, after_end - c)
+    before = (sums[c] - sums[before_start]) / np.maximum(1, c - before_start)
+    section = _normalized(np.where(c > 0, np.abs(after - before), 0.0))
+    # Beats in silence (e.g. between songs of a long recording) aren't phrase starts
+    return np.where(silent, -_SILENT_BEAT_COST, phrase), section
+
+
+def align_lines(weights: np.ndarray, stanza_starts: Set[int], phrase: np.ndarray, section: np.ndarray,
+                paces: np.ndarray) -> Tuple[float, np.ndarray]:
+    """Places lines on beats by dynamic programming; returns (cost, beat index of each line).
+
+    At pace p, line j is expected to last `weights[j] * p` beats; the pace is
+    part of the DP state and may change at a stanza start (at a cost), so songs
+    and sections sung at different speeds each get their own. The cost of a
+    placement adds, per line: minus the phrase strength of its beat (plus the
+    section strength for a line that opens a stanza), the squared log ratio of
+    the gap to the next line over its expected length, a bonus for gaps of whole
+    bars, and a small cost per beat left unsung (intro, outro, and breaks, which
+    are only allowed before a stanza).
+    """
+    lines, beats = len(weights), len(phrase)
+    node = -_PHRASE_WEIGHT * phrase
+    cost = np.tile(node - _SECTION_WEIGHT * section + _INSTRUMENTAL_COST * np.arange(beats), (len(paces), 1))
+    # Per line: the gap back to the previous line, and at stanza starts the pace the previous line had
+    gaps = np.zeros((lines, len(paces), beats), dtype=np.int16)
+    switches = {}
+    for j in range(1, lines):
+        expected = np.maximum(1.0, weights[j - 1] * paces)
+        stanza = j in stanza_starts
+        if stanza:
+            cheapest = cost.argmin(axis=0)
+            switched = cost[cheapest, np.arange(beats)] + _PACE_SWITCH_COST
+            keep = cost <= switched
+            switches[j] = np.where(keep, np.arange(len(paces))[:, None], cheapest[None, :]).astype(np.int8)
+            cost = np.where(keep, cost, switched)
+        limit = np.ceil(2.5 * expected) + (_MAX_BREAK_BEATS if stanza else 0)
+        best = np.full(cost.shape, np.inf)
+        for gap in range(1, min(beats - 1, int(limit.max())) + 1):
+            d = np.log(gap / expected)
+            if stanza:
+                penalty = _DURATION_WEIGHT * np.minimum(d, 0.0) ** 2 + _INSTRUMENTAL_COST * np.maximum(0.0, gap - expected)
+            else:
+                penalty = _DURATION_WEIGHT * d * d
+            penalty = np.where(gap <= limit, penalty, np.inf)
+            penalty -= _BAR_BONUS if gap % 4 == 0 else (_BAR_BONUS / 2 if gap % 2 == 0 else 0.0)
+            candidate = cost[:, :-gap] + penalty[:, None]
+            better = candidate < best[:, gap:]
+            best[:, gap:][better] = candidate[better]
+            gaps[j, :, gap:][better] = gap
+        cost = best + node - (_SECTION_WEIGHT * section if stanza else 0.0)
+
+    # The last line needs room for its own length before the music ends
+    expected = np.maximum(1.0, weights[-1] * paces)[:, None]
+    remaining = (beats - np.arange(beats))[None, :]
+    d = np.log(remaining / expected)
+    total = cost + _DURATION_WEIGHT * np.minimum(d, 0.0) ** 2 + _INSTRUMENTAL_COST * np.maximum(0.0, remaining - expected)
+    f, c = np.unravel_index(int(np.argmin(total)), total.shape)
+    if not np.isfinite(total[f, c]):
+        return np.inf, np.zeros(0, dtype=np.int64)
+    result = float(total[f, c])
+    placement = [c]
+    for j in range(lines - 1, 0, -1):
+        c -= int(gaps[j, f, c])
+        if j in switches:
+            f = switches[j][f, c]
+        placement.append(c)
+    return result, np.array(placement[::-1])
+
+
+def align_audio(file_path: str, lyrics_text: str, bpm: Optional[float] = None) -> AudioAlignment:
+    """Aligns the lines of `lyrics_text` to the recording at `file_path`.
+
+    Beats are tracked over the whole recording, phrase and section boundaries
+    scored at each beat, and the lines placed on them (`align_lines`). Without a
+    steady pulse, lines are placed on a fixed grid the same way; with too few
+    grid points they're spread evenly over the audible part of the recording.
+    """
+    features = extract_features(file_path)
+    lines, stanza_starts = lyric_lines(lyrics_text)
+    frame_times = features.offset + np.arange(len(features.energy)) / features.frame_rate
+
+    # The audible part of the recording
+    loud = np.flatnonzero(features.energy > silence_threshold(features.energy))
+    first, last = (int(loud[0]), int(loud[-1]) + 1) if len(loud) else (0, len(features.energy))
+
+    tracked = track_beats(features.onsets, features.frame_rate, bpm)
+    if tracked is not None:
+        beat_frames, detected_bpm = tracked
+        beat_frames = beat_frames[(beat_frames >= first - features.frame_rate * 0.1) & (beat_frames < last)]
+    else:
+        detected_bpm = None
+        beat_frames = np.arange(first, last, int(_FALLBACK_GRID_SECONDS * features.frame_rate))
+    beat_frames = np.clip(beat_frames, 0, max(0, len(frame_times) - 1)).astype(np.int64)
+    beat_times = frame_times[beat_frames] if len(frame_times) else np.zeros(0)
+
+    if not lines:
+        return AudioAlignment(TimecodeData(timecodes=[]), features.duration, detected_bpm, beat_times)
+    if len(beat_frames) < 2 * len(lines):
+        start = frame_times[first] if len(frame_times) else 0.0
+        spread = generate_basic_timecodes_from_text(lines, total_duration=max(0.0, features.duration - start))
+        timecodes = [TimecodeEntry(time=entry.time + start, text=entry.text) for entry in spread.timecodes]
+        return AudioAlignment(TimecodeData(timecodes=timecodes), features.duration, detected_bpm, beat_times)
+
+    phrase, section = boundary_strengths(features, beat_frames)
+    weights = np.array([_syllables(line) for line in lines], dtype=np.float64)
+    full_pace = len(beat_frames) / weights.sum()
+    _, placement = align_lines(weights, stanza_starts, phrase, section, full_pace * _PACE_FACTORS)
+    timecodes = [TimecodeEntry(time=float(beat_times[c]), text=line) for c, line in zip(placement, lines)]
+    return AudioAlignment(TimecodeData(timecodes=timecodes), features.duration, detected_bpm, beat_times)
+
+
+def process_audio_file(file_path: str, lyrics_text: Optional[str] = None, bpm: Optional[float] = None) -> TimecodeData:
+    """Timecodes for an audio recording (WAV, or MP3 and other formats via ffmpeg).
+
+    Lyric lines from `lyrics_text` (a companion `.txt`) are placed on the
+    recording's phrase and section boundaries; see `align_audio`. Without
+    lyrics there is nothing to place and the result is empty.
     """
-    print(f"Processing audio file: {file_path} (Placeholder)")
-    # Implement librosa logic here
-    # For now, return dummy data
-    return TimecodeData(timecodes=[])
+    if not lyrics_text:
+        logger.info("Processing audio file: %s (no lyrics to align)", file_path)
+        return TimecodeData(timecodes=[])
+    alignment = align_audio(file_path, lyrics_text, bpm)
+    tempo = f"{alignment.bpm:.1f} BPM" if alignment.bpm else "no steady pulse"
+    logger.info("Aligned %d lines to %s (%.1fs, %s)", len(alignment.timecodes.timecodes), file_path, alignment.duration, tempo)
+    return alignment.timecodes
@@ -1,23 +1,220 @@
 import asyncio
+import logging
+import shutil
+import subprocess
+import threading
+import time
+import wave
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from .clock_sync import server_time
+from .config import AUDIO_SAMPLE_RATE, AUDIO_BLOCK_FRAMES, AUDIO_BUFFER_SECONDS, AUDIO_DECODE_SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+
+class PcmRingBuffer:
+    """Fixed-size ring of mono float32 PCM frames between a capture thread and a consumer.
+
+    The writer never blocks (it may be a sound card callback): if the reader falls
+    more than `capacity` frames behind, the oldest unread audio is overwritten and
+    counted in `dropped_frames`. `read` blocks until a full block is available or
+    the buffer is closed.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._cond = threading.Condition()
+        self.written = 0  # Total frames ever written (the stream's sample clock)
+        self.read_pos = 0  # Total frames consumed
+        self.dropped_frames = 0
+        self.closed = False
+
+    def write(self, frames: np.ndarray):
+        frames = np.asarray(frames, dtype=np.float32).ravel()
+        if len(frames) > self.capacity:
+            frames = frames[-self.capacity:]
+        with self._cond:
+            start = self.written % self.capacity
+            first = min(len(frames), self.capacity - start)
+            self._data[start:start + first] = frames[:first]
+            self._data[:len(frames) - first] = frames[first:]
+            self.written += len(frames)
+            if self.written - self.read_pos > self.capacity:
+                self.dropped_frames += self.written - self.capacity - self.read_pos
+                self.read_pos = self.written - self.capacity
+            self._cond.notify_all()
+
+    def read(self, count: int, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        """Returns the next `count` frames, fewer at the end of a closed stream, or None once drained (or on timeout)."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.written - self.read_pos >= count or self.closed, timeout):
+                return None
+            count = min(count, self.written - self.read_pos)
+            if count == 0:
+                return None
+            start = self.read_pos % self.capacity
+            first = min(count, self.capacity - start)
+            block = np.concatenate((self._data[start:start + first], self._data[:count - first]))
+            self.read_pos += count
+            return block
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+def read_wav_blocks(path: str, block_frames: int = AUDIO_BLOCK_FRAMES) -> Tuple[int, Iterator[np.ndarray]]:
+    """Opens a PCM WAV file and returns (sample rate, iterator of mono float32 blocks in [-1, 1])."""
+    try:
+        wav = wave.open(path, "rb")
+    except (wave.Error, EOFError) as e:
+        raise ValueError(f"Not a PCM WAV file: {str(e) or 'truncated header'}")
+    sample_rate, channels, width = wav.getframerate(), wav.getnchannels(), wav.getsampwidth()
+    if width not in (1, 2, 3, 4):
+        wav.close()
+        raise ValueError(f"Unsupported WAV sample width: {width * 8} bits")
+
+    def blocks():
+        try:
+            while True:
+                raw = wav.readframes(block_frames)
+                if not raw:
+                    return
+                if width == 1:
+                    samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+                elif width == 3:
+                    b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+                    ints = (b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)) << 8 >> 8  # Sign-extend 24-bit
+                    samples = ints.astype(np.float32) / 8388608.0
+                else:
+                    dtype = np.int16 if width == 2 else np.int32
+                    samples = np.frombuffer(raw, dtype="<" + np.dtype(dtype).str[1:]).astype(np.float32) / float(np.iinfo(dtype).max + 1)
+                yield samples.reshape(-1, channels).mean(axis=1) if channels > 1 else samples
+        finally:
+            wav.close()
+
+    return sample_rate, blocks()
+
+
+def decode_audio_blocks(path: str, block_frames: int = AUDIO_BLOCK_FRAMES,
+                        sample_rate: int = AUDIO_DECODE_SAMPLE_RATE) -> Tuple[int, Iterator[np.ndarray]]:
+    """Streams any audio file as (sample rate, iterator of mono float32 blocks), without loading it whole.
+
+    WAV files are read directly (`read_wav_blocks`, at their own rate); other
+    formats such as MP3 are decoded by an `ffmpeg` subprocess to `sample_rate`.
+    """
+    if Path(path).suffix.lower() == ".wav":
+        return read_wav_blocks(path, block_frames)
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise ValueError(f"Decoding {Path(path).suffix} files requires ffmpeg on the PATH")
+    process = subprocess.Popen([ffmpeg, "-v", "error", "-nostdin", "-i", path, "-f", "s16le", "-ac", "1",
+                                "-ar", str(sample_rate), "-"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def blocks():
+        try:
+            while True:
+                raw = process.stdout.read(block_frames * 2)
+                if not raw:
+                    break
+                yield np.frombuffer(raw[:len(raw) // 2 * 2], dtype="<i2").astype(np.float32) / 32768.0
+            if process.wait() != 0:
+                raise ValueError(f"ffmpeg could not decode {path}: {process.stderr.read().decode(errors='replace').strip()}")
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            process.stderr.close()
+
+    return sample_rate, blocks()
+
 
 class AudioInput:
-    def __init__(self):
+    """Captures mono PCM into a ring buffer, from the microphone or by streaming a WAV file.
+
+    Capture runs on its own thread (or the sound card's callback thread), never on
+    the event loop. A WAV file goes through exactly the same buffer as live input,
+    paced in real time by default, which is how the beat tracker is exercised
+    without a microphone. `started_at` is the server time of the first frame, so
+    stream time `t` corresponds to server time `started_at + t`.
+    """
+
+    def __init__(self, sample_rate: int = AUDIO_SAMPLE_RATE, block_frames: int = AUDIO_BLOCK_FRAMES,
+                 buffer_seconds: float = AUDIO_BUFFER_SECONDS):
+        self.sample_rate = sample_rate
+        self.block_frames = block_frames
+        self.buffer_seconds = buffer_seconds
+        self.buffer: Optional[PcmRingBuffer] = None
+        self.started_at: Optional[float] = None
         self.is_running = False
+        self._thread: Optional[threading.Thread] = None
+        self._stream = None
+
+    async def start_capture(self, wav_path: Optional[str] = None, realtime: bool = True):
+        """Starts capturing from the default input device, or streams `wav_path` through the buffer.
 
-    async def start_capture(self):
-        """Placeholder for starting live microphone audio capture."""
-        print("Starting live audio capture (Placeholder)")
+        Returns once capture is running. Live capture needs the optional
+        `sounddevice` package.
+        """
+        if self.is_running:
+            return
+        if wav_path is not None:
+            self.sample_rate, blocks = read_wav_blocks(wav_path, self.block_frames)
+        self.buffer = PcmRingBuffer(int(self.sample_rate * self.buffer_seconds))
         self.is_running = True
-        while self.is_running:
-            # Simulate audio input processing
-            await asyncio.sleep(1) # Simulate reading audio chunks
-            # Here you would integrate sounddevice/pyaudio to get real audio data
-            # Then pass it to beat_detector
-            # print("Capturing audio...")
+        self.started_at = server_time()
+        if wav_path is not None:
+            logger.info("Streaming %s as live audio input", wav_path)
+            self._thread = threading.Thread(target=self._stream_wav, args=(blocks, realtime), name="audio-input", daemon=True)
+            self._thread.start()
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, self._open_device)
+
+    def _open_device(self):
+        try:
+            import sounddevice
+        except ImportError:
+            self.is_running = False
+            raise RuntimeError("Live audio capture requires the sounddevice package (pip install sounddevice)")
+        logger.info("Starting live audio capture")
+
+        def callback(indata, frames, time_info, status):
+            self.buffer.write(indata[:, 0])
+
+        self._stream = sounddevice.InputStream(samplerate=self.sample_rate, channels=1, dtype="float32",
+                                               blocksize=self.block_frames, callback=callback)
+        self._stream.start()
+
+    def _stream_wav(self, blocks: Iterator[np.ndarray], realtime: bool):
+        start = time.perf_counter()
+        sent = 0
+        for block in blocks:
+            if not self.is_running:
+                break
+            self.buffer.write(block)
+            sent += len(block)
+            if realtime:
+                delay = start + sent / self.sample_rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        self.buffer.close()
 
     def stop_capture(self):
-        """Placeholder for stopping live microphone audio capture."""
-        print("Stopping live audio capture (Placeholder)")
+        """Stops capturing; readers get the remaining buffered audio, then end of stream."""
+        if not self.is_running:
+            return
+        logger.info("Stopping live audio capture")
         self.is_running = False
-
-# audio_input = AudioInput() # Instantiate if needed as a singleton
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+        if self.buffer is not None:
+            self.buffer.close()
@@ -0,0 +1,340 @@
+import asyncio
+import fcntl
+import itertools
+import json
+import logging
+import os
+import struct
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .clock_sync import server_time
+from .config import BACKPLANE, BACKPLANE_MAX_BUFFER_BYTES, BACKPLANE_REQUEST_TIMEOUT, BACKPLANE_SOCKET
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# (header, payloads): handles a frame another worker published. For a `request`, the
+# returned dict (None: "not mine") is sent back to the requesting worker.
+Handler = Callable[[dict, List[str]], Awaitable[Optional[dict]]]
+
+_LENGTH = struct.Struct(">I")
+
+
+def encode_frame(header: dict, payloads: Sequence[str] = ()) -> bytes:
+    """A length-prefixed frame: a one-line JSON header, then the payloads as raw UTF-8.
+
+    Payloads are typically already-serialized WebSocket messages; carrying them
+    outside the header means they are never escaped or parsed again on the way.
+    """
+    data = [payload.encode("utf-8") for payload in payloads]
+    head = json.dumps({**header, "sizes": [len(d) for d in data]}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    body = b"".join([head, b"\n", *data])
+    return _LENGTH.pack(len(body)) + body
+
+
+def decode_header(body: bytes) -> dict:
+    return json.loads(body[:body.index(b"\n")])
+
+
+def decode_frame(body: bytes) -> Tuple[dict, List[str]]:
+    end = body.index(b"\n")
+    header = json.loads(body[:end])
+    payloads, offset = [], end + 1
+    for size in header.get("sizes", ()):
+        payloads.append(body[offset:offset + size].decode("utf-8"))
+        offset += size
+    return header, payloads
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return await reader.readexactly(length)
+
+
+@asynccontextmanager
+async def interprocess_lock(path: str):
+    """Holds an exclusive lock on the file `path` (created if missing), shared by every process on the host."""
+    with open(path, "a") as lock_file:
+        await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class Backplane:
+    """Carries broadcasts and playback requests between the server's worker processes.
+
+    Each worker only holds its own WebSockets and playback sessions, so with
+    several workers (`uvicorn --workers N`) whatever one of them broadcasts must
+    also reach the others' displays. Callers deliver to their own process
+    directly and `publish` the same frame for the other workers, whose handler
+    registered with `on` for that kind of frame delivers it there. A `request`
+    is a publish that waits for the first peer to answer (e.g. the worker holding
+    a room's playback session).
+
+    This base class is the single-process backplane: there are no peers, so
+    publishing does nothing and requests go unanswered.
+    """
+
+    name = "local"
+    shared = False  # Whether other workers can be reached at all
+    peers = 0  # Other workers currently reachable
+
+    def __init__(self):
+        self._handlers: Dict[str, Handler] = {}
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+
+    def on(self, kind: str, handler: Handler):
+        """Registers the handler for frames of `kind` published by other workers."""
+        self._handlers[kind] = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def publish(self, kind: str, header: dict, payloads: Sequence[str] = ()):
+        pass
+
+    async def request(self, kind: str, header: dict) -> Optional[dict]:
+        return None
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "peers": self.peers, "published": self.published, "received": self.received, "dropped": self.dropped}
+
+
+class UnixBackplane(Backplane):
+    """Backplane through a hub on a local Unix socket, for workers on one host.
+
+    Every worker connects to the hub, which relays each frame to all other
+    connected workers (or, for a reply, to the worker that asked). No separate
+    process is needed: the hub runs inside whichever worker holds an exclusive
+    lock next to the socket. If that worker exits, the lock is released, the
+    others lose their connection, and the first to retake the lock hosts a new
+    hub while the rest reconnect. Frames published while a worker is between hub
+    connections are dropped (and counted); delivery is at most once.
+
+    Writes never wait: a peer whose socket has more than BACKPLANE_MAX_BUFFER_BYTES
+    unsent is skipped (dropped) until it catches up, like a lagging display.
+    """
+
+    name = "unix"
+    shared = True
+
+    def __init__(self, path: str = BACKPLANE_SOCKET):
+        super().__init__()
+        self.path = path
+        self.worker = str(os.getpid())
+        self.peers = 0  # Other workers connected to the hub, as the hub last announced
+        self.reconnects = 0
+        self.hub_relayed = 0
+        self.hub_dropped = 0
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connected = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._hub: Optional[asyncio.AbstractServer] = None
+        self._hub_peers: Dict[str, asyncio.StreamWriter] = {}
+        self._lock_file = None
+        self._request_ids = itertools.count(1)
+        self._requests: Dict[int, list] = {}  # id -> [future, answers still expected]
+
+    async def start(self, timeout: float = 2.0):
+        """Connects to the hub (hosting it if no worker does yet), waiting up to `timeout` for the
+        first connection; `peers` is up to date when it returns."""
+        if len(self.path.encode()) > 100:
+            raise ValueError(f"Backplane socket path is too long for a Unix socket: {self.path} (set LYRICPILOT_BACKPLANE_SOCKET)")
+        self._task = asyncio.ensure_future(self._run())
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("No hub at %s yet; still trying", self.path)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._hub is not None:
+            self._hub.close()
+            for writer in self._hub_peers.values():
+                writer.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self._hub = None
+        if self._lock_file is not None:
+            self._lock_file.close()  # Releases the lock, so another worker can host the hub
+            self._lock_file = None
+
+    # --- Worker side ---
+    async def _run(self):
+        delay = 0.05
+        while True:
+            await self._host_hub()
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                await asyncio.sleep(delay)
+                delay = min(1.0, delay * 2)
+                continue
+            delay = 0.05
+            writer.write(encode_frame({"kind": "hello", "from": self.worker}))
+            self._writer = writer
+            try:
+                while True:
+                    await self._dispatch(*decode_frame(await read_frame(reader)))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                self._writer = None
+                self._connected.clear()
+                self.peers = 0
+                writer.close()
+                for future, _ in self._requests.values():
+                    if not future.done():
+                        future.set_result(None)
+            self.reconnects += 1
+            logger.warning("Lost the hub; reconnecting")
+
+    async def _dispatch(self, header: dict, payloads: List[str]):
+        kind = header.get("kind")
+        if kind == "peers":
+            self.peers = header["count"]
+            self._connected.set()  # Connected, and the peer count is known
+            return
+        if kind == "reply":
+            pending = self._requests.get(header["request"])
+            if pending is not None and not pending[0].done():
+                pending[1] -= 1
+                if header.get("reply") is not None or pending[1] <= 0:
+                    pending[0].set_result(header.get("reply"))
+            return
+        self.received += 1
+        handler = self._handlers.get(kind)
+        if "request" in header:
+            # Answered in the background, so a slow handler doesn't hold up the frames behind it
+            asyncio.ensure_future(self._answer(handler, header, payloads))
+        elif handler is not None:
+            try:
+                await handler(header, payloads)
+            except Exception as e:
+                logger.error("Error handling '%s' from worker %s: %s", kind, header.get("from"), e)
+
+    async def _answer(self, handler: Optional[Handler], header: dict, payloads: List[str]):
+        reply = None
+        if handler is not None:
+            try:
+                reply = await handler(header, payloads)
+            except Exception as e:
+                logger.error("Error answering '%s' from worker %s: %s", header.get("kind"), header.get("from"), e)
+        self._write(encode_frame({"kind": "reply", "from": self.worker, "to": header["from"], "request": header["request"], "reply": reply}))
+
+    def _write(self, frame: bytes) -> bool:
+        writer = self._writer
+        if writer is None or writer.transport.get_write_buffer_size() > BACKPLANE_MAX_BUFFER_BYTES:
+            self.dropped += 1
+            return False
+        writer.write(frame)
+        return True
+
+    def publish(self, kind: str, header: dict, payloads: Sequence[str] = ()):
+        """Sends a frame to every other worker; `sent` (server time) is added to its header."""
+        if not self.peers:
+            return
+        if self._write(encode_frame({**header, "kind": kind, "from": self.worker, "sent": server_time()}, payloads)):
+            self.published += 1
+
+    async def request(self, kind: str, header: dict) -> Optional[dict]:
+        """Publishes a request and returns the first non-None answer, or None once every
+        peer has declined (or after BACKPLANE_REQUEST_TIMEOUT)."""
+        if not self.peers or self._writer is None:
+            return None
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._requests[request_id] = [future, self.peers]
+        try:
+            self.publish(kind, {**header, "request": request_id})
+            return await asyncio.wait_for(future, BACKPLANE_REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            del self._requests[request_id]
+
+    # --- Hub ---
+    async def _host_hub(self):
+        """Starts the hub in this worker if no other worker holds the hub lock."""
+        if self._hub is not None:
+            return
+        lock_file = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return
+        try:
+            os.unlink(self.path)  # Left behind by a hub that exited without cleaning up
+        except FileNotFoundError:
+            pass
+        self._hub = await asyncio.start_unix_server(self._serve_peer, self.path)
+        self._lock_file = lock_file
+        logger.info("Worker %s is hosting the hub at %s", self.worker, self.path)
+
+    def _announce_peers(self):
+        frame = encode_frame({"kind": "peers", "count": max(0, len(self._hub_peers) - 1)})
+        for writer in self._hub_peers.values():
+            if not writer.is_closing():
+                writer.write(frame)
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = None
+        try:
+            hello = decode_header(await read_frame(reader))
+            peer = hello["from"]
+            self._hub_peers[peer] = writer
+            self._announce_peers()
+            while True:
+                body = await read_frame(reader)
+                to = decode_header(body).get("to")
+                frame = _LENGTH.pack(len(body)) + body
+                for target, target_writer in self._hub_peers.items():
+                    if target == peer or (to is not None and target != to):
+                        continue
+                    if target_writer.transport.get_write_buffer_size() > BACKPLANE_MAX_BUFFER_BYTES:
+                        self.hub_dropped += 1
+                        continue
+                    target_writer.write(frame)
+                    self.hub_relayed += 1
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, KeyError):
+            pass
+        finally:
+            if peer is not None and self._hub_peers.get(peer) is writer:
+                del self._hub_peers[peer]
+                self._announce_peers()
+            writer.close()
+
+    def stats(self) -> dict:
+        stats = {**super().stats(), "worker": self.worker, "connected": self._writer is not None,
+                 "reconnects": self.reconnects, "hub": self._hub is not None}
+        if self._hub is not None:
+            stats.update(hub_workers=len(self._hub_peers), hub_relayed=self.hub_relayed, hub_dropped=self.hub_dropped)
+        return stats
+
+
+def create_backplane(kind: str = BACKPLANE) -> Backplane:
+    if kind == "local":
+        return Backplane()
+    if kind == "unix":
+        return UnixBackplane()
+    raise ValueError(f"Unknown backplane '{kind}' (expected 'local' or 'unix')")
+
+
+backplane = create_backplane()
+metrics.callback("lyricpilot_backplane_frames_total", "Backplane frames, by direction", "counter",
+                 lambda: {("published",): backplane.published, ("received",): backplane.received, ("dropped",): backplane.dropped},
+                 ("direction",))
+metrics.callback("lyricpilot_backplane_peers", "Other workers reachable over the backplane", "gauge", lambda: backplane.peers)
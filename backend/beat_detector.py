@@ -1,15 +1,433 @@
 import asyncio
+import threading
+import time
+from collections import deque
+from typing import Callable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .audio_input import AudioInput
+from .clock_sync import server_time
+from .config import BEAT_MIN_BPM, BEAT_MAX_BPM, BEAT_HISTORY_SECONDS
+from .trigger_interface import LatencyRecorder
+
+# Onset envelope frames per second (10 ms hop)
+FRAME_RATE = 100
+# Log compression applied to STFT magnitudes before taking the flux
+_LOG_GAMMA = 100.0
+# Tempo prior: log-normal around this tempo, one octave wide, to settle half/double-time ambiguity
+_PRIOR_BPM = 120.0
+_PRIOR_OCTAVES = 1.0
+# Beats combined when estimating phase, most recent first
+_PHASE_BEATS = 6
+# Phase continuity: candidate beats off the previous beat grid are down-weighted (width as a fraction of a beat)
+_PHASE_CONTINUITY = 0.1
+# A tempo estimate more than 10% off must persist this long before the tracker jumps to it
+_TEMPO_SWITCH_SECONDS = 2.0
+
+
+class BeatState(NamedTuple):
+    time: float  # Stream time (seconds) up to which audio has been analyzed
+    bpm: Optional[float]
+    last_beat: Optional[float]  # Stream time of the most recent beat
+    confidence: float  # 0..1; strength of the tempo's periodicity in the onset envelope
+    new_beat: bool  # True if `last_beat` wasn't reported by a previous state
+    onsets: Tuple[float, ...] = ()  # Stream times of note onsets picked since the previous state
+
+
+class SpectralFlux:
+    """Streaming onset-strength envelope: half-wave rectified spectral flux of log-magnitude STFT frames.
+
+    Audio is consumed in arbitrary block sizes; each call returns the envelope
+    values for every complete frame (one per `hop` samples) and keeps the rest.
+    """
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self.hop = max(1, sample_rate // FRAME_RATE)
+        self.n_fft = 1 << int(np.ceil(np.log2(self.hop * 2.3)))
+        self.window = np.hanning(self.n_fft).astype(np.float32)
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._previous: Optional[np.ndarray] = None
+        self.frames = 0
+
+    def process(self, samples: np.ndarray):
+        """Returns (frame times in stream seconds, onset strengths) for the frames completed by `samples`."""
+        buf = np.concatenate((self._pending, samples.astype(np.float32, copy=False)))
+        count = 0 if len(buf) < self.n_fft else 1 + (len(buf) - self.n_fft) // self.hop
+        if count == 0:
+            self._pending = buf
+            return np.zeros(0), np.zeros(0)
+        frames = np.lib.stride_tricks.sliding_window_view(buf, self.n_fft)[::self.hop][:count]
+        magnitude = np.log1p(_LOG_GAMMA * np.abs(np.fft.rfft(frames * self.window, axis=1)))
+        previous = magnitude[:1] if self._previous is None else self._previous
+        flux = np.maximum(np.diff(np.vstack((previous, magnitude)), axis=0), 0.0).sum(axis=1)
+        self._previous = magnitude[-1:]
+        self._pending = buf[count * self.hop:]
+        # Each value is stamped with the centre of its frame
+        times = ((self.frames + np.arange(count)) * self.hop + self.n_fft / 2) / self.sample_rate
+        self.frames += count
+        return times, flux
+
+
+class OnsetPicker:
+    """Streaming note-onset detection: peaks of the onset envelope above an adaptive threshold.
+
+    A frame is an onset if it is the maximum of the frames `post` either side of
+    it, exceeds the mean of the `pre` frames before it by `delta` times the
+    envelope's (slowly decaying) peak level, and comes at least `wait` seconds
+    after the previous onset. Decisions lag the audio by `post` frames.
+    """
+
+    def __init__(self, frame_rate: float = FRAME_RATE, delta: float = 0.15, wait: float = 0.05):
+        self.pre = max(1, int(0.1 * frame_rate))
+        self.post = max(1, int(0.03 * frame_rate))
+        self.delta = delta
+        self.wait = wait
+        self._decay = 0.5 ** (1.0 / (10.0 * frame_rate))  # Peak level halves over 10 s without a louder frame
+        self._times = np.zeros(0)
+        self._values = np.zeros(0)
+        self._level = 0.0
+        self._next = self.post  # Buffer index of the first undecided frame
+        self.last_onset = -np.inf
+
+    def process(self, times: np.ndarray, strengths: np.ndarray) -> np.ndarray:
+        """Returns the stream times of onsets decided by these envelope frames."""
+        if len(strengths) == 0:
+            return np.zeros(0)
+        self._level = max(self._level * self._decay ** len(strengths), float(strengths.max()))
+        t = np.concatenate((self._times, times))
+        v = np.concatenate((self._values, strengths))
+        # Frames [first, last) weren't decided yet and have `post` frames after them
+        first = self._next
+        last = len(v) - self.post
+        onsets = np.zeros(0)
+        if last > first:
+            candidates = np.arange(first, last)
+            peaks = np.lib.stride_tricks.sliding_window_view(v, 2 * self.post + 1)[candidates - self.post].max(axis=1)
+            sums = np.concatenate(([0.0], np.cumsum(v)))
+            starts = np.maximum(candidates - self.pre, 0)
+            means = (sums[candidates] - sums[starts]) / np.maximum(candidates - starts, 1)
+            hits = candidates[(v[candidates] >= peaks) & (v[candidates] > means + self.delta * self._level)]
+            kept = []
+            for i in hits:
+                if t[i] - self.last_onset >= self.wait:
+                    kept.append(t[i])
+                    self.last_onset = t[i]
+            onsets = np.array(kept)
+        decided = max(last, first)
+        keep = max(0, decided - self.pre)
+        self._times, self._values = t[keep:], v[keep:]
+        self._next = decided - keep
+        return onsets
+
+
+def detrend_onsets(envelope: np.ndarray, frame_rate: float = FRAME_RATE) -> np.ndarray:
+    """Onset envelope minus its 100 ms moving average, so sustained loudness doesn't count as periodicity."""
+    width = max(1, int(frame_rate // 10))
+    return np.maximum(envelope - np.convolve(envelope, np.ones(width) / width, mode="same"), 0.0)
+
+
+def tempo_lags(frame_rate: float, min_bpm: float = BEAT_MIN_BPM, max_bpm: float = BEAT_MAX_BPM,
+               prior_bpm: float = _PRIOR_BPM, prior_octaves: float = _PRIOR_OCTAVES):
+    """Candidate beat periods (frames) for [min_bpm, max_bpm] and the log-normal tempo prior weight of each."""
+    lags = np.arange(int(np.floor(60.0 * frame_rate / max_bpm)), int(np.ceil(60.0 * frame_rate / min_bpm)) + 1)
+    return lags, np.exp(-0.5 * (np.log2(lags / (60.0 * frame_rate / prior_bpm)) / prior_octaves) ** 2)
+
+
+def estimate_period(onsets: np.ndarray, lags: np.ndarray, prior: np.ndarray) -> Optional[Tuple[float, float]]:
+    """Beat period (frames, sub-frame) and confidence of a detrended onset envelope, or None if it's flat.
+
+    The period is the autocorrelation peak among `lags`, weighted by `prior` and
+    reinforced by the peak at twice the lag; confidence is the normalized
+    autocorrelation at that lag.
+    """
+    centred = onsets - onsets.mean()
+    n = len(centred)
+    spectrum = np.fft.rfft(centred, 2 * n)
+    acf = np.fft.irfft(spectrum * np.conj(spectrum))[:n]
+    if acf[0] <= 0:
+        return None
+    acf /= acf[0]
+
+    keep = lags < n // 2
+    lags = lags[keep]
+    if len(lags) == 0:
+        return None
+    score = (acf[lags] + 0.5 * acf[np.minimum(2 * lags, n - 1)]) * prior[keep]
+    best = int(np.argmax(score))
+    period = float(lags[best])
+    if 0 < best < len(lags) - 1:
+        # Parabolic interpolation for a sub-frame period
+        a, b, c = score[best - 1], score[best], score[best + 1]
+        denominator = a - 2 * b + c
+        if denominator < 0:
+            period += 0.5 * (a - c) / denominator
+    return period, float(np.clip(acf[lags[best]], 0.0, 1.0))
+
+
+class TempoTracker:
+    """Online tempo and beat-phase estimate from a sliding window of the onset envelope.
+
+    Tempo is the autocorrelation peak within [min_bpm, max_bpm], weighted by a
+    tempo prior and reinforced by the peak at twice the lag. Phase comes from a
+    comb over the most recent beats: the offset whose beat grid collects the most
+    onset energy, favouring offsets that continue the previous beat grid so an
+    off-beat hi-hat doesn't flip the phase. Both are recomputed from the whole
+    window on every update, so a band drifting in tempo is followed continuously;
+    the tempo is smoothed, and only a change that persists for
+    _TEMPO_SWITCH_SECONDS (not a fill or a break) makes it jump.
+    """
+
+    def __init__(self, frame_rate: float = FRAME_RATE, min_bpm: float = BEAT_MIN_BPM, max_bpm: float = BEAT_MAX_BPM,
+                 history_seconds: float = BEAT_HISTORY_SECONDS):
+        self.frame_rate = frame_rate
+        self.min_lag = int(np.floor(60.0 * frame_rate / max_bpm))
+        self.max_lag = int(np.ceil(60.0 * frame_rate / min_bpm))
+        self.size = int(history_seconds * frame_rate)
+        self._envelope = np.zeros(self.size)
+        self._filled = 0
+        self.last_time = 0.0  # Stream time of the newest envelope frame
+        self._lags, self._prior = tempo_lags(frame_rate, min_bpm, max_bpm)
+        self.period: Optional[float] = None  # Frames per beat
+        self.last_beat: Optional[float] = None
+        self._outlier_since: Optional[float] = None
+
+    def add(self, times: np.ndarray, strengths: np.ndarray):
+        n = len(strengths)
+        if n == 0:
+            return
+        if n >= self.size:
+            self._envelope[:] = strengths[-self.size:]
+        else:
+            self._envelope[:-n] = self._envelope[n:]
+            self._envelope[-n:] = strengths
+        self._filled = min(self.size, self._filled + n)
+        self.last_time = float(times[-1])
+
+    def ready(self) -> bool:
+        return self._filled >= 2 * self.max_lag + self.min_lag
+
+    def estimate(self):
+        """Returns (bpm, stream time of the last beat, confidence), or None until enough audio was seen."""
+        if not self.ready():
+            return None
+        onsets = detrend_onsets(self._envelope[-self._filled:])
+        n = len(onsets)
+        estimate = estimate_period(onsets, self._lags, self._prior)
+        if estimate is None:
+            return None
+        period, confidence = estimate
+        self._smooth(period)
+
+        # Phase: for each candidate offset of the latest beat, sum the onsets on the beat grid behind it
+        offsets = np.arange(int(np.ceil(self.period)))
+        beats = np.round(np.arange(_PHASE_BEATS) * self.period).astype(int)
+        positions = n - 1 - offsets[:, None] - beats[None, :]
+        weights = 0.8 ** np.arange(_PHASE_BEATS)
+        comb = (onsets[np.clip(positions, 0, n - 1)] * (positions >= 0) * weights).sum(axis=1)
+        candidates = self.last_time - offsets / self.frame_rate
+        if self.last_beat is not None:
+            phase = ((candidates - self.last_beat) * self.frame_rate / self.period) % 1.0
+            distance = np.minimum(phase, 1.0 - phase)
+            comb *= 0.5 + 0.5 * np.exp(-0.5 * (distance / _PHASE_CONTINUITY) ** 2)
+        self.last_beat = float(candidates[int(np.argmax(comb))])
+        return 60.0 * self.frame_rate / self.period, self.last_beat, confidence
+
+    def _smooth(self, period: float):
+        if self.period is None:
+            self.period = period
+            return
+        if abs(period - self.period) / self.period > 0.1:
+            # Ignore short-lived jumps (fills, breaks); follow a change that persists
+            if self._outlier_since is None:
+                self._outlier_since = self.last_time
+            if self.last_time - self._outlier_since < _TEMPO_SWITCH_SECONDS:
+                return
+            self.period = period
+        else:
+            self.period += 0.25 * (period - self.period)
+        self._outlier_since = None
+
 
 class BeatDetector:
-    def __init__(self):
-        pass
-
-    async def detect_beats(self, audio_chunk):
-        """Placeholder for real-time beat detection."""
-        # Integrate librosa or other beat tracking algorithms here
-        # For now, just simulate some output
-        await asyncio.sleep(0.1) # Simulate processing time
-        # print("Detecting beats...")
-        return {"current_time": asyncio.get_event_loop().time(), "beat_detected": False}
-
-# beat_detector = BeatDetector() # Instantiate if needed as a singleton
+    """Turns blocks of mono PCM into BeatState updates (spectral flux + TempoTracker + OnsetPicker)."""
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self.onsets = SpectralFlux(sample_rate)
+        self.tracker = TempoTracker(self.onsets.sample_rate / self.onsets.hop)
+        self.picker = OnsetPicker(self.onsets.sample_rate / self.onsets.hop)
+        self._reported_beat: Optional[float] = None
+        self.time = 0.0
+
+    def process(self, samples: np.ndarray) -> BeatState:
+        """Analyzes the next block of audio. Pure NumPy; call it off the event loop."""
+        times, strengths = self.onsets.process(samples)
+        self.tracker.add(times, strengths)
+        onsets = tuple(self.picker.process(times, strengths).tolist())
+        self.time += len(samples) / self.sample_rate
+        estimate = self.tracker.estimate()
+        if estimate is None:
+            return BeatState(self.time, None, None, 0.0, False, onsets)
+        bpm, last_beat, confidence = estimate
+        beat_period = 60.0 / bpm
+        new_beat = self._reported_beat is None or last_beat > self._reported_beat + 0.7 * beat_period
+        if new_beat:
+            self._reported_beat = last_beat
+        return BeatState(self.time, bpm, last_beat, confidence, new_beat, onsets)
+
+    async def detect_beats(self, audio_chunk: np.ndarray) -> dict:
+        """Analyzes one block in the default executor, so the event loop is never blocked by DSP."""
+        state = await asyncio.get_running_loop().run_in_executor(None, self.process, audio_chunk)
+        return {"current_time": state.time, "beat_detected": state.new_beat, "bpm": state.bpm,
+                "last_beat": state.last_beat, "confidence": state.confidence}
+
+
+class PlayheadTracker:
+    """Maps the stream clock to a song position that follows the band's tempo and beat.
+
+    The song position advances at `rate` song seconds per audio second, where
+    rate = detected BPM / song BPM. On each confident beat the position at that
+    beat is pulled towards the nearest beat of the song's own grid (a
+    phase-locked loop with gains `rate_gain` / `phase_gain`), so tempo drift and
+    phase errors are corrected continuously instead of by seeking. Without a song
+    BPM the first confident tempo is taken as the song's.
+
+    With a `scheduler`, every update also feeds the corrected position to
+    `LyricScheduler.get_next_lyric`.
+    """
+
+    def __init__(self, song_bpm: Optional[float] = None, position: float = 0.0, stream_time: float = 0.0,
+                 scheduler=None, rate_gain: float = 0.5, phase_gain: float = 0.5, min_confidence: float = 0.1):
+        self.song_bpm = song_bpm
+        self.rate = 1.0
+        self._anchor_time = stream_time
+        self._anchor_position = position
+        self.scheduler = scheduler
+        self.rate_gain = rate_gain
+        self.phase_gain = phase_gain
+        self.min_confidence = min_confidence
+        self.corrections = 0
+
+    def position_at(self, stream_time: float) -> float:
+        return max(0.0, self._anchor_position + (stream_time - self._anchor_time) * self.rate)
+
+    def update(self, state: BeatState, now: Optional[float] = None) -> float:
+        """Applies a BeatState and returns the corrected song position at stream time `now` (default: `state.time`)."""
+        now = state.time if now is None else now
+        if state.bpm is not None and state.confidence >= self.min_confidence and state.new_beat:
+            if self.song_bpm is None:
+                self.song_bpm = state.bpm
+            self.rate += self.rate_gain * (state.bpm / self.song_bpm - self.rate)
+            beat_length = 60.0 / self.song_bpm
+            at_beat = self.position_at(state.last_beat)
+            error = round(at_beat / beat_length) * beat_length - at_beat
+            self._anchor_position = self.position_at(now) + self.phase_gain * error
+            self._anchor_time = now
+            self.corrections += 1
+        position = self.position_at(now)
+        if self.scheduler is not None:
+            self.scheduler.get_next_lyric(position)
+        return position
+
+
+class BeatTrackingPipeline:
+    """Runs a BeatDetector over an AudioInput's ring buffer on a worker thread.
+
+    Each block's BeatState is handed to `on_state`, on the event loop (via
+    `call_soon_threadsafe`) when a loop is given, so DSP never runs between
+    WebSocket sends. Per-block analysis latency is recorded for `stats()`.
+    """
+
+    def __init__(self, audio_input: AudioInput, on_state: Callable[[BeatState], None],
+                 loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.audio_input = audio_input
+        self.detector = BeatDetector(audio_input.sample_rate)
+        self.on_state = on_state
+        self.loop = loop
+        self.latency = LatencyRecorder()
+        self.blocks = 0
+        self.processing_seconds = 0.0
+        self.beats = deque(maxlen=4096)  # Stream times of recent beats
+        self._thread = threading.Thread(target=self._run, name="beat-tracker", daemon=True)
+        self.finished = threading.Event()
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        buffer = self.audio_input.buffer
+        try:
+            while True:
+                block = buffer.read(self.audio_input.block_frames, timeout=1.0)
+                if block is None:
+                    if buffer.closed:
+                        return
+                    continue
+                start = time.perf_counter()
+                state = self.detector.process(block)
+                elapsed = time.perf_counter() - start
+                self.latency.record(elapsed)
+                self.processing_seconds += elapsed
+                self.blocks += 1
+                if state.new_beat:
+                    self.beats.append(state.last_beat)
+                if self.loop is not None:
+                    self.loop.call_soon_threadsafe(self.on_state, state)
+                else:
+                    self.on_state(state)
+        finally:
+            self.finished.set()
+
+    def stop(self):
+        self.audio_input.stop_capture()
+
+    def stats(self) -> dict:
+        audio_seconds = self.detector.time
+        return {
+            "blocks": self.blocks,
+            "audio_seconds": audio_seconds,
+            "block_ms": self.audio_input.block_frames / self.audio_input.sample_rate * 1000,
+            "block_latency": self.latency.summary(),
+            "realtime_factor": audio_seconds / self.processing_seconds if self.processing_seconds else 0.0,
+            "dropped_frames": self.audio_input.buffer.dropped_frames if self.audio_input.buffer else 0,
+            "bpm": self.detector.tracker.period and 60.0 * self.detector.tracker.frame_rate / self.detector.tracker.period,
+            "beats": len(self.beats),
+        }
+
+
+class BeatFollower:
+    """Keeps a PlaybackSession's playhead locked to live (or WAV-streamed) audio."""
+
+    def __init__(self, session, song_bpm: Optional[float] = None):
+        self.session = session
+        self.song_bpm = song_bpm
+        self.audio_input = AudioInput()
+        self.pipeline: Optional[BeatTrackingPipeline] = None
+        self.tracker: Optional[PlayheadTracker] = None
+
+    async def start(self, wav_path: Optional[str] = None, realtime: bool = True):
+        await self.audio_input.start_capture(wav_path, realtime)
+        self.tracker = PlayheadTracker(self.song_bpm, self.session.position())
+        self.pipeline = BeatTrackingPipeline(self.audio_input, self._on_state, asyncio.get_running_loop())
+        self.pipeline.start()
+
+    def _on_state(self, state: BeatState):
+        if not state.new_beat or not self.session.playing:
+            return
+        now = server_time()
+        position = self.tracker.update(state, now - self.audio_input.started_at)
+        self.session.follow(position, self.tracker.rate, now)
+
+    def stop(self):
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        else:
+            self.audio_input.stop_capture()
+
+    def stats(self) -> dict:
+        stats = self.pipeline.stats() if self.pipeline else {}
+        if self.tracker:
+            stats.update(rate=self.tracker.rate, corrections=self.tracker.corrections)
+        return stats
@@ -0,0 +1,60 @@
+import time
+from collections import deque
+from typing import Optional, Tuple
+
+from .config import CLOCK_SYNC_WINDOW
+
+def server_time() -> float:
+    """The shared timeline all displays render against: this process's monotonic clock, in seconds."""
+    return time.monotonic()
+
+def compute_sample(client_send: float, server_receive: float, server_send: float, client_receive: float) -> Tuple[float, float]:
+    """Returns (offset, rtt) for one NTP-style ping/pong exchange.
+
+    `offset` is server clock minus client clock, so a server timestamp maps to the
+    client's clock as `server_ts - offset`. `rtt` excludes time spent in the server.
+    """
+    offset = ((server_receive - client_send) + (server_send - client_receive)) / 2.0
+    rtt = (client_receive - client_send) - (server_send - server_receive)
+    return offset, rtt
+
+class ClockEstimate:
+    """Filters ping/pong samples for one client.
+
+    Keeps the last `window` samples and trusts the one with the lowest RTT: its
+    offset error is bounded by rtt/2, while queueing delay on slower exchanges only
+    adds error. The frontend runs the same filter on its side.
+    """
+
+    def __init__(self, window: int = CLOCK_SYNC_WINDOW):
+        self.samples = deque(maxlen=window)  # (offset, rtt)
+        self.sample_count = 0
+
+    def add_sample(self, offset: float, rtt: float):
+        if rtt < 0:
+            return
+        self.samples.append((offset, rtt))
+        self.sample_count += 1
+
+    def best(self) -> Optional[Tuple[float, float]]:
+        return min(self.samples, key=lambda s: s[1]) if self.samples else None
+
+    @property
+    def offset(self) -> Optional[float]:
+        best = self.best()
+        return best[0] if best else None
+
+    @property
+    def rtt(self) -> Optional[float]:
+        best = self.best()
+        return best[1] if best else None
+
+    def stats(self) -> dict:
+        best = self.best()
+        offsets = [s[0] for s in self.samples]
+        return {
+            "samples": self.sample_count,
+            "offset_ms": best[0] * 1000 if best else None,
+            "rtt_ms": best[1] * 1000 if best else None,
+            "offset_spread_ms": (max(offsets) - min(offsets)) * 1000 if offsets else None,
+        }
@@ -1,10 +1,105 @@
 import os
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATABASE_URL = f"sqlite:///{os.path.join(BASE_DIR, '../data/lyrics.db')}"
-SONGS_DIR = os.path.join(BASE_DIR, '../data/songs')
-UPLOAD_DIR = os.path.join(BASE_DIR, '../data/uploads') # Temporary upload directory
+DATA_DIR = os.environ.get("LYRICPILOT_DATA_DIR", os.path.join(BASE_DIR, '../data'))
+DATABASE_URL = f"sqlite:///{os.path.join(DATA_DIR, 'lyrics.db')}"  # Synchronous engine, for command-line tools
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{os.path.join(DATA_DIR, 'lyrics.db')}"  # The server's engine
+SONGS_DIR = os.path.join(DATA_DIR, 'songs')
+UPLOAD_DIR = os.path.join(DATA_DIR, 'uploads') # Temporary upload directory
+PARSE_CACHE_DIR = os.path.join(DATA_DIR, 'parse_cache') # Content-addressed parse results and raw uploads
 
 # Ensure directories exist
 os.makedirs(SONGS_DIR, exist_ok=True)
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# SQLite connections kept open by the server (readers run in parallel under WAL; writes are serialized)
+DATABASE_POOL_SIZE = int(os.environ.get("LYRICPILOT_DB_POOL_SIZE", "5"))
+# Milliseconds a connection waits for another process's write lock before failing with "database is locked"
+DATABASE_BUSY_TIMEOUT_MS = int(os.environ.get("LYRICPILOT_DB_BUSY_TIMEOUT_MS", "5000"))
+
+# Disk budget for parse cache files no song uses any more; least recently used are evicted beyond it
+PARSE_CACHE_MAX_BYTES = int(os.environ.get("LYRICPILOT_PARSE_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+# Maximum number of songs whose parsed timecodes are kept in memory
+TIMECODE_CACHE_MAX_ENTRIES = int(os.environ.get("LYRICPILOT_TIMECODE_CACHE_SIZE", "64"))
+
+# Seconds ahead of its timecode that the server-side playback clock switches to a line
+PLAYBACK_LEAD_OFFSET = float(os.environ.get("LYRICPILOT_PLAYBACK_LEAD_OFFSET", "0.0"))
+# Seconds ahead of a line boundary that lyric_update is dispatched; displays apply it at the carried server timestamp
+PLAYBACK_DISPATCH_AHEAD = float(os.environ.get("LYRICPILOT_PLAYBACK_DISPATCH_AHEAD", "0.25"))
+
+# Per-client WebSocket send timeout (seconds); clients slower than this are dropped
+BROADCAST_SEND_TIMEOUT = float(os.environ.get("LYRICPILOT_BROADCAST_SEND_TIMEOUT", "1.0"))
+# Number of recent send latencies kept per client for p50/p99 reporting
+BROADCAST_LATENCY_SAMPLES = 1024
+# Maximum unsent messages queued per WebSocket client before it is disconnected
+CLIENT_QUEUE_MAX_MESSAGES = int(os.environ.get("LYRICPILOT_CLIENT_QUEUE_MAX", "64"))
+
+# Room (named playback session) of displays and playback requests that don't name one
+DEFAULT_ROOM = os.environ.get("LYRICPILOT_DEFAULT_ROOM", "main")
+
+# How worker processes (uvicorn --workers) share broadcasts: "local" (a single process) or "unix"
+# (a hub on a Unix socket, hosted by one of the workers); uvicorn's WEB_CONCURRENCY > 1 implies "unix"
+BACKPLANE = os.environ.get("LYRICPILOT_BACKPLANE", "unix" if int(os.environ.get("WEB_CONCURRENCY", "1")) > 1 else "local")
+BACKPLANE_SOCKET = os.environ.get("LYRICPILOT_BACKPLANE_SOCKET", os.path.join(DATA_DIR, "backplane.sock"))
+# Unsent bytes allowed per backplane connection before frames to it are dropped
+BACKPLANE_MAX_BUFFER_BYTES = 8 * 1024 * 1024
+# Seconds a worker waits for the worker holding a room's playback session to answer a forwarded command
+BACKPLANE_REQUEST_TIMEOUT = 1.0
+
+# External outputs (OSC / MIDI sinks): a JSON file listing them, loaded at startup
+OUTPUTS_CONFIG = os.environ.get("LYRICPILOT_OUTPUTS")
+# Bytes an output's UDP socket may have queued before its packets are dropped
+OUTPUT_MAX_BUFFER_BYTES = 64 * 1024
+# Directories MIDI device outputs may write into (os.pathsep-separated); only character devices and FIFOs are opened
+OUTPUT_DEVICE_DIRS = [os.path.realpath(d) for d in os.environ.get("LYRICPILOT_OUTPUT_DEVICE_DIRS", "/dev").split(os.pathsep) if d]
+
+# Level of the server's log (DEBUG adds per-message and per-upload detail, off the hot path by default)
+LOG_LEVEL = os.environ.get("LYRICPILOT_LOG_LEVEL", "INFO").upper()
+# Sampling profiler (POST /profiler/start): seconds between stack samples, and the longest a run may last
+PROFILER_INTERVAL = 0.005
+PROFILER_MAX_SECONDS = 300.0
+
+# Timeline lines carried by song_start; the rest streams as timeline_chunk messages ahead of the playhead
+TIMELINE_WINDOW_LINES = int(os.environ.get("LYRICPILOT_TIMELINE_WINDOW", "32"))
+# Lines per pushed timeline_chunk, sent once the playhead is within TIMELINE_LOOKAHEAD_LINES of the streamed end
+TIMELINE_CHUNK_LINES = int(os.environ.get("LYRICPILOT_TIMELINE_CHUNK", "64"))
+TIMELINE_LOOKAHEAD_LINES = 16
+# Most lines a client can fetch with one timeline_request
+TIMELINE_MAX_REQUEST_LINES = 4096
+
+# Number of recent ping/pong samples kept per client for clock offset estimation
+CLOCK_SYNC_WINDOW = 16
+
+# Worker processes used for parsing uploads in the background
+PROCESSING_WORKERS = int(os.environ.get("LYRICPILOT_PROCESSING_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+
+# PDF charts: a PDF's text is extracted in one chunk of pages per job queue worker, in parallel,
+# but no chunk smaller than this (each task reopens the document)
+PDF_MIN_PAGES_PER_TASK = int(os.environ.get("LYRICPILOT_PDF_MIN_PAGES_PER_TASK", "16"))
+# Scanned (image-only) pages are OCRed by their own, smaller pool at a lower CPU priority
+OCR_WORKERS = int(os.environ.get("LYRICPILOT_OCR_WORKERS", "1"))
+OCR_NICE = 10  # Added to the OCR workers' niceness (Unix)
+OCR_DPI = 300
+OCR_LANGUAGE = os.environ.get("LYRICPILOT_OCR_LANGUAGE", "eng")  # Tesseract language(s), e.g. "eng+deu"
+# Chart timing when the upload gives no measures per section: measures per lyric line,
+# and the length of a section without lyrics (intro, interlude)
+PDF_MEASURES_PER_LINE = 2
+PDF_INSTRUMENTAL_MEASURES = 4
+
+# Live audio capture and beat tracking
+AUDIO_SAMPLE_RATE = int(os.environ.get("LYRICPILOT_AUDIO_SAMPLE_RATE", "44100"))
+AUDIO_BLOCK_FRAMES = 1024  # Frames per block handed from capture to the beat tracker
+AUDIO_BUFFER_SECONDS = 10.0  # Capture ring buffer; older audio is overwritten if the tracker falls behind
+BEAT_MIN_BPM = 60.0
+BEAT_MAX_BPM = 180.0
+BEAT_HISTORY_SECONDS = 8.0  # Onset-strength history the tempo/phase tracker looks at
+
+# Offline audio alignment (uploads with companion lyrics)
+AUDIO_DECODE_SAMPLE_RATE = 22050  # Rate compressed formats are decoded to by ffmpeg
+ALIGN_CHUNK_FRAMES = 1 << 20  # Samples decoded and analyzed per chunk, so memory doesn't grow with recording length
+
+# Live score following (played onsets aligned online to a MIDI reference)
+SCORE_FOLLOW_WINDOW = 64  # Reference onsets considered per live onset, around the current position
+SCORE_FOLLOW_MAX_SKIP = 4  # Reference onsets one live onset may advance by (notes the band left out)
+SCORE_FOLLOW_RELOCATE_EVENTS = 8  # Recent live onsets matched against the whole reference when the follower is lost
@@ -1,9 +1,28 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean
+import asyncio
+import json
+import re
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional, Tuple
+
+from sqlalchemy import create_engine, event, inspect, literal_column, or_, select, text, update, Column, Index, Integer, String, Boolean
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from .config import DATABASE_URL
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from .backplane import backplane
+from .config import DATABASE_URL, ASYNC_DATABASE_URL, DATABASE_POOL_SIZE, DATABASE_BUSY_TIMEOUT_MS
+from .song_cache import SongInfo, song_cache
+from .timecode_store import timecode_text
 
 Base = declarative_base()
 
+# Upload extension -> `Song.source`, the kind of file a song was made from
+SOURCE_TYPES = {".mp3": "audio", ".wav": "audio", ".mid": "midi", ".midi": "midi", ".xml": "musicxml",
+                ".musicxml": "musicxml", ".mxl": "musicxml", ".txt": "text", ".pdf": "pdf", ".json": "json"}
+
+def source_type(file_path: Optional[str]) -> Optional[str]:
+    return SOURCE_TYPES.get(Path(file_path or "").suffix.lower())
+
 class Song(Base):
     __tablename__ = "songs"
 
@@ -13,50 +32,267 @@ class Song(Base):
     file_path = Column(String)
     processed = Column(Boolean, default=False)
     timecode_path = Column(String, nullable=True)
+    # Processing job state: queued -> running -> done / failed
+    status = Column(String, default="done")
+    job_error = Column(String, nullable=True)
+    source = Column(String, nullable=True, index=True)  # See SOURCE_TYPES
 
     def __repr__(self):
         return f"<Song(id='{self.id}', title='{self.title}', bpm={self.bpm})>"
 
+# The library's sort order, and the key its pages are cut on
+Index("ix_songs_title_nocase_id", Song.title.collate("NOCASE"), Song.id)
+
+# Full-text index over titles and lyric lines (FTS5). Each song's search row has the
+# same rowid as its `songs` row, so matches join back without reading song_id.
+SEARCH_TABLE = "song_search"
+
+def _configure_connection(dbapi_connection, connection_record):
+    """WAL lets readers carry on while a write commits; with WAL, synchronous=NORMAL only
+    syncs at checkpoints (a power cut can lose the last commits, never corrupt the file).
+    busy_timeout makes a writer wait for another process's lock instead of failing."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={DATABASE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+# The server uses the async engine: queries run on aiosqlite's connection threads, never on the event loop.
+# aiosqlite defaults to NullPool (a new connection, thread and PRAGMA round per session); keep them open instead.
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=AsyncAdaptedQueuePool,
+                                   pool_size=DATABASE_POOL_SIZE, max_overflow=DATABASE_POOL_SIZE)
+event.listen(async_engine.sync_engine, "connect", _configure_connection)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+# Synchronous engine for command-line tools (migrate_timecodes) that run outside the server.
 engine = create_engine(DATABASE_URL)
+event.listen(engine, "connect", _configure_connection)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+_write_lock: Optional[asyncio.Lock] = None
+
+@asynccontextmanager
+async def _writing():
+    """Serializes the server's write transactions.
+
+    SQLite has a single writer. Two pooled connections that both read a row and
+    then write would have the second fail with "database is locked" at once (its
+    snapshot is stale, so busy_timeout doesn't help); queueing writers here also
+    keeps them from spinning in SQLite's busy handler.
+    """
+    global _write_lock
+    if _write_lock is None:
+        _write_lock = asyncio.Lock()
+    async with _write_lock:
+        yield
+
+def _create_schema(conn):
+    Base.metadata.create_all(bind=conn)
+    _add_missing_columns(conn)
+    for index in Song.__table__.indexes:
+        index.create(conn, checkfirst=True)  # create_all skips the indexes of tables that already exist
+    conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+                      "song_id UNINDEXED, title, lyrics, tokenize='unicode61 remove_diacritics 2')"))
+
+def _add_missing_columns(conn):
+    """create_all doesn't alter existing tables, so add columns introduced after a database was created."""
+    existing = {column["name"] for column in inspect(conn).get_columns(Song.__tablename__)}
+    for column in Song.__table__.columns:
+        if column.name not in existing:
+            default = f" DEFAULT '{column.default.arg}'" if column.default is not None else ""
+            conn.execute(text(f"ALTER TABLE {Song.__tablename__} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}{default}"))
+
 def create_tables():
-    Base.metadata.create_all(bind=engine)
+    """Creates or updates the schema through the synchronous engine (command-line tools)."""
+    with engine.begin() as conn:
+        _create_schema(conn)
+
+async def create_tables_async():
+    """Creates or updates the schema through the server's async engine."""
+    async with async_engine.begin() as conn:
+        await conn.run_sync(_create_schema)
+
+async def index_songs() -> int:
+    """Brings the search index in line with the songs table at startup.
+
+    Indexes songs that have no search row (databases from before the search) or
+    whose row no longer shares their rowid (a VACUUM may renumber `songs`), drops
+    search rows left without a song, and fills in `source` where it is missing.
+    Returns the number of songs indexed.
+    """
+    async with AsyncSessionLocal() as db:
+        indexed = select(literal_column("1")).select_from(text(SEARCH_TABLE)).where(
+            text(f"{SEARCH_TABLE}.rowid = songs.rowid AND {SEARCH_TABLE}.song_id = songs.id"))
+        songs = (await db.execute(select(Song).where(Song.source.is_(None) | ~indexed.exists()))).scalars().all()
+        entries = await asyncio.to_thread(_search_entries, [(song.id, song.title, song.timecode_path) for song in songs])
+        async with _writing():
+            await db.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid NOT IN (SELECT rowid FROM songs)"))
+            for song in songs:
+                song.source = song.source or source_type(song.file_path)
+            await _index(db, [song.id for song in songs], entries, replace=True)
+            await db.commit()
+    return len(songs)
+
+def _search_entries(songs) -> list:
+    """Search rows for `(song_id, title, timecode_path)` tuples: the title plus the text of the timecodes."""
+    entries = []
+    for song_id, title, timecode_path in songs:
+        lyrics = ""
+        if timecode_path:
+            try:
+                lyrics = timecode_text(timecode_path)
+            except (OSError, ValueError):
+                pass  # Missing or unreadable; the title is still searchable
+        entries.append({"song_id": song_id, "title": title or "", "lyrics": lyrics})
+    return entries
+
+async def _index(db, song_ids: list, entries: list, replace: bool):
+    """Writes search rows in the caller's transaction; the songs' own rows must already be flushed.
+    With `replace`, first drops whatever search rows sit at the songs' rowids."""
+    if replace and song_ids:
+        await db.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN "
+                              "(SELECT rowid FROM songs WHERE id IN (SELECT value FROM json_each(:ids)))"), {"ids": json.dumps(song_ids)})
+    if entries:
+        await db.execute(text(f"INSERT INTO {SEARCH_TABLE} (rowid, song_id, title, lyrics) "
+                              "SELECT rowid, :song_id, :title, :lyrics FROM songs WHERE id = :song_id"), entries)
+
+def _match_expression(query: str) -> Optional[str]:
+    """Turns free text into an FTS5 query: every word must appear, as a word or the start of one."""
+    words = re.findall(r"\w+", query)
+    return " ".join(f'"{word}"*' for word in words) if words else None
+
+async def warm_song_cache() -> int:
+    """Loads every song's metadata into `song_cache`; returns the number of songs."""
+    async with AsyncSessionLocal() as db:
+        return song_cache.warm((await db.execute(select(Song))).scalars().all())
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
-
-# CRUD operations
-def add_song(db, song_id: str, title: str, file_path: str, bpm: int = None, processed: bool = False, timecode_path: str = None):
-    db_song = Song(id=song_id, title=title, file_path=file_path, bpm=bpm, processed=processed, timecode_path=timecode_path)
-    db.add(db_song)
-    db.commit()
-    db.refresh(db_song)
+
+def _cache_songs(songs=(), removed=()):
+    """Applies committed changes to `song_cache`, and to the other workers' caches through the backplane."""
+    infos = [song_cache.put(song) for song in songs]
+    for song_id in removed:
+        song_cache.remove(song_id)
+    if backplane.peers:
+        backplane.publish("songs", {"songs": [info._asdict() for info in infos], "removed": list(removed)})
+
+async def _apply_shared_songs(header: dict, payloads):
+    for song in header["songs"]:
+        song_cache.put(SongInfo(**song))
+    for song_id in header["removed"]:
+        song_cache.remove(song_id)
+
+backplane.on("songs", _apply_shared_songs)
+
+# CRUD operations. Writers update `song_cache` after committing.
+async def add_song(db, song_id: str, title: str, file_path: str, bpm: int = None, processed: bool = False, timecode_path: str = None, status: str = "done"):
+    db_song = Song(id=song_id, title=title, file_path=file_path, bpm=bpm, processed=processed, timecode_path=timecode_path, status=status,
+                   source=source_type(file_path))
+    entries = await asyncio.to_thread(_search_entries, [(song_id, title, timecode_path)])
+    async with _writing():
+        db.add(db_song)
+        await db.flush()
+        await _index(db, [song_id], entries, replace=False)
+        await db.commit()
+    _cache_songs([db_song])
     return db_song
 
-def get_song(db, song_id: str):
-    return db.query(Song).filter(Song.id == song_id).first()
+async def add_songs(db, songs: list):
+    """Inserts many songs (dicts of `Song` column values) in a single transaction."""
+    db_songs = [Song(**{"source": source_type(song.get("file_path")), **song}) for song in songs]
+    entries = await asyncio.to_thread(_search_entries, [(song.id, song.title, song.timecode_path) for song in db_songs])
+    async with _writing():
+        try:
+            db.add_all(db_songs)
+            await db.flush()
+            await _index(db, [song.id for song in db_songs], entries, replace=False)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+    _cache_songs(db_songs)
+    return db_songs
 
-def list_songs(db, skip: int = 0, limit: int = 100):
-    return db.query(Song).offset(skip).limit(limit).all()
+async def get_song(db, song_id: str):
+    return await db.get(Song, song_id)
 
-def delete_song(db, song_id: str):
-    db_song = db.query(Song).filter(Song.id == song_id).first()
+async def list_songs(db, limit: int = 100, after: Optional[Tuple[str, str]] = None, query: Optional[str] = None,
+                     processed: Optional[bool] = None, source: Optional[str] = None,
+                     bpm_min: Optional[int] = None, bpm_max: Optional[int] = None):
+    """One page of the library, ordered by title (case-insensitive) then id.
+
+    Keyset pagination: `after` is the `(title, id)` of the previous page's last
+    song, so every page is an index range scan however deep it is. `query`
+    matches words (or word prefixes) in titles and lyrics through the search
+    index; the other arguments filter on `Song` columns.
+    """
+    title = Song.title.collate("NOCASE")
+    stmt = select(Song).order_by(title, Song.id).limit(limit)
+    if after is not None:
+        # Spelled out rather than as a row value, which SQLite won't turn into an index seek
+        stmt = stmt.where(title >= after[0], or_(title > after[0], Song.id > after[1]))
+    if query is not None:
+        match = _match_expression(query)
+        if match is None:
+            return []
+        stmt = stmt.where(literal_column("songs.rowid").in_(select(literal_column("rowid")).select_from(text(SEARCH_TABLE))
+                                                            .where(text(f"{SEARCH_TABLE} MATCH :match").bindparams(match=match))))
+    if processed is not None:
+        stmt = stmt.where(Song.processed == processed)
+    if source is not None:
+        stmt = stmt.where(Song.source == source)
+    if bpm_min is not None:
+        stmt = stmt.where(Song.bpm >= bpm_min)
+    if bpm_max is not None:
+        stmt = stmt.where(Song.bpm <= bpm_max)
+    return (await db.execute(stmt)).scalars().all()
+
+async def delete_song(db, song_id: str):
+    async with _writing():
+        db_song = await db.get(Song, song_id)
+        if db_song:
+            await _index(db, [song_id], [], replace=True)
+            await db.delete(db_song)
+            await db.commit()
     if db_song:
-        db.delete(db_song)
-        db.commit()
+        _cache_songs(removed=[song_id])
     return db_song
 
-def update_song_processed_status(db, song_id: str, processed: bool, timecode_path: str = None):
-    db_song = db.query(Song).filter(Song.id == song_id).first()
-    if db_song:
+async def update_song_processed_status(db, song_id: str, processed: bool, timecode_path: str = None):
+    db_song = await db.get(Song, song_id)
+    if not db_song:
+        return None
+    # New timecodes: the song's lyrics are re-indexed (the file is read before taking the write lock)
+    entries = await asyncio.to_thread(_search_entries, [(song_id, db_song.title, timecode_path)]) if timecode_path else []
+    async with _writing():
         db_song.processed = processed
         if timecode_path:
             db_song.timecode_path = timecode_path
-        db.commit()
-        db.refresh(db_song)
+            await _index(db, [song_id], entries, replace=True)
+        await db.commit()
+    _cache_songs([db_song])
+    return db_song
+
+async def update_song_job_status(db, song_id: str, status: str, job_error: str = None):
+    async with _writing():
+        db_song = await db.get(Song, song_id)
+        if db_song:
+            db_song.status = status
+            db_song.job_error = job_error
+            await db.commit()
+    if db_song:
+        _cache_songs([db_song])
     return db_song
+
+async def fail_interrupted_jobs(db):
+    """Marks jobs left queued/running by a previous server process as failed.
+
+    Runs at startup before `warm_song_cache`, so it leaves the cache alone.
+    """
+    async with _writing():
+        result = await db.execute(update(Song).where(Song.status.in_(["queued", "running"])).values(
+            status="failed", job_error="Interrupted by server restart").execution_options(synchronize_session=False))
+        await db.commit()
+    return result.rowcount
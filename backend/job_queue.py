@@ -0,0 +1,145 @@
+import asyncio
+import multiprocessing
+import os
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+from .config import OCR_NICE, OCR_WORKERS, PROCESSING_WORKERS
+from .database import AsyncSessionLocal, update_song_job_status, update_song_processed_status
+from .log_config import configure_logging
+from .metrics import PARSE_BUCKETS, metrics
+from .timecode_cache import timecode_cache
+from .trigger_interface import trigger_interface
+
+logger = logging.getLogger(__name__)
+
+task_seconds = metrics.histogram(
+    "lyricpilot_job_task_seconds", "Time a task took in a worker process, waiting for a slot left out", ("task",), PARSE_BUCKETS)
+jobs_total = metrics.counter("lyricpilot_jobs_total", "Song processing jobs finished", ("status",))
+
+
+class JobQueue:
+    """Runs song processing (parsing, alignment) in a process pool, off the event loop.
+
+    A job is identified by its song id and its state lives in the `Song` row:
+    queued -> running -> done / failed. Each transition is also pushed to all
+    WebSocket clients as a `job_progress` message.
+
+    With `nice`, the workers run at that much lower CPU priority (the OCR queue).
+    """
+
+    def __init__(self, max_workers: int = PROCESSING_WORKERS, nice: int = 0):
+        self.max_workers = max_workers
+        self.nice = nice
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks = set()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn, not fork: forking a process that is running an event loop and threads isn't safe.
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_init_worker, initargs=(self.nice,))
+        return self._executor
+
+    def submit(self, song_id: str, fn: Callable[..., Optional[str]], *args) -> asyncio.Task:
+        """Queues `fn(*args)` for a song. `fn` runs in a worker process and returns the
+        timecode path it wrote, or None if the file couldn't be turned into timecodes.
+
+        `fn` may instead be a coroutine function that schedules its own steps with
+        `run` (PDF charts); it then runs on the event loop without taking a slot.
+        """
+        task = asyncio.get_running_loop().create_task(self._run(song_id, fn, args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def run(self, fn: Callable, *args):
+        """Runs `fn(*args)` in a worker process once a slot is free and returns its result.
+
+        Used directly for batches (bulk import) that track their own results rather
+        than per-song job state.
+        """
+        return (await self.run_timed(fn, *args))[0]
+
+    async def run_timed(self, fn: Callable, *args) -> Tuple[Any, float]:
+        """Like `run`, returning (result, seconds `fn` took in the worker process)."""
+        async with self._get_slots():
+            result, seconds = await asyncio.get_running_loop().run_in_executor(self.executor, _timed, fn, *args)
+        task_seconds.labels(fn.__name__).observe(seconds)
+        return result, seconds
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        return self._slots
+
+    async def _run(self, song_id: str, fn, args):
+        await self.publish(song_id, "queued")
+        try:
+            if asyncio.iscoroutinefunction(fn):
+                # Its steps wait for slots themselves; holding one here too could deadlock the queue
+                await self._start(song_id)
+                timecode_path = await fn(*args)
+            else:
+                async with self._get_slots():
+                    await self._start(song_id)
+                    timecode_path, seconds = await asyncio.get_running_loop().run_in_executor(self.executor, _timed, fn, *args)
+                task_seconds.labels(fn.__name__).observe(seconds)
+        except Exception as e:
+            logger.exception("Processing failed for song %s", song_id)
+            jobs_total.labels("failed").inc()
+            await self._set_status(song_id, "failed", str(e))
+            await self.publish(song_id, "failed", error=str(e))
+            return
+
+        async with AsyncSessionLocal() as db:
+            await update_song_processed_status(db, song_id, timecode_path is not None, timecode_path)
+            await update_song_job_status(db, song_id, "done")
+        timecode_cache.invalidate(song_id)
+        if timecode_path is not None:
+            # Compiled now, off the loop, rather than when the song is first played
+            await asyncio.to_thread(timecode_cache.get_plan, song_id, timecode_path)
+        jobs_total.labels("done").inc()
+        await self.publish(song_id, "done", processed=timecode_path is not None)
+
+    async def _start(self, song_id: str):
+        await self._set_status(song_id, "running")
+        await self.publish(song_id, "running")
+
+    @staticmethod
+    async def _set_status(song_id: str, status: str, error: Optional[str] = None):
+        async with AsyncSessionLocal() as db:
+            await update_song_job_status(db, song_id, status, error)
+
+    @staticmethod
+    async def publish(song_id: str, status: str, **extra):
+        await trigger_interface.send_message("job_progress", {"job_id": song_id, "song_id": song_id, "status": status, **extra})
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _init_worker(nice: int):
+    configure_logging(background=False)
+    if nice and hasattr(os, "nice"):
+        os.nice(nice)
+
+
+def _timed(fn: Callable, *args) -> Tuple[Any, float]:
+    """Runs in the worker: `fn(*args)` and the seconds it took there."""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+job_queue = JobQueue()
+# Scanned PDF pages: slow, so they get their own low-priority workers and never hold up the job queue
+ocr_queue = JobQueue(max_workers=OCR_WORKERS, nice=OCR_NICE)
+metrics.callback("lyricpilot_jobs_in_progress", "Jobs queued or running", "gauge",
+                 lambda: {("jobs",): len(job_queue._tasks), ("ocr",): len(ocr_queue._tasks)}, ("queue",))
@@ -0,0 +1,51 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Optional
+
+from .config import LOG_LEVEL
+
+# Every backend module logs to a child of this logger (logging.getLogger(__name__))
+ROOT_LOGGER = "backend"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(level: str = LOG_LEVEL, background: bool = True):
+    """Sends the backend's log records to stderr, at `level` and above.
+
+    With `background` (the server), records are handed to a queue and written by
+    a listener thread, so a slow stderr (a pipe nobody drains, a busy terminal)
+    never blocks the event loop; job queue worker processes write directly.
+    Calling it again only changes the level.
+    """
+    global _listener
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(level)
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+    if background:
+        records = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(records, handler)
+        _listener.start()
+        atexit.register(_listener.stop)
+        handler = logging.handlers.QueueHandler(records)
+    logger.addHandler(handler)
+    logger.propagate = False
+
+
+def set_log_level(level: str) -> str:
+    """Changes the backend's log level at runtime; raises ValueError for an unknown level."""
+    level = level.upper()
+    if not isinstance(logging.getLevelName(level), int):
+        raise ValueError(f"Unknown log level '{level}'")
+    logging.getLogger(ROOT_LOGGER).setLevel(level)
+    return level
+
+
+def get_log_level() -> str:
+    return logging.getLevelName(logging.getLogger(ROOT_LOGGER).getEffectiveLevel())
@@ -0,0 +1,64 @@
+from array import array
+from bisect import bisect_right
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+
+class LyricTimelineIndex:
+    """Precomputed, read-only lookup structure for a song's lyric timeline.
+
+    Times live in a flat float64 array sorted ascending and texts in a parallel
+    list, so "which line is showing at time t" is a single binary search instead
+    of a scan over pydantic objects. The index holds no playback state; seeks and
+    rewinds are just lookups at a different time. Times and texts can also be
+    views onto a memory-mapped columnar timecode file, which are used as-is.
+    """
+
+    __slots__ = ("times", "texts")
+
+    def __init__(self, times: Sequence[float], texts: Sequence[str]):
+        if len(times) != len(texts):
+            raise ValueError("times and texts must have the same length")
+        self.times = times if isinstance(times, (array, memoryview)) else array("d", times)
+        self.texts = texts
+
+    @classmethod
+    def from_entries(cls, entries: Iterable) -> "LyricTimelineIndex":
+        """Builds an index from TimecodeEntry objects or {'time', 'text'} dicts.
+
+        Entries are stably sorted by time, so lines sharing a timestamp keep their
+        original order.
+        """
+        pairs = [(e["time"], e["text"]) if isinstance(e, dict) else (e.time, e.text) for e in entries]
+        pairs.sort(key=lambda p: p[0])
+        return cls(array("d", (p[0] for p in pairs)), [p[1] for p in pairs])
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def index_at(self, t: float) -> int:
+        """Returns the index of the line showing at time `t`, or -1 before the first line."""
+        return bisect_right(self.times, t) - 1
+
+    def entry(self, i: int) -> dict:
+        return {"time": self.times[i], "text": self.texts[i]}
+
+    def upcoming(self, i: int, count: int = 3) -> List[str]:
+        """Returns the texts of up to `count` lines following index `i`."""
+        return list(self.texts[i + 1:i + 1 + count])
+
+    def window(self, t: float, count: int = 3) -> Tuple[Optional[str], List[str]]:
+        """Returns (current line, next `count` lines) at time `t`."""
+        i = self.index_at(t)
+        return (self.texts[i] if i >= 0 else None), self.upcoming(i, count)
+
+    def duration(self) -> float:
+        """Estimated end of the timeline: the last line plus the gap before it (its likely length)."""
+        n = len(self.times)
+        if n == 0:
+            return 0.0
+        last = self.times[n - 1]
+        return last + (last - (self.times[n - 2] if n > 1 else 0.0))
+
+    def next_time_after(self, i: int) -> Optional[float]:
+        """Returns the start time of the line after index `i`, or None at the end."""
+        return self.times[i + 1] if i + 1 < len(self.times) else None
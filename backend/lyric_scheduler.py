@@ -1,20 +1,50 @@
-import asyncio
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple, Union
+
+from .lyric_index import LyricTimelineIndex
 
 class LyricScheduler:
-    def __init__(self, timecodes: List[Dict], lead_offset: float = 0.5):
-        self.timecodes = sorted(timecodes, key=lambda x: x['time'])
+    def __init__(self, timecodes: Union[List[Dict], LyricTimelineIndex], lead_offset: float = 0.5):
+        if isinstance(timecodes, LyricTimelineIndex):
+            self.index = timecodes
+        else:
+            self.index = LyricTimelineIndex.from_entries(timecodes)
         self.lead_offset = lead_offset
         self.current_lyric_index = -1
 
     def get_next_lyric(self, current_audio_time: float) -> Dict | None:
-        """Predicts the next lyric line based on current audio time and lead offset."""
-        for i in range(self.current_lyric_index + 1, len(self.timecodes)):
-            lyric_entry = self.timecodes[i]
-            if current_audio_time >= (lyric_entry['time'] - self.lead_offset):
-                self.current_lyric_index = i
-                return lyric_entry
-        return None
+        """Returns the lyric line that should now be showing, if it changed since the last call.
+
+        Lines are shown `lead_offset` seconds ahead of their timecode. Because the
+        lookup is a binary search on the index, jumping forward or backward in time
+        (a seek or rewind) simply lands on the right line.
+        """
+        i = self.index.index_at(current_audio_time + self.lead_offset)
+        if i == self.current_lyric_index:
+            return None
+        self.current_lyric_index = i
+        return self.index.entry(i) if i >= 0 else None
+
+    def seek(self, current_audio_time: float) -> Dict | None:
+        """Repositions the scheduler at `current_audio_time` and returns the line showing there."""
+        self.current_lyric_index = self.index.index_at(current_audio_time + self.lead_offset)
+        return self.index.entry(self.current_lyric_index) if self.current_lyric_index >= 0 else None
+
+    def advance(self) -> Dict | None:
+        """Moves to the line after the current one (skipping lines that share its timestamp)."""
+        next_time = self.index.next_time_after(self.current_lyric_index)
+        if next_time is None:
+            return None
+        self.current_lyric_index = self.index.index_at(next_time)
+        return self.index.entry(self.current_lyric_index)
+
+    def get_display_window(self, current_audio_time: float, count: int = 3) -> Tuple[Optional[str], List[str]]:
+        """Returns (current line, next `count` lines) at `current_audio_time`, honouring the lead offset."""
+        return self.index.window(current_audio_time + self.lead_offset, count)
+
+    def next_boundary(self) -> Optional[float]:
+        """Returns the audio time at which the line after the current one should appear."""
+        next_time = self.index.next_time_after(self.current_lyric_index)
+        return None if next_time is None else next_time - self.lead_offset
 
     def reset(self):
         self.current_lyric_index = -1
@@ -1,41 +1,90 @@
 import os
+import base64
+import json
 import shutil
-import asyncio
-from typing import List, Optional
+import logging
+from typing import Annotated, List, Optional
 from pathlib import Path
 from uuid import uuid4
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, UploadFile, File, Form
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, WebSocket, Depends, HTTPException, UploadFile, File, Form, Header, Query
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
+from starlette.concurrency import run_in_threadpool
 from starlette.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .config import SONGS_DIR, UPLOAD_DIR
-from .database import create_tables, get_db, add_song, get_song, list_songs, delete_song, update_song_processed_status, Song
-from .song_loader import upload_and_process_song
-from .timecode_generator import load_timecode_json, save_timecode_json, TimecodeData, TimecodeEntry
-from .trigger_interface import trigger_interface
+from .config import DATA_DIR, SONGS_DIR, UPLOAD_DIR, OUTPUTS_CONFIG, DEFAULT_ROOM, PLAYBACK_DISPATCH_AHEAD, TIMELINE_MAX_REQUEST_LINES, PROFILER_MAX_SECONDS
+from .log_config import configure_logging, get_log_level, set_log_level
+from .metrics import metrics
+from .profiler import profiler
+from .database import async_engine, create_tables_async, index_songs, warm_song_cache, SOURCE_TYPES, get_db, AsyncSessionLocal, add_song, get_song, list_songs, delete_song, update_song_processed_status, fail_interrupted_jobs, Song
+from .song_cache import song_cache
+from .backplane import backplane, interprocess_lock
+from .song_loader import upload_and_process_song, import_setlist
+from .job_queue import job_queue, ocr_queue
+from .timecode_generator import TimecodeData, TimecodeEntry
+from .timecode_store import TIMECODE_FILENAME, save_timecodes, export_timecode_json
+from .timecode_cache import timecode_cache
+from .parse_cache import parse_cache
+from .trigger_interface import ROOM_NAME_PATTERN, trigger_interface, encode_timeline, encode_timeline_chunk, valid_room
+from .playback_engine import playback_engine
+from .output_sinks import OutputConfig, outputs
+from .beat_detector import BeatFollower
+from .score_follower import MIDI_EXTENSIONS, ScoreFollower, load_reference
+from .clock_sync import server_time
 from .lyrics_text_parser import parse_plain_text_lyrics, generate_basic_timecodes_from_text
 
+logger = logging.getLogger(__name__)
+configure_logging()
+
 app = FastAPI()
 
+# The room (named playback session) a request or display belongs to; DEFAULT_ROOM if not given
+Room = Annotated[str, Query(pattern=ROOM_NAME_PATTERN)]
+
 # Mount static files (CSS, JS) from the frontend directory
 app.mount("/static", StaticFiles(directory=os.path.join(Path(__file__).parent.parent, "frontend")), name="static")
 
 # --- Startup Events ---
 @app.on_event("startup")
-def on_startup():
-    create_tables()
+async def on_startup():
     # Ensure SONGS_DIR and UPLOAD_DIR exist
     os.makedirs(SONGS_DIR, exist_ok=True)
     os.makedirs(UPLOAD_DIR, exist_ok=True)
-    preload_example_song()
+    await backplane.start()
+    await run_in_threadpool(parse_cache.rescan)  # The parse cache's index: the only full walk until a song is deleted
+    # Workers started together (uvicorn --workers) prepare the database one at a time; one
+    # starting next to running workers must not fail the jobs those are still processing
+    async with interprocess_lock(os.path.join(DATA_DIR, "startup.lock")):
+        await create_tables_async()
+        async with AsyncSessionLocal() as db:
+            if not backplane.peers:
+                await fail_interrupted_jobs(db)
+            await preload_example_song(db)
+        indexed = await index_songs()
+        if indexed:
+            logger.info("Indexed %d songs for search", indexed)
+    # Playback endpoints read song metadata from here, never from SQLite
+    count = await warm_song_cache()
+    logger.info("Song metadata cache warmed with %d songs", count)
+    if OUTPUTS_CONFIG:
+        await outputs.load(OUTPUTS_CONFIG)
+    await outputs.sync()  # Outputs added at runtime before this worker started
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    profiler.stop()
+    playback_engine.stop_all()
+    outputs.close()
+    job_queue.shutdown()
+    ocr_queue.shutdown()
+    await backplane.stop()
+    await async_engine.dispose()
 
-def preload_example_song():
-    db = next(get_db())
+async def preload_example_song(db: AsyncSession):
     example_song_id = "amazing_grace"
-    if not get_song(db, example_song_id):
-        print("Preloading example song: Amazing Grace")
+    if not await get_song(db, example_song_id):
+        logger.info("Preloading example song: Amazing Grace")
         song_dir = os.path.join(SONGS_DIR, example_song_id)
         os.makedirs(song_dir, exist_ok=True)
         raw_files_dir = os.path.join(song_dir, "raw")
@@ -70,17 +119,17 @@ The hour I first believed.
             {"time": 23.0, "text": "The hour I first believed."},
         ]
         timecode_data = TimecodeData(timecodes=[TimecodeEntry(**tc) for tc in example_timecodes])
-        save_timecode_json(timecode_json_path, timecode_data)
+        timecode_path = os.path.join(song_dir, TIMECODE_FILENAME)
+        save_timecodes(timecode_path, timecode_data)
 
-        add_song(
+        await add_song(
             db,
             song_id=example_song_id,
             title="Amazing Grace",
             file_path=lyrics_file_path,
             processed=True,
-            timecode_path=timecode_json_path
+            timecode_path=timecode_path
         )
-        db.close()
 
 # --- HTML for Frontend ---
 @app.get("/", response_class=HTMLResponse)
@@ -96,38 +145,105 @@ async def upload_song_endpoint(
     bpm: Optional[float] = Form(None),
     measures_per_section: Optional[int] = Form(None),
     beats_per_measure: Optional[int] = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    print(f"Received BPM in upload_song_endpoint: {bpm}") # Debug log
-    print(f"Received Measures per Section in upload_song_endpoint: {measures_per_section}") # Debug log
-    print(f"Received Beats per Measure in upload_song_endpoint: {beats_per_measure}") # Debug log
+    logger.debug("Upload %s: bpm=%s, measures_per_section=%s, beats_per_measure=%s", file.filename, bpm, measures_per_section, beats_per_measure)
     try:
         song = await upload_and_process_song(db, file, title, bpm, measures_per_section, beats_per_measure)
-        return {"message": "Song uploaded and processing initiated", "song_id": song.id, "title": song.title}
+        return {"message": "Song uploaded and processing queued", "song_id": song.id, "job_id": song.id, "title": song.title, "status": song.status}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload song: {e}")
 
+@app.post("/songs/bulk", response_model=dict)
+async def import_setlist_endpoint(
+    files: List[UploadFile] = File(...),
+    bpm: Optional[float] = Form(None),
+    measures_per_section: Optional[int] = Form(None),
+    beats_per_measure: Optional[int] = Form(None),
+    db: AsyncSession = Depends(get_db)
+):
+    # Song files and/or zip archives; parsing finishes before the response is sent
+    try:
+        results = await import_setlist(db, files, bpm, measures_per_section, beats_per_measure)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to import setlist: {e}")
+    return {
+        "message": "Setlist imported",
+        "imported": sum(1 for r in results if r["status"] == "done"),
+        "failed": sum(1 for r in results if r["status"] == "failed"),
+        "results": results,
+    }
+
+def _encode_cursor(song) -> str:
+    return base64.urlsafe_b64encode(json.dumps([song.title, song.id]).encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        title, song_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(title, str) or not isinstance(song_id, str):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return title, song_id
+
 @app.get("/songs", response_model=List[dict])
-async def list_all_songs(db: Session = Depends(get_db)):
-    songs = list_songs(db)
-    return [{
+async def list_all_songs(
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    processed: Optional[bool] = None,
+    source: Optional[str] = None,
+    bpm_min: Optional[int] = None,
+    bpm_max: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """A page of the library in title order, optionally searched (`q`: words in titles and lyrics) and filtered.
+
+    The next page is fetched by passing the `X-Next-Cursor` response header back
+    as `cursor`; there is no such header on the last page. Responses carry an
+    ETag that changes with any song write, so a refresh with `If-None-Match` is
+    answered 304 without querying the database.
+    """
+    if not 1 <= limit <= 500:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
+    if source is not None and source not in SOURCE_TYPES.values():
+        raise HTTPException(status_code=400, detail=f"Unknown source type: {source}")
+    etag = song_cache.etag()  # Taken before querying, so a write racing the query changes it
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    after = _decode_cursor(cursor) if cursor else None
+    songs = await list_songs(db, limit, after, q, processed, source, bpm_min, bpm_max)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if len(songs) == limit:
+        headers["X-Next-Cursor"] = _encode_cursor(songs[-1])
+    return JSONResponse([{
         "id": song.id,
         "title": song.title,
         "bpm": song.bpm,
         "processed": song.processed,
+        "status": song.status,
+        "source": song.source,
         "file_path": song.file_path,
         "timecode_path": song.timecode_path
-    } for song in songs]
+    } for song in songs], headers=headers)
+
+async def _timecode_data(song) -> TimecodeData:
+    """The song's cached timecodes; a miss loads (and validates) the file in the thread pool, off the event loop."""
+    if timecode_cache.loaded(song.id, song.timecode_path):
+        return timecode_cache.get(song.id, song.timecode_path)
+    return await run_in_threadpool(timecode_cache.get, song.id, song.timecode_path)
 
 @app.get("/songs/{song_id}", response_model=dict)
-async def get_song_details(song_id: str, db: Session = Depends(get_db)):
-    song = get_song(db, song_id)
+async def get_song_details(song_id: str, db: AsyncSession = Depends(get_db)):
+    song = await get_song(db, song_id)
     if not song:
         raise HTTPException(status_code=404, detail="Song not found")
 
     timecodes = []
     if song.processed and song.timecode_path and os.path.exists(song.timecode_path):
-        timecode_data = load_timecode_json(song.timecode_path)
+        timecode_data = await _timecode_data(song)
         timecodes = [tc.model_dump() for tc in timecode_data.timecodes]
 
     return {
@@ -135,90 +251,421 @@ async def get_song_details(song_id: str, db: Session = Depends(get_db)):
         "title": song.title,
         "bpm": song.bpm,
         "processed": song.processed,
+        "status": song.status,
+        "source": song.source,
         "file_path": song.file_path,
         "timecode_path": song.timecode_path,
         "timecodes": timecodes
     }
 
+@app.get("/songs/{song_id}/timecode.json")
+async def export_song_timecodes(song_id: str, db: AsyncSession = Depends(get_db)):
+    # Songs are stored in the columnar format; this is the portable JSON form (re-uploadable as a .json song)
+    song = await get_song(db, song_id)
+    if not song:
+        raise HTTPException(status_code=404, detail="Song not found")
+    if not song.processed or not song.timecode_path or not os.path.exists(song.timecode_path):
+        raise HTTPException(status_code=400, detail="Song has no timecodes")
+    body = export_timecode_json(await _timecode_data(song))
+    return Response(content=body, media_type="application/json",
+                    headers={"Content-Disposition": f'attachment; filename="{song.id}.timecode.json"'})
+
+@app.get("/jobs/{job_id}", response_model=dict)
+async def get_job_status(job_id: str, db: AsyncSession = Depends(get_db)):
+    # A job id is the id of the song it processes; job state lives on the Song row
+    song = await get_song(db, job_id)
+    if not song:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "job_id": song.id,
+        "song_id": song.id,
+        "status": song.status,
+        "error": song.job_error,
+        "processed": song.processed,
+    }
+
 @app.delete("/songs/{song_id}", response_model=dict)
-async def delete_song_endpoint(song_id: str, db: Session = Depends(get_db)):
-    song = delete_song(db, song_id)
+async def delete_song_endpoint(song_id: str, db: AsyncSession = Depends(get_db)):
+    song = await delete_song(db, song_id)
     if not song:
         raise HTTPException(status_code=404, detail="Song not found")
 
+    timecode_cache.invalidate(song_id)
+
     # Optionally, remove song files from disk
     song_dir = os.path.join(SONGS_DIR, song_id)
     if os.path.exists(song_dir):
         shutil.rmtree(song_dir)
+    # Cached parse results and raw files only this song used now count against the cache budget
+    await run_in_threadpool(parse_cache.evict, True)
 
     return {"message": f"Song {song_id} deleted successfully"}
 
+@app.get("/timecode_cache/stats", response_model=dict)
+async def timecode_cache_stats():
+    return timecode_cache.stats()
+
+@app.get("/song_cache/stats", response_model=dict)
+async def song_cache_stats():
+    return song_cache.stats()
+
+@app.get("/parse_cache/stats", response_model=dict)
+async def parse_cache_stats():
+    return await run_in_threadpool(parse_cache.stats)
+
+@app.get("/broadcast/stats", response_model=dict)
+async def broadcast_stats():
+    return trigger_interface.stats()
+
+@app.get("/rooms", response_model=List[dict])
+async def list_rooms():
+    """Rooms with displays connected or a song playing: their display count and playback state."""
+    rooms = []
+    for name in sorted(set(trigger_interface.rooms) | set(playback_engine.sessions)):
+        session = playback_engine.get(name)
+        rooms.append({"room": name, "connections": len(trigger_interface.room_clients(name)),
+                      "playback": session.state() if session else None})
+    return rooms
+
+# --- External Outputs (OSC / MIDI) ---
+@app.get("/outputs", response_model=List[dict])
+async def list_outputs():
+    """Configured OSC/MIDI outputs with their packet counts, lateness against each event's `at` and write time."""
+    return outputs.stats()
+
+@app.post("/outputs", response_model=dict)
+async def add_output(config: OutputConfig):
+    """Adds (or replaces, by name) an output sink for a room's playback events, on every worker."""
+    try:
+        sink = await outputs.add(config, publish=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return sink.stats()
+
+@app.delete("/outputs/{name}", response_model=dict)
+async def remove_output(name: str):
+    if not outputs.remove(name, publish=True):
+        raise HTTPException(status_code=404, detail="Output not found")
+    return {"message": f"Output {name} removed"}
+
+@app.get("/clock/stats", response_model=dict)
+async def clock_stats():
+    """Per-client clock offset (server minus client) and round-trip time from ping/pong sync."""
+    return {"server_time": server_time(), "clients": trigger_interface.clock_stats()}
+
+# --- Monitoring ---
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """This worker's metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/logging/level", response_model=dict)
+async def get_logging_level():
+    return {"level": get_log_level()}
+
+@app.post("/logging/level", response_model=dict)
+async def set_logging_level(level: str):
+    """Changes this worker's log level (DEBUG, INFO, WARNING, ERROR) until it restarts."""
+    try:
+        return {"level": set_log_level(level)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/profiler/start", response_model=dict)
+async def start_profiler(interval_ms: float = Query(5.0, ge=1.0, le=1000.0),
+                         max_seconds: float = Query(PROFILER_MAX_SECONDS, gt=0, le=PROFILER_MAX_SECONDS)):
+    """Starts sampling this worker's stacks (clearing the previous samples)."""
+    if not profiler.start(interval_ms / 1000, max_seconds):
+        raise HTTPException(status_code=409, detail="The profiler is already running")
+    return profiler.stats()
+
+@app.post("/profiler/stop", response_model=dict)
+async def stop_profiler():
+    await run_in_threadpool(profiler.stop)
+    return profiler.stats()
+
+@app.get("/profiler", response_class=PlainTextResponse)
+async def profiler_samples():
+    """The samples so far as collapsed stacks, for flamegraph.pl or speedscope."""
+    return PlainTextResponse(profiler.collapsed())
+
+@app.get("/profiler/stats", response_model=dict)
+async def profiler_stats():
+    return profiler.stats()
+
 # --- WebSocket Endpoint ---
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    trigger_interface.active_connections.append(websocket)
-    try:
-        while True:
-            # Keep connection alive, or handle incoming messages if any
-            # For now, we just wait for disconnect
-            await asyncio.sleep(0.1) # Keep connection alive, non-blocking
-    except WebSocketDisconnect:
-        print("WebSocket disconnected")
-    except Exception as e:
-        print(f"WebSocket error: {e}")
-    finally:
-        if websocket in trigger_interface.active_connections:
-            trigger_interface.active_connections.remove(websocket)
+async def websocket_endpoint(websocket: WebSocket, room: Room = DEFAULT_ROOM):
+    await trigger_interface.serve(websocket, _handle_client_message, room)
+
+async def _handle_client_message(client, message: dict):
+    if message.get("type") == "subscribe":
+        # `room` moves the display to another room; either way, catch it up with what its room is playing
+        if valid_room(message.get("room")):
+            trigger_interface.join(client, message["room"])
+        snapshot = await _playback_command(message.get("song_id"), client.room, "snapshot")
+        client.song_id = snapshot["state"]["song_id"] if snapshot else message.get("song_id")
+        if not snapshot:
+            return
+        song = song_cache.get(client.song_id)
+        if song and song.timecode_path and os.path.exists(song.timecode_path):
+            payload = timecode_cache.get_song_start_payload(song.id, song.title, song.timecode_path, None, client.timeline,
+                                                            client.encoding, tuple(snapshot["window"]))
+            trigger_interface.send_text_to(client, "song_start", payload)
+        trigger_interface.send_to(client, "playback_state", snapshot["state"])
+        trigger_interface.send_to(client, "lyric_update", snapshot["lyric"])
+    elif message.get("type") == "timeline_request":
+        # Timeline lines a display wants beyond what is streamed to it (e.g. to show the whole song)
+        start, count = message.get("start", 0), message.get("count", TIMELINE_MAX_REQUEST_LINES)
+        if not isinstance(start, int) or not isinstance(count, int):
+            return
+        song = song_cache.get(message.get("song_id"))
+        if not song or not song.processed or not song.timecode_path or not os.path.exists(song.timecode_path):
+            return
+        index = timecode_cache.get_index(song.id, song.timecode_path)
+        timeline_json = encode_timeline(index, start, start + max(0, min(count, TIMELINE_MAX_REQUEST_LINES)), client.encoding)
+        trigger_interface.send_text_to(client, "timeline_chunk", encode_timeline_chunk(song.id, timeline_json))
+
+async def _playback_plan(song):
+    """The song's cached playback plan; a miss loads and compiles it in the thread pool, off the event loop."""
+    if timecode_cache.loaded(song.id, song.timecode_path, "plan"):
+        return timecode_cache.get_plan(song.id, song.timecode_path)
+    return await run_in_threadpool(timecode_cache.get_plan, song.id, song.timecode_path)
 
 # --- Live Lyric Trigger (for testing/manual control) ---
 @app.post("/trigger_lyric/{song_id}")
-async def trigger_lyric(song_id: str, current_time: float, db: Session = Depends(get_db)):
-    song = get_song(db, song_id)
+async def trigger_lyric(song_id: str, current_time: float, room: Room = DEFAULT_ROOM):
+    song = song_cache.get(song_id)
     if not song or not song.processed or not song.timecode_path:
         raise HTTPException(status_code=404, detail="Song not found or not processed")
 
-    timecode_data = load_timecode_json(song.timecode_path)
-    # This is a simplified trigger. In a real scenario, lyric_scheduler would be used.
-    current_lyric = None
-    next_lyrics = []
-
-    # Find current and next lyrics based on current_time
-    for i, tc in enumerate(timecode_data.timecodes):
-        if tc.time <= current_time:
-            current_lyric = tc.text
-        else:
-            next_lyrics.append(tc.text)
-            if len(next_lyrics) >= 3: # Show up to 3 upcoming lines
-                break
-
-    await trigger_interface.send_message("lyric_update", {
-        "current_lyric": current_lyric,
-        "next_lyrics": next_lyrics
-    })
-    return {"message": "Lyric triggered", "current_lyric": current_lyric, "next_lyrics": next_lyrics}
-
-async def _send_song_start_to_clients(song_id: str, db: Session):
-    song = get_song(db, song_id)
+    plan = await _playback_plan(song)
+    # The frame showing at current_time (binary search) and its pre-encoded message, with up to 3 upcoming lines
+    data, text = plan.lyric_update(plan.frame_of(plan.index.index_at(current_time)))
+    await outputs.send_message("lyric_update", data, room, text)
+    return {"message": "Lyric triggered", "current_lyric": data["current_lyric"], "next_lyrics": data["next_lyrics"]}
+
+async def _send_song_start_to_clients(song_id: str, start_at: Optional[float] = None, window=None, room: str = DEFAULT_ROOM):
+    song = song_cache.get(song_id)
     if not song or not song.processed or not song.timecode_path:
-        print(f"Warning: Song {song_id} not found or not processed for playback.")
+        logger.warning("Song %s not found or not processed for playback", song_id)
         return
 
-    timecode_data = load_timecode_json(song.timecode_path)
-    await trigger_interface.send_song_start(song.id, song.title, [tc.model_dump() for tc in timecode_data.timecodes])
+    outputs.dispatch("song_start", {"song_id": song.id, "title": song.title, "at": start_at}, room)
+    # Encoded once per timeline mode / encoding the room's displays negotiated
+    await trigger_interface.broadcast_variants("song_start", lambda timeline, encoding: timecode_cache.get_song_start_payload(
+        song.id, song.title, song.timecode_path, start_at, timeline, encoding, window), room)
 
 @app.post("/start_song_playback/{song_id}")
-async def start_song_playback_endpoint(song_id: str, db: Session = Depends(get_db)):
-    await _send_song_start_to_clients(song_id, db)
+async def start_song_playback_endpoint(song_id: str, room: Room = DEFAULT_ROOM):
+    await _send_song_start_to_clients(song_id, room=room)
     return {"message": f"Playback started for {song_id}"}
 
 @app.post("/play_song/{song_id}", response_model=dict)
-async def play_song_endpoint(song_id: str, db: Session = Depends(get_db)):
-    song = get_song(db, song_id)
+async def play_song_endpoint(song_id: str, room: Room = DEFAULT_ROOM):
+    song = song_cache.get(song_id)
+    if not song:
+        raise HTTPException(status_code=404, detail="Song not found")
+    if not song.processed or not song.timecode_path:
+        raise HTTPException(status_code=400, detail="Song not processed for playback")
+
+    plan = await _playback_plan(song)
+    start_at = server_time() + PLAYBACK_DISPATCH_AHEAD
+    # The session's own messages are queued after this song_start, which carries its first timeline window
+    session = playback_engine.start(song.id, song.title, plan, start_at=start_at, room=room)
+    await _send_song_start_to_clients(song_id, start_at, session.timeline_window(), room)
+    return {"message": f"Initiated playback for song ID: {song_id}", "room": room}
+
+# --- Server-side Playback Clock ---
+def _get_playback_session(song_id: str, room: str = DEFAULT_ROOM):
+    session = playback_engine.get(room)
+    if not session or session.song_id != song_id:
+        raise HTTPException(status_code=404, detail=f"No active playback session for this song in room '{room}'")
+    return session
+
+def _apply_playback_command(song_id: Optional[str], room: str, action: str, args: dict) -> Optional[dict]:
+    """Runs a transport command on this worker's session in `room` and returns the response.
+
+    `snapshot` (what a subscribing display needs) answers None rather than 404
+    when the room isn't playing `song_id` (or, without one, anything).
+    """
+    if action == "snapshot":
+        session = playback_engine.get(room)
+        if not session or (song_id and session.song_id != song_id):
+            return None
+        return {"state": session.state(), "window": session.timeline_window(), "lyric": session.lyric_data()}
+    session = _get_playback_session(song_id, room)
+    if action == "pause":
+        session.pause()
+    elif action == "resume":
+        session.resume()
+    elif action == "seek":
+        session.seek(args["position"])
+    elif action == "tempo":
+        try:
+            session.set_tempo(args["scale"])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    elif action == "stop":
+        playback_engine.stop(room)
+        return {"message": f"Playback stopped for {song_id}", "room": room}
+    return session.state()
+
+async def _playback_command(song_id: Optional[str], room: str, action: str, **args) -> Optional[dict]:
+    """`_apply_playback_command`, in whichever worker holds the room's session.
+
+    A room's session lives in the worker that started it; a worker without one
+    asks the others over the backplane, and only if none has it either answers
+    (404) itself.
+    """
+    if playback_engine.get(room) is None and backplane.peers:
+        reply = await backplane.request("playback", {"song_id": song_id, "room": room, "action": action, "args": args})
+        if reply is not None:
+            if "status_code" in reply:
+                raise HTTPException(status_code=reply["status_code"], detail=reply["detail"])
+            return reply["result"]
+    return _apply_playback_command(song_id, room, action, args)
+
+async def _answer_playback_request(header: dict, payloads) -> Optional[dict]:
+    """A transport command forwarded by another worker; answered only if the room's session is here."""
+    if playback_engine.get(header["room"]) is None:
+        return None
+    try:
+        result = _apply_playback_command(header["song_id"], header["room"], header["action"], header["args"])
+    except HTTPException as e:
+        return {"status_code": e.status_code, "detail": e.detail}
+    return {"result": result} if result is not None else None
+
+backplane.on("playback", _answer_playback_request)
+
+@app.post("/playback/{song_id}/start", response_model=dict)
+async def playback_start_endpoint(song_id: str, position: float = 0.0, room: Room = DEFAULT_ROOM):
+    song = song_cache.get(song_id)
     if not song:
         raise HTTPException(status_code=404, detail="Song not found")
     if not song.processed or not song.timecode_path:
         raise HTTPException(status_code=400, detail="Song not processed for playback")
 
-    await _send_song_start_to_clients(song_id, db)
-    return {"message": f"Initiated playback for song ID: {song_id}"}
\ No newline at end of file
+    plan = await _playback_plan(song)
+    start_at = server_time() + PLAYBACK_DISPATCH_AHEAD
+    session = playback_engine.start(song.id, song.title, plan, position, start_at, room)
+    await _send_song_start_to_clients(song_id, start_at, session.timeline_window(), room)
+    return session.state()
+
+@app.post("/playback/{song_id}/pause", response_model=dict)
+async def playback_pause_endpoint(song_id: str, room: Room = DEFAULT_ROOM):
+    return await _playback_command(song_id, room, "pause")
+
+@app.post("/playback/{song_id}/resume", response_model=dict)
+async def playback_resume_endpoint(song_id: str, room: Room = DEFAULT_ROOM):
+    return await _playback_command(song_id, room, "resume")
+
+@app.post("/playback/{song_id}/seek", response_model=dict)
+async def playback_seek_endpoint(song_id: str, position: float, room: Room = DEFAULT_ROOM):
+    return await _playback_command(song_id, room, "seek", position=position)
+
+@app.post("/playback/{song_id}/tempo", response_model=dict)
+async def playback_tempo_endpoint(song_id: str, scale: float, room: Room = DEFAULT_ROOM):
+    return await _playback_command(song_id, room, "tempo", scale=scale)
+
+@app.post("/playback/{song_id}/stop", response_model=dict)
+async def playback_stop_endpoint(song_id: str, room: Room = DEFAULT_ROOM):
+    return await _playback_command(song_id, room, "stop")
+
+@app.get("/playback/{song_id}", response_model=dict)
+async def playback_state_endpoint(song_id: str, room: Room = DEFAULT_ROOM):
+    return await _playback_command(song_id, room, "state")
+
+# --- Beat Following ---
+async def _save_follow_upload(upload: UploadFile, default_suffix: str) -> str:
+    """Saves an upload driving a follower to UPLOAD_DIR, keeping its extension; returns the path."""
+    suffix = Path(upload.filename or "").suffix.lower() or default_suffix
+    path = os.path.join(UPLOAD_DIR, f"follow_{uuid4()}{suffix}")
+    with open(path, "wb") as f:
+        await run_in_threadpool(shutil.copyfileobj, upload.file, f)
+    return path
+
+def _remove_follow_uploads(*paths):
+    for path in paths:
+        if path:
+            try:
+                os.remove(path)  # Already read, or open for streaming
+            except OSError:
+                pass
+
+@app.post("/playback/{song_id}/follow", response_model=dict)
+async def playback_follow_endpoint(
+    song_id: str,
+    audio: Optional[UploadFile] = File(None),
+    bpm: Optional[float] = Form(None),
+    room: Room = DEFAULT_ROOM
+):
+    """Locks the playhead to the band: live microphone input, or an uploaded WAV streamed in real time."""
+    session = _get_playback_session(song_id, room)
+    song = song_cache.get(song_id)
+    if session.follower is not None:
+        session.follower.stop()
+        session.follower = None
+
+    wav_path = await _save_follow_upload(audio, ".wav") if audio is not None else None
+    follower = BeatFollower(session, bpm or (song.bpm if song else None))
+    try:
+        await follower.start(wav_path)
+    except (RuntimeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Failed to start beat following: {e}")
+    finally:
+        _remove_follow_uploads(wav_path)
+    session.follower = follower
+    return {"message": f"Following {'uploaded audio' if audio is not None else 'live audio'} for {song_id}",
+            "song_bpm": follower.song_bpm}
+
+@app.post("/playback/{song_id}/score_follow", response_model=dict)
+async def playback_score_follow_endpoint(
+    song_id: str,
+    performance: Optional[UploadFile] = File(None),
+    reference: Optional[UploadFile] = File(None),
+    room: Room = DEFAULT_ROOM
+):
+    """Follows the band through a MIDI reference of the song, note by note.
+
+    The reference is the song's own MIDI file, or an uploaded `reference` MIDI
+    file on the song's clock. The band is a `performance` upload (a MIDI file
+    replayed as MIDI input, or a WAV streamed as audio), or the microphone.
+    """
+    session = _get_playback_session(song_id, room)
+    song = song_cache.get(song_id)
+    if reference is None and not (song and Path(song.file_path).suffix.lower() in MIDI_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Song has no MIDI reference; upload one as 'reference'")
+    if session.follower is not None:
+        session.follower.stop()
+        session.follower = None
+
+    reference_path = await _save_follow_upload(reference, ".mid") if reference is not None else None
+    performance_path = await _save_follow_upload(performance, ".wav") if performance is not None else None
+    try:
+        times, pitches = await run_in_threadpool(load_reference, reference_path or song.file_path)
+        follower = ScoreFollower(session, times, pitches)
+        await follower.start(performance_path)
+    except (RuntimeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Failed to start score following: {e}")
+    finally:
+        _remove_follow_uploads(reference_path, performance_path)
+    session.follower = follower
+    source = "live audio" if performance is None else f"uploaded {'MIDI' if follower.midi_input else 'audio'}"
+    return {"message": f"Following {source} against the MIDI reference for {song_id}", "reference_onsets": len(times)}
+
+@app.get("/playback/{song_id}/follow", response_model=dict)
+async def playback_follow_stats_endpoint(song_id: str, room: Room = DEFAULT_ROOM):
+    """Follower health: beat tracker latency, realtime factor, dropped frames and tempo; score position and update latency."""
+    session = _get_playback_session(song_id, room)
+    if session.follower is None:
+        raise HTTPException(status_code=404, detail="Playback is not following audio")
+    return session.follower.stats()
+
+@app.post("/playback/{song_id}/unfollow", response_model=dict)
+async def playback_unfollow_endpoint(song_id: str, room: Room = DEFAULT_ROOM):
+    session = _get_playback_session(song_id, room)
+    if session.follower is not None:
+        session.follower.stop()
+        session.follower = None
+    return session.state()
\ No newline at end of file
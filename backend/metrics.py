@@ -0,0 +1,193 @@
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+# Bucket upper bounds (seconds) for hot-path timings: tens of microseconds to a few seconds
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Bucket upper bounds (seconds) for song processing: a text file to a long recording or a scanned PDF
+PARSE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Value of a callback metric: a number, or {label values: number}
+CallbackValue = Union[float, Dict[Tuple[str, ...], float]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """The child for one combination of label values (created on first use)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._child()
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """A monotonically increasing count."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _child(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, values)} {_number(child.value)}"]
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Per bucket (not cumulative); the last is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    """Observations counted into fixed buckets, for latency distributions.
+
+    Observing is a bisect over the bucket bounds and two additions, cheap enough
+    for per-message paths. Label children are created on first use; keep label
+    values to a small, fixed set (message types, file types), never per client.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def _render_child(self, values, child) -> List[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = 'le="' + _number(bound) + '"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_number(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """A counter or gauge read from existing state when /metrics is scraped, so the
+    hot path pays nothing for it (connection counts, the stats objects already keep)."""
+
+    def __init__(self, name: str, help: str, kind: str, fn: Callable[[], CallbackValue], labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        value = self.fn()
+        samples = value if isinstance(value, dict) else {(): value}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, number in sorted(samples.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, values)} {_number(number)}")
+        return lines
+
+
+class MetricsRegistry:
+    """The process's metrics, rendered in the Prometheus text exposition format (`GET /metrics`).
+
+    Metrics are per process: with several workers, a scrape describes whichever
+    worker answered it.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name: str, help: str, kind: str, fn: Callable[[], CallbackValue], labelnames: Sequence[str] = ()) -> CallbackMetric:
+        """Registers a `counter` or `gauge` whose value `fn` returns at scrape time."""
+        return self._register(CallbackMetric(name, help, kind, fn, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:  # One broken callback shouldn't take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
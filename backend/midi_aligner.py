@@ -1,13 +1,22 @@
-from music21 import converter, stream, note, chord, tempo
 from .timecode_generator import TimecodeData, TimecodeEntry
-from typing import List
-import traceback
+from .midi_reader import MidiFormatError, note_name, read_midi_notes
+from typing import Iterable, List, Optional
+import logging
 
-def process_midi_file(file_path: str) -> TimecodeData:
+logger = logging.getLogger(__name__)
+
+def process_midi_file(file_path: str, tracks: Optional[Iterable[int]] = None, channels: Optional[Iterable[int]] = None) -> TimecodeData:
     """Parses a MIDI file and extracts timecodes for note/rest onsets.
 
+    Onsets are in seconds, following the file's tempo map. Notes starting together
+    (across all tracks) form one entry: "Note: C4" for a single note, "Chord: <lowest
+    note>" otherwise, and "Rest" marks where everything falls silent. Files the
+    streaming reader rejects fall back to music21.
+
     Args:
         file_path: The path to the MIDI file.
+        tracks: Optional 0-based track numbers to take notes from.
+        channels: Optional MIDI channels (0-15) to take notes from.
 
     Returns:
         TimecodeData: An object containing time-aligned entries for notes/rests.
@@ -15,28 +24,63 @@ def process_midi_file(file_path: str) -> TimecodeData:
         Exception: If parsing fails.
     """
     try:
-        score = converter.parse(file_path)
-        timecodes: List[TimecodeEntry] = []
-
-        # Flatten the score to get all notes and rests in sequence
-        # This handles multiple tracks/parts and measures correctly for time offsets
-        for element in score.flat.notesAndRests:
-            if isinstance(element, note.Note):
-                text_content = f"Note: {element.nameWithOctave}"
-            elif isinstance(element, chord.Chord):
-                text_content = f"Chord: {element.root().nameWithOctave}"
-            elif isinstance(element, note.Rest):
-                text_content = "Rest"
-            else:
-                continue # Skip other elements
-
-            timecodes.append(TimecodeEntry(time=element.offset, text=text_content))
-
-        # Sort timecodes by time, as flat.notesAndRests might not always be perfectly ordered
-        timecodes.sort(key=lambda x: x.time)
-
-        return TimecodeData(timecodes=timecodes)
+        try:
+            notes = read_midi_notes(file_path, tracks=tracks, channels=channels)
+        except MidiFormatError as e:
+            logger.info("Streaming reader rejected %s (%s); falling back to music21", file_path, e)
+            return _process_midi_file_music21(file_path)
+        return TimecodeData.model_construct(timecodes=_group_onsets(notes))
     except Exception as e:
-        print(f"Error during MIDI processing for {file_path}:")
-        traceback.print_exc() # Print the full traceback
+        logger.exception("Error during MIDI processing for %s", file_path)
         raise Exception(f"Failed to process MIDI file {file_path}: {e}")
+
+def _group_onsets(notes) -> List[TimecodeEntry]:
+    # Entries are built with model_construct: the values come straight from the reader
+    # and validating one pydantic model per onset dominated the cost on large files.
+    timecodes: List[TimecodeEntry] = []
+    onsets, pitches, rests = notes.onsets, notes.pitches, notes.rests
+    r = 0
+    i = 0
+    n = len(onsets)
+    while i < n:
+        time = onsets[i]
+        while r < len(rests) and rests[r] < time:
+            timecodes.append(TimecodeEntry.model_construct(time=rests[r], text="Rest"))
+            r += 1
+        j = i + 1
+        lowest = pitches[i]
+        while j < n and onsets[j] == time:
+            lowest = min(lowest, pitches[j])
+            j += 1
+        text_content = f"Note: {note_name(lowest)}" if j - i == 1 else f"Chord: {note_name(lowest)}"
+        timecodes.append(TimecodeEntry.model_construct(time=time, text=text_content))
+        i = j
+    for rest in rests[r:]:
+        timecodes.append(TimecodeEntry.model_construct(time=rest, text="Rest"))
+    return timecodes
+
+def _process_midi_file_music21(file_path: str) -> TimecodeData:
+    """Fallback for files the streaming reader can't handle; builds a full music21 score."""
+    from music21 import converter, note, chord
+
+    score = converter.parse(file_path)
+    timecodes: List[TimecodeEntry] = []
+
+    # secondsMap resolves each element's offset through the score's tempo indications
+    for item in score.flatten().secondsMap:
+        element = item["element"]
+        if isinstance(element, note.Note):
+            text_content = f"Note: {element.nameWithOctave}"
+        elif isinstance(element, chord.Chord):
+            text_content = f"Chord: {element.root().nameWithOctave}"
+        elif isinstance(element, note.Rest):
+            text_content = "Rest"
+        else:
+            continue # Skip other elements
+
+        timecodes.append(TimecodeEntry(time=item["offsetSeconds"], text=text_content))
+
+    # Sort timecodes by time, as flat.notesAndRests might not always be perfectly ordered
+    timecodes.sort(key=lambda x: x.time)
+
+    return TimecodeData(timecodes=timecodes)
@@ -0,0 +1,214 @@
+import struct
+from array import array
+from typing import Iterable, Optional, Tuple, Union
+
+DEFAULT_TEMPO = 500000  # Microseconds per quarter note (120 BPM) until the first Set Tempo event
+
+NOTE_NAMES = ['C', 'C#', 'D', 'E-', 'E', 'F', 'F#', 'G', 'G#', 'A', 'B-', 'B']  # music21's default spelling
+
+
+class MidiFormatError(ValueError):
+    """Raised for data that isn't a Standard MIDI File this reader understands."""
+
+
+def note_name(pitch: int) -> str:
+    """MIDI note number to music21-style name with octave (60 -> 'C4')."""
+    return f"{NOTE_NAMES[pitch % 12]}{pitch // 12 - 1}"
+
+
+class MidiNotes:
+    """Note onsets of a MIDI file as parallel compact arrays, sorted by onset.
+
+    `onsets` are in seconds (tempo map applied). `rests` holds the times at which
+    every note has been released and nothing sounds until the next onset.
+    """
+
+    __slots__ = ("onsets", "pitches", "tracks", "channels", "rests", "duration")
+
+    def __init__(self):
+        self.onsets = array('d')
+        self.pitches = array('B')
+        self.tracks = array('H')
+        self.channels = array('B')
+        self.rests = array('d')
+        self.duration = 0.0
+
+    def __len__(self) -> int:
+        return len(self.onsets)
+
+
+def _read_varlen(data, pos: int) -> Tuple[int, int]:
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+
+
+def _iter_chunks(data):
+    """Yields (chunk type, start, end) for each chunk of an SMF byte string."""
+    pos = 0
+    while pos + 8 <= len(data):
+        chunk_type = bytes(data[pos:pos + 4])
+        (length,) = struct.unpack_from(">I", data, pos + 4)
+        start = pos + 8
+        yield chunk_type, start, min(start + length, len(data))
+        pos = start + length
+
+
+def _unwrap_rmid(data):
+    """RIFF-wrapped MIDI (.rmi) carries the SMF in its 'data' sub-chunk."""
+    if data[:4] != b"RIFF" or data[8:12] != b"RMID":
+        return data
+    pos = 12
+    while pos + 8 <= len(data):
+        (length,) = struct.unpack_from("<I", data, pos + 4)
+        if data[pos:pos + 4] == b"data":
+            return data[pos + 8:pos + 8 + length]
+        pos += 8 + length + (length & 1)
+    raise MidiFormatError("RIFF MIDI file has no data chunk")
+
+
+def _scan_track(data, start: int, end: int, track: int, channels: Optional[frozenset],
+                note_events: list, tempos: list):
+    """Walks one MTrk chunk, appending (tick, kind, track, channel, pitch) note events
+    (kind 0 = off, 1 = on, so offs sort first at equal ticks) and (tick, tempo) changes."""
+    pos = start
+    tick = 0
+    status = 0
+    while pos < end:
+        delta, pos = _read_varlen(data, pos)
+        tick += delta
+        byte = data[pos]
+        if byte == 0xFF:  # Meta event
+            meta_type = data[pos + 1]
+            length, pos = _read_varlen(data, pos + 2)
+            if meta_type == 0x51 and length == 3:
+                tempos.append((tick, (data[pos] << 16) | (data[pos + 1] << 8) | data[pos + 2]))
+            elif meta_type == 0x2F:  # End of track
+                break
+            pos += length
+            continue
+        if byte in (0xF0, 0xF7):  # SysEx
+            length, pos = _read_varlen(data, pos + 1)
+            pos += length
+            continue
+        if byte & 0x80:
+            status = byte
+            pos += 1
+        elif not status:
+            raise MidiFormatError(f"Running status without a previous status byte in track {track}")
+        kind = status & 0xF0
+        if kind in (0xC0, 0xD0):  # Program change / channel pressure: one data byte
+            pos += 1
+            continue
+        if kind == 0x90 or kind == 0x80:
+            channel = status & 0x0F
+            if channels is None or channel in channels:
+                pitch, velocity = data[pos], data[pos + 1]
+                note_events.append((tick, 1 if kind == 0x90 and velocity else 0, track, channel, pitch))
+        pos += 2
+
+
+def read_midi_notes(source: Union[str, bytes], tracks: Optional[Iterable[int]] = None,
+                    channels: Optional[Iterable[int]] = None) -> MidiNotes:
+    """Reads note onsets from a Standard MIDI File without building a score model.
+
+    `source` is a path or the file's bytes. `tracks` (0-based MTrk index) and
+    `channels` (0-15) optionally restrict which notes are returned; tempo changes
+    are honoured from every track regardless. Raises MidiFormatError on data that
+    isn't an SMF.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            data = f.read()
+    else:
+        data = source
+    data = memoryview(_unwrap_rmid(data))
+
+    chunks = _iter_chunks(data)
+    header = next(chunks, None)
+    if header is None or header[0] != b"MThd" or header[2] - header[1] < 6:
+        raise MidiFormatError("Missing MThd header")
+    _, track_count, division = struct.unpack_from(">HHH", data, header[1])
+
+    track_filter = frozenset(tracks) if tracks is not None else None
+    channel_filter = frozenset(channels) if channels is not None else None
+    note_events = []
+    tempos = []
+    track = 0
+    try:
+        for chunk_type, start, end in chunks:
+            if chunk_type != b"MTrk":
+                continue  # Unknown chunk types must be skipped
+            # Filtered-out tracks are still scanned for tempo changes, just not for notes
+            wanted = track_filter is None or track in track_filter
+            _scan_track(data, start, end, track, channel_filter, note_events if wanted else [], tempos)
+            track += 1
+    except IndexError:
+        raise MidiFormatError(f"Track {track} is truncated")
+    if track == 0 and track_count:
+        raise MidiFormatError("No MTrk chunks")
+
+    note_events.sort()
+    if division & 0x8000:
+        # SMPTE timing: -frames per second in the high byte, ticks per frame in the low byte
+        fps = 256 - (division >> 8)
+        seconds_per_tick = 1.0 / ((29.97 if fps == 29 else fps) * (division & 0xFF))
+        to_seconds = lambda t: t * seconds_per_tick
+    else:
+        to_seconds = _tempo_map(tempos, division or 480)
+
+    notes = MidiNotes()
+    sounding = {}  # (track, channel, pitch) -> count of notes held
+    active = 0
+    last_release = None
+    for tick, is_on, track, channel, pitch in note_events:
+        key = (track, channel, pitch)
+        if is_on:
+            seconds = to_seconds(tick)
+            if active == 0 and last_release is not None and seconds > last_release:
+                notes.rests.append(last_release)
+            last_release = None
+            notes.onsets.append(seconds)
+            notes.pitches.append(pitch)
+            notes.tracks.append(track)
+            notes.channels.append(channel)
+            sounding[key] = sounding.get(key, 0) + 1
+            active += 1
+        elif sounding.get(key):
+            sounding[key] -= 1
+            active -= 1
+            if active == 0:
+                last_release = to_seconds(tick)
+    if note_events:
+        notes.duration = to_seconds(note_events[-1][0])
+    return notes
+
+
+def _tempo_map(tempos: list, ticks_per_quarter: int):
+    """Returns a tick -> seconds function for ascending ticks, applying each Set Tempo from its tick on."""
+    tempos.sort()
+    segments = [(0, 0.0, DEFAULT_TEMPO)]  # (start tick, seconds at start, microseconds per quarter)
+    for tick, tempo in tempos:
+        start_tick, start_seconds, current = segments[-1]
+        seconds = start_seconds + (tick - start_tick) * current / (ticks_per_quarter * 1e6)
+        if tick == start_tick:
+            segments[-1] = (tick, start_seconds, tempo)
+        else:
+            segments.append((tick, seconds, tempo))
+
+    # Note events are converted in ascending tick order, so walk the segments with a cursor.
+    cursor = [0]
+
+    def to_seconds(tick: int) -> float:
+        i = cursor[0]
+        while i + 1 < len(segments) and segments[i + 1][0] <= tick:
+            i += 1
+        cursor[0] = i
+        start_tick, start_seconds, tempo = segments[i]
+        return start_seconds + (tick - start_tick) * tempo / (ticks_per_quarter * 1e6)
+
+    return to_seconds
@@ -0,0 +1,65 @@
+"""Converts existing songs' `timecode.json` files to the columnar timecode format.
+
+Run from the project root (with the server stopped):
+    python -m backend.migrate_timecodes [--dry-run] [--keep-json]
+
+Each song whose timecode file is JSON gets a `timecodes.lptc` next to it and its
+`timecode_path` pointed at the new file; the JSON file is removed unless
+`--keep-json` is given. Songs already in the columnar format are left alone, so
+the command can be re-run safely. Migration is optional: the JSON files remain
+readable, they just load slower.
+"""
+import argparse
+import os
+
+from .database import SessionLocal, Song, create_tables
+from .timecode_generator import load_timecode_json
+from .timecode_store import TIMECODE_FILENAME, is_columnar, save_timecodes
+
+
+def migrate(dry_run: bool = False, keep_json: bool = False) -> dict:
+    counts = {"migrated": 0, "already_columnar": 0, "missing": 0, "failed": 0}
+    create_tables()
+    db = SessionLocal()
+    try:
+        for song in db.query(Song).filter(Song.timecode_path.isnot(None)).all():
+            json_path = song.timecode_path
+            if not os.path.exists(json_path):
+                counts["missing"] += 1
+                continue
+            if is_columnar(json_path):
+                counts["already_columnar"] += 1
+                continue
+            columnar_path = os.path.join(os.path.dirname(json_path), TIMECODE_FILENAME)
+            print(f"{song.id}: {json_path} -> {columnar_path}")
+            if dry_run:
+                counts["migrated"] += 1
+                continue
+            try:
+                save_timecodes(columnar_path, load_timecode_json(json_path))
+            except Exception as e:
+                print(f"  failed: {e}")
+                counts["failed"] += 1
+                continue
+            song.timecode_path = columnar_path
+            db.commit()
+            if not keep_json and os.path.abspath(json_path) != os.path.abspath(columnar_path):
+                os.remove(json_path)
+            counts["migrated"] += 1
+    finally:
+        db.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert timecode.json files to the columnar timecode format.")
+    parser.add_argument("--dry-run", action="store_true", help="only list the songs that would be converted")
+    parser.add_argument("--keep-json", action="store_true", help="keep the original timecode.json files")
+    args = parser.parse_args()
+    counts = migrate(args.dry_run, args.keep_json)
+    print(", ".join(f"{name.replace('_', ' ')}: {count}" for name, count in counts.items()))
+    raise SystemExit(1 if counts["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
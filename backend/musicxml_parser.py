@@ -1,12 +1,22 @@
-from music21 import converter, stream, note, text
 from .timecode_generator import TimecodeData, TimecodeEntry
-from typing import List
+from .musicxml_reader import MusicXMLFormatError, read_score_lyrics
+from typing import List, Optional
+import zipfile
+import logging
 
-def parse_musicxml(file_path: str) -> TimecodeData:
+logger = logging.getLogger(__name__)
+
+def parse_musicxml(file_path: str, part: Optional[int] = None) -> TimecodeData:
     """Parses a MusicXML file and extracts time-aligned lyrics.
 
+    The score is streamed (`musicxml_reader`), syllables are merged into lines and
+    times are in seconds, with tempo marks and repeats applied. Compressed `.mxl`
+    files are read directly. Documents the streaming reader doesn't handle fall
+    back to music21, which yields one entry per lyric syllable.
+
     Args:
         file_path: The path to the MusicXML file.
+        part: Index of the part to take lyrics from (default: first part with lyrics).
 
     Returns:
         TimecodeData: An object containing time-aligned lyric entries.
@@ -14,28 +24,33 @@ def parse_musicxml(file_path: str) -> TimecodeData:
         Exception: If parsing or lyric extraction fails.
     """
     try:
-        score = converter.parse(file_path)
-        timecodes: List[TimecodeEntry] = []
-
-        # Iterate through all parts in the score
-        for part in score.parts:
-            # Flatten the part to get all notes and rests in sequence
-            # This handles measures and voices correctly for time offsets
-            for element in part.flat.notesAndRests:
-                if isinstance(element, note.Note):
-                    # Check for lyrics associated with the note
-                    if element.lyrics:
-                        # music21 can have multiple lyric objects per note
-                        # We'll concatenate them or take the first one
-                        lyric_text = " ".join([ly.text for ly in element.lyrics])
-                        timecodes.append(TimecodeEntry(time=element.offset, text=lyric_text))
-
-        # Sort timecodes by time, as flat.notesAndRests might not always be perfectly ordered
-        timecodes.sort(key=lambda x: x.time)
-
-        # Optional: Merge consecutive lyrics if they have the same timestamp (e.g., from chords)
-        # For simplicity, we'll keep them separate for now, but this could be a refinement.
-
-        return TimecodeData(timecodes=timecodes)
+        try:
+            score = read_score_lyrics(file_path)
+        except (MusicXMLFormatError, zipfile.BadZipFile) as e:
+            logger.info("Streaming reader rejected %s (%s); falling back to music21", file_path, e)
+            return _parse_musicxml_music21(file_path)
+        return TimecodeData(timecodes=[TimecodeEntry(time=time, text=line) for time, line in score.lines(part)])
     except Exception as e:
-        raise Exception(f"Failed to parse MusicXML file {file_path}: {e}")
\ No newline at end of file
+        raise Exception(f"Failed to parse MusicXML file {file_path}: {e}")
+
+def _parse_musicxml_music21(file_path: str) -> TimecodeData:
+    """Fallback that loads the full score into music21; one entry per lyric syllable."""
+    from music21 import converter, note
+
+    score = converter.parse(file_path)
+    timecodes: List[TimecodeEntry] = []
+
+    # Iterate through all parts in the score
+    for part in score.parts:
+        # secondsMap gives each element's offset in seconds through the part's tempo marks
+        for item in part.flatten().secondsMap:
+            element = item["element"]
+            if isinstance(element, note.NotRest) and element.lyrics:
+                # music21 can have multiple lyric objects per note
+                lyric_text = " ".join([ly.text for ly in element.lyrics])
+                timecodes.append(TimecodeEntry(time=item["offsetSeconds"], text=lyric_text))
+
+    # Sort timecodes by time, as parts are walked one after another
+    timecodes.sort(key=lambda x: x.time)
+
+    return TimecodeData(timecodes=timecodes)
@@ -0,0 +1,380 @@
+import math
+import posixpath
+import re
+import zipfile
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from xml.etree.ElementTree import iterparse
+
+DEFAULT_TEMPO = 120.0  # Quarter notes per minute until the first <sound tempo>
+MAX_UNROLLED_MEASURES = 20000  # Guards against repeat structures that never terminate
+
+# Quarter-note length of each <beat-unit>, for tempos given only as <metronome> marks
+BEAT_UNIT_QUARTERS = {"whole": 4.0, "half": 2.0, "quarter": 1.0, "eighth": 0.5, "16th": 0.25}
+
+# A lyric line ends at a word ending in one of these, at <end-line/>/<end-paragraph/>,
+# before a gap of LINE_GAP_QUARTERS or more, or after MAX_LINE_WORDS words.
+LINE_END_PUNCTUATION = re.compile(r"[,.;:!?]['\")’”]*$")
+LINE_GAP_QUARTERS = 2.0
+MAX_LINE_WORDS = 12
+
+
+# End tags read_score_lyrics acts on; everything else (pitch, type, beams, ...) is skipped
+_HANDLED_END_TAGS = frozenset(("divisions", "note", "backup", "forward", "sound", "metronome", "barline", "measure", "part"))
+
+
+class MusicXMLFormatError(ValueError):
+    """Raised for documents the streaming reader doesn't handle (e.g. score-timewise)."""
+
+
+class LyricSyllable(NamedTuple):
+    measure: int      # Index of the measure within its part (document order, before repeats)
+    offset: float     # Quarter notes from the start of the measure
+    part: int
+    verse: int
+    syllabic: str     # single / begin / middle / end
+    text: str
+    line_end: bool    # <end-line/> or <end-paragraph/>
+
+
+class _Measure:
+    __slots__ = ("duration", "forward_repeat", "backward_times", "endings", "tempos")
+
+    def __init__(self):
+        self.duration = 0.0
+        self.forward_repeat = False
+        self.backward_times = 0
+        self.endings: Optional[frozenset] = None
+        self.tempos: List[Tuple[float, float]] = []  # (offset in quarters, quarter notes per minute)
+
+
+class ScoreLyrics:
+    """Lyric syllables and the measure structure (durations, repeats, tempos) of a score."""
+
+    def __init__(self):
+        self.part_ids: List[str] = []
+        self.measures: List[_Measure] = []
+        self.syllables: List[LyricSyllable] = []
+
+    def verses(self, part: int) -> int:
+        return max((s.verse for s in self.syllables if s.part == part), default=0)
+
+    def playback_order(self, verses: int = 1) -> List[Tuple[int, int]]:
+        """Measure indices in performance order with the pass number each is played on.
+
+        Repeats and first/second endings are unrolled; the pass number picks the
+        verse sung under repeated notes. A score with several verses but no repeat
+        signs is strophic: it is sung through once per verse.
+        """
+        measures = self.measures
+        has_repeats = any(m.backward_times for m in measures)
+        if not has_repeats:
+            return [(i, verse) for verse in range(1, max(1, verses) + 1) for i in range(len(measures))]
+
+        order = []
+        i = 0
+        section_start = 0
+        repeat_pass = 1
+        while i < len(measures) and len(order) < MAX_UNROLLED_MEASURES:
+            measure = measures[i]
+            if measure.forward_repeat and repeat_pass == 1:
+                section_start = i
+            if measure.endings is not None and repeat_pass not in measure.endings:
+                i += 1
+                continue
+            order.append((i, repeat_pass))
+            if measure.backward_times and repeat_pass < measure.backward_times:
+                repeat_pass += 1
+                i = section_start
+                continue
+            if measure.backward_times or (measure.endings is not None and (i + 1 == len(measures) or measures[i + 1].endings is None)):
+                # Left the repeated section (or its last ending)
+                repeat_pass = 1
+                section_start = i + 1
+            i += 1
+        return order
+
+    def lyric_part(self) -> Optional[int]:
+        """The first part that has any lyrics (usually the lead vocal)."""
+        return min((s.part for s in self.syllables), default=None)
+
+    def lines(self, part: Optional[int] = None) -> List[Tuple[float, str]]:
+        """Returns (seconds, line text) for the lyrics of `part` as performed, repeats unrolled."""
+        if part is None:
+            part = self.lyric_part()
+        if part is None:
+            return []
+
+        by_measure: Dict[int, List[LyricSyllable]] = {}
+        for syllable in self.syllables:
+            if syllable.part == part:
+                by_measure.setdefault(syllable.measure, []).append(syllable)
+        for syllables in by_measure.values():
+            syllables.sort(key=lambda s: s.offset)
+
+        to_seconds = _TempoClock()
+        sung = []  # (quarters, syllable)
+        position = 0.0
+        for index, repeat_pass in self.playback_order(self.verses(part)):
+            measure = self.measures[index]
+            for offset, tempo in measure.tempos:
+                to_seconds.set_tempo(position + offset, tempo)
+            chosen = {}
+            for syllable in by_measure.get(index, ()):
+                verses = chosen.setdefault(syllable.offset, {})
+                verses.setdefault(syllable.verse, syllable)
+            for offset in sorted(chosen):
+                verses = chosen[offset]
+                # Sing this pass's verse; a lone lyric (e.g. a refrain) is sung on every pass
+                syllable = verses.get(repeat_pass) or (next(iter(verses.values())) if len(verses) == 1 else None)
+                if syllable is not None:
+                    sung.append((position + offset, syllable))
+            position += measure.duration
+
+        return [(to_seconds(start), text) for start, text in _merge_lines(sung)]
+
+
+class _TempoClock:
+    """Converts unrolled quarter-note positions (ascending) to seconds through a tempo map."""
+
+    def __init__(self):
+        self.changes = [(0.0, 0.0, DEFAULT_TEMPO)]  # (quarters, seconds, tempo)
+
+    def set_tempo(self, quarters: float, tempo: float):
+        start_quarters, start_seconds, current = self.changes[-1]
+        seconds = start_seconds + (quarters - start_quarters) * 60.0 / current
+        if quarters <= start_quarters:
+            self.changes[-1] = (start_quarters, start_seconds, tempo)
+        else:
+            self.changes.append((quarters, seconds, tempo))
+
+    def __call__(self, quarters: float) -> float:
+        lo, hi = 0, len(self.changes) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.changes[mid][0] <= quarters:
+                lo = mid
+            else:
+                hi = mid - 1
+        start_quarters, start_seconds, tempo = self.changes[lo]
+        return start_seconds + (quarters - start_quarters) * 60.0 / tempo
+
+
+def _merge_lines(sung: List[Tuple[float, LyricSyllable]]) -> List[Tuple[float, str]]:
+    """Joins syllables into words (by <syllabic>) and words into lines."""
+    lines = []
+    words: List[str] = []
+    word = ""
+    line_start = None
+    for n, (quarters, syllable) in enumerate(sung):
+        if line_start is None:
+            line_start = quarters
+        word += syllable.text
+        if syllable.syllabic in ("begin", "middle"):
+            continue
+        words.append(word)
+        word = ""
+        next_start = sung[n + 1][0] if n + 1 < len(sung) else None
+        if (syllable.line_end or LINE_END_PUNCTUATION.search(words[-1]) or len(words) >= MAX_LINE_WORDS
+                or next_start is None or next_start - quarters >= LINE_GAP_QUARTERS):
+            lines.append((line_start, " ".join(words)))
+            words = []
+            line_start = None
+    if word:
+        words.append(word)
+    if words:
+        lines.append((line_start, " ".join(words)))
+    return lines
+
+
+def _open_score(path: str):
+    """Returns a binary stream of the score document, unpacking compressed .mxl archives."""
+    if not zipfile.is_zipfile(path):
+        return open(path, "rb")
+    archive = zipfile.ZipFile(path)
+    names = archive.namelist()
+    rootfile = None
+    if "META-INF/container.xml" in names:
+        with archive.open("META-INF/container.xml") as container:
+            for _, element in iterparse(container):
+                if element.tag.rsplit("}", 1)[-1] == "rootfile" and element.get("full-path"):
+                    rootfile = element.get("full-path")
+                    break
+    if rootfile is None:
+        rootfile = next((n for n in names if not n.startswith("META-INF/") and n.lower().endswith((".xml", ".musicxml"))), None)
+    if rootfile is None:
+        archive.close()
+        raise MusicXMLFormatError("Compressed MusicXML archive contains no score")
+    return _ArchiveMember(archive, posixpath.normpath(rootfile))
+
+
+class _ArchiveMember:
+    """A zip member stream that closes its archive along with itself."""
+
+    def __init__(self, archive: zipfile.ZipFile, name: str):
+        self._archive = archive
+        self._stream = archive.open(name)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._stream.read(size)
+
+    def close(self):
+        self._stream.close()
+        self._archive.close()
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1] if "}" in tag else tag
+
+
+def _number(element, name: str, default: float = 0.0) -> float:
+    child = element.find(name)
+    try:
+        return float(child.text) if child is not None and child.text else default
+    except ValueError:
+        return default
+
+
+def _attribute_number(element, name: str, default: float = 0.0) -> float:
+    try:
+        value = float(element.get(name, default))
+    except ValueError:
+        return default
+    return value if math.isfinite(value) else default
+
+
+def read_score_lyrics(path: str) -> ScoreLyrics:
+    """Streams a MusicXML (.xml/.musicxml/.mxl) score and collects its lyrics and structure.
+
+    Each measure is processed when its end tag is parsed and then discarded, so
+    memory stays flat however large the score is; only lyric syllables and a few
+    numbers per measure are kept.
+    """
+    score = ScoreLyrics()
+    stream = _open_score(path)
+    try:
+        part_index = -1
+        part_element = None
+        measure_index = 0
+        divisions = 1.0
+        cursor = 0.0
+        measure_end = 0.0
+        last_onset = 0.0
+        active_endings: Optional[frozenset] = None
+        root_checked = False
+        for event, element in iterparse(stream, events=("start", "end")):
+            tag = element.tag
+            if tag[0] == "{":
+                tag = _local(tag)
+            if event == "end" and tag not in _HANDLED_END_TAGS:
+                continue
+            if event == "start":
+                if not root_checked:
+                    root_checked = True
+                    if tag != "score-partwise":
+                        raise MusicXMLFormatError(f"Unsupported MusicXML root element <{tag}>")
+                if tag == "part":
+                    part_index += 1
+                    part_element = element
+                    score.part_ids.append(element.get("id", str(part_index)))
+                    measure_index = 0
+                    divisions = 1.0
+                    active_endings = None
+                elif tag == "measure":
+                    cursor = measure_end = 0.0
+                    if part_index == 0:
+                        score.measures.append(_Measure())
+                        if active_endings is not None:
+                            score.measures[-1].endings = active_endings
+                continue
+
+            if tag == "divisions":
+                divisions = float(element.text or 1) or 1.0
+            elif tag == "note":
+                duration = _number(element, "duration") / divisions
+                if element.find("chord") is not None:
+                    onset = last_onset
+                else:
+                    onset = last_onset = cursor
+                    if element.find("grace") is None:
+                        cursor += duration
+                        measure_end = max(measure_end, cursor)
+                for verse, lyric in enumerate(element.iterfind("lyric"), start=1):
+                    syllable = _lyric_syllable(lyric, verse)
+                    if syllable is not None:
+                        score.syllables.append(LyricSyllable(measure_index, onset, part_index, *syllable))
+            elif tag == "backup":
+                cursor -= _number(element, "duration") / divisions
+            elif tag == "forward":
+                cursor += _number(element, "duration") / divisions
+                measure_end = max(measure_end, cursor)
+            elif tag == "sound" and element.get("tempo"):
+                # An empty or unparseable tempo is ignored (_add_tempo skips anything not above zero)
+                _add_tempo(score, measure_index, cursor, _attribute_number(element, "tempo"))
+            elif tag == "metronome":
+                per_minute = _number(element, "per-minute")
+                unit = BEAT_UNIT_QUARTERS.get((element.findtext("beat-unit") or "quarter").strip())
+                if per_minute and unit:
+                    if element.find("beat-unit-dot") is not None:
+                        unit *= 1.5
+                    _add_tempo(score, measure_index, cursor, per_minute * unit, explicit=False)
+            elif tag == "barline" and part_index == 0:
+                measure = score.measures[measure_index]
+                repeat = element.find("repeat")
+                if repeat is not None:
+                    if repeat.get("direction") == "forward":
+                        measure.forward_repeat = True
+                    else:
+                        measure.backward_times = max(2, int(_attribute_number(repeat, "times", 2)))
+                ending = element.find("ending")
+                if ending is not None:
+                    numbers = frozenset(int(n) for n in re.findall(r"\d+", ending.get("number", "")))
+                    if ending.get("type") == "start":
+                        active_endings = numbers
+                        measure.endings = numbers
+                    else:  # stop / discontinue: this is the ending's last measure
+                        active_endings = None
+            elif tag == "measure":
+                if measure_index < len(score.measures):
+                    target = score.measures[measure_index]
+                    target.duration = max(target.duration, measure_end)
+                measure_index += 1
+                # Done with this measure: drop it (and everything under it) from the tree
+                part_element.clear()
+            elif tag == "part":
+                element.clear()
+    finally:
+        stream.close()
+    return score
+
+
+def _add_tempo(score: ScoreLyrics, measure_index: int, offset: float, tempo: float, explicit: bool = True):
+    if measure_index >= len(score.measures) or tempo <= 0:
+        return
+    tempos = score.measures[measure_index].tempos
+    for n, (existing_offset, _) in enumerate(tempos):
+        if abs(existing_offset - offset) < 1e-9:
+            # The same mark is usually repeated in every part, or given both as
+            # <sound tempo> and <metronome>; <sound tempo> is authoritative.
+            if explicit:
+                tempos[n] = (offset, tempo)
+            return
+    tempos.append((offset, tempo))
+    tempos.sort()
+
+
+def _lyric_syllable(lyric, default_verse: int):
+    texts = []
+    for child in lyric:
+        name = _local(child.tag)
+        if name == "text" and child.text:
+            texts.append(child.text)
+        elif name == "elision" and texts:
+            texts.append(" ")
+    text = "".join(texts).strip()
+    if not text:
+        return None
+    number = lyric.get("number", "")
+    verse = int(number) if number.isdigit() else default_verse
+    syllabic = (lyric.findtext("syllabic") or "single").strip()
+    line_end = lyric.find("end-line") is not None or lyric.find("end-paragraph") is not None
+    return verse, syllabic, text, line_end
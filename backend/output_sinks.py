@@ -0,0 +1,389 @@
+import asyncio
+import errno
+import json
+import logging
+import os
+import stat
+import struct
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from pydantic import BaseModel, Field
+
+from .backplane import Backplane, backplane
+from .clock_sync import server_time
+from .config import DEFAULT_ROOM, OUTPUT_DEVICE_DIRS, OUTPUT_MAX_BUFFER_BYTES
+from .metrics import metrics
+from .trigger_interface import LatencyRecorder, TriggerInterface, trigger_interface, valid_room
+
+logger = logging.getLogger(__name__)
+
+# Playback events an output sink can be sent
+OUTPUT_EVENTS = ("song_start", "lyric_update", "playback_state")
+
+
+class OutputConfig(BaseModel):
+    """One external output: an OSC or MIDI sink fed with one room's playback events."""
+    name: str
+    type: str  # "osc" or "midi"
+    # udp://host:port (OSC, or raw MIDI bytes per datagram as network MIDI bridges take them), or a MIDI device path
+    target: str
+    room: str = DEFAULT_ROOM
+    events: List[str] = ["song_start", "lyric_update"]
+    address_prefix: str = "/lyricpilot"  # OSC
+    channel: int = Field(1, ge=1, le=16)  # MIDI
+    note_base: int = Field(0, ge=0, le=127)  # MIDI: line i is note note_base + i
+    velocity: int = Field(127, ge=1, le=127)
+    programs: Dict[str, int] = {}  # MIDI: song id -> program change sent on song_start
+
+
+# --- OSC 1.0 encoding ---
+def _osc_string(value: str) -> bytes:
+    data = value.encode("utf-8") + b"\0"
+    return data + b"\0" * (-len(data) % 4)
+
+
+def encode_osc_message(address: str, *args) -> bytes:
+    """An OSC message; arguments are int (i), float (f) or str (s, None as "")."""
+    tags, data = ",", []
+    for arg in args:
+        if isinstance(arg, bool) or isinstance(arg, int):
+            tags += "i"
+            data.append(struct.pack(">i", int(arg)))
+        elif isinstance(arg, float):
+            tags += "f"
+            data.append(struct.pack(">f", arg))
+        else:
+            tags += "s"
+            data.append(_osc_string("" if arg is None else str(arg)))
+    return b"".join([_osc_string(address), _osc_string(tags), *data])
+
+
+def decode_osc_message(packet: bytes) -> Tuple[str, list]:
+    """Parses an OSC message built by `encode_osc_message` (for listeners and tests)."""
+    def string(offset):
+        end = packet.index(b"\0", offset)
+        return packet[offset:end].decode("utf-8"), end + 1 + (-(end + 1 - offset) % 4)
+    address, offset = string(0)
+    tags, offset = string(offset)
+    args = []
+    for tag in tags[1:]:
+        if tag == "i":
+            args.append(struct.unpack_from(">i", packet, offset)[0])
+            offset += 4
+        elif tag == "f":
+            args.append(struct.unpack_from(">f", packet, offset)[0])
+            offset += 4
+        else:
+            value, offset = string(offset)
+            args.append(value)
+    return address, args
+
+
+# --- Transports: every write returns at once ---
+class UdpTransport:
+    """Datagrams to host:port. sendto never blocks; if the socket buffer is full, asyncio
+    queues the datagram, and beyond OUTPUT_MAX_BUFFER_BYTES queued the packet is dropped."""
+
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self._transport: Optional[asyncio.DatagramTransport] = None
+
+    async def open(self):
+        try:
+            self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                asyncio.DatagramProtocol, remote_addr=(self.host, self.port))
+        except OSError as e:  # Including an unresolvable host (socket.gaierror)
+            raise ValueError(f"Cannot reach udp://{self.host}:{self.port}: {e.strerror or e}")
+
+    def write(self, packets: Sequence[bytes]) -> bool:
+        if self._transport is None or self._transport.get_write_buffer_size() > OUTPUT_MAX_BUFFER_BYTES:
+            return False
+        for packet in packets:
+            self._transport.sendto(packet)
+        return True
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+
+class DeviceTransport:
+    """Raw bytes to a character device or FIFO (e.g. an ALSA raw MIDI port, /dev/snd/midiC1D0),
+    opened non-blocking: a write that would block is dropped instead.
+
+    The path must resolve into one of OUTPUT_DEVICE_DIRS, and anything but a
+    character device or FIFO is refused, so an output can never overwrite a file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    async def open(self):
+        resolved = os.path.realpath(self.path)
+        if not any(os.path.commonpath([resolved, allowed]) == allowed for allowed in OUTPUT_DEVICE_DIRS):
+            raise ValueError(f"{self.path} is not in an output device directory ({os.pathsep.join(OUTPUT_DEVICE_DIRS)})")
+        try:
+            fd = os.open(resolved, os.O_WRONLY | os.O_NONBLOCK | os.O_NOCTTY)
+        except OSError as e:
+            raise ValueError(f"Cannot open {self.path}: {e.strerror}")
+        mode = os.fstat(fd).st_mode
+        if not (stat.S_ISCHR(mode) or stat.S_ISFIFO(mode)):
+            os.close(fd)
+            raise ValueError(f"{self.path} is not a character device or FIFO")
+        self._fd = fd
+
+    def write(self, packets: Sequence[bytes]) -> bool:
+        if self._fd is None:
+            return False
+        data = b"".join(packets)
+        try:
+            return os.write(self._fd, data) == len(data)
+        except BlockingIOError:
+            return False
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def open_transport(target: str):
+    if target.startswith("udp://"):
+        url = urlparse(target)
+        if not url.hostname or not url.port:
+            raise ValueError(f"Expected udp://host:port, got '{target}'")
+        return UdpTransport(url.hostname, url.port)
+    if target.startswith("/"):
+        return DeviceTransport(target)
+    raise ValueError(f"Unknown output target '{target}' (expected udp://host:port or a device path)")
+
+
+# --- Sinks ---
+class OutputSink:
+    """An external output for one room's playback events.
+
+    `encode` turns an event into the packets to send (none: nothing to send),
+    ahead of time; `write` puts them on the wire without waiting. Stats: how late
+    packets left against the event's `at`, and how long each write took.
+    """
+
+    def __init__(self, config: OutputConfig):
+        if not valid_room(config.room):
+            raise ValueError(f"Invalid room name '{config.room}'")
+        unknown = set(config.events) - set(OUTPUT_EVENTS)
+        if unknown:
+            raise ValueError(f"Unknown output events: {', '.join(sorted(unknown))}")
+        self.config = config
+        self.name = config.name
+        self.room = config.room
+        self.events = frozenset(config.events)
+        self.transport = open_transport(config.target)
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self.lateness = LatencyRecorder()
+        self.write_time = LatencyRecorder()
+
+    def encode(self, message_type: str, data: dict) -> List[bytes]:
+        raise NotImplementedError
+
+    def write(self, packets: Sequence[bytes], at: Optional[float]):
+        start = time.perf_counter()
+        try:
+            written = self.transport.write(packets)
+        except OSError as e:
+            self.errors += 1
+            if e.errno not in (errno.ECONNREFUSED, errno.EPIPE):  # Nobody listening (yet); not worth a log line each time
+                logger.warning("Output %s: write failed: %s", self.name, e)
+            return
+        self.write_time.record(time.perf_counter() - start)
+        if not written:
+            self.dropped += 1
+            return
+        self.sent += 1
+        if at is not None:
+            self.lateness.record(max(0.0, server_time() - at))
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name, "type": self.config.type, "target": self.config.target, "room": self.room,
+            "events": sorted(self.events), "sent": self.sent, "dropped": self.dropped, "errors": self.errors,
+            "lateness": self.lateness.summary(), "write_time": self.write_time.summary(),
+        }
+
+
+class OscSink(OutputSink):
+    """OSC over UDP (e.g. ProPresenter, QLab, lighting desks):
+
+    song_start      <prefix>/song  ,ss  song_id title
+    lyric_update    <prefix>/line  ,iss line_index current_lyric next_lyric
+    playback_state  <prefix>/state ,sif song_id playing position
+    """
+
+    def encode(self, message_type: str, data: dict) -> List[bytes]:
+        prefix = self.config.address_prefix
+        if message_type == "song_start":
+            return [encode_osc_message(f"{prefix}/song", data.get("song_id"), data.get("title"))]
+        if message_type == "lyric_update":
+            upcoming = data.get("next_lyrics") or [None]
+            return [encode_osc_message(f"{prefix}/line", data.get("line_index", -1), data.get("current_lyric"), upcoming[0])]
+        if message_type == "playback_state":
+            return [encode_osc_message(f"{prefix}/state", data.get("song_id"), bool(data.get("playing")), float(data.get("position") or 0.0))]
+        return []
+
+
+class MidiSink(OutputSink):
+    """MIDI messages as raw bytes: a line change is a note (on, then off) whose number is
+    `note_base` plus the line index; a song start is the program change mapped to the
+    song in `programs`, if any. Lines past note 127, and unmapped songs, send nothing.
+    """
+
+    def encode(self, message_type: str, data: dict) -> List[bytes]:
+        channel = self.config.channel - 1
+        if message_type == "lyric_update":
+            line = data.get("line_index")
+            note = self.config.note_base + line if line is not None and line >= 0 else None
+            if note is None or note > 127:
+                return []
+            return [bytes((0x90 | channel, note, self.config.velocity, 0x80 | channel, note, 0))]
+        if message_type == "song_start":
+            program = self.config.programs.get(data.get("song_id"))
+            return [bytes((0xC0 | channel, program & 0x7F))] if program is not None else []
+        return []
+
+
+SINK_TYPES = {"osc": OscSink, "midi": MidiSink}
+
+
+class OutputRouter:
+    """Sends playback events to the room's displays and to every external output sink.
+
+    Each event is encoded for every sink that takes it as soon as it is
+    dispatched; then a single event-loop timer at the event's `at` (the moment
+    displays apply it, PLAYBACK_DISPATCH_AHEAD after the engine dispatches it)
+    writes all of them, back to back, since OSC and MIDI receivers act on arrival.
+    Events without `at` (or already due) are written at once. Writes never wait,
+    so a stalled sink drops its packets without holding up the others or the
+    displays.
+
+    With a shared `backplane`, outputs added or removed with `publish` are
+    applied on every worker too, since a room's session may run on any of them;
+    each worker writes only the events of the sessions it runs. A worker that
+    starts later takes the running workers' outputs with `sync`.
+    """
+
+    def __init__(self, interface: TriggerInterface, backplane: Optional[Backplane] = None):
+        self.interface = interface
+        self.sinks: Dict[str, OutputSink] = {}
+        self._backplane = backplane
+
+    async def add(self, config: OutputConfig, publish: bool = False) -> OutputSink:
+        sink_type = SINK_TYPES.get(config.type)
+        if sink_type is None:
+            raise ValueError(f"Unknown output type '{config.type}' (expected one of: {', '.join(SINK_TYPES)})")
+        sink = sink_type(config)
+        await sink.transport.open()
+        self.remove(config.name)
+        self.sinks[config.name] = sink
+        if publish and self._backplane is not None:
+            self._backplane.publish("outputs", {"config": config.model_dump()})
+        return sink
+
+    def remove(self, name: str, publish: bool = False) -> bool:
+        sink = self.sinks.pop(name, None)
+        if sink is not None:
+            sink.transport.close()
+        if publish and self._backplane is not None:
+            self._backplane.publish("outputs", {"name": name})
+        return sink is not None
+
+    async def on_outputs_elsewhere(self, header: dict, payloads: List[str]):
+        """Applies an output another worker added or removed."""
+        if "config" not in header:
+            self.remove(header["name"])
+            return
+        try:
+            await self.add(OutputConfig(**header["config"]))
+        except ValueError as e:
+            logger.warning("Output %r added on worker %s can't be opened here: %s", header["config"].get("name"), header.get("from"), e)
+
+    async def answer_sync(self, header: dict, payloads: List[str]) -> dict:
+        return {"configs": [sink.config.model_dump() for sink in self.sinks.values()]}
+
+    async def sync(self):
+        """Replaces this worker's outputs with those of the running workers, if there are any."""
+        if self._backplane is None or not self._backplane.peers:
+            return
+        reply = await self._backplane.request("outputs_sync", {})
+        if reply is None:
+            return
+        configs = {config["name"]: config for config in reply["configs"]}
+        for name in list(self.sinks):
+            if name not in configs:
+                self.remove(name)
+        for config in configs.values():
+            await self.on_outputs_elsewhere({"config": config}, [])
+
+    async def load(self, path: str):
+        """Adds the outputs listed in a JSON file (a list of OutputConfig objects)."""
+        with open(path, encoding="utf-8") as f:
+            configs = json.load(f)
+        for config in configs:
+            try:
+                await self.add(OutputConfig(**config))
+            except (ValueError, TypeError) as e:
+                logger.warning("Skipping output %r from %s: %s", config.get("name"), path, e)
+
+    def close(self):
+        for name in list(self.sinks):
+            self.remove(name)
+
+    def dispatch(self, message_type: str, data: dict, room: Optional[str] = DEFAULT_ROOM):
+        """Encodes an event for the sinks that take it and schedules their writes at `data['at']`."""
+        batch = []
+        for sink in self.sinks.values():
+            if message_type in sink.events and (room is None or sink.room == room):
+                packets = sink.encode(message_type, data)
+                if packets:
+                    batch.append((sink, packets))
+        if not batch:
+            return
+        at = data.get("at")
+        delay = at - server_time() if at is not None else 0.0
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._write, batch, at)
+        else:
+            self._write(batch, at)
+
+    @staticmethod
+    def _write(batch, at: Optional[float]):
+        for sink, packets in batch:
+            sink.write(packets, at)
+
+    async def send_message(self, message_type: str, data: dict, room: Optional[str] = None, text: Optional[str] = None):
+        """`TriggerInterface.send_message`, plus the external sinks."""
+        self.dispatch(message_type, data, room)
+        await self.interface.send_message(message_type, data, room, text)
+
+    def stats(self) -> List[dict]:
+        return [sink.stats() for sink in self.sinks.values()]
+
+
+outputs = OutputRouter(trigger_interface, backplane)
+backplane.on("outputs", outputs.on_outputs_elsewhere)
+backplane.on("outputs_sync", outputs.answer_sync)
+
+
+def _output_packets() -> dict:
+    samples = {}
+    for name, sink in outputs.sinks.items():
+        samples.update({(name, "sent"): sink.sent, (name, "dropped"): sink.dropped, (name, "error"): sink.errors})
+    return samples
+
+
+metrics.callback("lyricpilot_output_packets_total", "Writes to external outputs, by result", "counter",
+                 _output_packets, ("output", "result"))
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import BinaryIO, Dict, List, Optional
+
+from .config import PARSE_CACHE_DIR, PARSE_CACHE_MAX_BYTES
+from .metrics import metrics
+
+# Part of every cache key: bump whenever a parser's output for the same input changes,
+# so artifacts produced by the old code are never served again.
+PARSER_VERSION = 5
+
+_COPY_CHUNK = 1024 * 1024
+
+
+def copy_and_hash(stream: BinaryIO, dest_path: str) -> str:
+    """Copies `stream` to `dest_path` and returns the SHA-256 hex digest of the bytes, in one pass."""
+    digest = hashlib.sha256()
+    with open(dest_path, "wb") as out:
+        while True:
+            chunk = stream.read(_COPY_CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(file_digest: str, extension: str, bpm: Optional[float] = None, measures_per_section: Optional[int] = None,
+              beats_per_measure: Optional[int] = None, companion_digest: Optional[str] = None) -> str:
+    """Key for the timecodes parsed from one file with the given processing parameters."""
+    params = {
+        "parser_version": PARSER_VERSION,
+        "file": file_digest,
+        "extension": extension.lower(),
+        "companion": companion_digest,
+        "bpm": float(bpm) if bpm is not None else None,
+        "measures_per_section": measures_per_section,
+        "beats_per_measure": beats_per_measure,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def _link_or_copy(src: str, dest: str):
+    """Hard-links `src` to `dest` (replacing it), falling back to a copy across filesystems."""
+    tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+
+class ParseCache:
+    """Content-addressed store of parse results and raw uploads under `data/parse_cache/`.
+
+    `artifacts/` holds columnar timecode files keyed by `cache_key` (hash of the
+    upload's bytes, parser version and parameters); `blobs/` holds raw uploads
+    keyed by their SHA-256. Songs share these files through hard links: a song's
+    `raw/<file>` and `timecodes.lptc` are links to the cached copy, so identical
+    uploads occupy disk once and a cache hit needs no parsing at all.
+
+    The link count doubles as a reference count. Only files no song links to any
+    more count against `max_bytes`, and those are evicted least recently used
+    first; files still in use by a song cost nothing extra to keep.
+
+    Sizes, access times and link counts are kept in an index with running byte
+    totals, updated as files are stored, touched and removed, so a store within
+    budget does no directory walk. The index is built by walking the cache once
+    (`rescan`, at startup) and rebuilt when songs are deleted, since removing a
+    song's links changes counts behind the index's back. Only server processes
+    store (job queue workers return their results instead), so the index sees
+    every file this process adds; with several server workers, files another
+    worker added are picked up at the next rescan.
+    """
+
+    def __init__(self, root: str = PARSE_CACHE_DIR, max_bytes: int = PARSE_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.artifacts_dir = os.path.join(root, "artifacts")
+        self.blobs_dir = os.path.join(root, "blobs")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.raw_dedupes = 0
+        self.raw_bytes_saved = 0
+        self._files: Optional[Dict[str, List[int]]] = None  # Path -> [atime_ns, size, link count]
+        self._bytes = 0
+        self._unreferenced_bytes = 0
+
+    def _artifact_path(self, key: str) -> str:
+        return os.path.join(self.artifacts_dir, key[:2], f"{key}.lptc")
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blobs_dir, digest[:2], digest)
+
+    @staticmethod
+    def _touch(path: str):
+        # Recency is tracked in atime so the shared mtime (which the timecode cache validates against) never changes
+        st = os.stat(path)
+        os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+
+    def restore(self, key: str, timecode_path: str) -> bool:
+        """On a hit, links the cached timecodes to `timecode_path` and returns True."""
+        artifact = self._artifact_path(key)
+        try:
+            self._touch(artifact)
+            _link_or_copy(artifact, timecode_path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            self._note(artifact)  # Gone: evicted by another process
+            return False
+        with self._lock:
+            self.hits += 1
+        self._note(artifact)
+        return True
+
+    def store(self, key: str, timecode_path: str):
+        """Adds a freshly generated timecode file to the cache under `key`."""
+        artifact = self._artifact_path(key)
+        os.makedirs(os.path.dirname(artifact), exist_ok=True)
+        _link_or_copy(timecode_path, artifact)
+        self._note(artifact)
+        self.evict()
+
+    def store_raw(self, path: str, digest: str, evict: bool = True):
+        """Dedupes an uploaded raw file: replaces it with a link to an identical blob, or adds it as the blob.
+
+        Batches pass `evict=False` and call `evict` once at the end.
+        """
+        blob = self._blob_path(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            if os.path.exists(blob):
+                size = os.path.getsize(path)
+                _link_or_copy(blob, path)
+                self._touch(blob)
+                with self._lock:
+                    self.raw_dedupes += 1
+                    self.raw_bytes_saved += size
+            else:
+                os.link(path, blob)
+        except OSError:
+            pass  # No hard links here (e.g. the cache is on another filesystem): keep the private copy
+        self._note(blob)
+        if evict:
+            self.evict()
+
+    def _scan(self):
+        """Yields (atime_ns, size, link count, path) for every cached file."""
+        for base in (self.artifacts_dir, self.blobs_dir):
+            for dirpath, _, filenames in os.walk(base):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue  # Evicted concurrently by another worker
+                    yield st.st_atime_ns, st.st_size, st.st_nlink, path
+
+    def rescan(self):
+        """Rebuilds the index from disk: one walk of the whole cache."""
+        files = {path: [atime_ns, size, nlink] for atime_ns, size, nlink, path in self._scan()}
+        with self._lock:
+            self._files = files
+            self._bytes = sum(entry[1] for entry in files.values())
+            self._unreferenced_bytes = sum(entry[1] for entry in files.values() if entry[2] <= 1)
+
+    def _index(self) -> Dict[str, List[int]]:
+        if self._files is None:
+            self.rescan()
+        return self._files
+
+    def _note(self, path: str):
+        """Brings the index entry for `path` up to date with the file (or its absence)."""
+        files = self._index()
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            st = None
+        with self._lock:
+            old = files.pop(path, None)
+            if old is not None:
+                self._bytes -= old[1]
+                if old[2] <= 1:
+                    self._unreferenced_bytes -= old[1]
+            if st is not None:
+                files[path] = [st.st_atime_ns, st.st_size, st.st_nlink]
+                self._bytes += st.st_size
+                if st.st_nlink <= 1:
+                    self._unreferenced_bytes += st.st_size
+
+    def evict(self, rescan: bool = False):
+        """Removes least recently used unreferenced files until they fit in `max_bytes`.
+
+        Works from the index, so within budget it returns at once. With `rescan`
+        (after songs were deleted) the index is rebuilt from disk first.
+        """
+        if rescan:
+            self.rescan()
+        files = self._index()
+        with self._lock:
+            if self._unreferenced_bytes <= self.max_bytes:
+                return
+            candidates = sorted((entry[0], path) for path, entry in files.items() if entry[2] <= 1)
+        for _, path in candidates:
+            with self._lock:
+                if self._unreferenced_bytes <= self.max_bytes:
+                    break
+            try:
+                if os.stat(path).st_nlink <= 1:  # Another process may have linked it to a song since
+                    os.remove(path)
+                    with self._lock:
+                        self.evictions += 1
+            except FileNotFoundError:
+                pass
+            self._note(path)
+
+    def stats(self) -> Dict[str, float]:
+        files = self._index()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "artifacts": sum(1 for path in files if path.startswith(self.artifacts_dir)),
+                "blobs": sum(1 for path in files if path.startswith(self.blobs_dir)),
+                "bytes": self._bytes,
+                "unreferenced_bytes": self._unreferenced_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "raw_dedupes": self.raw_dedupes,
+                "raw_bytes_saved": self.raw_bytes_saved,
+            }
+
+
+parse_cache = ParseCache()
+metrics.callback("lyricpilot_parse_cache_lookups_total", "Parse cache lookups", "counter",
+                 lambda: {("hit",): parse_cache.hits, ("miss",): parse_cache.misses}, ("result",))
@@ -0,0 +1,68 @@
+import asyncio
+import math
+import os
+import logging
+from typing import Optional
+
+from .config import PDF_MIN_PAGES_PER_TASK
+from .job_queue import job_queue, ocr_queue
+from .pdf_parser import PAGE_BREAK, extract_pages, ocr_page, parse_song_structure, pdf_page_count
+from .structure_timecode_generator import generate_timecodes_from_structure
+from .timecode_store import TIMECODE_FILENAME, save_timecodes
+
+logger = logging.getLogger(__name__)
+
+
+async def ingest_pdf(song_id: str, saved_file_path: str, bpm: Optional[float] = None, measures_per_section: Optional[int] = None,
+                     beats_per_measure: Optional[int] = None) -> str:
+    """Turns a PDF chart into the song's timecode file; the PDF counterpart of `process_song_file`.
+
+    The text layer is extracted in page chunks, one per job queue worker (of at
+    least PDF_MIN_PAGES_PER_TASK pages), in parallel. Image-only pages (scans) are
+    OCRed on the separate, low-priority OCR queue, so a scanned songbook waits its
+    turn there while text PDFs keep going through the job queue. Parsing the chart
+    and writing its timecodes is one more job queue task. A scanned page OCR can't
+    read is left out, unless no page has any text.
+
+    Returns the timecode path; raises if the chart can't be processed.
+    """
+    song_dir = os.path.dirname(os.path.dirname(saved_file_path))
+    timecode_path = os.path.join(song_dir, TIMECODE_FILENAME)
+    file_name = os.path.basename(saved_file_path)
+    try:
+        page_count = await job_queue.run(pdf_page_count, saved_file_path)
+        chunk = max(PDF_MIN_PAGES_PER_TASK, math.ceil(page_count / job_queue.max_workers))
+        chunks = await asyncio.gather(*(job_queue.run(extract_pages, saved_file_path, start, start + chunk)
+                                        for start in range(0, page_count, chunk)))
+        pages = [page for chunk in chunks for page in chunk]
+
+        scanned = [page.number for page in pages if page.needs_ocr]
+        if scanned:
+            logger.info("%s: OCR of %d of %d pages queued", file_name, len(scanned), page_count)
+            await job_queue.publish(song_id, "running", ocr_pages=len(scanned))
+            recognized = await asyncio.gather(*(ocr_queue.run(ocr_page, saved_file_path, number) for number in scanned),
+                                              return_exceptions=True)
+            failed = [result for result in recognized if isinstance(result, Exception)]
+            for result in failed:
+                logger.warning("%s: %s; page left out", file_name, result)
+            by_number = {result.number: result for result in recognized if not isinstance(result, Exception)}
+            pages = [by_number.get(page.number, page) for page in pages]
+
+        text = PAGE_BREAK.join(page.text for page in pages)
+        if not text.strip():
+            raise failed[0] if scanned and failed else ValueError("The PDF has no text")
+        await job_queue.run(build_chart_timecodes, text, timecode_path, bpm, measures_per_section, beats_per_measure)
+    except Exception as e:
+        logger.exception("Error processing file %s", file_name)
+        if os.path.exists(timecode_path):
+            os.remove(timecode_path)
+        raise Exception(f"Failed to process uploaded file: {e}")
+    return timecode_path
+
+
+def build_chart_timecodes(text: str, timecode_path: str, bpm: Optional[float] = None, measures_per_section: Optional[int] = None,
+                          beats_per_measure: Optional[int] = None) -> str:
+    """Parses a chart's extracted text and writes its timecodes. Runs in a job queue worker."""
+    structure = parse_song_structure(text)
+    save_timecodes(timecode_path, generate_timecodes_from_structure(structure, bpm, measures_per_section, beats_per_measure))
+    return timecode_path
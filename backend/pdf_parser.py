@@ -0,0 +1,230 @@
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+from .config import OCR_DPI, OCR_LANGUAGE
+
+# Pages are joined with a form feed in the extracted text, so the structure
+# parser can tell page breaks (and the running headers/footers around them) apart.
+PAGE_BREAK = "\f"
+
+
+class PdfPage(NamedTuple):
+    """The text of one page; `needs_ocr` marks a page with images but no text layer (a scan)."""
+    number: int  # 0-based
+    text: str
+    needs_ocr: bool
+
+
+class ChartSection(NamedTuple):
+    label: str  # "Verse 1", "Chorus", ...; "" for a stanza without a header
+    lines: Tuple[str, ...]  # Lyric lines, with line-level repeats ("x2") already written out
+    repeat: int  # Times the section is played at this point in the chart
+
+
+class ChartStructure(NamedTuple):
+    sections: List[ChartSection]
+    bpm: Optional[float]  # Tempo printed on the chart ("Tempo - 72", "BPM: 72"), if any
+    beats_per_measure: Optional[int]  # Numerator of a printed time signature ("Time - 3/4"), if any
+
+
+def _open(path: str):
+    try:
+        import pymupdf
+    except ImportError:
+        raise ValueError("PDF processing requires the PyMuPDF package (pip install pymupdf)")
+    try:
+        return pymupdf.open(path, filetype="pdf")
+    except Exception as e:
+        raise ValueError(f"Not a readable PDF: {e}")
+
+
+def pdf_page_count(path: str) -> int:
+    with _open(path) as doc:
+        return doc.page_count
+
+
+def extract_pages(path: str, start: int = 0, stop: Optional[int] = None) -> List[PdfPage]:
+    """Extracts the text layer of pages [start, stop). Runs in a job queue worker, one
+    call per chunk of pages; pages that need OCR come back empty and flagged."""
+    with _open(path) as doc:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        pages = []
+        for number in range(start, stop):
+            page = doc[number]
+            text = _page_text(page)
+            pages.append(PdfPage(number, text, not text.strip() and bool(page.get_images(full=False))))
+        return pages
+
+
+def _page_text(page, textpage=None) -> str:
+    # Text blocks (paragraphs) in reading order, a blank line between blocks. Sorting the
+    # blocks here is an order of magnitude cheaper than get_text(sort=True), which sorts every line.
+    blocks = page.get_text("blocks", textpage=textpage)
+    blocks.sort(key=lambda block: (round(block[1]), block[0]))
+    return "\n".join(block[4] for block in blocks if block[6] == 0)
+
+
+def ocr_page(path: str, number: int, dpi: int = OCR_DPI, language: str = OCR_LANGUAGE) -> PdfPage:
+    """Recognizes the text of an image-only page with Tesseract (through PyMuPDF).
+    Runs in an OCR queue worker: it takes seconds per page, against milliseconds for a text layer."""
+    with _open(path) as doc:
+        page = doc[number]
+        try:
+            textpage = page.get_textpage_ocr(dpi=dpi, language=language, full=True)
+        except RuntimeError as e:
+            raise ValueError(f"Page {number + 1} is a scanned image and OCR failed (Tesseract is required): {e}")
+        return PdfPage(number, _page_text(page, textpage), False)
+
+
+def extract_text_from_pdf(path: str) -> str:
+    """Extracts a whole PDF's text in this process, OCRing image-only pages inline.
+
+    The server splits the same work across the job and OCR queues (`pdf_ingest`);
+    this is for running it in one place, such as a worker processing a whole file.
+    """
+    pages = [ocr_page(path, page.number) if page.needs_ocr else page for page in extract_pages(path)]
+    return PAGE_BREAK.join(page.text for page in pages)
+
+
+# --- Chart structure ---
+
+_SECTION_NAMES = (r"pre[- ]?chorus|post[- ]?chorus|verse|chorus|bridge|intro|outro|tag|interlude|instrumental|"
+                  r"ending|refrain|turnaround|vamp|coda|hook|breakdown|channel|solo")
+_ABBREVIATIONS = {"v": "Verse", "c": "Chorus", "pc": "Pre-Chorus", "b": "Bridge", "t": "Tag"}
+# "x2", "(x2)", "2x", "×2", "[x 2]", "(Repeat)", "Repeat 2x"
+_REPEAT = (r"(?:[\(\[]\s*)?(?:(?:x|×)\s*(?P<{0}a>\d+)|(?P<{0}b>\d+)\s*(?:x|×)|"
+           r"(?P<{0}r>repeat)(?:\s*(?:x|×)?\s*(?P<{0}c>\d+)\s*(?:x|×)?)?)(?:\s*[\)\]])?")
+_HEADER_RE = re.compile(
+    r"^[\[\(]?\s*(?P<name>(?:{names})(?:\s*\d+)?|(?:pc|v|c|b|t)\d*(?=\s*[:\]\)]))\s*[\]\)]?\s*[:.\-–]?\s*(?:{repeat})?\s*$"
+    .format(names=_SECTION_NAMES, repeat=_REPEAT.format("h")), re.IGNORECASE)
+# "Repeat Chorus", "Chorus again", "(Repeat Chorus x2)"
+_REFERENCE_RE = re.compile(
+    r"^[\[\(]?\s*(?:repeat\s+(?P<name>(?:{names})(?:\s*\d+)?)|(?P<again>(?:{names})(?:\s*\d+)?)\s+again)\s*[\]\)]?\s*(?:{repeat})?\s*$"
+    .format(names=_SECTION_NAMES, repeat=_REPEAT.format("r")), re.IGNORECASE)
+_STANDALONE_REPEAT_RE = re.compile(r"^{0}$".format(_REPEAT.format("s")), re.IGNORECASE)
+# A repeated lyric line: "Hallelujah x4", "Hallelujah (2x)", "Hallelujah (repeat)"; a bare trailing
+# "repeat" could be a lyric, so it only counts in brackets.
+_LINE_REPEAT_RE = re.compile(
+    r"^(?P<line>.*?\S)\s*(?:(?<=\s)(?:x|×)\s*(?P<la>\d+)|(?<=\s)(?P<lb>\d+)\s*(?:x|×)|[\(\[]\s*(?:(?:x|×)\s*(?P<lc>\d+)|"
+    r"(?P<ld>\d+)\s*(?:x|×)|(?P<lr>repeat))\s*[\)\]])$", re.IGNORECASE)
+_CHORD_TOKEN_RE = re.compile(
+    r"^[\(\[]?(?:[A-G](?:#|b|♯|♭)?(?:maj|min|m|dim|aug|sus|add|M|°|ø|\+)?\d*(?:(?:sus|add|maj|b|#|♭|♯)\d+)*"
+    r"(?:/[A-G](?:#|b|♯|♭)?)?|N\.?C\.?|[|/\-.%:]+)[\)\]]?$")
+_TEMPO_RE = re.compile(r"\b(?:tempo|bpm)\s*[-:=]?\s*(?P<bpm>\d+(?:\.\d+)?)|(?P<bpm2>\d+(?:\.\d+)?)\s*bpm\b", re.IGNORECASE)
+_METER_RE = re.compile(r"\b(?:time(?:\s+signature)?|meter)\s*[-:=]?\s*(?P<beats>\d+)\s*/\s*\d+", re.IGNORECASE)
+_METADATA_RE = re.compile(
+    r"^(?:key|tempo|bpm|time(?:\s+signature)?|meter|capo)\s*[-:=|]|^(?:©|\(c\)\s)|\bccli\b|copyright|"
+    r"all rights reserved|used by permission|^(?:words(?:\s+and\s+music)?|music|lyrics|written|arr(?:anged|\.)?)\s+by\b",
+    re.IGNORECASE)
+_PAGE_NUMBER_RE = re.compile(r"^(?:page\s*)?\d+(?:\s*(?:of|/)\s*\d+)?$", re.IGNORECASE)
+_DIRECTION_RE = re.compile(r"^[\(\[][^\)\]]*[\)\]]$")  # "(Instrumental)", "[Drums in]": a whole line of direction
+
+
+def _repeat_count(match, group: str) -> Optional[int]:
+    """The count of a matched repeat marker (a bare "Repeat" is 2), or None if there is none."""
+    for suffix in "abcd":
+        if group + suffix in match.re.groupindex and match.group(group + suffix):
+            return max(1, int(match.group(group + suffix)))
+    return 2 if match.group(group + "r") else None
+
+
+def _label(name: str) -> str:
+    name = re.sub(r"\s+", " ", name.strip())
+    abbreviation = re.fullmatch(r"(pc|v|c|b|t)(\d*)", name, re.IGNORECASE)
+    if abbreviation:
+        return f"{_ABBREVIATIONS[abbreviation.group(1).lower()]} {abbreviation.group(2)}".strip()
+    return name
+
+
+def _section_key(label: str) -> str:
+    return re.sub(r"[\s\-]+", "", label).lower()
+
+
+def _is_metadata(line: str) -> bool:
+    return bool(_METADATA_RE.search(line) or _TEMPO_RE.search(line) or _METER_RE.search(line))
+
+
+def _is_chord_line(line: str) -> bool:
+    return all(_CHORD_TOKEN_RE.match(token) for token in line.split())
+
+
+def _running_lines(pages: List[List[str]]) -> set:
+    """Lines repeated at the top or bottom of several pages: running titles and footers."""
+    if len(pages) < 2:
+        return set()
+    seen = {}
+    for lines in pages:
+        for line in set(lines[:2] + lines[-2:]):
+            if not (_HEADER_RE.match(line) or _REFERENCE_RE.match(line)):
+                seen[line] = seen.get(line, 0) + 1
+    return {line for line, count in seen.items() if count > 1}
+
+
+def parse_song_structure(text: str) -> ChartStructure:
+    """Parses a chord chart or lyric sheet's text into its sections, in play order.
+
+    Recognizes section headers ("Verse 1", "[Chorus]", "Bridge:", "V2:"), section
+    repeats on the header or on a line of their own ("Chorus x2", "(x2)", "2x",
+    "Repeat"), references back to an earlier section ("Repeat Chorus", "Chorus
+    again") and line repeats ("Hallelujah (x4)"). Chord-only lines, page numbers,
+    running headers/footers and metadata (key, tempo, CCLI and copyright lines)
+    are dropped; a printed tempo and time signature are kept on the result. Lines
+    before the first header are the title block and dropped when the chart has
+    headers; without any, blank lines separate unlabelled sections.
+    """
+    pages = [[line.strip() for line in page.splitlines()] for page in text.split(PAGE_BREAK)]
+    running = _running_lines([[line for line in page if line] for page in pages])
+    lines = [line for page in pages for line in page + [""] if line not in running]
+
+    bpm = beats_per_measure = None
+    for line in lines:
+        if bpm is None and (m := _TEMPO_RE.search(line)):
+            bpm = float(m.group("bpm") or m.group("bpm2"))
+        if beats_per_measure is None and (m := _METER_RE.search(line)):
+            beats_per_measure = int(m.group("beats"))
+    has_headers = any(_HEADER_RE.match(line) for line in lines)
+
+    sections: List[ChartSection] = []
+    played = {}  # Section key -> lines of the last section with that label, for repeats of it
+    label, body, repeat, started = "", [], 1, not has_headers
+
+    def close():
+        # A header with no lines of its own ("Chorus" again, "Repeat Chorus") plays the earlier section
+        lines = tuple(body) if body or not label else played.get(_section_key(label), ())
+        if label or lines:
+            sections.append(ChartSection(label, lines, repeat))
+            if label and lines:
+                played[_section_key(label)] = lines
+
+    for line in lines:
+        if not line:
+            if not has_headers and body:
+                close()
+                label, body, repeat = "", [], 1
+            continue
+        header = _HEADER_RE.match(line)
+        reference = None if header else _REFERENCE_RE.match(line)
+        if header or reference:
+            close()
+            match, group = (header, "h") if header else (reference, "r")
+            name = header.group("name") if header else reference.group("name") or reference.group("again")
+            label, body, repeat, started = _label(name), [], _repeat_count(match, group) or 1, True
+            continue
+        if not started or _is_metadata(line) or _PAGE_NUMBER_RE.match(line) or _is_chord_line(line):
+            continue
+        standalone = _STANDALONE_REPEAT_RE.match(line)
+        if standalone:
+            if body or label:
+                repeat = _repeat_count(standalone, "s")
+            elif sections:  # "x2" after a blank line, under an unlabelled stanza
+                sections[-1] = sections[-1]._replace(repeat=_repeat_count(standalone, "s"))
+            continue
+        if _DIRECTION_RE.match(line):
+            continue
+        line_repeat = _LINE_REPEAT_RE.match(line)
+        if line_repeat:
+            body.extend([line_repeat.group("line")] * _repeat_count(line_repeat, "l"))
+        else:
+            body.append(line)
+    close()
+    return ChartStructure(sections, bpm, beats_per_measure)
@@ -0,0 +1,321 @@
+import asyncio
+from functools import partial
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from .backplane import Backplane, backplane
+from .clock_sync import server_time
+from .config import DEFAULT_ROOM, PLAYBACK_LEAD_OFFSET, PLAYBACK_DISPATCH_AHEAD, TIMELINE_WINDOW_LINES, TIMELINE_CHUNK_LINES, TIMELINE_LOOKAHEAD_LINES
+from .lyric_index import LyricTimelineIndex
+from .lyric_scheduler import LyricScheduler
+from .metrics import metrics
+from .output_sinks import outputs
+from .playback_plan import PlaybackPlan
+from .trigger_interface import trigger_interface
+
+# (message_type, data, text=None): sends a message to the session's displays; `text`, if given, is the message already serialized
+Broadcast = Callable[..., Awaitable[None]]
+# (song_id, index, start, stop): sends timeline lines [start, stop) to the session's displays
+StreamTimeline = Callable[[str, LyricTimelineIndex, int, int], Awaitable[None]]
+
+timer_lateness_seconds = metrics.histogram(
+    "lyricpilot_playback_timer_lateness_seconds", "How late a session's line-boundary timer fired against its schedule")
+
+
+class PlaybackSession:
+    """Server-side playhead for one song playing in one room.
+
+    The playhead is stored as an anchor (song position at a given server time, see
+    clock_sync.server_time) plus a tempo scale, so reading the position never
+    accumulates drift. Instead of polling, the session arms a single event-loop
+    timer for the next line boundary and re-arms it after each one, or whenever
+    start/pause/seek/tempo changes the timeline.
+
+    The timer fires `dispatch_ahead` seconds before the boundary and the
+    `lyric_update` carries the boundary's server timestamp in `at`; displays that
+    have synchronized their clocks apply it at that instant rather than on arrival,
+    so network jitter doesn't turn into skew between screens.
+
+    Lines are sent from the song's PlaybackPlan: at each boundary the session
+    moves to the plan's next frame and sends its pre-encoded `lyric_update`.
+
+    `song_start` only carries the first TIMELINE_WINDOW_LINES of the timeline; with
+    a `stream` callback the session sends the following lines in chunks as the
+    playhead approaches the end of what displays already have.
+
+    A `follower` (beat_detector.BeatFollower, score_follower.ScoreFollower) can
+    drive the playhead from live input through `follow`; it is stopped along with
+    the session.
+    """
+
+    def __init__(self, song_id: str, title: str, plan: PlaybackPlan, broadcast: Broadcast,
+                 lead_offset: float = PLAYBACK_LEAD_OFFSET,
+                 dispatch_ahead: float = PLAYBACK_DISPATCH_AHEAD, stream: Optional[StreamTimeline] = None,
+                 room: str = DEFAULT_ROOM):
+        self.song_id = song_id
+        self.room = room
+        self.title = title
+        self.plan = plan
+        self.scheduler = LyricScheduler(plan.index, lead_offset=lead_offset)
+        self.frame = -1  # Plan frame of the current line
+        self.dispatch_ahead = dispatch_ahead
+        self._broadcast = broadcast
+        self._stream = stream
+        # Timeline lines [_stream_from, _stream_until) have been sent to displays
+        self._stream_from = 0
+        self._stream_until = 0
+        self._loop = asyncio.get_running_loop()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._pending_sends = set()
+        self.playing = False
+        self.tempo_scale = 1.0
+        self._anchor_position = 0.0
+        self._anchor_time = server_time()
+        # Position the playhead waits at until the next `follow` (a score follower's next expected note)
+        self.limit: Optional[float] = None
+        self.follower = None
+
+    # --- Clock ---
+    def position_at(self, t: float) -> float:
+        """Song position in seconds at server time `t`."""
+        if not self.playing:
+            return self._anchor_position
+        position = self._anchor_position + max(0.0, t - self._anchor_time) * self.tempo_scale
+        return position if self.limit is None else max(self._anchor_position, min(position, self.limit))
+
+    def position(self) -> float:
+        """Current song position in seconds."""
+        return self.position_at(server_time())
+
+    def _time_of(self, position: float) -> float:
+        """Server time at which the playhead reaches `position` at the current tempo."""
+        return self._anchor_time + (position - self._anchor_position) / self.tempo_scale
+
+    def _set_anchor(self, position: float, at: float):
+        self._anchor_position = max(0.0, position)
+        self._anchor_time = at
+
+    # --- Transport controls ---
+    def start(self, position: float = 0.0, start_at: Optional[float] = None):
+        """Starts playing from `position` at server time `start_at` (default: one dispatch interval from now)."""
+        self.playing = True
+        self._relocate(position, start_at if start_at is not None else server_time() + self.dispatch_ahead, song_start=True)
+
+    def pause(self):
+        if not self.playing:
+            return
+        now = server_time()
+        self._set_anchor(self.position_at(now), now)
+        self.playing = False
+        self._cancel_timer()
+        self._emit_state()
+
+    def resume(self):
+        if self.playing:
+            return
+        self._set_anchor(self._anchor_position, server_time())
+        self.playing = True
+        self._emit_state()
+        self._arm_timer()
+
+    def seek(self, position: float):
+        # Take effect one dispatch interval from now so every display jumps together.
+        self._relocate(position, server_time() + self.dispatch_ahead)
+
+    def _relocate(self, position: float, at: float, song_start: bool = False):
+        self._set_anchor(position, at)
+        self.limit = None
+        self.scheduler.seek(self._anchor_position)
+        if song_start:
+            # The song_start sent alongside carries this window (see timeline_window)
+            self._stream_from = max(0, self.scheduler.current_lyric_index)
+            self._stream_until = min(len(self.scheduler.index), self._stream_from + TIMELINE_WINDOW_LINES)
+        self._emit_state()
+        self._emit_lyrics(at)
+        self._arm_timer()
+
+    def set_tempo(self, tempo_scale: float):
+        if tempo_scale <= 0:
+            raise ValueError("tempo_scale must be positive")
+        now = server_time()
+        self._set_anchor(self.position_at(now), max(now, self._anchor_time))
+        self.limit = None
+        self.tempo_scale = tempo_scale
+        self._emit_state()
+        self._arm_timer()
+
+    def follow(self, position: float, tempo_scale: float, at: Optional[float] = None, limit: Optional[float] = None):
+        """Re-anchors the playhead at `position` (server time `at`, default now) and plays on at `tempo_scale`.
+
+        Meant for small, frequent corrections from a beat tracker or score
+        follower: unlike seek it takes effect immediately, and a lyric_update is
+        only sent if the correction moves the playhead onto a different line. With
+        a `limit`, the playhead stops there until the next correction, and no line
+        beyond it is dispatched ahead of time.
+        """
+        if not self.playing:
+            return
+        if tempo_scale <= 0:
+            raise ValueError("tempo_scale must be positive")
+        at = server_time() if at is None else at
+        previous = self.scheduler.current_lyric_index
+        self._set_anchor(position, at)
+        self.limit = limit
+        self.tempo_scale = tempo_scale
+        # The timer dispatches lines `dispatch_ahead` early, so compare against where the playhead will be by then
+        self.scheduler.seek(self.position_at(at + self.dispatch_ahead))
+        self._emit_state()
+        i = self.scheduler.current_lyric_index
+        if i != previous:
+            shown_at = self._time_of(self.scheduler.index.times[i] - self.scheduler.lead_offset) if i >= 0 else at
+            self._emit_lyrics(max(at, shown_at))
+        self._arm_timer()
+
+    def stop(self):
+        self._cancel_timer()
+        self.playing = False
+        if self.follower is not None:
+            self.follower.stop()
+            self.follower = None
+
+    # --- Scheduling ---
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _arm_timer(self):
+        self._cancel_timer()
+        if not self.playing:
+            return
+        boundary = self.scheduler.next_boundary()
+        if boundary is None or (self.limit is not None and boundary > self.limit):
+            return
+        at = self._time_of(boundary)
+        delay = max(0.0, at - self.dispatch_ahead - server_time())
+        self._timer = self._loop.call_later(delay, self._on_boundary, at)
+
+    def _on_boundary(self, at: float):
+        self._timer = None
+        timer_lateness_seconds.observe(max(0.0, server_time() - (at - self.dispatch_ahead)))
+        if self.scheduler.advance() is not None:
+            self._emit_lyrics(at)
+        self._arm_timer()
+
+    # --- Output ---
+    def _send(self, message_type: str, data: dict, text: Optional[str] = None):
+        self._spawn(self._broadcast(message_type, data, text=text))
+
+    def _spawn(self, coro):
+        task = self._loop.create_task(coro)
+        self._pending_sends.add(task)
+        task.add_done_callback(self._pending_sends.discard)
+
+    def _emit_lyrics(self, at: float):
+        self._send("lyric_update", *self.lyric_update(at))
+        self._stream_ahead()
+
+    def _stream_ahead(self):
+        """Sends the next chunk of timeline lines once the playhead nears the end of what was sent."""
+        if self._stream is None:
+            return
+        i = max(0, self.scheduler.current_lyric_index)
+        if not self._stream_from <= i <= self._stream_until:
+            # Seeked outside the lines displays have: restart the stream at the playhead
+            self._stream_from = self._stream_until = i
+        n = len(self.scheduler.index)
+        if self._stream_until < n and i + TIMELINE_LOOKAHEAD_LINES >= self._stream_until:
+            start, self._stream_until = self._stream_until, min(n, self._stream_until + TIMELINE_CHUNK_LINES)
+            self._spawn(self._stream(self.song_id, self.scheduler.index, start, self._stream_until))
+
+    def timeline_window(self) -> Tuple[int, int]:
+        """Timeline lines (start, stop) for a song_start sent now: the current line through everything streamed so far."""
+        i = max(0, self.scheduler.current_lyric_index)
+        return i, min(len(self.scheduler.index), max(self._stream_until, i + TIMELINE_WINDOW_LINES))
+
+    def lyric_update(self, at: Optional[float] = None) -> Tuple[dict, str]:
+        """The `lyric_update` for the current line, to be shown at server time `at`, as (data, serialized message)."""
+        self.frame = self.plan.frame_of(self.scheduler.current_lyric_index, self.frame + 1)
+        at = server_time() if at is None else at
+        return self.plan.lyric_update(self.frame, at, self.position_at(at))
+
+    def lyric_data(self, at: Optional[float] = None) -> dict:
+        """The `lyric_update` payload for the current line, to be shown at server time `at`."""
+        return self.lyric_update(at)[0]
+
+    def _emit_state(self):
+        self._send("playback_state", self.state())
+
+    def state(self) -> dict:
+        now = server_time()
+        return {
+            "song_id": self.song_id,
+            "title": self.title,
+            "room": self.room,
+            "playing": self.playing,
+            "position": self.position_at(now),
+            "tempo_scale": self.tempo_scale,
+            "line_index": self.scheduler.current_lyric_index,
+            "server_time": now,
+            "anchor_position": self._anchor_position,
+            "anchor_time": self._anchor_time,
+            "limit": self.limit,
+        }
+
+
+class PlaybackEngine:
+    """Owns one PlaybackSession per room: each room plays one song at a time, on its
+    own playhead and scheduler, and its messages go to that room's displays only.
+
+    `broadcast` and `stream` take the room as a keyword argument (see TriggerInterface).
+
+    With several worker processes, a room's session lives in the worker that
+    started it. Starting one announces it on the `backplane`, and any other worker
+    that was playing in that room (a session started earlier) stops, so a room
+    never has two playheads.
+    """
+
+    def __init__(self, broadcast: Callable[..., Awaitable[None]], stream: Optional[Callable[..., Awaitable[None]]] = None,
+                 backplane: Optional[Backplane] = None):
+        self._broadcast = broadcast
+        self._stream = stream
+        self._backplane = backplane
+        self.sessions: Dict[str, PlaybackSession] = {}  # Room -> its session
+        self._started: Dict[str, float] = {}  # Room -> server time its session was started
+
+    def start(self, song_id: str, title: str, plan: PlaybackPlan, position: float = 0.0,
+              start_at: Optional[float] = None, room: str = DEFAULT_ROOM) -> PlaybackSession:
+        """Starts `song_id` in `room`, replacing whatever the room was playing."""
+        self.stop(room)
+        session = PlaybackSession(song_id, title, plan, partial(self._broadcast, room=room),
+                                  stream=partial(self._stream, room=room) if self._stream else None, room=room)
+        self.sessions[room] = session
+        self._started[room] = server_time()
+        session.start(position, start_at)
+        if self._backplane is not None:
+            self._backplane.publish("session", {"room": room, "started": self._started[room]})
+        return session
+
+    async def on_session_elsewhere(self, header: dict, payloads):
+        """Another worker started a session in a room: stops this worker's, if it is older."""
+        room = header["room"]
+        if room in self.sessions and self._started[room] <= header["started"]:
+            self.stop(room)
+
+    def get(self, room: str = DEFAULT_ROOM) -> Optional[PlaybackSession]:
+        return self.sessions.get(room)
+
+    def stop(self, room: str = DEFAULT_ROOM):
+        session = self.sessions.pop(room, None)
+        self._started.pop(room, None)
+        if session:
+            session.stop()
+
+    def stop_all(self):
+        for room in list(self.sessions):
+            self.stop(room)
+
+
+playback_engine = PlaybackEngine(outputs.send_message, trigger_interface.send_timeline_chunk, backplane)
+backplane.on("session", playback_engine.on_session_elsewhere)
+metrics.callback("lyricpilot_playback_sessions", "Rooms with a song playing or paused in this worker", "gauge",
+                 lambda: len(playback_engine.sessions))
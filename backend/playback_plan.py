@@ -0,0 +1,95 @@
+import time
+from array import array
+from bisect import bisect_left
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .lyric_index import LyricTimelineIndex
+from .trigger_interface import encode_message, serialize_seconds
+
+
+class PlaybackPlan:
+    """A song's timeline compiled for playback: one display frame per distinct line time.
+
+    Lines sharing a timestamp (a second voice, a chord symbol next to its lyric)
+    are merged into one frame whose text is their distinct, non-empty texts
+    joined by newlines; before, only the last of them was ever shown. Only
+    timed songs are merged: a timeline whose lines all share one time (an
+    untimed plain-text upload) keeps one frame per line. A frame is identified
+    by the timeline index of its last line, which is where LyricScheduler
+    lands on that timestamp, so `line_index` in messages still points into the
+    timeline displays receive.
+
+    Every frame's `lyric_update` (song id, line index, current text and the
+    next `window` frames' texts) is built when the plan is, as data and as
+    serialized JSON up to where `at` goes, so sending a frame only splices in
+    `at` and `position`. Plans are built off the event loop (when a processing
+    job finishes, or by the first play after a cache miss) and kept with the
+    cached timecodes, so no song pays for encoding its payloads while it plays.
+    """
+
+    __slots__ = ("song_id", "index", "window", "frame_lines", "_texts", "_frames")
+
+    def __init__(self, song_id: str, index: LyricTimelineIndex, window: int = 3):
+        self.song_id = song_id
+        self.index = index
+        self.window = window
+        times = np.asarray(index.times, dtype=np.float64)
+        if len(times) and times[0] != times[-1]:
+            last = np.append(np.flatnonzero(times[1:] != times[:-1]), len(times) - 1)
+        else:
+            # Untimed (plain text without a duration puts every line at 0.0): one frame per line
+            last = np.arange(len(times))
+        # Timeline index of each frame's last line, ascending
+        self.frame_lines = array("q")
+        self.frame_lines.frombytes(last.astype(np.int64).tobytes())
+        self._texts = [self._text(frame) for frame in range(len(self.frame_lines))]
+        # Frame + 1 (0: before the first line) -> (data, JSON up to the value of "at", JSON without timing)
+        self._frames: List[Tuple[dict, str, str]] = [self._encode(frame) for frame in range(-1, len(self.frame_lines))]
+
+    def __len__(self) -> int:
+        return len(self.frame_lines)
+
+    def frame_of(self, line: int, hint: int = -1) -> int:
+        """Frame whose last line is timeline index `line` (-1 before the first line).
+
+        `hint` is the frame the caller expects (the one after the current frame
+        during playback) and is checked before searching.
+        """
+        if line < 0:
+            return -1
+        if 0 <= hint < len(self.frame_lines) and self.frame_lines[hint] == line:
+            return hint
+        return bisect_left(self.frame_lines, line)
+
+    def text(self, frame: int) -> str:
+        """The text shown for a frame: its lines' distinct, non-empty texts, one per line."""
+        return self._texts[frame]
+
+    def _text(self, frame: int) -> str:
+        stop = self.frame_lines[frame] + 1
+        start = self.frame_lines[frame - 1] + 1 if frame > 0 else 0
+        if stop - start == 1:
+            return self.index.texts[start]
+        return "\n".join(dict.fromkeys(line for line in self.index.texts[start:stop] if line))
+
+    def _encode(self, frame: int) -> Tuple[dict, str, str]:
+        start = time.perf_counter()
+        data = {
+            "song_id": self.song_id,
+            "line_index": self.frame_lines[frame] if frame >= 0 else -1,
+            "current_lyric": self._texts[frame] if frame >= 0 else None,
+            "next_lyrics": self._texts[frame + 1:frame + 1 + self.window],
+        }
+        prefix = encode_message("lyric_update", data)[:-2]
+        serialize_seconds.labels("lyric_update").observe(time.perf_counter() - start)
+        return data, prefix + ',"at":', prefix + "}}"
+
+    def lyric_update(self, frame: int, at: Optional[float] = None, position: Optional[float] = None) -> Tuple[dict, str]:
+        """The `lyric_update` for `frame` as (data, serialized message), shown at server time `at`
+        with the playhead at song `position` (both or neither)."""
+        data, prefix, untimed = self._frames[frame + 1]
+        if at is None:
+            return data, untimed
+        return {**data, "at": at, "position": position}, f'{prefix}{at!r},"position":{position!r}}}}}'
@@ -0,0 +1,96 @@
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+from .config import PROFILER_INTERVAL, PROFILER_MAX_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """Samples every thread's Python stack from a background thread, on demand.
+
+    Each sample walks `sys._current_frames()` and counts the stack, root first,
+    under its thread's name (the event loop runs in `MainThread`). The result is
+    in the collapsed format flame graph tools read (`flamegraph.pl`, speedscope):
+    one `thread;outer;...;inner count` line per distinct stack.
+
+    Sampling holds the GIL for a stack walk per thread, so it costs the server a
+    little for as long as it runs: it only runs when started, and stops by itself
+    after `max_seconds`. Samples are kept until the next start.
+    """
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.stacks: Dict[str, int] = collections.Counter()
+        self.samples = 0
+        self.interval = PROFILER_INTERVAL
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = PROFILER_INTERVAL, max_seconds: float = PROFILER_MAX_SECONDS) -> bool:
+        """Clears the previous samples and starts sampling; False if it is already running."""
+        if self.running:
+            return False
+        with self._lock:
+            self.stacks = collections.Counter()
+            self.samples = 0
+        self.interval = interval
+        self.started_at, self.stopped_at = time.time(), None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval, max_seconds), name="profiler", daemon=True)
+        self._thread.start()
+        logger.info("Profiler started (every %.1fms, for at most %.0fs)", interval * 1000, max_seconds)
+        return True
+
+    def stop(self) -> bool:
+        """Stops sampling; False if it wasn't running."""
+        if not self.running:
+            return False
+        self._stop.set()
+        self._thread.join()
+        return True
+
+    def _run(self, interval: float, max_seconds: float):
+        own = threading.get_ident()
+        deadline = time.monotonic() + max_seconds
+        while not self._stop.wait(interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                with self._lock:
+                    self.stacks[";".join(reversed(stack))] += 1
+            with self._lock:
+                self.samples += 1
+        self.stopped_at = time.time()
+        logger.info("Profiler stopped after %d samples", self.samples)
+
+    def collapsed(self) -> str:
+        """The samples so far as collapsed stacks, most frequent first."""
+        with self._lock:
+            stacks = self.stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def stats(self) -> dict:
+        return {"running": self.running, "interval": self.interval, "samples": self.samples,
+                "stacks": len(self.stacks), "started_at": self.started_at, "stopped_at": self.stopped_at}
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,383 @@
+import asyncio
+import time
+from bisect import bisect_left
+from collections import deque
+from pathlib import Path
+from typing import Callable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .audio_input import AudioInput
+from .beat_detector import BeatState, BeatTrackingPipeline
+from .clock_sync import server_time
+from .config import SCORE_FOLLOW_WINDOW, SCORE_FOLLOW_MAX_SKIP, SCORE_FOLLOW_RELOCATE_EVENTS
+from .midi_reader import MidiNotes, read_midi_notes
+from .trigger_interface import LatencyRecorder
+
+MIDI_EXTENSIONS = ('.mid', '.midi')
+
+# Cost of a live onset matched to no reference onset (a wrong or extra note, a false audio onset)
+_EXTRA_COST = 0.8
+# Cost per reference onset passed over without a live onset
+_SKIP_COST = 0.4
+# Timing cost is |log| of live interval over the expected one, both plus this many seconds,
+# so jitter on very short intervals isn't charged like a real change of tempo
+_TIMING_SLACK = 0.05
+_TIMING_CAP = 2.0
+# Intervals longer than expected (a held note, a breath before a section) cost this fraction of rushing
+_LATE_WEIGHT = 0.35
+_PITCH_COST = 1.0
+# Each hypothesis' tempo moves this fraction (in log terms) towards the interval it just matched,
+# unless the interval is off by more than this ratio (a hold or a fill, not a change of tempo)
+_TEMPO_GAIN = 0.3
+_TEMPO_TRUST = np.log(1.5)
+# Tempo relative to the reference stays within [1 / _MAX_TEMPO, _MAX_TEMPO]
+_MAX_TEMPO = 3.0
+# Cost per reference second between the first live onset's match and the starting position
+_START_COST = 0.5
+# Moving average (per onset) of the best hypothesis' cost above which the follower counts as lost
+_LOST_COST = 0.6
+_LOST_SMOOTHING = 0.2
+# A relocation candidate must score below this, and beat the current position by _RELOCATE_MARGIN
+_RELOCATE_MAX_COST = 0.35
+_RELOCATE_MARGIN = 0.2
+# Relocation prefers nearby candidates among equal ones (repeated choruses): cost per reference minute away
+_RELOCATE_DISTANCE_COST = 0.01
+# Between onsets the estimate stops this far short of the next reference onset, so a held note doesn't run ahead
+_HOLD_MARGIN = 0.001
+# Seconds of position error (or relative tempo change) before the playhead is re-anchored
+_FOLLOW_TOLERANCE = 0.02
+_FOLLOW_TEMPO_TOLERANCE = 0.02
+
+
+def onset_groups(notes: MidiNotes) -> Tuple[np.ndarray, np.ndarray]:
+    """Collapses notes starting together into one onset: (onset times, lowest pitch of each), as process_midi_file groups them."""
+    times = np.frombuffer(notes.onsets, dtype=np.float64) if len(notes) else np.zeros(0)
+    if len(times) == 0:
+        return times, np.zeros(0, dtype=np.int16)
+    pitches = np.frombuffer(notes.pitches, dtype=np.uint8).astype(np.int16)
+    starts = np.flatnonzero(np.concatenate(([True], np.diff(times) > 0)))
+    return times[starts].copy(), np.minimum.reduceat(pitches, starts)
+
+
+def load_reference(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Reads a MIDI file as a score-following reference. Raises MidiFormatError (a ValueError) if it isn't one."""
+    times, pitches = onset_groups(read_midi_notes(path))
+    if len(times) < 2:
+        raise ValueError("The reference MIDI file needs at least two note onsets")
+    return times, pitches
+
+
+class OnlineScoreAligner:
+    """Online alignment of live note onsets to a reference onset timeline (windowed online DTW).
+
+    Each live onset extends every alignment hypothesis "the band is at reference
+    onset i" by one step: match it to a reference onset up to `max_skip` ahead
+    (charging for skipped reference notes, for the difference between the live
+    and reference inter-onset intervals at that hypothesis' own tempo, and for a
+    pitch mismatch when both pitches are known), or count it as an extra note.
+    Only a band of `window` reference onsets around the current best position is
+    updated, so the cost per onset is bounded regardless of the song's length,
+    and identical passages elsewhere (repeated choruses) can't capture it.
+
+    If the band leaves the window (repeats a chorus, skips a verse), the best
+    hypothesis' cost per onset rises; once it counts as lost, the last
+    `relocate_events` onsets are matched against the whole reference (one
+    vectorized pass) and the follower jumps to a clearly better match.
+
+    Reference times are song seconds; live times are any monotonic stream clock.
+    `tempo` is reference seconds per live second.
+    """
+
+    def __init__(self, times: Sequence[float], pitches: Optional[Sequence[int]] = None, position: float = 0.0,
+                 tempo: float = 1.0, window: int = SCORE_FOLLOW_WINDOW, max_skip: int = SCORE_FOLLOW_MAX_SKIP,
+                 relocate_events: int = SCORE_FOLLOW_RELOCATE_EVENTS):
+        self.times = np.asarray(times, dtype=np.float64)
+        n = len(self.times)
+        self.pitches = np.full(n, -1, dtype=np.int16) if pitches is None else np.asarray(pitches, dtype=np.int16)
+        self.window = window
+        self.max_skip = max_skip
+        self.relocate_events = relocate_events
+        self.start_position = position
+        self.tempo = tempo
+        # Per reference onset, for hypotheses inside [_lo, _hi): accumulated cost, live time of the
+        # onset last matched on that path, and the path's tempo
+        self._cost = np.full(n, np.inf)
+        self._matched_at = np.zeros(n)
+        self._tempo = np.full(n, tempo)
+        self._lo = self._hi = 0
+        self._steps = np.arange(1, max_skip + 1)
+        self._log_spans = np.log(np.maximum(np.diff(self.times), 1e-6))
+        self._recent = deque(maxlen=relocate_events)
+        self.index = -1  # Reference onset the band is at
+        self.stream_time: Optional[float] = None  # Live time of the latest onset
+        self.drift = 0.0
+        self.onsets = 0
+        self.relocations = 0
+        self._since_relocate = 0
+        self.latency = LatencyRecorder()
+
+    def lost(self) -> bool:
+        return self.drift > _LOST_COST
+
+    def limit(self) -> Optional[float]:
+        """Position the estimate can't pass until the next live onset: just short of the next reference onset."""
+        if self.stream_time is None or self.index + 1 >= len(self.times):
+            return None
+        return float(self.times[self.index + 1]) - _HOLD_MARGIN
+
+    def position_at(self, stream_time: float, hold: bool = True) -> float:
+        """Estimated reference position at live time `stream_time`, extrapolated at `tempo` (up to `limit()` if `hold`)."""
+        if self.stream_time is None:
+            return self.start_position
+        position = float(self.times[self.index]) + max(0.0, stream_time - self.stream_time) * self.tempo
+        limit = self.limit() if hold else None
+        return position if limit is None else max(float(self.times[self.index]), min(position, limit))
+
+    def update(self, stream_time: float, pitch: int = -1) -> float:
+        """Aligns one live onset (pitch -1 if unknown) and returns the reference position it was matched to."""
+        start = time.perf_counter()
+        n = len(self.times)
+        if self.stream_time is None:
+            first = int(np.searchsorted(self.times, self.start_position))
+            lo, hi = max(0, first - self.window // 4), min(n, first + self.window)
+            cost = _START_COST * np.abs(self.times[lo:hi] - self.start_position) + self._pitch_cost(lo, hi, pitch)
+            matched_at = np.full(hi - lo, stream_time)
+            tempo = np.full(hi - lo, self.tempo)
+        else:
+            lo = max(0, self.index - self.window // 4)
+            hi = min(n, self.index + self.window - self.window // 4)
+            cost, matched_at, tempo = self._step(lo, hi, stream_time, pitch)
+
+        best = int(np.argmin(cost))
+        increment = float(cost[best])
+        cost -= increment
+        self._cost[self._lo:self._hi] = np.inf
+        self._cost[lo:hi] = cost
+        self._matched_at[lo:hi] = matched_at
+        self._tempo[lo:hi] = tempo
+        self._lo, self._hi = lo, hi
+        self.index = lo + best
+        self.tempo = float(tempo[best])
+        self.stream_time = stream_time
+        if self.onsets:
+            self.drift += _LOST_SMOOTHING * (increment - self.drift)
+        self.onsets += 1
+
+        self._recent.append((stream_time, pitch))
+        self._since_relocate += 1
+        if self.lost() and len(self._recent) == self.relocate_events and self._since_relocate >= self.relocate_events // 2:
+            self._relocate()
+        self.latency.record(time.perf_counter() - start)
+        return float(self.times[self.index])
+
+    def _pitch_cost(self, lo: int, hi: int, pitch: int):
+        if pitch < 0:
+            return 0.0
+        reference = self.pitches[lo:hi]
+        return _PITCH_COST * ((reference != pitch) & (reference >= 0))
+
+    def _step(self, lo: int, hi: int, stream_time: float, pitch: int):
+        """One DTW column: the best way to reach each hypothesis in [lo, hi) with this onset."""
+        targets = np.arange(lo, hi)
+        sources = targets[None, :] - self._steps[:, None]  # (max_skip, width)
+        valid = sources >= 0
+        sources = np.maximum(sources, 0)
+        tempo = self._tempo[sources]
+        span = self.times[targets][None, :] - self.times[sources]
+        interval = stream_time - self._matched_at[sources]
+        timing = np.log((interval + _TIMING_SLACK) / (span / tempo + _TIMING_SLACK))
+        matches = (np.where(valid, self._cost[sources], np.inf) + (self._steps[:, None] - 1) * _SKIP_COST
+                   + np.minimum(np.where(timing > 0, _LATE_WEIGHT * timing, -timing), _TIMING_CAP)
+                   + self._pitch_cost(lo, hi, pitch))
+        observed = span / np.maximum(interval, 1e-3)
+        matched_tempo = np.where(np.abs(timing) < _TEMPO_TRUST,
+                                 np.clip(tempo * (observed / tempo) ** _TEMPO_GAIN, 1 / _MAX_TEMPO, _MAX_TEMPO), tempo)
+
+        step = np.argmin(matches, axis=0)
+        columns = np.arange(hi - lo)
+        best = matches[step, columns]
+        extra = self._cost[lo:hi] + _EXTRA_COST
+        is_match = best <= extra
+        cost = np.where(is_match, best, extra)
+        matched_at = np.where(is_match, stream_time, self._matched_at[lo:hi])
+        tempo = np.where(is_match, matched_tempo[step, columns], self._tempo[lo:hi])
+        return cost, matched_at, tempo
+
+    def _relocate(self):
+        """Matches the recent onsets against every stretch of the reference; jumps if one fits clearly better."""
+        self._since_relocate = 0
+        count = len(self._recent)
+        if len(self.times) < count:
+            return
+        times = np.array([t for t, _ in self._recent])
+        pitches = np.array([p for _, p in self._recent], dtype=np.int16)
+        log_intervals = np.log(np.maximum(np.diff(times), 1e-3))
+        # Candidate k covers reference onsets k .. k + count - 1, taken one-to-one with the recent onsets.
+        # One contiguous pass per recent onset keeps this to a few hundred microseconds on long references.
+        n = len(self.times) - count + 1
+        log_tempo = np.log(np.maximum(self.times[count - 1:] - self.times[:n], 1e-6)) - np.log(max(times[-1] - times[0], 1e-3))
+        score = np.zeros(n)
+        for j, log_interval in enumerate(log_intervals):
+            score += np.minimum(np.abs(self._log_spans[j:j + n] - log_tempo - log_interval), _TIMING_CAP)
+        score /= count - 1
+        known = np.flatnonzero(pitches >= 0)
+        if len(known):
+            mismatches = np.zeros(n)
+            for j in known:
+                mismatches += self.pitches[j:j + n] != pitches[j]
+            score += _PITCH_COST * mismatches / len(known)
+        ends = np.arange(count - 1, len(self.times))
+        score += _RELOCATE_DISTANCE_COST * np.abs(self.times[ends] - self.times[self.index]) / 60.0
+
+        best = int(np.argmin(score))
+        here = self.index - (count - 1)
+        current = score[here] if 0 <= here < len(score) else np.inf
+        end = int(ends[best])
+        if score[best] > _RELOCATE_MAX_COST or score[best] + _RELOCATE_MARGIN > current:
+            return
+        lo, hi = max(0, end - self.window // 4), min(len(self.times), end + self.window - self.window // 4)
+        self._cost[self._lo:self._hi] = np.inf
+        self._cost[lo:hi] = _EXTRA_COST * self.relocate_events  # Reachable, but only as a fallback
+        self._cost[end] = 0.0
+        self._matched_at[lo:hi] = times[-1]
+        self._tempo[lo:hi] = np.clip(np.exp(log_tempo[best]), 1 / _MAX_TEMPO, _MAX_TEMPO)
+        self._lo, self._hi = lo, hi
+        self.index = end
+        self.tempo = float(self._tempo[end])
+        self.drift = 0.0
+        self.relocations += 1
+
+    def stats(self) -> dict:
+        return {
+            "onsets": self.onsets,
+            "reference_onsets": len(self.times),
+            "reference_index": self.index,
+            "position": float(self.times[self.index]) if self.index >= 0 else self.start_position,
+            "tempo": self.tempo,
+            "lost": self.lost(),
+            "relocations": self.relocations,
+            "update_latency": self.latency.summary(),
+        }
+
+
+class MidiFileInput:
+    """Replays a MIDI file's note onsets as live input: a stand-in for a MIDI input port.
+
+    Notes starting together arrive as one onset with the lowest pitch, grouped
+    like the reference. Replay runs as a task on the event loop, in real time by
+    default; `started_at` is the server time of stream time 0.
+    """
+
+    def __init__(self, path: str):
+        self.times, self.pitches = onset_groups(read_midi_notes(path))
+        self.started_at: Optional[float] = None
+        self.sent = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, on_onset: Callable[[float, int], None], realtime: bool = True):
+        self.started_at = server_time()
+        self._task = asyncio.get_running_loop().create_task(self._replay(on_onset, realtime))
+
+    async def _replay(self, on_onset: Callable[[float, int], None], realtime: bool):
+        start = time.perf_counter()
+        for t, pitch in zip(self.times.tolist(), self.pitches.tolist()):
+            if realtime:
+                delay = start + t - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif self.sent % 256 == 0:
+                await asyncio.sleep(0)
+            on_onset(t, pitch)
+            self.sent += 1
+
+    def done(self) -> bool:
+        return self._task is not None and self._task.done()
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+
+class ScoreFollower:
+    """Keeps a PlaybackSession's playhead on the band's position in a reference score.
+
+    Live onsets come from a MIDI performance replayed through MidiFileInput, or
+    from audio (the microphone or a streamed WAV) through the beat tracker's
+    onset picker; each one updates an OnlineScoreAligner, and the session is
+    re-anchored (PlaybackSession.follow) when the estimate moves it noticeably,
+    so the LyricScheduler switches lines from the aligned position. Same
+    start/stop/stats interface as beat_detector.BeatFollower.
+    """
+
+    def __init__(self, session, reference_times: Sequence[float], reference_pitches: Optional[Sequence[int]] = None):
+        self.session = session
+        self.aligner = OnlineScoreAligner(reference_times, reference_pitches, session.position(), session.tempo_scale)
+        self.midi_input: Optional[MidiFileInput] = None
+        self.audio_input: Optional[AudioInput] = None
+        self.pipeline: Optional[BeatTrackingPipeline] = None
+        self.started_at: Optional[float] = None
+        self.corrections = 0
+
+    async def start(self, performance_path: Optional[str] = None, realtime: bool = True):
+        """Follows `performance_path` (a MIDI file replayed as MIDI input, or a WAV), or the microphone."""
+        if performance_path is not None and Path(performance_path).suffix.lower() in MIDI_EXTENSIONS:
+            self.midi_input = MidiFileInput(performance_path)
+            self.midi_input.start(self._on_onset, realtime)
+            self.started_at = self.midi_input.started_at
+            return
+        self.audio_input = AudioInput()
+        await self.audio_input.start_capture(performance_path, realtime)
+        self.started_at = self.audio_input.started_at
+        self.pipeline = BeatTrackingPipeline(self.audio_input, self._on_state, asyncio.get_running_loop())
+        self.pipeline.start()
+
+    def _on_state(self, state: BeatState):
+        for onset in state.onsets:
+            self._on_onset(onset)
+
+    def _on_onset(self, stream_time: float, pitch: int = -1):
+        matched = self.aligner.update(stream_time, pitch)
+        if not self.session.playing:
+            return
+        now = server_time()
+        limit = self._line_limit(matched)
+        position = self.aligner.position_at(now - self.started_at, hold=False)
+        if limit is not None:
+            position = max(matched, min(position, limit))
+        tempo = self.aligner.tempo
+        # Most onsets only confirm the playhead; re-anchor (and tell displays) when it's off or may move on a line
+        if (limit != self.session.limit or abs(position - self.session.position_at(now)) > _FOLLOW_TOLERANCE
+                or abs(tempo / self.session.tempo_scale - 1.0) > _FOLLOW_TEMPO_TOLERANCE):
+            self.session.follow(position, tempo, now, limit)
+            self.corrections += 1
+
+    def _line_limit(self, matched: float) -> Optional[float]:
+        """Where the playhead has to wait for the next onset: just before the first line that isn't sung yet.
+
+        A line starting on (or after) the next reference onset is only switched to
+        once the band plays that onset, so a held note can't bring it in early.
+        """
+        following = self.aligner.limit()
+        if following is None:
+            return None
+        scheduler = self.session.scheduler
+        times = scheduler.index.times
+        j = bisect_left(times, following + _HOLD_MARGIN)
+        if j >= len(times):
+            return None
+        return max(matched, times[j] - scheduler.lead_offset - _HOLD_MARGIN)
+
+    def stop(self):
+        if self.midi_input is not None:
+            self.midi_input.stop()
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        elif self.audio_input is not None:
+            self.audio_input.stop_capture()
+
+    def stats(self) -> dict:
+        stats = self.pipeline.stats() if self.pipeline else {}
+        stats["score"] = self.aligner.stats()
+        stats["corrections"] = self.corrections
+        return stats
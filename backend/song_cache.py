@@ -0,0 +1,85 @@
+import os
+import threading
+from typing import Dict, Iterable, NamedTuple, Optional
+
+
+class SongInfo(NamedTuple):
+    """Immutable snapshot of a `Song` row; same attribute names, so it stands in for one on read paths."""
+    id: str
+    title: str
+    bpm: Optional[int]
+    file_path: str
+    processed: bool
+    timecode_path: Optional[str]
+    status: str
+    job_error: Optional[str]
+    source: Optional[str]
+
+    @classmethod
+    def from_row(cls, song) -> "SongInfo":
+        return cls(song.id, song.title, song.bpm, song.file_path, bool(song.processed), song.timecode_path,
+                   song.status, song.job_error, song.source)
+
+
+class SongMetadataCache:
+    """In-process copy of every song's metadata, so playback never waits on SQLite.
+
+    Warmed from the database at startup; afterwards every write in `database`
+    (the server is the only writer while it runs) replaces or drops the song's
+    entry once its transaction has committed, and with several worker processes
+    sends the same change to the others' caches over the backplane. Entries are immutable snapshots,
+    so readers need no lock and never see a half-applied update. Lookups of
+    unknown ids are answered from the cache too: a song that isn't here doesn't
+    exist.
+
+    `version` counts changes to the library; with `epoch` (random per process,
+    since the count restarts) it makes the song listing's ETag.
+    """
+
+    def __init__(self):
+        self._songs: Dict[str, SongInfo] = {}
+        self._lock = threading.Lock()  # Serializes writers; readers use the dict as-is
+        self.warmed = False
+        self.epoch = os.urandom(4).hex()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def warm(self, songs: Iterable) -> int:
+        """Replaces the cache contents with `songs` (ORM rows); returns how many were loaded."""
+        snapshot = {song.id: SongInfo.from_row(song) for song in songs}
+        with self._lock:
+            self._songs = snapshot
+            self.warmed = True
+            self.version += 1
+        return len(snapshot)
+
+    def get(self, song_id: Optional[str]) -> Optional[SongInfo]:
+        song = self._songs.get(song_id)
+        if song is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return song
+
+    def put(self, song) -> SongInfo:
+        """Stores a snapshot of `song` (an ORM row or a SongInfo) and returns it."""
+        info = SongInfo.from_row(song)
+        with self._lock:
+            self._songs[song.id] = info
+            self.version += 1
+        return info
+
+    def remove(self, song_id: str):
+        with self._lock:
+            self._songs.pop(song_id, None)
+            self.version += 1
+
+    def etag(self) -> str:
+        return f'"{self.epoch}-{self.version}"'
+
+    def stats(self) -> dict:
+        return {"songs": len(self._songs), "warmed": self.warmed, "version": self.version, "hits": self.hits, "misses": self.misses}
+
+
+song_cache = SongMetadataCache()
@@ -1,28 +1,48 @@
+import asyncio
+import hashlib
 import os
 import shutil
-from typing import Optional
+import time
+import zipfile
+from typing import List, Optional
 from pathlib import Path
 from uuid import uuid4
-import traceback
+import logging
 
 from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
 
 from .config import SONGS_DIR, UPLOAD_DIR
-from .database import add_song, update_song_processed_status
+from .database import add_song, add_songs
+from .job_queue import job_queue
+from .metrics import PARSE_BUCKETS, metrics
+from .parse_cache import parse_cache, cache_key, copy_and_hash
 from .lyrics_text_parser import parse_plain_text_lyrics, generate_basic_timecodes_from_text
-from .timecode_generator import save_timecode_json
+from .timecode_generator import load_timecode_json
+from .timecode_store import TIMECODE_FILENAME, save_timecodes
 from .musicxml_parser import parse_musicxml
 from .midi_aligner import process_midi_file
+from .pdf_ingest import ingest_pdf
 from .pdf_parser import extract_text_from_pdf, parse_song_structure
 from .structure_timecode_generator import generate_timecodes_from_structure
+from .audio_aligner import process_audio_file
 
-# Placeholder imports for other aligners/parsers
-# from .audio_aligner import process_audio_file
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav')
+SUPPORTED_EXTENSIONS = AUDIO_EXTENSIONS + ('.mid', '.midi', '.xml', '.musicxml', '.mxl', '.txt', '.pdf', '.json')
+
+parse_seconds = metrics.histogram(
+    "lyricpilot_parse_seconds", "Time to turn an upload into timecodes, per file type "
+    "(in the worker; PDFs: the whole page-parallel ingest)", ("type",), PARSE_BUCKETS)
 
 async def upload_and_process_song(db, file: UploadFile, title: Optional[str] = None, bpm: Optional[float] = None, measures_per_section: Optional[int] = None, beats_per_measure: Optional[int] = None):
-    print(f"Received BPM in upload_and_process_song: {bpm}") # Debug log
-    print(f"Received Measures per Section in upload_and_process_song: {measures_per_section}") # Debug log
-    print(f"Received Beats per Measure in upload_and_process_song: {beats_per_measure}") # Debug log
+    """Saves an upload, records it in the DB as `queued` and hands parsing to the job queue.
+
+    Returns as soon as the file is on disk; the song's `status` column tracks the job.
+    If the same bytes were already parsed with the same parameters, the cached
+    timecodes are reused and the song is `done` straight away.
+    """
     song_id = str(uuid4())
     if not title:
         title = Path(file.filename).stem.replace('_', ' ').title()
@@ -33,50 +53,209 @@ async def upload_and_process_song(db, file: UploadFile, title: Optional[str] = N
     raw_files_dir = os.path.join(song_dir, "raw")
     os.makedirs(raw_files_dir, exist_ok=True)
 
-    # Save the uploaded file first
-    file_extension = Path(file.filename).suffix.lower()
-    print(f"File name: {file.filename}")
-    print(f"Detected file extension: {file_extension}")
+    # Save the uploaded file first (in a thread, so a large upload doesn't block the event loop)
     saved_file_path = os.path.join(raw_files_dir, file.filename)
-    with open(saved_file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    digest = await run_in_threadpool(_save_upload, file, saved_file_path)
+
+    key = cache_key(digest, Path(file.filename).suffix, bpm, measures_per_section, beats_per_measure)
+    timecode_path = os.path.join(song_dir, TIMECODE_FILENAME)
+    if await run_in_threadpool(parse_cache.restore, key, timecode_path):
+        logger.debug("Parse cache hit for %s", file.filename)
+        return await add_song(db, song_id=song_id, title=title, file_path=saved_file_path, processed=True, timecode_path=timecode_path, status="done")
 
     # Add initial song entry to DB
-    db_song = add_song(db, song_id=song_id, title=title, file_path=saved_file_path, processed=False)
+    db_song = await add_song(db, song_id=song_id, title=title, file_path=saved_file_path, processed=False, status="queued")
+
+    job_queue.submit(song_id, process_song, song_id, saved_file_path, bpm, measures_per_section, beats_per_measure, key)
+    return db_song
+
+async def process_song(song_id: str, saved_file_path: str, bpm: Optional[float] = None, measures_per_section: Optional[int] = None, beats_per_measure: Optional[int] = None, parse_cache_key: Optional[str] = None) -> Optional[str]:
+    """Processes an upload on the job queue: PDF charts through the page-parallel
+    `ingest_pdf` pipeline, everything else as one `process_song_file` task.
+
+    With a `parse_cache_key`, the result is added to the parse cache here, in the
+    server process, so the cache's index sees it."""
+    file_extension = Path(saved_file_path).suffix.lower()
+    if file_extension == '.pdf':
+        start = time.perf_counter()
+        timecode_path = await ingest_pdf(song_id, saved_file_path, bpm, measures_per_section, beats_per_measure)
+        parse_seconds.labels("pdf").observe(time.perf_counter() - start)
+    else:
+        timecode_path, seconds = await job_queue.run_timed(process_song_file, song_id, saved_file_path, bpm, measures_per_section, beats_per_measure)
+        # Labels stay a fixed set: the extension of an unchecked single upload could be anything
+        parse_seconds.labels(file_extension.lstrip('.') if file_extension in SUPPORTED_EXTENSIONS else "other").observe(seconds)
+    if timecode_path is not None and parse_cache_key:
+        await run_in_threadpool(_store_parsed, parse_cache_key, timecode_path)
+    return timecode_path
+
+def _store_parsed(parse_cache_key: str, timecode_path: str):
+    try:
+        parse_cache.store(parse_cache_key, timecode_path)
+    except OSError as e:
+        logger.warning("Could not add %s to the parse cache: %s", timecode_path, e)
+
+async def import_setlist(db, files: List[UploadFile], bpm: Optional[float] = None, measures_per_section: Optional[int] = None, beats_per_measure: Optional[int] = None) -> List[dict]:
+    """Imports a whole setlist: any mix of song files and zip archives of song files.
+
+    A `.txt` whose stem matches an audio file is stored next to it as its lyrics
+    (the pairing `process_song_file` looks for) rather than becoming a song of its
+    own. Files found in the parse cache are reused; the rest are parsed concurrently
+    on the job queue's worker processes, and the resulting `Song` rows are written
+    in one transaction once parsing is done.
+    Returns one result dict per input file, in input order.
+    """
+    staged, results = await run_in_threadpool(_stage_setlist, files, bpm, measures_per_section, beats_per_measure)
+
+    async def parse(song, key):
+        if song.get("timecode_path"):
+            return song["timecode_path"]  # Restored from the parse cache while staging
+        return await process_song(song["id"], song["file_path"], bpm, measures_per_section, beats_per_measure, key)
+
+    outcomes = await asyncio.gather(*(parse(song, key) for song, _, key in staged), return_exceptions=True)
+
+    rows = []
+    for (song, result, _), outcome in zip(staged, outcomes):
+        if isinstance(outcome, Exception):
+            song.update(processed=False, status="failed", job_error=str(outcome))
+            result.update(status="failed", processed=False, error=str(outcome))
+        else:
+            song.update(processed=outcome is not None, timecode_path=outcome, status="done")
+            result.update(status="done", processed=outcome is not None)
+        rows.append(song)
+
+    try:
+        await add_songs(db, rows)
+    except Exception:
+        for song, _, _ in staged:
+            shutil.rmtree(os.path.join(SONGS_DIR, song["id"]), ignore_errors=True)
+        raise
+    return results
 
-    timecode_path = os.path.join(song_dir, "timecode.json")
+def _stage_setlist(files: List[UploadFile], bpm: Optional[float] = None, measures_per_section: Optional[int] = None, beats_per_measure: Optional[int] = None):
+    """Expands zip archives, pairs audio with companion lyrics, saves each song's raw files
+    and restores cached timecodes where the parse cache has them.
+
+    Returns ([(song column values, result dict, cache key)], all result dicts in input order).
+    """
+    entries = []  # (file name, readable binary stream)
+    results = []
+    archives = []
+    try:
+        for file in files:
+            name = os.path.basename(file.filename or "")
+            if Path(name).suffix.lower() != '.zip':
+                entries.append((name, file.file))
+                continue
+            try:
+                archive = zipfile.ZipFile(file.file)
+            except zipfile.BadZipFile:
+                results.append({"file": name, "status": "failed", "error": "Not a valid zip archive"})
+                continue
+            archives.append(archive)
+            for info in archive.infolist():
+                member_name = os.path.basename(info.filename)
+                # Skip folders and the resource-fork/hidden files macOS adds to archives
+                if info.is_dir() or not member_name or member_name.startswith('.') or info.filename.startswith('__MACOSX/'):
+                    continue
+                entries.append((member_name, archive.open(info)))
+
+        audio_stems = {Path(name).stem.lower() for name, _ in entries if Path(name).suffix.lower() in AUDIO_EXTENSIONS}
+        companions = {Path(name).stem.lower(): (name, stream) for name, stream in entries
+                      if Path(name).suffix.lower() == '.txt' and Path(name).stem.lower() in audio_stems}
+
+        staged = []
+        companion_contents = {}
+        for name, stream in entries:
+            extension = Path(name).suffix.lower()
+            if extension not in SUPPORTED_EXTENSIONS:
+                results.append({"file": name, "status": "skipped", "error": f"Unsupported file type: {extension or 'none'}"})
+                continue
+            if extension == '.txt' and Path(name).stem.lower() in audio_stems:
+                continue  # Reported together with the audio file it belongs to
+
+            song_id = str(uuid4())
+            raw_files_dir = os.path.join(SONGS_DIR, song_id, "raw")
+            os.makedirs(raw_files_dir, exist_ok=True)
+            saved_file_path = os.path.join(raw_files_dir, name)
+            digest = copy_and_hash(stream, saved_file_path)
+            parse_cache.store_raw(saved_file_path, digest, evict=False)
+
+            title = Path(name).stem.replace('_', ' ').title()
+            song = {"id": song_id, "title": title, "file_path": saved_file_path}
+            result = {"file": name, "song_id": song_id, "title": title, "status": "queued"}
+            results.append(result)
+
+            companion = companions.get(Path(name).stem.lower()) if extension in AUDIO_EXTENSIONS else None
+            companion_digest = None
+            if companion:
+                companion_name, companion_stream = companion
+                if companion_name not in companion_contents:
+                    companion_contents[companion_name] = companion_stream.read()
+                with open(os.path.join(raw_files_dir, f"{Path(name).stem}.txt"), "wb") as f:
+                    f.write(companion_contents[companion_name])
+                companion_digest = hashlib.sha256(companion_contents[companion_name]).hexdigest()
+                result["companion"] = companion_name
+                results.append({"file": companion_name, "song_id": song_id, "title": title, "status": "paired", "paired_with": name})
+
+            key = cache_key(digest, extension, bpm, measures_per_section, beats_per_measure, companion_digest)
+            timecode_path = os.path.join(SONGS_DIR, song_id, TIMECODE_FILENAME)
+            if parse_cache.restore(key, timecode_path):
+                song["timecode_path"] = timecode_path
+                result["cached"] = True
+            staged.append((song, result, key))
+        parse_cache.evict()
+        return staged, results
+    finally:
+        for archive in archives:
+            archive.close()
+
+def _save_upload(file: UploadFile, saved_file_path: str) -> str:
+    """Saves an upload, dedupes it against identical raw files and returns its SHA-256."""
+    digest = copy_and_hash(file.file, saved_file_path)
+    parse_cache.store_raw(saved_file_path, digest)
+    return digest
+
+def process_song_file(song_id: str, saved_file_path: str, bpm: Optional[float] = None, measures_per_section: Optional[int] = None, beats_per_measure: Optional[int] = None) -> Optional[str]:
+    """Generates the song's timecode file for an upload. Runs in a job queue worker process.
+
+    Timecodes are written in the columnar format (`timecode_store`); an uploaded
+    `timecode.json` is imported as-is.
+
+    Returns the timecode path, or None if the file type yields no timecodes.
+    Raises if parsing fails.
+    """
+    # Derived from the upload's location: data/songs/<song_id>/raw/<file>
+    raw_files_dir = os.path.dirname(saved_file_path)
+    song_dir = os.path.dirname(raw_files_dir)
+    file_name = os.path.basename(saved_file_path)
+    file_extension = Path(file_name).suffix.lower()
+    logger.debug("Processing %s (%s)", file_name, file_extension)
+
+    timecode_path = os.path.join(song_dir, TIMECODE_FILENAME)
     processed = False
 
     try:
         # Determine file type and process from the saved file
-        if file_extension in ['.mp3', '.wav']:
-            # Placeholder for audio processing
-            # timecode_data = process_audio_file(saved_file_path)
-            # save_timecode_json(timecode_path, timecode_data)
-            # processed = True
-            print(f"Audio file {file.filename} uploaded. Audio processing is a placeholder.")
-            # For now, generate basic timecodes from a dummy lyrics file if available
-            dummy_lyrics_path = os.path.join(raw_files_dir, f"{Path(file.filename).stem}.txt")
-            if os.path.exists(dummy_lyrics_path):
-                with open(dummy_lyrics_path, 'r', encoding='utf-8') as f:
+        if file_extension in AUDIO_EXTENSIONS:
+            # The lyrics come from a companion .txt with the same stem; the recording says when each line is sung
+            lyrics_path = os.path.join(raw_files_dir, f"{Path(file_name).stem}.txt")
+            if os.path.exists(lyrics_path):
+                with open(lyrics_path, 'r', encoding='utf-8') as f:
                     lyrics_text = f.read()
-                lyrics_lines = parse_plain_text_lyrics(lyrics_text)
-                timecode_data = generate_basic_timecodes_from_text(lyrics_lines, total_duration=180.0) # Assume 3 min duration
-                save_timecode_json(timecode_path, timecode_data)
+                timecode_data = process_audio_file(saved_file_path, lyrics_text, bpm)
+                save_timecodes(timecode_path, timecode_data)
                 processed = True
             else:
-                print("No dummy lyrics file found for audio. Song not fully processed.")
+                logger.warning("No companion lyrics file found for %s; song not fully processed", file_name)
 
         elif file_extension in ['.mid', '.midi']:
-            print(f"MIDI file {file.filename} uploaded. Processing...")
             timecode_data = process_midi_file(saved_file_path)
-            save_timecode_json(timecode_path, timecode_data)
+            save_timecodes(timecode_path, timecode_data)
             processed = True
 
-        elif file_extension in ['.xml', '.musicxml']:
-            print(f"MusicXML file {file.filename} uploaded. Processing...")
+        elif file_extension in ['.xml', '.musicxml', '.mxl']:
             timecode_data = parse_musicxml(saved_file_path)
-            save_timecode_json(timecode_path, timecode_data)
+            save_timecodes(timecode_path, timecode_data)
             processed = True
 
         elif file_extension == '.txt':
@@ -84,36 +263,30 @@ async def upload_and_process_song(db, file: UploadFile, title: Optional[str] = N
                 lyrics_text = f.read()
             lyrics_lines = parse_plain_text_lyrics(lyrics_text)
             timecode_data = generate_basic_timecodes_from_text(lyrics_lines)
-            save_timecode_json(timecode_path, timecode_data)
+            save_timecodes(timecode_path, timecode_data)
+            processed = True
+
+        elif file_extension == '.json':
+            timecode_data = load_timecode_json(saved_file_path)
+            save_timecodes(timecode_path, timecode_data)
             processed = True
-            print(f"Plain text lyrics file {file.filename} uploaded and processed.")
 
         elif file_extension == '.pdf':
-            print(f"PDF file {file.filename} uploaded. Processing...")
-            if bpm is None:
-                raise ValueError("BPM is required for PDF song chart processing.")
-            
+            # The server sends PDFs through `ingest_pdf`; this is the same work in one process
             pdf_text = extract_text_from_pdf(saved_file_path)
             song_structure = parse_song_structure(pdf_text)
             timecode_data = generate_timecodes_from_structure(song_structure, bpm, measures_per_section, beats_per_measure)
-            save_timecode_json(timecode_path, timecode_data)
+            save_timecodes(timecode_path, timecode_data)
             processed = True
 
         else:
-            print(f"Unsupported file type: {file_extension}. Song not processed for timecodes.")
+            logger.warning("Unsupported file type %s; %s not processed for timecodes", file_extension, file_name)
 
     except Exception as e:
-        print(f"[Song Loader] Error processing file {file.filename}: {e}")
-        traceback.print_exc() # Print full traceback
-        # Clean up partially created song directory if processing fails
-        if os.path.exists(song_dir):
-            shutil.rmtree(song_dir)
-        # Delete song entry from DB if processing failed
-        db.delete(db_song)
-        db.commit()
+        logger.exception("Error processing file %s", file_name)
+        # Don't leave a partial timecode file behind; the raw upload is kept for inspection
+        if os.path.exists(timecode_path):
+            os.remove(timecode_path)
         raise Exception(f"Failed to process uploaded file: {e}")
 
-    # Update song status in DB
-    update_song_processed_status(db, song_id, processed, timecode_path if processed else None)
-
-    return db_song
\ No newline at end of file
+    return timecode_path if processed else None
@@ -0,0 +1,59 @@
+from typing import Optional
+
+import numpy as np
+
+from .config import PDF_INSTRUMENTAL_MEASURES, PDF_MEASURES_PER_LINE
+from .pdf_parser import ChartStructure
+from .timecode_generator import TimecodeData
+
+
+def generate_timecodes_from_structure(structure: ChartStructure, bpm: Optional[float] = None,
+                                      measures_per_section: Optional[int] = None,
+                                      beats_per_measure: Optional[int] = None) -> TimecodeData:
+    """Times every lyric line of a parsed chart from its tempo.
+
+    Each time a section is played it lasts `measures_per_section` measures, or
+    without one, PDF_MEASURES_PER_LINE measures per lyric line (sections with no
+    lyrics, such as an intro, PDF_INSTRUMENTAL_MEASURES); its lines are spread
+    evenly over it, on the beat where there is room. Sections play in order, each
+    `repeat` times. `bpm` and `beats_per_measure` fall back to what the chart
+    prints, then (meter only) to 4/4.
+
+    Section labels are not included in the output. The times of all played
+    lines are computed at once with array arithmetic, not line by line.
+    """
+    bpm = bpm or structure.bpm
+    if not bpm:
+        raise ValueError("BPM is required for PDF song chart processing (none given, and none printed on the chart).")
+    beats_per_measure = beats_per_measure or structure.beats_per_measure or 4
+    sections = structure.sections
+    if not sections:
+        return TimecodeData(timecodes=[])
+    seconds_per_beat = 60.0 / bpm
+
+    line_counts = np.array([len(section.lines) for section in sections], dtype=np.int64)
+    repeats = np.array([max(1, section.repeat) for section in sections], dtype=np.int64)
+    if measures_per_section:
+        measures = np.full(len(sections), float(measures_per_section))
+    else:
+        measures = np.where(line_counts > 0, line_counts * PDF_MEASURES_PER_LINE, PDF_INSTRUMENTAL_MEASURES).astype(np.float64)
+    durations = measures * beats_per_measure * seconds_per_beat
+
+    # One entry per played section (repeats written out), then one per played line
+    played = np.repeat(np.arange(len(sections)), repeats)
+    played_starts = np.concatenate(([0.0], np.cumsum(durations[played])[:-1]))
+    played_counts = line_counts[played]
+    line_played = np.repeat(np.arange(len(played)), played_counts)
+    line_in_section = np.arange(len(line_played)) - np.repeat(np.cumsum(played_counts) - played_counts, played_counts)
+
+    interval = (durations[played] / np.maximum(played_counts, 1))[line_played]
+    offsets = line_in_section * interval
+    on_beat = np.floor(offsets / seconds_per_beat + 1e-9) * seconds_per_beat
+    times = played_starts[line_played] + np.where(interval >= seconds_per_beat, on_beat, offsets)
+
+    # Texts are looked up by index into the chart's lines, so each is stored once however often it is sung
+    texts = [line for section in sections for line in section.lines]
+    section_offsets = np.cumsum(line_counts) - line_counts
+    text_index = section_offsets[played][line_played] + line_in_section
+    # Validating plain dicts in one call is cheaper than building an entry model per line
+    return TimecodeData(timecodes=[{"time": t, "text": texts[i]} for t, i in zip(times.tolist(), text_index.tolist())])
@@ -0,0 +1,185 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple, Union
+
+from .config import TIMECODE_CACHE_MAX_ENTRIES, TIMELINE_WINDOW_LINES
+from .lyric_index import LyricTimelineIndex
+from .metrics import metrics
+from .playback_plan import PlaybackPlan
+from .timecode_generator import TimecodeData
+from .timecode_store import ColumnarTimecodes, open_timecodes
+from .trigger_interface import encode_song_start, encode_timeline
+
+lookup_seconds = metrics.histogram(
+    "lyricpilot_timecode_lookup_seconds", "Time to look a song's timecodes up in the cache (a miss includes the load)", ("result",))
+load_seconds = metrics.histogram("lyricpilot_timecode_load_seconds", "Time to load a song's timecode file on a cache miss")
+
+
+class _CacheEntry:
+    __slots__ = ("path", "mtime_ns", "size", "source", "data", "index", "plan", "timeline_json")
+
+    def __init__(self, path: str, mtime_ns: int, size: int, source: Union[ColumnarTimecodes, TimecodeData]):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.source = source
+        # Columnar files are only decoded into pydantic objects if something asks for them
+        self.data: Optional[TimecodeData] = source if isinstance(source, TimecodeData) else None
+        self.index: Optional[LyricTimelineIndex] = None
+        self.plan: Optional[PlaybackPlan] = None
+        self.timeline_json: Dict[str, str] = {}  # Whole timeline, per encoding
+
+
+class TimecodeCache:
+    """Process-wide LRU cache of parsed timecode files, keyed by song id.
+
+    Entries are revalidated against the file's mtime and size on every lookup,
+    so a timecode file rewritten behind our back is reloaded on next access.
+    Writes through `save_timecodes` / `save_timecode_json` invalidate the matching
+    entry directly. Columnar files stay memory-mapped: the lyric index reads the
+    mapped times and texts without copying them.
+    """
+
+    def __init__(self, max_entries: int = TIMECODE_CACHE_MAX_ENTRIES):
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _lookup(self, song_id: str, path: str) -> _CacheEntry:
+        start = time.perf_counter()
+        st = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(song_id)
+            if entry is not None and entry.path == path and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+                self._entries.move_to_end(song_id)
+                self.hits += 1
+                lookup_seconds.labels("hit").observe(time.perf_counter() - start)
+                return entry
+            self.misses += 1
+
+        # Parse outside the lock so a slow load doesn't stall other lookups.
+        load_start = time.perf_counter()
+        entry = _CacheEntry(path, st.st_mtime_ns, st.st_size, open_timecodes(path))
+        load_seconds.observe(time.perf_counter() - load_start)
+        with self._lock:
+            self._entries[song_id] = entry
+            self._entries.move_to_end(song_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        lookup_seconds.labels("miss").observe(time.perf_counter() - start)
+        return entry
+
+    def loaded(self, song_id: str, path: str, part: str = "data") -> bool:
+        """True if the song's timecodes are cached and current with `part` ("data", "index" or "plan") built,
+        i.e. the matching `get*` call won't load, decode or compile anything. Async callers check this and
+        go through the thread pool otherwise."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        with self._lock:
+            entry = self._entries.get(song_id)
+            return (entry is not None and entry.path == path and entry.mtime_ns == st.st_mtime_ns
+                    and entry.size == st.st_size and getattr(entry, part) is not None)
+
+    def get(self, song_id: str, path: str) -> TimecodeData:
+        """Returns the parsed timecodes for a song, loading them on a miss."""
+        entry = self._lookup(song_id, path)
+        if entry.data is None:
+            entry.data = entry.source.to_timecode_data()
+        return entry.data
+
+    def get_index(self, song_id: str, path: str) -> LyricTimelineIndex:
+        """Returns the binary-search lyric index for a song, built once per cached load."""
+        return self._index(self._lookup(song_id, path))
+
+    @staticmethod
+    def _index(entry: _CacheEntry) -> LyricTimelineIndex:
+        if entry.index is None:
+            if isinstance(entry.source, ColumnarTimecodes):
+                # Already sorted by time on write
+                entry.index = LyricTimelineIndex(entry.source.times, entry.source.texts)
+            else:
+                entry.index = LyricTimelineIndex.from_entries(entry.source.timecodes)
+        return entry.index
+
+    def get_plan(self, song_id: str, path: str) -> PlaybackPlan:
+        """Returns the song's compiled playback plan, built (every frame encoded) once per cached load."""
+        entry = self._lookup(song_id, path)
+        if entry.plan is None:
+            entry.plan = PlaybackPlan(song_id, self._index(entry))
+        return entry.plan
+
+    def get_timeline_json(self, song_id: str, path: str, encoding: str = "plain") -> str:
+        """Returns the song's whole timeline serialized with `encode_timeline`, encoded once per cached load."""
+        return self._timeline_json(self._lookup(song_id, path), encoding)
+
+    def _timeline_json(self, entry: _CacheEntry, encoding: str) -> str:
+        if encoding not in entry.timeline_json:
+            index = self._index(entry)
+            entry.timeline_json[encoding] = encode_timeline(index, 0, len(index), encoding)
+        return entry.timeline_json[encoding]
+
+    def get_song_start_payload(self, song_id: str, title: str, path: str, at: Optional[float] = None,
+                               timeline: str = "stream", encoding: str = "plain",
+                               window: Optional[Tuple[int, int]] = None) -> str:
+        """Returns the serialized `song_start` message for a client with the given timeline mode and encoding.
+
+        `stream` carries the lines in `window` (start, stop; default the first
+        TIMELINE_WINDOW_LINES), `full` the whole timeline and `none` only the header.
+        """
+        entry = self._lookup(song_id, path)
+        index = self._index(entry)
+        if timeline == "full":
+            timeline_json = self._timeline_json(entry, encoding)
+        elif timeline == "none":
+            timeline_json = None
+        else:
+            start, stop = window or (0, TIMELINE_WINDOW_LINES)
+            timeline_json = encode_timeline(index, start, stop, encoding)
+        return encode_song_start(song_id, title, len(index), index.duration(), timeline_json, at)
+
+    def invalidate(self, song_id: str):
+        with self._lock:
+            if self._entries.pop(song_id, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_path(self, path: str):
+        """Drops every entry backed by `path` (used after the file is rewritten)."""
+        path = os.path.abspath(path)
+        with self._lock:
+            stale = [song_id for song_id, entry in self._entries.items() if os.path.abspath(entry.path) == path]
+            for song_id in stale:
+                del self._entries[song_id]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+timecode_cache = TimecodeCache()
+metrics.callback("lyricpilot_timecode_cache_lookups_total", "Timecode cache lookups", "counter",
+                 lambda: {("hit",): timecode_cache.hits, ("miss",): timecode_cache.misses}, ("result",))
+metrics.callback("lyricpilot_timecode_cache_evictions_total", "Songs evicted from the timecode cache", "counter",
+                 lambda: timecode_cache.evictions)
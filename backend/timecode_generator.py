@@ -1,4 +1,5 @@
 import json
+import os
 from typing import List
 from pydantic import BaseModel
 
@@ -10,8 +11,15 @@ class TimecodeData(BaseModel):
     timecodes: List[TimecodeEntry]
 
 def save_timecode_json(file_path: str, timecode_data: TimecodeData):
-    with open(file_path, 'w', encoding='utf-8') as f:
+    # Write a new file and swap it in rather than rewriting in place: the old file may be a
+    # hard link shared with the parse cache and other songs.
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         json.dump(timecode_data.model_dump(), f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, file_path)
+    # Imported here to avoid a circular import; the cache loads through this module.
+    from .timecode_cache import timecode_cache
+    timecode_cache.invalidate_path(file_path)
 
 def load_timecode_json(file_path: str) -> TimecodeData:
     with open(file_path, 'r', encoding='utf-8') as f:
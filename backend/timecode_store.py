@@ -0,0 +1,165 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Iterable, Sequence, Union
+
+from .timecode_generator import TimecodeData, TimecodeEntry, load_timecode_json
+
+# Columnar timecode file layout (all little-endian):
+#   header   magic "LPTC", u16 format version, u16 flags (0), u64 entry count, u64 text blob size
+#   times    f64[count], ascending
+#   offsets  u32[count + 1], byte offsets of each line's UTF-8 text in the blob
+#   blob     the line texts, concatenated
+MAGIC = b"LPTC"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHHQQ")
+
+# File name for a song's timecodes in the columnar format (`timecode.json` remains the JSON one)
+TIMECODE_FILENAME = "timecodes.lptc"
+
+_NATIVE_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+class TimecodeFormatError(ValueError):
+    """Raised for a columnar timecode file that is truncated or from an unknown format version."""
+
+
+def save_timecodes(file_path: str, timecode_data: Union[TimecodeData, Iterable]):
+    """Writes timecodes in the columnar format, sorted by time (stable for equal times).
+
+    Accepts a TimecodeData or any iterable of TimecodeEntry / {'time', 'text'} dicts.
+    Like `save_timecode_json`, it writes a new file and renames it into place.
+    """
+    entries = timecode_data.timecodes if isinstance(timecode_data, TimecodeData) else timecode_data
+    pairs = [(e["time"], e["text"]) if isinstance(e, dict) else (e.time, e.text) for e in entries]
+    pairs.sort(key=lambda p: p[0])
+
+    times = array("d", (p[0] for p in pairs))
+    offsets = array("I", [0])
+    blob = bytearray()
+    for _, text in pairs:
+        blob += text.encode("utf-8")
+        if len(blob) > 0xFFFFFFFF:
+            raise ValueError("Timecode texts exceed 4 GiB")
+        offsets.append(len(blob))
+    if not _NATIVE_LITTLE_ENDIAN:
+        times.byteswap()
+        offsets.byteswap()
+
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(pairs), len(blob)))
+        f.write(times.tobytes())
+        f.write(offsets.tobytes())
+        f.write(blob)
+    os.replace(tmp_path, file_path)
+    # Imported here to avoid a circular import; the cache loads through this module.
+    from .timecode_cache import timecode_cache
+    timecode_cache.invalidate_path(file_path)
+
+
+class LazyTexts(Sequence):
+    """The line texts of a columnar file, decoded from the mapped blob only when accessed."""
+
+    __slots__ = ("_offsets", "_blob")
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("timecode index out of range")
+        return str(self._blob[self._offsets[i]:self._offsets[i + 1]], "utf-8")
+
+
+class ColumnarTimecodes:
+    """A memory-mapped columnar timecode file.
+
+    `times` is a float64 view straight onto the mapping (no copy, no parsing) and
+    `texts` decodes a line only when it is read, so opening even a million-entry
+    file costs a header read. Keep the object (or a view taken from it) alive for
+    as long as the data is used; the mapping is released with it.
+    """
+
+    def __init__(self, file_path: str):
+        with open(file_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                raise TimecodeFormatError(f"{file_path} is too short for a timecode header")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count, blob_size = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise TimecodeFormatError(f"{file_path} is not a columnar timecode file")
+        if version != FORMAT_VERSION:
+            raise TimecodeFormatError(f"{file_path} has unsupported format version {version}")
+        times_start = _HEADER.size
+        offsets_start = times_start + 8 * count
+        blob_start = offsets_start + 4 * (count + 1)
+        if blob_start + blob_size > size:
+            raise TimecodeFormatError(f"{file_path} is truncated")
+
+        view = memoryview(self._mmap)
+        if _NATIVE_LITTLE_ENDIAN:
+            self.times = view[times_start:offsets_start].cast("d")
+            offsets = view[offsets_start:blob_start].cast("I")
+        else:
+            # Big-endian hosts pay for one copy of the numeric columns
+            self.times = array("d", view[times_start:offsets_start].tobytes())
+            self.times.byteswap()
+            offsets = array("I", view[offsets_start:blob_start].tobytes())
+            offsets.byteswap()
+        self.texts = LazyTexts(offsets, view[blob_start:blob_start + blob_size])
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def entry(self, i: int) -> dict:
+        return {"time": self.times[i], "text": self.texts[i]}
+
+    def to_timecode_data(self) -> TimecodeData:
+        """Decodes every line into a TimecodeData (for JSON export and API responses)."""
+        texts = self.texts[:]
+        return TimecodeData.model_construct(timecodes=[TimecodeEntry.model_construct(time=t, text=s) for t, s in zip(self.times.tolist(), texts)])
+
+
+def is_columnar(file_path: str) -> bool:
+    with open(file_path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def open_timecodes(file_path: str) -> Union[ColumnarTimecodes, TimecodeData]:
+    """Opens a timecode file in either format, detected from its first bytes (not its name)."""
+    if is_columnar(file_path):
+        return ColumnarTimecodes(file_path)
+    return load_timecode_json(file_path)
+
+
+def load_timecodes(file_path: str) -> TimecodeData:
+    """Loads a timecode file in either format as TimecodeData."""
+    timecodes = open_timecodes(file_path)
+    return timecodes.to_timecode_data() if isinstance(timecodes, ColumnarTimecodes) else timecodes
+
+
+def timecode_text(file_path: str) -> str:
+    """The distinct line texts of a timecode file in order, one per line (what the song search indexes)."""
+    timecodes = open_timecodes(file_path)
+    texts = timecodes.texts[:] if isinstance(timecodes, ColumnarTimecodes) else [e.text for e in timecodes.timecodes]
+    return "\n".join(dict.fromkeys(text for text in texts if text))
+
+
+def export_timecode_json(timecodes: Union[ColumnarTimecodes, TimecodeData]) -> str:
+    """Serializes timecodes in the `timecode.json` import/export format."""
+    if isinstance(timecodes, ColumnarTimecodes):
+        timecodes = timecodes.to_timecode_data()
+    return json.dumps(timecodes.model_dump(), ensure_ascii=False, indent=4)
@@ -1,67 +1,500 @@
-from typing import List
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 import asyncio
+import itertools
 import json
+import logging
+import re
+import time
+from collections import deque
 
 from websockets.exceptions import ConnectionClosedOK, ConnectionClosedError
-from fastapi import WebSocket
+from fastapi import WebSocket, WebSocketDisconnect
+
+from .backplane import Backplane, backplane
+from .clock_sync import ClockEstimate, server_time
+from .config import BROADCAST_SEND_TIMEOUT, BROADCAST_LATENCY_SAMPLES, CLIENT_QUEUE_MAX_MESSAGES, DEFAULT_ROOM
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Message types where only the newest unsent one matters to a lagging client
+COALESCED_MESSAGE_TYPES = frozenset({"lyric_update"})
+
+# How a display wants the song timeline (negotiated with `hello`): a window in song_start plus
+# timeline_chunk messages ahead of the playhead, the whole timeline in song_start, or none at all
+TIMELINE_MODES = ("stream", "full", "none")
+# Timeline line encodings: `plain` times are seconds, `delta` times are integer millisecond steps
+TIMELINE_ENCODINGS = ("plain", "delta")
+
+# Room (named session) names: letters, digits, '_', '-' and '.', up to 64 characters
+ROOM_NAME_PATTERN = r"^[A-Za-z0-9][A-Za-z0-9_.\-]{0,63}$"
+_ROOM_NAME_RE = re.compile(ROOM_NAME_PATTERN)
+
+serialize_seconds = metrics.histogram(
+    "lyricpilot_serialize_seconds", "Time to serialize an outgoing message", ("message",))
+broadcast_seconds = metrics.histogram(
+    "lyricpilot_broadcast_seconds", "Time to queue one broadcast on the outbound queue of every client it goes to")
+client_send_seconds = metrics.histogram(
+    "lyricpilot_client_send_seconds", "Time from queueing a message for a WebSocket client to its send completing")
+connections_total = metrics.counter("lyricpilot_websocket_connections_total", "WebSocket connections accepted")
+
+
+def valid_room(room) -> bool:
+    return isinstance(room, str) and _ROOM_NAME_RE.match(room) is not None
+
+
+def encode_message(message_type: str, data: dict) -> str:
+    """Serializes a WebSocket message once, in the same compact form as `send_json`."""
+    return json.dumps({"type": message_type, "data": data}, ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_timeline(index, start: int, stop: int, encoding: str = "plain") -> str:
+    """Serializes lines [start, stop) of a LyricTimelineIndex as a JSON object.
+
+    `plain`: {"start", "encoding", "times": [seconds, ...], "texts"}.
+    `delta`: {"start", "encoding", "t0", "dt", "texts"}, where line k is shown at
+    t0 + dt[0] + ... + dt[k-1] milliseconds; the steps between lines are small
+    integers, so long timelines shrink to a fraction of their `plain` size.
+    """
+    start = max(0, start)
+    stop = max(start, min(stop, len(index)))
+    texts = list(index.texts[start:stop])
+    if encoding == "delta":
+        ms = [round(t * 1000) for t in index.times[start:stop].tolist()]
+        timeline = {"start": start, "encoding": "delta", "t0": ms[0] if ms else 0,
+                    "dt": [b - a for a, b in zip(ms, ms[1:])], "texts": texts}
+    else:
+        timeline = {"start": start, "encoding": "plain", "times": index.times[start:stop].tolist(), "texts": texts}
+    return json.dumps(timeline, ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_song_start(song_id: str, title: str, line_count: int, duration: float,
+                      timeline_json: Optional[str] = None, at: Optional[float] = None) -> str:
+    """Builds a `song_start` message: a small header plus, optionally, already-serialized timeline lines.
+
+    `at` is the server time (see clock_sync.server_time) at which playback begins.
+    """
+    header = json.dumps({"song_id": song_id, "title": title, "at": at, "line_count": line_count, "duration": duration},
+                        ensure_ascii=False, separators=(",", ":"))
+    if timeline_json is None:
+        return f'{{"type":"song_start","data":{header}}}'
+    return f'{{"type":"song_start","data":{header[:-1]},"timeline":{timeline_json}}}}}'
+
+
+def encode_timeline_chunk(song_id: str, timeline_json: str) -> str:
+    return f'{{"type":"timeline_chunk","data":{{"song_id":{json.dumps(song_id)},"timeline":{timeline_json}}}}}'
+
+
+class LatencyRecorder:
+    """Keeps the most recent latency samples (seconds) and reports percentiles."""
+
+    def __init__(self, max_samples: int = BROADCAST_LATENCY_SAMPLES):
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def percentile(self, pct: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "p50_ms": self.percentile(50) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+        }
+
+
+class ClientConnection:
+    """One WebSocket plus its bounded outbound queue and writer task.
+
+    Broadcasting only appends to the queue; the writer drains it at whatever pace
+    the client manages. If the client falls behind, a newer `lyric_update` replaces
+    the unsent older one instead of queueing behind it. Other messages are never
+    discarded: a client whose queue fills up with them is disconnected instead.
+    """
+
+    def __init__(self, websocket: WebSocket, interface: "TriggerInterface", max_queue: int = CLIENT_QUEUE_MAX_MESSAGES,
+                 room: str = DEFAULT_ROOM):
+        self.websocket = websocket
+        self.label = str(websocket.client)
+        self.room = room  # Changed only through TriggerInterface.join, which keeps the room index in step
+        self.max_queue = max_queue
+        self.queue = deque()  # (message_type, text, enqueued_at)
+        self.latency = LatencyRecorder()
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.song_id: Optional[str] = None  # Song the client subscribed to, if any
+        self.timeline = "stream"  # Negotiated with `hello` (TIMELINE_MODES / TIMELINE_ENCODINGS)
+        self.encoding = "plain"
+        # Compression itself is the standard permessage-deflate extension, agreed in the handshake
+        self.deflate_offered = "permessage-deflate" in websocket.headers.get("sec-websocket-extensions", "")
+        self.acks = 0
+        self.last_ack: Optional[dict] = None
+        self.clock = ClockEstimate()
+        self._interface = interface
+        self._wakeup = asyncio.Event()
+        self._writer = asyncio.ensure_future(self._write_loop())
+
+    def enqueue(self, message_type: str, text: str) -> bool:
+        """Queues a message for this client; returns False if the client must be dropped."""
+        queue = self.queue
+        if message_type in COALESCED_MESSAGE_TYPES:
+            for i in range(len(queue) - 1, -1, -1):
+                if queue[i][0] == message_type:
+                    del queue[i]
+                    self.coalesced += 1
+                    self._interface.coalesced += 1
+                    break
+        if len(queue) >= self.max_queue:
+            self.dropped += 1
+            self._interface.dropped_sends += 1
+            return False
+        queue.append((message_type, text, time.perf_counter()))
+        if len(queue) > self.max_depth:
+            self.max_depth = len(queue)
+        self._wakeup.set()
+        return True
+
+    async def _write_loop(self):
+        send_timeout = self._interface.send_timeout
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.queue:
+                _, text, enqueued_at = self.queue.popleft()
+                try:
+                    await asyncio.wait_for(self.websocket.send_text(text), send_timeout)
+                except asyncio.TimeoutError:
+                    # A send cancelled mid-frame leaves the socket unusable, so a client this slow is dropped.
+                    logger.debug("Send to %s timed out after %ss; dropping connection", self.label, send_timeout)
+                    self.dropped += 1
+                    self._interface.dropped_sends += 1
+                    self._interface.drop(self.websocket)
+                    return
+                except (ConnectionClosedOK, ConnectionClosedError, RuntimeError) as e:
+                    logger.debug("Failed to send to %s (%s); removing connection", self.label, e)
+                    self.dropped += 1
+                    self._interface.dropped_sends += 1
+                    self._interface.drop(self.websocket)
+                    return
+                latency = time.perf_counter() - enqueued_at
+                self.latency.record(latency)
+                client_send_seconds.observe(latency)
+                self.sent += 1
+
+    def close(self):
+        self._writer.cancel()
+        self.queue.clear()
+
+    def stats(self) -> dict:
+        return {
+            "client": self.label,
+            "room": self.room,
+            "queue_depth": len(self.queue),
+            "max_queue_depth": self.max_depth,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "song_id": self.song_id,
+            "timeline": self.timeline,
+            "encoding": self.encoding,
+            "deflate_offered": self.deflate_offered,
+            "acks": self.acks,
+            **self.latency.summary(),
+        }
+
+
+class Room:
+    """The clients in one room, and the cost of broadcasting to them."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.broadcast_latency = LatencyRecorder()
+        self.broadcasts = 0
+
+    def stats(self) -> dict:
+        return {"connections": len(self.clients), "broadcasts": self.broadcasts, "broadcast_latency": self.broadcast_latency.summary()}
+
 
 class TriggerInterface:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    """All WebSocket clients, indexed by room.
+
+    Every client is in exactly one room (DEFAULT_ROOM unless it asked for
+    another). A broadcast goes either to one room, touching only that room's
+    clients through the room index, or to everyone (`room=None`, for messages
+    such as `job_progress` that aren't about playback).
+
+    With a shared `backplane` (several worker processes), every broadcast is also
+    published to the other workers, which fan it out to their own clients through
+    `deliver`; this worker's clients never wait on that hop.
+    """
+
+    def __init__(self, send_timeout: float = BROADCAST_SEND_TIMEOUT, backplane: Optional[Backplane] = None):
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.rooms: Dict[str, Room] = {}
+        self.send_timeout = send_timeout
+        self.broadcast_latency = LatencyRecorder()
+        self.broadcasts = 0
+        self.dropped_sends = 0
+        self.dropped_connections = 0
+        self.coalesced = 0
+        self.backplane = backplane
+        self.relayed = 0  # Broadcasts from other workers fanned out here
+        self.relay_latency = LatencyRecorder()  # From publish in the other worker to fan-out here
+
+    async def serve(self, websocket: WebSocket, on_message: Optional[Callable[[ClientConnection, dict], Awaitable[None]]] = None,
+                    room: str = DEFAULT_ROOM):
+        """Accepts a WebSocket into `room` and services it until the client disconnects.
 
-    async def connect(self, websocket: WebSocket):
-        self.active_connections.append(websocket)
-        print(f"WebSocket connected: {websocket.client}")
+        The handler sleeps in `receive()` until a frame arrives, so an idle socket
+        costs nothing and a disconnect is noticed immediately. `ping`, `ack` and
+        `hello` are answered here; any other JSON object is passed to `on_message`.
+
+        `hello` negotiates how the client receives song timelines: `timeline` is one
+        of TIMELINE_MODES and `encoding` one of TIMELINE_ENCODINGS. The reply echoes
+        what was accepted; clients that never say hello get `stream` / `plain`.
+
+        `ping` is the clock-sync exchange: the client sends its send time, and the
+        pong carries the server's receive and send times so the client can compute
+        its offset and RTT (see clock_sync). Each ping also reports the client's
+        previous raw sample, which feeds the server-side per-client estimate.
+        """
+        await websocket.accept()
+        client = self.register(websocket, room)
         try:
-            await websocket.wait_closed()
-        except (ConnectionClosedOK, ConnectionClosedError):
+            while True:
+                frame = await websocket.receive()
+                received_at = server_time()
+                if frame["type"] == "websocket.disconnect":
+                    break
+                try:
+                    message = json.loads(frame.get("text") or frame.get("bytes") or b"")
+                except ValueError:
+                    logger.debug("Ignoring malformed WebSocket message from %s", client.label)
+                    continue
+                if not isinstance(message, dict):
+                    continue
+                message_type = message.get("type")
+                if message_type == "ping":
+                    sample = message.get("sample")
+                    if isinstance(sample, dict) and isinstance(sample.get("offset"), (int, float)) and isinstance(sample.get("rtt"), (int, float)):
+                        client.clock.add_sample(sample["offset"], sample["rtt"])
+                    self.send_to(client, "pong", {"client_time": message.get("client_time"), "server_receive": received_at, "server_time": server_time()})
+                elif message_type == "ack":
+                    client.acks += 1
+                    client.last_ack = message.get("data")
+                elif message_type == "hello":
+                    if message.get("timeline") in TIMELINE_MODES:
+                        client.timeline = message["timeline"]
+                    if message.get("encoding") in TIMELINE_ENCODINGS:
+                        client.encoding = message["encoding"]
+                    self.send_to(client, "hello", {"timeline": client.timeline, "encoding": client.encoding})
+                elif on_message is not None:
+                    try:
+                        await on_message(client, message)
+                    except WebSocketDisconnect:
+                        raise
+                    except Exception:
+                        # A bug or bad input in the app's handler costs this message, not the connection
+                        logger.exception("Error handling %r message from %s", message_type, client.label)
+        except WebSocketDisconnect:
             pass
+        except Exception as e:
+            logger.warning("WebSocket error: %s", e)
         finally:
-            if websocket in self.active_connections:
-                self.active_connections.remove(websocket)
-            print(f"WebSocket disconnected: {websocket.client}")
-
-    async def send_lyric_update(self, lyric_data: dict):
-        message_dict = {"type": "lyric_update", "data": lyric_data}
-        print(f"Sending lyric update to {len(self.active_connections)} connections.")
-        # Create a copy of the list to iterate over, as we might modify the original
-        connections_to_remove = []
-        for connection in list(self.active_connections):
-            try:
-                await connection.send_json(message_dict)
-            except (ConnectionClosedOK, ConnectionClosedError, RuntimeError) as e:
-                print(f"Failed to send to {connection.client} (Error: {e}). Removing connection.")
-                connections_to_remove.append(connection)
-        for conn in connections_to_remove:
-            if conn in self.active_connections:
-                self.active_connections.remove(conn)
-
-    async def send_song_start(self, song_id: str, title: str, timecodes: List[dict]):
-        message_dict = {"type": "song_start", "data": {"song_id": song_id, "title": title, "timecodes": timecodes}}
-        print(f"Sending song_start for {title} to {len(self.active_connections)} connections.")
-        connections_to_remove = []
-        for connection in list(self.active_connections):
-            try:
-                await connection.send_json(message_dict)
-            except (ConnectionClosedOK, ConnectionClosedError, RuntimeError) as e:
-                print(f"Failed to send to {connection.client} (Error: {e}). Removing connection.")
-                connections_to_remove.append(connection)
-        for conn in connections_to_remove:
-            if conn in self.active_connections:
-                self.active_connections.remove(conn)
-
-    async def send_message(self, message_type: str, data: dict):
-        message_dict = {"type": message_type, "data": data}
-        print(f"Sending generic message '{message_type}' to {len(self.active_connections)} connections.")
-        connections_to_remove = []
-        for connection in list(self.active_connections):
-            try:
-                await connection.send_json(message_dict)
-            except (ConnectionClosedOK, ConnectionClosedError, RuntimeError) as e:
-                print(f"Failed to send to {connection.client} (Error: {e}). Removing connection.")
-                connections_to_remove.append(connection)
-        for conn in connections_to_remove:
-            if conn in self.active_connections:
-                self.active_connections.remove(conn)
-
-trigger_interface = TriggerInterface()
+            self.unregister(websocket)
+
+    def register(self, websocket: WebSocket, room: str = DEFAULT_ROOM) -> ClientConnection:
+        """Starts broadcasting to an accepted WebSocket, as a member of `room`."""
+        client = ClientConnection(websocket, self, room=room)
+        self.clients[websocket] = client
+        self._room(room).clients[websocket] = client
+        connections_total.inc()
+        return client
+
+    def unregister(self, websocket: WebSocket):
+        client = self.clients.pop(websocket, None)
+        if client:
+            self._leave(client)
+            client.close()
+
+    def join(self, client: ClientConnection, room: str):
+        """Moves a client to another room."""
+        if client.room == room or client.websocket not in self.clients:
+            return
+        self._leave(client)
+        client.room = room
+        self._room(room).clients[client.websocket] = client
+
+    def _room(self, name: str) -> Room:
+        room = self.rooms.get(name)
+        if room is None:
+            room = self.rooms[name] = Room(name)
+        return room
+
+    def _leave(self, client: ClientConnection):
+        room = self.rooms.get(client.room)
+        if room is not None:
+            room.clients.pop(client.websocket, None)
+            if not room.clients:
+                del self.rooms[client.room]  # Rooms exist while they have clients
+
+    def room_clients(self, room: Optional[str]):
+        """The clients a broadcast to `room` reaches (None: everyone), snapshotted as a list."""
+        if room is None:
+            return list(self.clients.values())
+        members = self.rooms.get(room)
+        return list(members.clients.values()) if members is not None else []
+
+    def drop(self, websocket: WebSocket):
+        """Unregisters a client that can't keep up and closes its socket in the background."""
+        if websocket not in self.clients:
+            return
+        self.unregister(websocket)
+        self.dropped_connections += 1
+        asyncio.ensure_future(self._close_quietly(websocket))
+
+    @staticmethod
+    async def _close_quietly(connection: WebSocket):
+        try:
+            await connection.close()
+        except Exception:
+            pass
+
+    async def broadcast(self, message_type: str, text: str, room: Optional[str] = None):
+        """Queues an already-serialized message on the outbound queue of every client in
+        `room` (every client at all if None).
+
+        This never waits on the network; each client's writer task sends at its own pace.
+        """
+        self._fan_out(message_type, text, room)
+        if self.backplane is not None and self.backplane.shared:
+            self.backplane.publish("broadcast", {"type": message_type, "room": room}, (text,))
+
+    def _fan_out(self, message_type: str, text: str, room: Optional[str]):
+        start = time.perf_counter()
+        for client in self.room_clients(room):
+            self.send_text_to(client, message_type, text)
+        self._record_broadcast(room, time.perf_counter() - start)
+
+    async def broadcast_variants(self, message_type: str, encode: Callable[[str, str], Optional[str]], room: Optional[str] = None):
+        """Like `broadcast`, for messages whose form depends on what each client negotiated.
+
+        `encode(timeline_mode, encoding)` is called once per combination present among
+        the room's clients; clients for which it returns None are skipped. Other
+        workers' clients may have negotiated anything, so with a shared backplane
+        every combination is encoded and published.
+        """
+        encoded: Dict[Tuple[str, str], Optional[str]] = {}
+
+        def variant(key: Tuple[str, str]) -> Optional[str]:
+            if key not in encoded:
+                start = time.perf_counter()
+                encoded[key] = encode(*key)
+                serialize_seconds.labels(message_type).observe(time.perf_counter() - start)
+            return encoded[key]
+        self._fan_out_variants(message_type, variant, room)
+        if self.backplane is not None and self.backplane.shared:
+            keys = [key for key in itertools.product(TIMELINE_MODES, TIMELINE_ENCODINGS) if variant(key) is not None]
+            self.backplane.publish("broadcast", {"type": message_type, "room": room, "variants": keys}, [encoded[key] for key in keys])
+
+    def _fan_out_variants(self, message_type: str, variant: Callable[[Tuple[str, str]], Optional[str]], room: Optional[str]):
+        start = time.perf_counter()
+        for client in self.room_clients(room):
+            text = variant((client.timeline, client.encoding))
+            if text is not None:
+                self.send_text_to(client, message_type, text)
+        self._record_broadcast(room, time.perf_counter() - start)
+
+    async def deliver(self, header: dict, payloads: List[str]):
+        """Fans out a broadcast another worker published on the backplane to this worker's clients."""
+        self.relayed += 1
+        self.relay_latency.record(max(0.0, server_time() - header["sent"]))
+        if "variants" in header:
+            encoded = {tuple(key): text for key, text in zip(header["variants"], payloads)}
+            self._fan_out_variants(header["type"], encoded.get, header["room"])
+        else:
+            self._fan_out(header["type"], payloads[0], header["room"])
+
+    def _record_broadcast(self, room: Optional[str], seconds: float):
+        self.broadcast_latency.record(seconds)
+        broadcast_seconds.observe(seconds)
+        self.broadcasts += 1
+        members = self.rooms.get(room) if room is not None else None
+        if members is not None:
+            members.broadcast_latency.record(seconds)
+            members.broadcasts += 1
+
+    def send_to(self, client: ClientConnection, message_type: str, data: dict):
+        """Queues a message for a single client."""
+        self.send_text_to(client, message_type, encode_message(message_type, data))
+
+    def send_text_to(self, client: ClientConnection, message_type: str, text: str):
+        if not client.enqueue(message_type, text):
+            logger.debug("Outbound queue full for %s; dropping connection", client.label)
+            self.drop(client.websocket)
+
+    async def send_lyric_update(self, lyric_data: dict, room: Optional[str] = None):
+        await self.broadcast("lyric_update", encode_message("lyric_update", lyric_data), room)
+
+    async def send_timeline_chunk(self, song_id: str, index, start: int, stop: int, room: Optional[str] = None):
+        """Streams timeline lines [start, stop) to the clients in `stream` mode."""
+        def encode(timeline_mode: str, encoding: str) -> Optional[str]:
+            if timeline_mode != "stream":
+                return None
+            return encode_timeline_chunk(song_id, encode_timeline(index, start, stop, encoding))
+        await self.broadcast_variants("timeline_chunk", encode, room)
+
+    async def send_message(self, message_type: str, data: dict, room: Optional[str] = None, text: Optional[str] = None):
+        """Broadcasts `data`; `text` is the message already serialized, if the caller has it."""
+        if text is None:
+            start = time.perf_counter()
+            text = encode_message(message_type, data)
+            serialize_seconds.labels(message_type).observe(time.perf_counter() - start)
+        await self.broadcast(message_type, text, room)
+
+    def clock_stats(self) -> List[dict]:
+        return [{"client": client.label, **client.clock.stats()} for client in self.clients.values()]
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.clients),
+            "broadcasts": self.broadcasts,
+            "dropped_sends": self.dropped_sends,
+            "dropped_connections": self.dropped_connections,
+            "coalesced": self.coalesced,
+            "broadcast_latency": self.broadcast_latency.summary(),
+            "relayed": self.relayed,
+            "relay_latency": self.relay_latency.summary(),
+            "backplane": self.backplane.stats() if self.backplane is not None else None,
+            "rooms": {name: room.stats() for name, room in self.rooms.items()},
+            "clients": [client.stats() for client in self.clients.values()],
+        }
+
+trigger_interface = TriggerInterface(backplane=backplane)
+backplane.on("broadcast", trigger_interface.deliver)
+
+# Read from the stats the interface already keeps, when /metrics is scraped
+metrics.callback("lyricpilot_websocket_connections", "Open WebSocket connections, per room", "gauge",
+                 lambda: {(name,): len(room.clients) for name, room in trigger_interface.rooms.items()}, ("room",))
+metrics.callback("lyricpilot_broadcasts_total", "Broadcasts fanned out to this worker's clients", "counter",
+                 lambda: trigger_interface.broadcasts)
+metrics.callback("lyricpilot_relayed_broadcasts_total", "Broadcasts from other workers fanned out here", "counter",
+                 lambda: trigger_interface.relayed)
+metrics.callback("lyricpilot_dropped_sends_total", "Sends to a client that failed or timed out", "counter",
+                 lambda: trigger_interface.dropped_sends)
+metrics.callback("lyricpilot_dropped_connections_total", "Connections dropped for being too slow or gone", "counter",
+                 lambda: trigger_interface.dropped_connections)
+metrics.callback("lyricpilot_coalesced_messages_total", "Queued messages replaced by a newer one before being sent", "counter",
+                 lambda: trigger_interface.coalesced)
+metrics.callback("lyricpilot_client_queue_depth_max", "Longest outbound queue among this worker's clients", "gauge",
+                 lambda: max((len(client.queue) for client in trigger_interface.clients.values()), default=0))
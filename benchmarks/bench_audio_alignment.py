@@ -0,0 +1,236 @@
+"""Benchmark: offline audio-to-lyrics alignment on synthetic click-track songs.
+
+Each song is a click track (accented downbeats) over a pad that changes level
+between verse and chorus, with a sung line of one tone per syllable on eighth
+notes starting every two or four bars, a count-in, breaks between stanzas and
+an outro. The true start of every line is known.
+
+  * Accuracy, over several songs at different tempos: line start error of the
+    aligner against the old behaviour (lines spread evenly over an assumed 180
+    seconds) and against spreading them over the real duration.
+  * Throughput and memory: a long "service recording" of many songs back to
+    back is aligned in a child process (as the job queue would), reporting
+    speed as a multiple of real time and peak RSS growth; the same is done for a
+    short one to show memory doesn't grow with recording length.
+
+Run from the project root:
+    python -m benchmarks.bench_audio_alignment [--songs 6] [--minutes 60]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 22050
+WORDS = {
+    1: ["grace", "sound", "light", "love", "hope", "night", "home", "sing", "all", "come", "heart", "free"],
+    2: ["amazing", "river", "morning", "glory", "shelter", "mercy", "praises", "forever", "holy", "over"],
+    3: ["beautiful", "everyone", "wonderful", "faithfully", "singing out"],
+}
+
+
+def make_song(rng, bpm):
+    """A song's lyrics text and its arrangement: list of (kind, bars, line text or None, syllables)."""
+    sections, text = [("count-in", 2, None, 0)], []
+    stanzas = [("verse", 4), ("chorus", 4), ("verse", 4), ("chorus", 4)]
+    choruses = None
+    for kind, lines in stanzas:
+        if kind == "chorus" and choruses:
+            stanza = choruses
+        else:
+            stanza = []
+            for _ in range(lines):
+                count = int(rng.integers(4, 12))
+                words, syllables = [], 0
+                while syllables < count:
+                    size = int(rng.choice([1, 1, 1, 2, 2, 3]))
+                    words.append(str(rng.choice(WORDS[size])))
+                    syllables += size
+                stanza.append((" ".join(words).capitalize(), syllables))
+            if kind == "chorus":
+                choruses = stanza
+        for line, syllables in stanza:
+            sections.append((kind, 2 if syllables <= 7 else 4, line, syllables))
+        sections.append(("break", 2, None, 0))
+        text.append("\n".join(line for line, _ in stanza))
+    sections[-1] = ("outro", 4, None, 0)
+    return "\n\n".join(text) + "\n", sections
+
+
+def render_song(rng, bpm, sections):
+    """Renders the song as float32 chunks; returns (chunks, true line start times)."""
+    beat = 60.0 / bpm
+    n = np.arange(int(0.03 * SAMPLE_RATE)) / SAMPLE_RATE
+    click = np.sin(2 * np.pi * 1500 * n) * np.exp(-n * 200)
+    accent = np.sin(2 * np.pi * 2500 * n) * np.exp(-n * 150)
+    starts, chunks, t = [], [], 0.0
+    for kind, bars, line, syllables in sections:
+        length = bars * 4 * beat
+        count = int(round(length * SAMPLE_RATE))
+        audio = np.zeros(count)
+        span = np.arange(count) / SAMPLE_RATE
+        pad_level = {"chorus": 0.06, "verse": 0.03}.get(kind, 0.015)
+        audio += pad_level * np.sin(2 * np.pi * 110 * span) * (1 + 0.5 * np.sin(2 * np.pi * 165 * span))
+        for b in range(bars * 4):
+            at = int(b * beat * SAMPLE_RATE)
+            sound = accent if b % 4 == 0 else click
+            audio[at:at + len(sound)] += (0.5 if b % 4 == 0 else 0.3) * sound[:count - at]
+        if line:
+            starts.append(t)
+            note = beat / 2
+            pitch = 220.0 * 2 ** (rng.integers(0, 8) / 12)
+            for s in range(min(int(length / note) - 1, syllables)):
+                at = int(s * note * SAMPLE_RATE)
+                size = int(note * 0.9 * SAMPLE_RATE)
+                tone_t = np.arange(min(size, count - at)) / SAMPLE_RATE
+                freq = pitch * 2 ** (rng.choice([0, 2, 4, 5, 7]) / 12)
+                tone = sum(np.sin(2 * np.pi * freq * h * tone_t) / h for h in (1, 2, 3, 4))
+                audio[at:at + len(tone)] += 0.12 * tone * np.minimum(1, tone_t / 0.02) * np.exp(-tone_t * 1.5)
+        audio += rng.normal(0, 0.003, count)
+        chunks.append(audio.astype(np.float32))
+        t += count / SAMPLE_RATE
+    return chunks, starts
+
+
+def write_wav(path, chunks):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        for chunk in chunks:
+            f.writeframes((np.clip(chunk, -1, 1) * 32767).astype("<i2").tobytes())
+
+
+def peak_rss_kb():
+    # VmHWM is per address space; ru_maxrss would carry over the parent's peak through exec
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child(wav_path, text_path, out_path):
+    import backend.audio_aligner  # noqa: F401  (imports aren't part of the measurement)
+    from backend.audio_aligner import align_audio
+    base = peak_rss_kb()
+    with open(text_path) as f:
+        text = f.read()
+    start = time.perf_counter()
+    alignment = align_audio(wav_path, text)
+    elapsed = time.perf_counter() - start
+    with open(out_path, "w") as f:
+        json.dump({"seconds": elapsed, "rss_growth_kb": peak_rss_kb() - base, "duration": alignment.duration,
+                   "times": [e.time for e in alignment.timecodes.timecodes]}, f)
+
+
+def run_child(wav_path, text_path):
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as out:
+        out_path = out.name
+    try:
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_audio_alignment", "--child", wav_path, text_path, out_path],
+                       check=True, stdout=subprocess.DEVNULL)
+        with open(out_path) as f:
+            return json.load(f)
+    finally:
+        os.unlink(out_path)
+
+
+def render_recording(rng, path, minutes):
+    """Songs back to back (a few seconds of room noise between) until `minutes`; returns (text, true starts, seconds)."""
+    texts, truth, t = [], [], 0.0
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        while t < minutes * 60:
+            bpm = float(rng.uniform(72, 136))
+            text, sections = make_song(rng, bpm)
+            chunks, starts = render_song(rng, bpm, sections)
+            chunks.append(rng.normal(0, 0.003, int(4 * SAMPLE_RATE)).astype(np.float32))
+            for chunk in chunks:
+                f.writeframes((np.clip(chunk, -1, 1) * 32767).astype("<i2").tobytes())
+            truth.extend(t + s for s in starts)
+            texts.append(text)
+            t += sum(len(c) for c in chunks) / SAMPLE_RATE
+    return "\n".join(texts), np.array(truth), t
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--songs", type=int, default=6)
+    parser.add_argument("--minutes", type=float, default=60.0)
+    parser.add_argument("--child", nargs=3, metavar=("WAV", "TEXT", "OUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    from backend.audio_aligner import align_audio
+    from backend.lyrics_text_parser import generate_basic_timecodes_from_text, parse_plain_text_lyrics
+
+    rng = np.random.default_rng(11)
+    errors = {"aligned": [], "spread over 180 s": [], "spread over duration": []}
+    beat_errors = []
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "song.wav")
+        print(f"Accuracy over {args.songs} synthetic songs")
+        for i in range(args.songs):
+            bpm = float(rng.uniform(72, 136))
+            text, sections = make_song(rng, bpm)
+            chunks, truth = render_song(rng, bpm, sections)
+            write_wav(path, chunks)
+            truth = np.array(truth)
+            alignment = align_audio(path, text, bpm=None)
+            aligned = np.array([e.time for e in alignment.timecodes.timecodes])
+            lines = parse_plain_text_lyrics(text)
+            old = np.array([e.time for e in generate_basic_timecodes_from_text(lines, total_duration=180.0).timecodes])
+            even = np.array([e.time for e in generate_basic_timecodes_from_text(lines, total_duration=alignment.duration).timecodes])
+            for name, times in (("aligned", aligned), ("spread over 180 s", old), ("spread over duration", even)):
+                errors[name].extend(np.abs(times - truth))
+            beat = 60.0 / bpm
+            beat_errors.extend(np.abs(aligned - truth) / beat)
+            within = np.mean(np.abs(aligned - truth) <= beat / 2) * 100
+            print(f"  song {i + 1}: {bpm:5.1f} BPM (detected {alignment.bpm or 0:5.1f}), {len(lines)} lines, "
+                  f"{alignment.duration:5.1f}s; median error {np.median(np.abs(aligned - truth)) * 1000:6.0f} ms, "
+                  f"{within:5.1f}% on the right beat")
+        print(f"  {'method':<22} {'median':>9} {'p90':>9} {'max':>9}")
+        for name, values in errors.items():
+            values = np.array(values)
+            print(f"  {name:<22} {np.median(values):8.2f}s {np.percentile(values, 90):8.2f}s {values.max():8.2f}s")
+        on_beat = np.mean(np.array(beat_errors) <= 0.5) * 100
+        print(f"  aligned lines on the right beat: {on_beat:.1f}%")
+        ok &= np.median(errors["aligned"]) < np.median(errors["spread over duration"]) and on_beat > 80
+
+        print("Throughput and memory (child process, WAV at 22.05 kHz)")
+        results = {}
+        for minutes in (6.0, args.minutes):
+            wav_path, text_path = os.path.join(tmp, "recording.wav"), os.path.join(tmp, "recording.txt")
+            text, truth, duration = render_recording(rng, wav_path, minutes)
+            with open(text_path, "w") as f:
+                f.write(text)
+            result = run_child(wav_path, text_path)
+            results[minutes] = result
+            error = np.abs(np.array(result["times"]) - truth)
+            print(f"  {duration / 60:5.1f} min ({os.path.getsize(wav_path) / 2**20:6.0f} MiB WAV, {len(truth)} lines): "
+                  f"{result['seconds']:6.1f}s, x{duration / result['seconds']:5.0f} realtime, "
+                  f"peak RSS +{result['rss_growth_kb'] / 1024:6.1f} MiB, median error {np.median(error):.2f}s")
+            os.unlink(wav_path)
+        short, long = results[6.0], results[args.minutes]
+        ok &= long["rss_growth_kb"] < 4 * max(short["rss_growth_kb"], 20 * 1024)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
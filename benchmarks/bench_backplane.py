@@ -0,0 +1,155 @@
+"""Benchmark: lyric triggers reaching displays spread over several worker processes.
+
+Starts the real app with uvicorn (in a child process, against a temporary data
+directory), connects N displays (default 2000; the kernel spreads them over the
+workers) and fires a series of `POST /trigger_lyric` requests, each of which
+lands on whichever worker accepts it. Every display timestamps the
+`lyric_update`s it receives.
+
+Three setups are compared:
+  * 1 worker (nothing to share);
+  * W workers with the local backplane: a trigger only reaches the displays of
+    the worker that served it, which is what `--workers` did before there was a
+    backplane;
+  * W workers with the Unix socket backplane.
+
+Reported: the share of displays each trigger reached (with it, or with a newer
+update that superseded it in a lagging display's queue; that share is shown
+too), and trigger-to-receive latency (from sending the POST to a display
+receiving the update; client and server share the host's monotonic clock) at
+p50/p99/max over all displays. The displays run on the same host as the
+server, and workers only add capacity when there are cores to spare for them.
+
+Run from the project root:
+    python -m benchmarks.bench_backplane [--clients 2000] [--workers 4] [--triggers 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+import websockets
+
+SONG_ID = "backplane-bench"
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def make_song(data_dir, lines):
+    os.environ["LYRICPILOT_DATA_DIR"] = data_dir
+    from backend.database import AsyncSessionLocal, add_song, async_engine, create_tables_async
+    from backend.timecode_store import TIMECODE_FILENAME, save_timecodes
+
+    await create_tables_async()
+    song_dir = os.path.join(data_dir, "songs", SONG_ID)
+    os.makedirs(song_dir, exist_ok=True)
+    path = os.path.join(song_dir, TIMECODE_FILENAME)
+    save_timecodes(path, [{"time": float(i), "text": f"line {i}"} for i in range(lines)])
+    async with AsyncSessionLocal() as db:
+        await add_song(db, song_id=SONG_ID, title="Backplane benchmark", file_path=path, processed=True, timecode_path=path)
+    await async_engine.dispose()
+
+
+class Display:
+    def __init__(self):
+        self.received = {}  # current_lyric -> monotonic receive time
+
+    async def run(self, uri, connected: asyncio.Event):
+        async with websockets.connect(uri, ping_interval=None) as ws:
+            connected.set()
+            async for raw in ws:
+                received = time.monotonic()
+                message = json.loads(raw)
+                if message["type"] == "lyric_update":
+                    self.received.setdefault(message["data"]["current_lyric"], received)
+
+
+def request(url, method="GET"):
+    with urllib.request.urlopen(urllib.request.Request(url, method=method)) as response:
+        return response.read()
+
+
+async def run_setup(data_dir, port, workers, backplane, args):
+    env = dict(os.environ, LYRICPILOT_DATA_DIR=data_dir, LYRICPILOT_BACKPLANE=backplane)
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1", "--port", str(port),
+                               "--workers", str(workers), "--log-level", "warning", "--backlog", "4096"],
+                              env=env, stdout=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(200):
+            try:
+                await asyncio.to_thread(request, f"{base}/songs?limit=1")
+                break
+            except OSError:
+                await asyncio.sleep(0.1)
+        await asyncio.sleep(1.0)  # Let every worker finish starting (and join the hub)
+
+        displays = [Display() for _ in range(args.clients)]
+        connected = [asyncio.Event() for _ in displays]
+        tasks = []
+        for display, event in zip(displays, connected):
+            tasks.append(asyncio.ensure_future(display.run(f"ws://127.0.0.1:{port}/ws", event)))
+            await asyncio.sleep(0)
+        await asyncio.wait_for(asyncio.gather(*(event.wait() for event in connected)), 120)
+
+        sent = {}
+        for i in range(args.triggers):
+            sent[f"line {i}"] = time.monotonic()
+            await asyncio.to_thread(request, f"{base}/trigger_lyric/{SONG_ID}?current_time={i + 0.5}", "POST")
+            await asyncio.sleep(args.interval)
+        await asyncio.sleep(1.0)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = np.array([display.received[line] - start for display in displays
+                          for line, start in sent.items() if line in display.received])
+    # An update superseded by a newer one before a lagging display's writer got to it is coalesced away by design
+    lines = list(sent)
+    reached = sum(1 for display in displays for i in range(len(lines))
+                  if any(line in display.received for line in lines[i:]))
+    total = len(displays) * len(lines)
+    return reached / total, (reached - len(latencies)) / total, latencies
+
+
+async def main(args):
+    raise_fd_limit()
+    with tempfile.TemporaryDirectory() as data_dir:
+        await make_song(data_dir, args.triggers + 1)
+        print(f"{args.clients} displays, {args.triggers} triggers {args.interval}s apart")
+        print(f"  {'setup':<36} {'reach':>7} {'superseded':>10} {'p50':>9} {'p99':>9} {'max':>9}")
+        results = {}
+        setups = (("1 worker", 1, "local"), (f"{args.workers} workers, local backplane", args.workers, "local"),
+                  (f"{args.workers} workers, unix backplane", args.workers, "unix"))
+        for n, (name, workers, backplane) in enumerate(setups):
+            reach, superseded, latencies = await run_setup(data_dir, args.port + n, workers, backplane, args)
+            results[backplane, workers] = reach
+            if len(latencies):
+                print(f"  {name:<36} {reach:7.1%} {superseded:10.1%} {np.median(latencies) * 1000:7.1f}ms "
+                      f"{np.percentile(latencies, 99) * 1000:7.1f}ms {latencies.max() * 1000:7.1f}ms")
+            else:
+                print(f"  {name:<36} {reach:7.1%}")
+    raise SystemExit(0 if results["unix", args.workers] == 1.0 else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--triggers", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.25, help="seconds between triggers")
+    parser.add_argument("--port", type=int, default=8790)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,196 @@
+"""Benchmark: real-time beat tracking and beat-following playback on a synthetic band.
+
+Renders a WAV of a band (kick, snare, hi-hat, sustained pad) drifting from 96
+to 104 BPM with human timing jitter, and a lyric sheet charted at 96 BPM with
+a line every two bars. The WAV goes through the same ring buffer and worker
+thread as microphone input:
+
+  * offline, as fast as possible: per-block analysis latency (p50/p99) against
+    the block duration, realtime factor, tempo error, beat F-measure (+-70 ms),
+    and how far from the band each lyric line switches with a fixed clock at the
+    charted tempo versus the beat-tracked playhead;
+  * paced in real time for a few seconds next to an asyncio loop: scheduling lag
+    of the event loop while the tracker runs, and frames dropped by the ring.
+
+Run from the project root:
+    python -m benchmarks.bench_beat_tracking [--seconds 60] [--realtime 8]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+from backend.audio_input import AudioInput
+from backend.beat_detector import BeatTrackingPipeline, PlayheadTracker
+
+SAMPLE_RATE = 44100
+CHART_BPM = 96.0
+END_BPM = 104.0
+JITTER = 0.008  # Seconds, standard deviation of each hit's timing
+WARMUP = 5.0  # Seconds excluded from accuracy figures while the tracker locks on
+TOLERANCE = 0.07
+
+
+def render_band(path, seconds, seed=7):
+    """Writes the band to `path`; returns the true beat times (seconds) and the tempo curve."""
+    rng = np.random.default_rng(seed)
+    # Tempo ramps linearly; beat k falls where the integrated tempo reaches k beats
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    bpm = CHART_BPM + (END_BPM - CHART_BPM) * t / seconds
+    beats_elapsed = np.cumsum(bpm / 60.0) / SAMPLE_RATE
+    beat_times = np.searchsorted(beats_elapsed, np.arange(int(beats_elapsed[-1]))) / SAMPLE_RATE
+
+    audio = np.zeros(len(t) + SAMPLE_RATE)
+
+    def hit(at, sound, gain):
+        start = int((at + rng.normal(0, JITTER)) * SAMPLE_RATE)
+        if start < 0:
+            return
+        audio[start:start + len(sound)] += gain * sound[:len(audio) - start]
+
+    n = np.arange(int(0.25 * SAMPLE_RATE)) / SAMPLE_RATE
+    kick = np.sin(2 * np.pi * (50 + 100 * np.exp(-n * 30)) * n) * np.exp(-n * 12)
+    snare = rng.normal(0, 1, len(n)) * np.exp(-n * 25) + 0.5 * np.sin(2 * np.pi * 190 * n) * np.exp(-n * 20)
+    hat = np.diff(rng.normal(0, 1, int(0.05 * SAMPLE_RATE) + 1)) * np.exp(-np.arange(int(0.05 * SAMPLE_RATE)) / SAMPLE_RATE * 80)
+    for k, at in enumerate(beat_times):
+        hit(at, kick if k % 2 == 0 else snare, 0.8 if k % 2 == 0 else 0.5)
+        hit(at, hat, 0.15)
+        if k + 1 < len(beat_times):
+            hit((at + beat_times[k + 1]) / 2, hat, 0.1)
+    # A pad changing chord every bar: loud, but with soft attacks that shouldn't read as beats
+    for bar in range(0, len(beat_times) - 4, 4):
+        start, end = int(beat_times[bar] * SAMPLE_RATE), int(beat_times[bar + 4] * SAMPLE_RATE)
+        span = np.arange(end - start) / SAMPLE_RATE
+        root = 110.0 * 2 ** ((bar // 4 % 4) * 5 / 12)
+        envelope = np.minimum(1.0, span / 0.3)
+        audio[start:end] += 0.12 * envelope * sum(np.sin(2 * np.pi * root * r * span) for r in (1, 1.26, 1.5))
+    audio = audio[:len(t)] + rng.normal(0, 0.01, len(t))
+    audio /= np.abs(audio).max() * 1.1
+
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((audio * 32767).astype("<i2").tobytes())
+    return beat_times
+
+
+def f_measure(detected, truth):
+    detected, truth = np.asarray(detected), np.asarray(truth)
+    if not len(detected) or not len(truth):
+        return 0.0
+    matched, used = 0, set()
+    for beat in detected:
+        k = int(np.argmin(np.abs(truth - beat)))
+        if abs(truth[k] - beat) <= TOLERANCE and k not in used:
+            used.add(k)
+            matched += 1
+    precision, recall = matched / len(detected), matched / len(truth)
+    return 0.0 if matched == 0 else 2 * precision * recall / (precision + recall)
+
+
+def crossing_times(times, positions, targets):
+    """Time at which a (non-decreasing-ish) position trace first reaches each target."""
+    running = np.maximum.accumulate(positions)
+    idx = np.searchsorted(running, targets)
+    out = []
+    for target, i in zip(targets, idx):
+        if i == 0 or i >= len(times):
+            out.append(np.nan)
+            continue
+        p0, p1, t0, t1 = running[i - 1], running[i], times[i - 1], times[i]
+        out.append(t0 + (t1 - t0) * (target - p0) / (p1 - p0) if p1 > p0 else t1)
+    return np.array(out)
+
+
+async def run_offline(path, beat_times, seconds):
+    audio = AudioInput(buffer_seconds=seconds + 2)
+    await audio.start_capture(path, realtime=False)
+    tracker = PlayheadTracker(CHART_BPM)
+    states, trace = [], []
+
+    def on_state(state):
+        states.append(state)
+        trace.append((state.time, tracker.update(state)))
+
+    pipeline = BeatTrackingPipeline(audio, on_state)
+    pipeline.start()
+    await asyncio.to_thread(pipeline.finished.wait)
+    stats = pipeline.stats()
+
+    # Tempo error against the true tempo at each block, once locked on
+    late = [s for s in states if s.time > WARMUP and s.bpm is not None]
+    true_bpm = np.array([CHART_BPM + (END_BPM - CHART_BPM) * s.time / seconds for s in late])
+    tempo_error = np.abs(np.array([s.bpm for s in late]) - true_bpm) / true_bpm * 100
+    beats = [b for b in pipeline.beats if b > WARMUP]
+    f = f_measure(beats, beat_times[beat_times > WARMUP])
+
+    # Lyrics every two bars of the chart; the band reaches chart position k beats at beat_times[k]
+    line_beats = np.arange(8, len(beat_times), 8)
+    line_positions = line_beats * 60.0 / CHART_BPM
+    truth = beat_times[line_beats]
+    keep = truth > WARMUP
+    times, positions = np.array(trace).T
+    tracked = crossing_times(times, positions, line_positions)
+    fixed = line_positions  # A clock at the charted tempo from the first beat
+    tracked_error = np.abs(tracked - truth)[keep]
+    fixed_error = np.abs(fixed - truth)[keep]
+    return stats, tempo_error, f, fixed_error, tracked_error, tracker
+
+
+async def run_realtime(path, seconds):
+    audio = AudioInput()
+    await audio.start_capture(path)
+    loop = asyncio.get_running_loop()
+    pipeline = BeatTrackingPipeline(audio, lambda state: None, loop)
+    pipeline.start()
+    lags = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        before = time.perf_counter()
+        await asyncio.sleep(0.005)
+        lags.append(time.perf_counter() - before - 0.005)
+    audio.stop_capture()
+    await asyncio.to_thread(pipeline.finished.wait)
+    lags.sort()
+    return pipeline.stats(), lags[len(lags) // 2], lags[int(len(lags) * 0.99)], lags[-1]
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "band.wav")
+        start = time.perf_counter()
+        beat_times = render_band(path, args.seconds)
+        print(f"Rendered {args.seconds:.0f}s band, {CHART_BPM:.0f}->{END_BPM:.0f} BPM, {len(beat_times)} beats "
+              f"({time.perf_counter() - start:.1f}s)")
+
+        stats, tempo_error, f, fixed_error, tracked_error, tracker = await run_offline(path, beat_times, args.seconds)
+        latency = stats["block_latency"]
+        print(f"Offline: {stats['blocks']} blocks of {stats['block_ms']:.1f} ms, analysis p50 {latency['p50_ms']:.2f} ms "
+              f"p99 {latency['p99_ms']:.2f} ms, realtime factor x{stats['realtime_factor']:.0f}")
+        print(f"  tempo error median {np.median(tempo_error):.2f}% p95 {np.percentile(tempo_error, 95):.2f}%, "
+              f"beat F-measure {f:.3f} (+-{TOLERANCE * 1000:.0f} ms), final rate x{tracker.rate:.3f}")
+        print(f"  lyric switch error vs band: fixed clock median {np.median(fixed_error) * 1000:.0f} ms "
+              f"max {fixed_error.max() * 1000:.0f} ms; beat-tracked median {np.nanmedian(tracked_error) * 1000:.0f} ms "
+              f"max {np.nanmax(tracked_error) * 1000:.0f} ms")
+
+        rt_stats, lag_p50, lag_p99, lag_max = await run_realtime(path, args.realtime)
+        rt_latency = rt_stats["block_latency"]
+        print(f"Realtime ({args.realtime:.0f}s): analysis p50 {rt_latency['p50_ms']:.2f} ms p99 {rt_latency['p99_ms']:.2f} ms, "
+              f"dropped frames {rt_stats['dropped_frames']}, event loop lag p50 {lag_p50 * 1000:.2f} ms "
+              f"p99 {lag_p99 * 1000:.2f} ms max {lag_max * 1000:.2f} ms")
+
+    ok = (latency["p99_ms"] < stats["block_ms"] and f > 0.8 and np.nanmax(tracked_error) < np.max(fixed_error)
+          and rt_stats["dropped_frames"] == 0)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--realtime", type=float, default=8.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,143 @@
+"""Benchmark: importing a 40-song setlist one upload at a time vs. one bulk import.
+
+Builds a synthetic setlist (MIDI, MusicXML, plain-text lyrics and WAV files with
+companion `.txt` lyrics), then imports it twice into a throwaway data directory:
+
+  * per-song: 40 `POST /songs` requests, polling `GET /jobs/{id}` until every
+    job is done (the pre-bulk workflow),
+  * bulk: a single `POST /songs/bulk` with the setlist zipped.
+
+Reports wall time and the number of database commits for each.
+
+Run from the project root:
+    python -m benchmarks.bench_bulk_import [--songs 40]
+"""
+import argparse
+import io
+import os
+import struct
+import tempfile
+import time
+import wave
+import zipfile
+
+WORDS = "grace love light way home heart morning song glory peace".split()
+
+
+def midi_bytes(notes=120, bpm=100):
+    """A format-0 MIDI file with a tempo event and `notes` quarter notes."""
+    events = bytearray(b"\x00\xff\x51\x03" + (60_000_000 // bpm).to_bytes(3, "big"))
+    for n in range(notes):
+        pitch = 60 + n % 12
+        events += bytes([0x00, 0x90, pitch, 80, 0x83, 0x60, 0x80, pitch, 0])  # on, 480 ticks, off
+    events += b"\x00\xff\x2f\x00"
+    return b"MThd" + struct.pack(">IHHH", 6, 0, 1, 480) + b"MTrk" + struct.pack(">I", len(events)) + bytes(events)
+
+
+def musicxml_bytes(measures=32):
+    notes = []
+    for m in range(measures):
+        word = WORDS[m % len(WORDS)]
+        notes.append(f'<measure number="{m + 1}">'
+                     + ('<attributes><divisions>1</divisions><time><beats>4</beats><beat-type>4</beat-type></time></attributes>' if m == 0 else '')
+                     + f'<note><pitch><step>C</step><octave>4</octave></pitch><duration>4</duration><type>whole</type>'
+                       f'<lyric><syllabic>single</syllabic><text>{word}</text></lyric></note></measure>')
+    return ('<?xml version="1.0" encoding="UTF-8"?><score-partwise version="3.1"><part-list>'
+            '<score-part id="P1"><part-name>Voice</part-name></score-part></part-list>'
+            f'<part id="P1">{"".join(notes)}</part></score-partwise>').encode()
+
+
+def lyrics_bytes(lines=24):
+    return "\n".join(" ".join(WORDS[(i + j) % len(WORDS)] for j in range(6)) for i in range(lines)).encode()
+
+
+def wav_bytes(seconds=1.0, rate=8000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buffer.getvalue()
+
+
+def build_setlist(songs):
+    """Returns [(file name, bytes)]; each WAV is followed by its companion `.txt`."""
+    files = []
+    for n in range(songs):
+        kind = n % 4
+        if kind == 0:
+            files.append((f"song_{n:02d}.mid", midi_bytes()))
+        elif kind == 1:
+            files.append((f"song_{n:02d}.musicxml", musicxml_bytes()))
+        elif kind == 2:
+            files.append((f"song_{n:02d}.txt", lyrics_bytes()))
+        else:
+            files.append((f"song_{n:02d}.wav", wav_bytes()))
+            files.append((f"song_{n:02d}.txt", lyrics_bytes()))
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--songs", type=int, default=40)
+    args = parser.parse_args()
+
+    # Point the app at a scratch data directory before anything from backend is imported
+    os.environ["LYRICPILOT_DATA_DIR"] = tempfile.mkdtemp(prefix="lyricpilot-bench-")
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+
+    from backend.config import PROCESSING_WORKERS
+    from backend.database import async_engine
+    from backend.main import app
+
+    commits = [0]
+    event.listen(async_engine.sync_engine, "commit", lambda conn: commits.__setitem__(0, commits[0] + 1))
+
+    files = build_setlist(args.songs)
+    song_files = [f for f in files if not (f[0].endswith(".txt") and (f[0][:-4] + ".wav") in dict(files))]
+    print(f"Setlist: {args.songs} songs, {len(files)} files, {PROCESSING_WORKERS} worker processes")
+
+    with TestClient(app) as client:
+        # Warm every worker process so neither run pays process start-up and import costs
+        client.post("/songs/bulk", files=[("files", (f"warmup_{n}.mid", midi_bytes(8), "audio/midi")) for n in range(PROCESSING_WORKERS)])
+
+        commits[0] = 0
+        start = time.perf_counter()
+        job_ids = []
+        for name, data in song_files:
+            response = client.post("/songs", files={"file": (name, data)})
+            response.raise_for_status()
+            job_ids.append(response.json()["job_id"])
+        pending = set(job_ids)
+        while pending:
+            for job_id in list(pending):
+                if client.get(f"/jobs/{job_id}").json()["status"] in ("done", "failed"):
+                    pending.discard(job_id)
+            time.sleep(0.01)
+        per_song_time, per_song_commits = time.perf_counter() - start, commits[0]
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, data in files:
+                zf.writestr(f"setlist/{name}", data)
+
+        commits[0] = 0
+        start = time.perf_counter()
+        response = client.post("/songs/bulk", files=[("files", ("setlist.zip", archive.getvalue(), "application/zip"))])
+        response.raise_for_status()
+        bulk_time, bulk_commits = time.perf_counter() - start, commits[0]
+        body = response.json()
+
+    statuses = {}
+    for result in body["results"]:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    print(f"  per-song uploads  {per_song_time * 1000:8.0f} ms  {per_song_commits:4d} commits  ({len(song_files)} requests + job polling)")
+    print(f"  bulk import       {bulk_time * 1000:8.0f} ms  {bulk_commits:4d} commits  (1 request)")
+    print(f"  speedup x{per_song_time / bulk_time:.1f}; bulk results: {statuses}")
+
+
+if __name__ == "__main__":
+    main()
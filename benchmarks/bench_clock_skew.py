@@ -0,0 +1,105 @@
+"""Simulation harness: lyric render skew between displays with and without clock sync.
+
+Each simulated display has its own clock offset and a noisy network path. It
+runs the same ping/pong exchange and min-RTT filter as frontend/script.js
+(backend.clock_sync), then receives `lyric_update` messages dispatched
+PLAYBACK_DISPATCH_AHEAD before their `at` timestamp. For every update we
+record when each display actually renders it on the server's timeline, and the
+skew is the spread between the earliest and latest display.
+
+Everything runs in simulated time, so results are deterministic for a seed.
+Note that NTP-style sync can't observe a *constant* asymmetry between uplink
+and downlink; the paths are modeled with equal base latency and independent
+jitter each way.
+
+Run from the project root:
+    python -m benchmarks.bench_clock_skew [--clients 50] [--seed 1]
+"""
+import argparse
+import random
+
+from backend.clock_sync import ClockEstimate, compute_sample
+from backend.config import CLOCK_SYNC_WINDOW, PLAYBACK_DISPATCH_AHEAD
+
+SKEW_BUDGET_MS = 20.0
+TIMER_JITTER = 0.004  # setTimeout/paint granularity on the display
+
+
+class SimulatedDisplay:
+    def __init__(self, rng, base_latency, jitter_mean):
+        self.rng = rng
+        self.true_offset = rng.uniform(-60.0, 60.0)  # server clock minus this display's clock
+        self.base_latency = base_latency
+        self.jitter_mean = jitter_mean
+        self.clock = ClockEstimate()
+
+    def one_way_delay(self):
+        return self.base_latency + self.rng.expovariate(1.0 / self.jitter_mean)
+
+    def sync(self, pings=CLOCK_SYNC_WINDOW, server_processing=0.00005):
+        client_time = 0.0
+        for _ in range(pings):
+            client_send = client_time
+            server_receive = client_send + self.true_offset + self.one_way_delay()
+            server_send = server_receive + server_processing
+            client_receive = server_send - self.true_offset + self.one_way_delay()
+            self.clock.add_sample(*compute_sample(client_send, server_receive, server_send, client_receive))
+            client_time += 0.1
+
+    def render_time(self, dispatch_time, at, scheduled):
+        """Server time at which this display shows an update dispatched at `dispatch_time`."""
+        arrival = dispatch_time + self.one_way_delay()
+        if scheduled:
+            # Local target is at - offset; converting back to server time adds the true offset.
+            target = at - self.clock.offset + self.true_offset
+            shown = max(arrival, target)
+        else:
+            shown = arrival
+        return shown + self.rng.uniform(0.0, TIMER_JITTER)
+
+
+def run(label, clients, base_range, jitter_range, updates, seed, gate=True):
+    rng = random.Random(seed)
+    displays = [SimulatedDisplay(rng, rng.uniform(*base_range), rng.uniform(*jitter_range)) for _ in range(clients)]
+    for display in displays:
+        display.sync()
+
+    results = {}
+    for scheduled in (False, True):
+        skews = []
+        for n in range(updates):
+            at = 10.0 + n * 1.5
+            dispatch = at - PLAYBACK_DISPATCH_AHEAD
+            times = [display.render_time(dispatch, at, scheduled) for display in displays]
+            skews.append((max(times) - min(times)) * 1000)
+        skews.sort()
+        results[scheduled] = (skews[len(skews) // 2], skews[int(len(skews) * 0.99)], skews[-1])
+
+    print(f"{label}: {clients} displays, base latency {base_range[0] * 1000:.0f}-{base_range[1] * 1000:.0f} ms, "
+          f"jitter mean {jitter_range[0] * 1000:.0f}-{jitter_range[1] * 1000:.0f} ms")
+    for scheduled, name in ((False, "apply on arrival"), (True, "clock-synced `at`")):
+        p50, p99, worst = results[scheduled]
+        print(f"  {name:<20} skew p50 {p50:6.1f} ms  p99 {p99:6.1f} ms  max {worst:6.1f} ms")
+    worst = results[True][2]
+    if not gate:
+        print(f"  (stress profile, not gated: delays here exceed the {PLAYBACK_DISPATCH_AHEAD * 1000:.0f} ms dispatch lead)")
+        return True
+    print(f"  {'PASS' if worst < SKEW_BUDGET_MS else 'FAIL'}: max synced skew {worst:.1f} ms (budget {SKEW_BUDGET_MS:.0f} ms)")
+    return worst < SKEW_BUDGET_MS
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    ok = run("Wired/good Wi-Fi", args.clients, (0.001, 0.010), (0.001, 0.005), args.updates, args.seed)
+    ok &= run("Venue Wi-Fi", args.clients, (0.005, 0.040), (0.002, 0.030), args.updates, args.seed)
+    ok &= run("Congested phones", args.clients, (0.020, 0.080), (0.010, 0.080), args.updates, args.seed, gate=False)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""Benchmark: lyric triggers while uploads write to the database.
+
+Drives the real app in-process (httpx over ASGI, one event loop) with clients
+calling `/trigger_lyric` at a fixed total rate while others upload files back
+to back; every upload makes the same four writes a processed song does (insert
+as queued, running, processed, done). Optionally a second process writes to the same database file in short
+transactions, as a second server worker or a command-line tool would.
+
+  * legacy: the old path, on its own database file with default SQLite settings
+    (rollback journal, synchronous=FULL): a synchronous session on the event
+    loop for every trigger lookup and upload write.
+  * async: `/trigger_lyric` answered from the song metadata cache; uploads
+    through the aiosqlite engine (pooled, WAL, synchronous=NORMAL, busy_timeout).
+
+Reports trigger latency, event-loop lag, upload throughput and errors (such as
+"database is locked") for each. Triggers are paced rather than sent back to
+back, so both modes carry the same trigger load, and a trigger's latency counts
+from when it was due: time spent waiting behind a blocked event loop included.
+
+Run from the project root:
+    python -m benchmarks.bench_db_concurrency [--seconds 10] [--triggers 8] [--trigger-rate 200] [--uploads 4] [--external-writer]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from uuid import uuid4
+
+import numpy as np
+
+UPLOAD_BYTES = 64 * 1024
+
+
+def external_writer(db_path, seconds):
+    """Another process writing 50-row transactions to its own table until `seconds` pass."""
+    con = sqlite3.connect(db_path, timeout=30)
+    con.execute("CREATE TABLE IF NOT EXISTS bench_writer (id INTEGER PRIMARY KEY, payload TEXT)")
+    con.commit()
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        with con:
+            con.executemany("INSERT INTO bench_writer (payload) VALUES (?)", [("x" * 200,)] * 50)
+        time.sleep(0.005)
+    con.close()
+
+
+def add_routes(app, data_dir):
+    """Adds the two upload paths and the old trigger path to the app, under /bench."""
+    from fastapi import Depends, File, HTTPException, UploadFile
+    from sqlalchemy import create_engine
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    from starlette.concurrency import run_in_threadpool
+
+    from backend.database import Base, Song, add_song, get_db, update_song_job_status, update_song_processed_status
+    from backend.timecode_cache import timecode_cache
+    from backend.trigger_interface import trigger_interface
+
+    legacy_engine = create_engine(f"sqlite:///{os.path.join(data_dir, 'legacy.db')}")
+    Base.metadata.create_all(bind=legacy_engine)
+    LegacySession = sessionmaker(autocommit=False, autoflush=False, bind=legacy_engine)
+    upload_dir = os.path.join(data_dir, "bench_uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+
+    def save(file, song_id):
+        path = os.path.join(upload_dir, song_id)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(file.file, f)
+        return path
+
+    @app.post("/bench/legacy/trigger_lyric/{song_id}")
+    async def legacy_trigger(song_id: str, current_time: float):
+        db = LegacySession()
+        try:
+            song = db.query(Song).filter(Song.id == song_id).first()
+        finally:
+            db.close()
+        if not song or not song.processed or not song.timecode_path:
+            raise HTTPException(status_code=404, detail="Song not found or not processed")
+        current_lyric, next_lyrics = timecode_cache.get_index(song.id, song.timecode_path).window(current_time, 3)
+        await trigger_interface.send_message("lyric_update", {"current_lyric": current_lyric, "next_lyrics": next_lyrics})
+        return {"current_lyric": current_lyric, "next_lyrics": next_lyrics}
+
+    @app.post("/bench/legacy/songs")
+    async def legacy_upload(file: UploadFile = File(...)):
+        song_id = str(uuid4())
+        path = await run_in_threadpool(save, file, song_id)
+        db = LegacySession()
+        try:
+            db.add(Song(id=song_id, title=file.filename, file_path=path, processed=False, status="queued"))
+            db.commit()
+            for status in ("running", "processed", "done"):
+                song = db.query(Song).filter(Song.id == song_id).first()
+                if status == "processed":
+                    song.processed, song.timecode_path = True, path
+                else:
+                    song.status = status
+                db.commit()
+        finally:
+            db.close()
+        return {"song_id": song_id}
+
+    @app.post("/bench/async/songs")
+    async def async_upload(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
+        song_id = str(uuid4())
+        path = await run_in_threadpool(save, file, song_id)
+        await add_song(db, song_id=song_id, title=file.filename, file_path=path, processed=False, status="queued")
+        await update_song_job_status(db, song_id, "running")
+        await update_song_processed_status(db, song_id, True, path)
+        await update_song_job_status(db, song_id, "done")
+        return {"song_id": song_id}
+
+    return legacy_engine, LegacySession
+
+
+async def run_mode(client, mode, args, db_path):
+    trigger_url = "/trigger_lyric/amazing_grace" if mode == "async" else "/bench/legacy/trigger_lyric/amazing_grace"
+    upload_url = f"/bench/{mode}/songs"
+    latencies, upload_latencies, lags, errors = [], [], [], {}
+    end = time.perf_counter() + args.seconds
+
+    def record_error(text):
+        key = "database is locked" if "locked" in text else text[:60]
+        errors[key] = errors.get(key, 0) + 1
+
+    async def trigger_client(n):
+        i, interval = n, args.triggers / args.trigger_rate
+        due = time.perf_counter() + n * interval / args.triggers
+        while time.perf_counter() < end:
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+            start, due = due, due + interval
+            try:
+                response = await client.post(trigger_url, params={"current_time": (i * 0.7) % 25})
+                if response.status_code != 200:
+                    record_error(response.text)
+            except Exception as e:
+                record_error(str(e))
+            latencies.append(time.perf_counter() - start)
+            i += 1
+
+    async def upload_client(n):
+        payload = os.urandom(UPLOAD_BYTES)
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            try:
+                response = await client.post(upload_url, files={"file": (f"song_{n}.txt", payload)})
+                if response.status_code != 200:
+                    record_error(response.text)
+                else:
+                    upload_latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                record_error(str(e))
+
+    async def ticker():
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - start - 0.005)
+
+    writer = None
+    if args.external_writer:
+        writer = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_db_concurrency", "--writer", db_path,
+                                   str(args.seconds + 1)])
+    await asyncio.gather(ticker(), *(trigger_client(n) for n in range(args.triggers)),
+                         *(upload_client(n) for n in range(args.uploads)))
+    if writer is not None:
+        writer.wait()
+    return np.array(latencies), np.array(upload_latencies), np.array(lags), errors
+
+
+async def main(args):
+    data_dir = tempfile.mkdtemp(prefix="lyricpilot-bench-")
+    # Point the app at the scratch data directory before anything from backend is imported
+    os.environ["LYRICPILOT_DATA_DIR"] = data_dir
+    import httpx
+
+    from backend.database import Song
+    from backend.main import app, on_shutdown, on_startup
+
+    await on_startup()
+    legacy_engine, LegacySession = add_routes(app, data_dir)
+    from backend.song_cache import song_cache
+    example = song_cache.get("amazing_grace")
+    db = LegacySession()
+    db.add(Song(**example._asdict()))
+    db.commit()
+    db.close()
+
+    print(f"{args.seconds:.0f}s per mode: {args.triggers} trigger clients ({args.trigger_rate:.0f}/s), {args.uploads} upload clients "
+          f"({UPLOAD_BYTES // 1024} KiB, 4 writes each)" + (", plus a second process writing" if args.external_writer else ""))
+    print(f"  {'mode':<7} {'trigger p50':>11} {'p99':>8} {'max':>8} {'triggers/s':>10} {'loop lag p99':>12} "
+          f"{'max':>8} {'uploads/s':>9} {'upload p50':>10}  errors")
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for mode in ("legacy", "async"):
+            db_path = os.path.join(data_dir, "legacy.db" if mode == "legacy" else "lyrics.db")
+            latencies, uploads, lags, errors = await run_mode(client, mode, args, db_path)
+            results[mode] = (latencies, lags, errors)
+            print(f"  {mode:<7} {np.median(latencies) * 1000:9.1f}ms {np.percentile(latencies, 99) * 1000:6.1f}ms "
+                  f"{latencies.max() * 1000:6.1f}ms {len(latencies) / args.seconds:10.0f} "
+                  f"{np.percentile(lags, 99) * 1000:10.1f}ms {lags.max() * 1000:6.1f}ms {len(uploads) / args.seconds:9.1f} "
+                  f"{np.median(uploads) * 1000 if len(uploads) else float('nan'):8.1f}ms  "
+                  f"{', '.join(f'{k}: {v}' for k, v in errors.items()) or 'none'}")
+    await on_shutdown()
+    legacy_engine.dispose()
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+    legacy, new = results["legacy"], results["async"]
+    ok = not new[2] and np.percentile(new[0], 99) <= np.percentile(legacy[0], 99)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--triggers", type=int, default=8)
+    parser.add_argument("--trigger-rate", type=float, default=200.0, help="triggers per second, over all clients")
+    parser.add_argument("--uploads", type=int, default=4)
+    parser.add_argument("--external-writer", action="store_true", help="also write from a second process")
+    parser.add_argument("--writer", nargs=2, metavar=("DB", "SECONDS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.writer:
+        external_writer(args.writer[0], float(args.writer[1]))
+    else:
+        asyncio.run(main(args))
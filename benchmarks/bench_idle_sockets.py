@@ -0,0 +1,122 @@
+"""Load test: server CPU spent holding idle WebSocket connections open.
+
+Starts a uvicorn server in a child process twice, once with the old
+`while True: await asyncio.sleep(0.1)` endpoint and once with
+`TriggerInterface.serve`, opens N idle sockets against each and samples the
+server's CPU time over a quiet window.
+
+Run from the project root:
+    python -m benchmarks.bench_idle_sockets [--clients 1000] [--window 10]
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+
+import websockets
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def build_app(mode):
+    from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+    from backend.trigger_interface import TriggerInterface
+
+    app = FastAPI()
+    interface = TriggerInterface()
+
+    if mode == "legacy":
+        @app.websocket("/ws")
+        async def legacy_endpoint(websocket: WebSocket):
+            await websocket.accept()
+            interface.register(websocket)
+            try:
+                while True:
+                    await asyncio.sleep(0.1)
+            except WebSocketDisconnect:
+                pass
+            finally:
+                interface.unregister(websocket)
+    else:
+        @app.websocket("/ws")
+        async def event_endpoint(websocket: WebSocket):
+            await interface.serve(websocket)
+
+    return app
+
+
+def serve(mode, port):
+    import uvicorn
+
+    raise_fd_limit()
+    uvicorn.run(build_app(mode), host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+
+
+def cpu_seconds(pid):
+    try:
+        import psutil
+        times = psutil.Process(pid).cpu_times()
+        return times.user + times.system
+    except ImportError:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def measure(mode, port, clients, window):
+    proc = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_idle_sockets", "--serve", mode, "--port", str(port)])
+    try:
+        uri = f"ws://127.0.0.1:{port}/ws"
+        for _ in range(100):
+            try:
+                async with websockets.connect(uri):
+                    break
+            except OSError:
+                await asyncio.sleep(0.1)
+
+        sockets = []
+        for start in range(0, clients, 100):
+            batch = [websockets.connect(uri, ping_interval=None, close_timeout=1) for _ in range(start, min(clients, start + 100))]
+            sockets.extend(await asyncio.gather(*batch))
+        await asyncio.sleep(1.0)  # let connection setup settle
+
+        cpu_before = cpu_seconds(proc.pid)
+        await asyncio.sleep(window)
+        cpu_used = cpu_seconds(proc.pid) - cpu_before
+
+        await asyncio.gather(*(ws.close() for ws in sockets))
+        return cpu_used
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            # The legacy loop never notices shutdown, so uvicorn can wait on it forever.
+            proc.kill()
+            proc.wait()
+
+
+async def main(clients, window):
+    raise_fd_limit()
+    print(f"{clients} idle sockets, {window:.0f}s window")
+    for i, mode in enumerate(("legacy", "event")):
+        cpu_used = await measure(mode, 8760 + i, clients, window)
+        print(f"  {mode:<8} server CPU {cpu_used:6.2f}s  ({cpu_used / window * 100:5.1f}% of one core)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--window", type=float, default=10.0)
+    parser.add_argument("--serve", choices=("legacy", "event"))
+    parser.add_argument("--port", type=int, default=8760)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.port)
+    else:
+        asyncio.run(main(args.clients, args.window))
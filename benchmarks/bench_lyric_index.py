@@ -0,0 +1,70 @@
+"""Micro-benchmark: per-lookup latency of LyricTimelineIndex vs. the old linear scan.
+
+Run from the project root:
+    python -m benchmarks.bench_lyric_index
+"""
+import random
+import time
+
+from backend.lyric_index import LyricTimelineIndex
+from backend.lyric_scheduler import LyricScheduler
+
+
+def linear_window(timecodes, current_time, count=3):
+    """The scan trigger_lyric used before the index existed."""
+    current_lyric = None
+    next_lyrics = []
+    for tc in timecodes:
+        if tc["time"] <= current_time:
+            current_lyric = tc["text"]
+        else:
+            next_lyrics.append(tc["text"])
+            if len(next_lyrics) >= count:
+                break
+    return current_lyric, next_lyrics
+
+
+def make_timeline(n):
+    # Dense, MIDI-like timeline: an event every ~30 ms
+    t = 0.0
+    timecodes = []
+    for i in range(n):
+        t += random.uniform(0.005, 0.055)
+        timecodes.append({"time": t, "text": f"Note: C{i % 8}"})
+    return timecodes
+
+
+def bench(label, fn, queries):
+    start = time.perf_counter()
+    for q in queries:
+        fn(q)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {elapsed / len(queries) * 1e6:10.2f} us/lookup")
+
+
+def main():
+    random.seed(1)
+    for n in (100, 10_000, 100_000):
+        timecodes = make_timeline(n)
+        end = timecodes[-1]["time"]
+        queries = [random.uniform(0, end) for _ in range(2_000)]
+
+        build_start = time.perf_counter()
+        index = LyricTimelineIndex.from_entries(timecodes)
+        build_ms = (time.perf_counter() - build_start) * 1e3
+
+        for q in queries[:50]:
+            assert index.window(q) == linear_window(timecodes, q)
+
+        print(f"{n} entries (index build {build_ms:.1f} ms)")
+        bench("linear scan (old)", lambda q: linear_window(timecodes, q), queries)
+        bench("index.window", lambda q: index.window(q), queries)
+
+        scheduler = LyricScheduler(index)
+        bench("scheduler random seek", scheduler.get_next_lyric, queries)
+        sequential = sorted(queries)
+        bench("scheduler sequential", scheduler.get_next_lyric, sequential)
+
+
+if __name__ == "__main__":
+    main()
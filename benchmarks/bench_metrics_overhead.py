@@ -0,0 +1,109 @@
+"""Benchmark: what the /metrics instrumentation and leveled logging cost the hot path.
+
+Measures, in-process:
+  * each instrumentation primitive: a perf_counter pair, Histogram.observe
+    (plain and labelled), Counter.inc, and a `logger.debug` call while the log
+    level is INFO (how per-message logging sits on the hot path by default);
+  * a lyric_update broadcast (serialize + fan-out to N clients, default 200)
+    through TriggerInterface.send_message, with the histograms as shipped and
+    with them replaced by no-ops, i.e. the code as it was before;
+  * rendering GET /metrics with every backend module's metrics registered.
+
+Run from the project root:
+    python -m benchmarks.bench_metrics_overhead [--clients 200] [--broadcasts 5000]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+
+class FakeWebSocket:
+    """Just enough of a WebSocket for TriggerInterface: sends complete at once."""
+
+    def __init__(self, n):
+        self.client = f"bench-{n}"
+        self.headers = {}
+
+    async def send_text(self, text):
+        pass
+
+
+class NullHistogram:
+    def observe(self, value):
+        pass
+
+    def labels(self, *values):
+        return self
+
+
+def per_call(fn, n=200_000):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n
+
+
+async def broadcast_time(interface, broadcasts):
+    data = {"song_id": "bench", "line_index": 0, "current_lyric": "and the words of the song go on", "next_lyrics": ["a", "b", "c"]}
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for i in range(broadcasts):
+            data["line_index"] = i
+            await interface.send_message("lyric_update", data)
+            await asyncio.sleep(0)  # Each client's writer sends it
+        best = min(best, (time.perf_counter() - start) / broadcasts)
+    return best
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as data_dir:
+        # Nothing from backend may be imported before the data directory is set
+        os.environ["LYRICPILOT_DATA_DIR"] = data_dir
+        from backend import main as _app  # noqa: F401 (registers every module's metrics)
+        from backend import trigger_interface as ti
+        from backend.log_config import set_log_level
+        from backend.metrics import metrics
+
+        histogram = metrics.histogram("bench_seconds", "benchmark")
+        labelled = metrics.histogram("bench_labelled_seconds", "benchmark", ("message",))
+        counter = metrics.counter("bench_total", "benchmark")
+        set_log_level("INFO")
+        logger = logging.getLogger("backend.bench")
+        clock = time.perf_counter
+        print("  primitive                         per call")
+        for name, fn in (("perf_counter pair", lambda: clock() - clock()),
+                         ("Histogram.observe", lambda: histogram.observe(0.0003)),
+                         ("labels(...).observe", lambda: labelled.labels("lyric_update").observe(0.0003)),
+                         ("Counter.inc", counter.inc),
+                         ("logger.debug at INFO", lambda: logger.debug("Sent %s to %s", "lyric_update", "client"))):
+            print(f"  {name:<30} {per_call(fn) * 1e9:8.0f}ns")
+
+        interface = ti.TriggerInterface()
+        for n in range(args.clients):
+            interface.register(FakeWebSocket(n))
+        instrumented = await broadcast_time(interface, args.broadcasts)
+        shipped = (ti.serialize_seconds, ti.broadcast_seconds, ti.client_send_seconds)
+        ti.serialize_seconds = ti.broadcast_seconds = ti.client_send_seconds = NullHistogram()
+        bare = await broadcast_time(interface, args.broadcasts)
+        ti.serialize_seconds, ti.broadcast_seconds, ti.client_send_seconds = shipped
+        print(f"\n  lyric_update to {args.clients} clients, per broadcast (sends included):")
+        print(f"    instrumented  {instrumented * 1e6:8.1f}us")
+        print(f"    bare          {bare * 1e6:8.1f}us   overhead {(instrumented - bare) / bare * 100:+.1f}%")
+
+        start = time.perf_counter()
+        text = metrics.render()
+        render = time.perf_counter() - start
+        print(f"\n  GET /metrics render: {render * 1000:.2f}ms, {len(text.splitlines())} lines, {len(text)} bytes")
+        for websocket in list(interface.clients):
+            interface.unregister(websocket)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--broadcasts", type=int, default=5000)
+    asyncio.run(main(parser.parse_args()))
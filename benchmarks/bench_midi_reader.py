@@ -0,0 +1,136 @@
+"""Benchmark: streaming MIDI reader vs. the music21 score path for MIDI timecodes.
+
+Generates a small corpus of Standard MIDI Files (a short lead sheet up to a
+5-minute, 16-track arrangement with tempo changes), then for each file runs
+`process_midi_file` (streaming reader) and the music21 fallback in separate
+child processes, reporting wall time and peak RSS growth while parsing. It
+also checks that both paths place note onsets at the same times in seconds.
+
+Run from the project root:
+    python -m benchmarks.bench_midi_reader [--runs 3]
+"""
+import argparse
+import json
+import os
+import resource
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+# music21 rounds each tempo to 0.01 BPM, so its seconds drift slightly from the exact
+# tempo map over a long song: allow 1 ms plus 20 ppm of the onset time.
+ONSET_TOLERANCE = 0.001
+ONSET_DRIFT = 20e-6
+
+
+def _varlen(value):
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def _track(events):
+    body = b"".join(events) + b"\x00\xff\x2f\x00"
+    return b"MTrk" + struct.pack(">I", len(body)) + body
+
+
+def make_midi(minutes, tracks, notes_per_beat, tempo_changes, ppq=480):
+    """A format-1 file: a tempo track plus `tracks` note tracks playing steady notes."""
+    beats = int(minutes * 60 * 2)  # Roughly `minutes` long at the 120 BPM base tempo
+    conductor = [_varlen(0) + b"\xff\x51\x03" + (500000).to_bytes(3, "big")]
+    if tempo_changes:
+        # On a beat: music21 quantizes event offsets, so an off-grid tempo change would move in its score
+        step = beats // (tempo_changes + 1) * ppq
+        for n in range(tempo_changes):
+            tempo = 500000 + (n % 5 - 2) * 40000  # 105-140 BPM
+            conductor.append(_varlen(step) + b"\xff\x51\x03" + tempo.to_bytes(3, "big"))
+    chunks = [_track(conductor)]
+    length = ppq // notes_per_beat
+    for t in range(tracks):
+        channel = t % 16
+        events = [_varlen(0) + bytes([0xC0 | channel, t % 128])]
+        for n in range(beats * notes_per_beat):
+            pitch = 36 + (t * 7 + n * 5) % 48
+            events.append(_varlen(0) + bytes([0x90 | channel, pitch, 90]))
+            events.append(_varlen(length) + bytes([0x80 | channel, pitch, 0]))
+        chunks.append(_track(events))
+    return b"MThd" + struct.pack(">IHHH", 6, 1, len(chunks), ppq) + b"".join(chunks)
+
+
+CORPUS = [
+    ("lead sheet, 3 min, 1 track", dict(minutes=3, tracks=1, notes_per_beat=1, tempo_changes=0)),
+    ("band chart, 4 min, 6 tracks", dict(minutes=4, tracks=6, notes_per_beat=2, tempo_changes=4)),
+    ("arrangement, 5 min, 16 tracks", dict(minutes=5, tracks=16, notes_per_beat=2, tempo_changes=12)),
+]
+
+
+def child(mode, path, out_path):
+    """Runs one parse in this (fresh) process and writes timing, memory and onsets as JSON."""
+    from backend import midi_aligner
+    parse = midi_aligner.process_midi_file if mode == "fast" else midi_aligner._process_midi_file_music21
+    if mode != "fast":
+        import music21  # noqa: F401  (import cost is not part of the parse)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    data = parse(path)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    onsets = sorted({round(tc.time, 6) for tc in data.timecodes if tc.text != "Rest"})
+    with open(out_path, "w") as f:
+        json.dump({"seconds": elapsed, "rss_growth_kb": peak_rss - base_rss, "peak_rss_kb": peak_rss,
+                   "entries": len(data.timecodes), "onsets": onsets}, f)
+
+
+def run_child(mode, path):
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as out:
+        out_path = out.name
+    try:
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_midi_reader", "--child", mode, path, out_path],
+                       check=True, stdout=subprocess.DEVNULL)
+        with open(out_path) as f:
+            return json.load(f)
+    finally:
+        os.unlink(out_path)
+
+
+def onsets_match(a, b):
+    return len(a) == len(b) and all(abs(x - y) <= ONSET_TOLERANCE + ONSET_DRIFT * x for x, y in zip(a, b))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "PATH", "OUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, spec in CORPUS:
+            path = os.path.join(tmp, "song.mid")
+            with open(path, "wb") as f:
+                f.write(make_midi(**spec))
+            print(f"{label} ({os.path.getsize(path) // 1024} KiB)")
+            results = {}
+            for mode in ("fast", "music21"):
+                runs = [run_child(mode, path) for _ in range(args.runs)]
+                best = min(runs, key=lambda r: r["seconds"])
+                results[mode] = best
+                print(f"  {mode:<8} {best['seconds'] * 1000:9.1f} ms  peak RSS +{best['rss_growth_kb'] / 1024:7.1f} MiB "
+                      f"(total {best['peak_rss_kb'] / 1024:6.1f} MiB)  {best['entries']} entries")
+            match = onsets_match(results["fast"]["onsets"], results["music21"]["onsets"])
+            ok &= match
+            print(f"  speedup x{results['music21']['seconds'] / results['fast']['seconds']:.0f}; "
+                  f"note onsets {'match' if match else 'DIFFER'} ({len(results['fast']['onsets'])} distinct)")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Benchmark: streaming MusicXML lyric extraction vs. loading the score into music21.
+
+Generates a corpus of partwise scores: a hymn with two verses and first/second
+endings, a choral piece whose parts use <backup> for a second voice, and a
+large orchestral score (lyrics in one of many parts) both as `.musicxml` and
+compressed `.mxl`. For each file, in fresh child processes, it times
+`parse_musicxml` (streaming) and the music21 fallback and reports peak RSS
+growth. It checks that:
+
+  * both read the same lyric syllables (verse, text) at the same score offsets,
+  * on scores without repeats, every streamed line starts where music21 places
+    that syllable in seconds,
+  * the streaming path is at least 10x faster.
+
+Run from the project root:
+    python -m benchmarks.bench_musicxml_reader [--runs 3]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+SPEEDUP_TARGET = 10.0
+# One measure of four quarter notes each; words never cross a barline, so any repeat
+# structure still yields whole words.
+MEASURE_LYRICS = [
+    [("begin", "A"), ("middle", "maz"), ("end", "ing"), ("single", "grace")],
+    [("single", "how"), ("single", "sweet"), ("single", "the"), ("single", "sound,")],
+    [("single", "that"), ("single", "saved"), ("single", "a"), ("single", "wretch")],
+    [("single", "like"), ("single", "me."), ("single", "O"), ("single", "Lord,")],
+    [("begin", "Hal"), ("middle", "le"), ("middle", "lu"), ("end", "jah,")],
+    [("begin", "to"), ("middle", "geth"), ("end", "er."), ("single", "Amen.")],
+]
+
+
+def _measure_lyric(measure, beat, verse):
+    syllabic, text = MEASURE_LYRICS[measure % len(MEASURE_LYRICS)][beat]
+    return syllabic, text if verse == 1 else text.lower()
+
+
+def _note(step, octave, duration, kind, lyrics=(), chord=False, voice=1):
+    lyric_xml = "".join(f'<lyric number="{v}"><syllabic>{s}</syllabic><text>{t}</text></lyric>' for v, (s, t) in lyrics)
+    return (f'<note>{"<chord/>" if chord else ""}<pitch><step>{step}</step><octave>{octave}</octave></pitch>'
+            f'<duration>{duration}</duration><voice>{voice}</voice><type>{kind}</type>{lyric_xml}</note>')
+
+
+def make_score(parts, measures, verses=1, lyric_parts=(0,), second_voice=False, repeats=False, tempo_every=0):
+    """A 4/4 partwise score with quarter notes (divisions=2); lyrics on `lyric_parts`."""
+    out = ['<?xml version="1.0" encoding="UTF-8"?>\n<score-partwise version="3.1"><part-list>']
+    for p in range(parts):
+        out.append(f'<score-part id="P{p + 1}"><part-name>Part {p + 1}</part-name></score-part>')
+    out.append("</part-list>")
+    steps = "CDEFGAB"
+    for p in range(parts):
+        out.append(f'<part id="P{p + 1}">')
+        for m in range(measures):
+            out.append(f'<measure number="{m + 1}">')
+            if repeats and m == 4:
+                out.append('<barline location="left"><repeat direction="forward"/></barline>')
+            if repeats and m == 11:
+                out.append('<barline location="left"><ending number="1" type="start"/></barline>')
+            if repeats and m == 12:
+                out.append('<barline location="left"><ending number="2" type="start"/></barline>')
+            if m == 0:
+                out.append('<attributes><divisions>2</divisions><time><beats>4</beats><beat-type>4</beat-type></time></attributes>'
+                           '<direction placement="above"><direction-type><metronome><beat-unit>quarter</beat-unit>'
+                           '<per-minute>96</per-minute></metronome></direction-type><sound tempo="96"/></direction>')
+            elif tempo_every and m % tempo_every == 0:
+                bpm = 80 + (m // tempo_every) % 5 * 10
+                out.append(f'<direction><direction-type><words>tempo</words></direction-type><sound tempo="{bpm}"/></direction>')
+            for beat in range(4):
+                step = steps[(m + beat + p) % 7]
+                lyrics = []
+                if p in lyric_parts:
+                    sung_verses = range(1, verses + 1) if (not repeats or 4 <= m <= 11) else (1,)
+                    lyrics = [(v, _measure_lyric(m, beat, v)) for v in sung_verses]
+                out.append(_note(step, 4, 2, "quarter", lyrics))
+                if p % 3 == 1:
+                    out.append(_note(steps[(m + beat + p + 2) % 7], 4, 2, "quarter", chord=True))
+            if second_voice:
+                out.append('<backup><duration>8</duration></backup>')
+                out.append(_note("C", 3, 4, "half", voice=2) + _note("G", 2, 4, "half", voice=2))
+            if repeats and m == 11:
+                out.append('<barline location="right"><ending number="1" type="stop"/><repeat direction="backward"/></barline>')
+            if repeats and m == 12:
+                out.append('<barline location="right"><ending number="2" type="discontinue"/></barline>')
+            out.append("</measure>")
+        out.append("</part>")
+    out.append("</score-partwise>")
+    return "".join(out).encode()
+
+
+def write_mxl(path, xml_bytes):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("META-INF/container.xml", '<?xml version="1.0"?><container><rootfiles>'
+                    '<rootfile full-path="score/score.xml" media-type="application/vnd.recordare.musicxml+xml"/>'
+                    '</rootfiles></container>')
+        zf.writestr("score/score.xml", xml_bytes)
+
+
+CORPUS = [
+    ("hymn, 2 verses, repeats + endings", "hymn.musicxml", dict(parts=1, measures=24, verses=2, repeats=True)),
+    ("choir, 4 parts, 2 voices/part", "choir.musicxml", dict(parts=4, measures=120, lyric_parts=(0, 1, 2, 3), second_voice=True, tempo_every=16)),
+    ("orchestral, 24 parts x 400 measures", "orchestra.musicxml", dict(parts=24, measures=400, lyric_parts=(2,), tempo_every=32)),
+    ("orchestral, compressed .mxl", "orchestra.mxl", dict(parts=24, measures=400, lyric_parts=(2,), tempo_every=32)),
+]
+
+
+def child(mode, path, out_path):
+    """Runs one parse in this (fresh) process and writes timing, memory and lyric data as JSON."""
+    from backend import musicxml_parser
+    from backend.musicxml_reader import read_score_lyrics
+    if mode != "fast":
+        import music21  # noqa: F401  (import cost is not part of the parse)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if mode == "fast":
+        data = musicxml_parser.parse_musicxml(path)
+    else:
+        from music21 import converter, note
+        score = converter.parse(path)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if mode == "fast":
+        lyrics = read_score_lyrics(path)
+        measure_starts = [0.0]
+        for measure in lyrics.measures:
+            measure_starts.append(measure_starts[-1] + measure.duration)
+        syllables = sorted((s.part, round(measure_starts[s.measure] + s.offset, 4), s.verse, s.text) for s in lyrics.syllables)
+        result = {"syllables": syllables, "lines": [[tc.time, tc.text] for tc in data.timecodes]}
+    else:
+        syllables = []
+        seconds = []
+        for p, part in enumerate(score.parts):
+            for item in part.flatten().secondsMap:
+                element = item["element"]
+                if isinstance(element, note.NotRest):
+                    for n, lyric in enumerate(element.lyrics, start=1):
+                        syllables.append((p, round(float(element.offset), 4), lyric.number or n, lyric.text))
+                        if lyric.number == 1 or (n == 1 and not lyric.number):
+                            seconds.append([p, item["offsetSeconds"], lyric.text])
+        result = {"syllables": sorted(syllables), "seconds": seconds}
+    result.update(seconds_taken=elapsed, rss_growth_kb=peak_rss - base_rss)
+    with open(out_path, "w") as f:
+        json.dump(result, f)
+
+
+def run_child(mode, path):
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as out:
+        out_path = out.name
+    try:
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_musicxml_reader", "--child", mode, path, out_path],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with open(out_path) as f:
+            return json.load(f)
+    finally:
+        os.unlink(out_path)
+
+
+def lines_match_music21(fast, slow, lyric_part):
+    """Every line's start time should be where music21 puts that line's first syllable."""
+    starts = [(t, text) for p, t, text in slow["seconds"] if p == lyric_part]
+    for time_, line in fast["lines"]:
+        first = line.split(" ")[0]
+        if not any(abs(t - time_) < 1e-3 and first.startswith(text) for t, text in starts):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "PATH", "OUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, name, spec in CORPUS:
+            path = os.path.join(tmp, name)
+            xml = make_score(**spec)
+            if name.endswith(".mxl"):
+                write_mxl(path, xml)
+            else:
+                with open(path, "wb") as f:
+                    f.write(xml)
+            print(f"{label} ({os.path.getsize(path) // 1024} KiB)")
+            results = {}
+            for mode in ("fast", "music21"):
+                runs = [run_child(mode, path) for _ in range(args.runs)]
+                results[mode] = best = min(runs, key=lambda r: r["seconds_taken"])
+                print(f"  {mode:<8} {best['seconds_taken'] * 1000:9.1f} ms  peak RSS +{best['rss_growth_kb'] / 1024:7.1f} MiB")
+            fast, slow = results["fast"], results["music21"]
+            same_syllables = [list(s) for s in fast["syllables"]] == [list(s) for s in slow["syllables"]]
+            timing = "n/a (repeats)" if spec.get("repeats") else ("match" if lines_match_music21(fast, slow, spec.get("lyric_parts", (0,))[0]) else "DIFFER")
+            speedup = slow["seconds_taken"] / fast["seconds_taken"]
+            ok &= same_syllables and timing != "DIFFER" and speedup >= SPEEDUP_TARGET
+            print(f"  speedup x{speedup:.0f} (target x{SPEEDUP_TARGET:.0f}); {len(fast['syllables'])} syllables "
+                  f"{'match' if same_syllables else 'DIFFER'}; line times {timing}; {len(fast['lines'])} lines")
+            if spec.get("repeats"):
+                print("   " + " / ".join(line for _, line in fast["lines"][:6]) + " ...")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
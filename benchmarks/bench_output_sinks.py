@@ -0,0 +1,147 @@
+"""Benchmark: OSC and MIDI output sinks driven by the playback engine.
+
+Plays a dense song (default: a line every 40 ms) through the real
+PlaybackEngine and OutputRouter, in-process, with an OSC sink and a MIDI sink
+(raw MIDI bytes per datagram) each sending to a local UDP listener standing in
+for the receiving device. The listeners timestamp every packet on arrival.
+
+Two setups:
+  * OSC + MIDI;
+  * OSC + MIDI + a stalled MIDI device: a FIFO whose reader never reads and
+    whose pipe buffer is already full, as a hung USB/serial port would be.
+    Its writes must be dropped without delaying the other sinks.
+
+Reported per sink: packets received (or sent, for the FIFO) and dropped,
+arrival lateness against the `at` each line was scheduled for (p50/p99/max;
+listeners and server share the host's monotonic clock), the time each write
+took, and the skew between the OSC and MIDI packets of the same line (both
+are written from one timer, so it should stay in the tens of microseconds).
+
+Run from the project root:
+    python -m benchmarks.bench_output_sinks [--lines 120] [--interval 0.04]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import numpy as np
+
+
+class Listener(asyncio.DatagramProtocol):
+    """A UDP receiver standing in for an OSC or MIDI device: (arrival time, packet) per datagram."""
+
+    def __init__(self):
+        self.packets = []
+
+    def datagram_received(self, data, addr):
+        self.packets.append((time.monotonic(), data))
+
+
+async def listen(loop):
+    transport, listener = await loop.create_datagram_endpoint(Listener, local_addr=("127.0.0.1", 0))
+    return transport, listener
+
+
+def stalled_fifo(path):
+    """A FIFO with a reader that never reads, and its pipe buffer filled up. Returns the reader's fd."""
+    os.mkfifo(path)
+    reader = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    writer = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+    try:
+        while True:
+            os.write(writer, b"\0" * 4096)
+    except BlockingIOError:
+        pass
+    os.close(writer)
+    return reader
+
+
+def ms(values):
+    values = np.asarray(values)
+    if not len(values):
+        return f"{'-':>8} {'-':>8} {'-':>8}"
+    return f"{np.median(values) * 1000:6.3f}ms {np.percentile(values, 99) * 1000:6.3f}ms {values.max() * 1000:6.3f}ms"
+
+
+async def run_setup(args, stalled: bool, work_dir: str):
+    from backend.lyric_index import LyricTimelineIndex
+    from backend.output_sinks import OutputConfig, OutputRouter, decode_osc_message
+    from backend.playback_engine import PlaybackEngine
+    from backend.playback_plan import PlaybackPlan
+    from backend.trigger_interface import TriggerInterface
+
+    loop = asyncio.get_running_loop()
+    router = OutputRouter(TriggerInterface())
+    osc_transport, osc = await listen(loop)
+    midi_transport, midi = await listen(loop)
+    await router.add(OutputConfig(name="osc", type="osc", target=f"udp://127.0.0.1:{osc_transport.get_extra_info('sockname')[1]}"))
+    await router.add(OutputConfig(name="midi", type="midi", target=f"udp://127.0.0.1:{midi_transport.get_extra_info('sockname')[1]}"))
+    reader = None
+    if stalled:
+        path = os.path.join(work_dir, "stalled-midi")
+        reader = stalled_fifo(path)
+        await router.add(OutputConfig(name="stalled", type="midi", target=path))
+
+    scheduled = {}  # line index -> `at` of its lyric_update
+
+    async def send(message_type, data, room=None, text=None):
+        if message_type == "lyric_update" and data.get("line_index", -1) >= 0:
+            scheduled.setdefault(data["line_index"], data["at"])
+        await router.send_message(message_type, data, room, text)
+
+    engine = PlaybackEngine(send)
+    index = LyricTimelineIndex([i * args.interval for i in range(args.lines)], [f"line {i}" for i in range(args.lines)])
+    engine.start("bench", "Output sink benchmark", PlaybackPlan("bench", index))
+    await asyncio.sleep(args.lines * args.interval + 0.5)
+    engine.stop_all()
+
+    arrivals = {"osc": {}, "midi": {}}
+    for received, packet in osc.packets:
+        address, values = decode_osc_message(packet)
+        if address.endswith("/line"):
+            arrivals["osc"].setdefault(values[0], received)
+    for received, packet in midi.packets:
+        if packet[0] & 0xF0 == 0x90:
+            arrivals["midi"].setdefault(packet[1], received)  # note_base 0: the note is the line index
+
+    results = {}
+    for name, sink in router.sinks.items():
+        lateness = [arrivals[name][i] - at for i, at in scheduled.items() if i in arrivals.get(name, {})]
+        results[name] = {"received": len(arrivals[name]) if name in arrivals else sink.sent, "dropped": sink.dropped,
+                         "lateness": lateness, "write_time": list(sink.write_time.samples)}
+    skew = [abs(arrivals["osc"][i] - arrivals["midi"][i]) for i in scheduled if i in arrivals["osc"] and i in arrivals["midi"]]
+    router.close()
+    osc_transport.close()
+    midi_transport.close()
+    if reader is not None:
+        os.close(reader)
+    return len(scheduled), results, skew
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Nothing from backend may be imported before the data directory is set
+        os.environ["LYRICPILOT_DATA_DIR"] = work_dir
+        os.environ["LYRICPILOT_OUTPUT_DEVICE_DIRS"] = work_dir  # The stalled FIFO lives here
+        print(f"{args.lines} lines, one every {args.interval * 1000:.0f}ms")
+        print(f"  {'setup':<26} {'sink':<8} {'received':>8} {'dropped':>7}   {'lateness p50':>12} {'p99':>8} {'max':>8}   "
+              f"{'write p50':>9} {'p99':>8} {'max':>8}")
+        ok = True
+        for name, stalled in (("osc + midi", False), ("osc + midi + stalled fifo", True)):
+            lines, results, skew = await run_setup(args, stalled, work_dir)
+            for sink, result in results.items():
+                print(f"  {name:<26} {sink:<8} {result['received']:>8} {result['dropped']:>7}   "
+                      f"{ms(result['lateness']):>30}   {ms(result['write_time']):>27}")
+                if sink != "stalled":
+                    ok = ok and result["received"] == lines
+            print(f"  {name:<26} {'osc/midi skew':<17}{'':>7}   {ms(skew):>30}")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=120, help="at most 128, one MIDI note per line")
+    parser.add_argument("--interval", type=float, default=0.04, help="seconds between lines")
+    asyncio.run(main(parser.parse_args()))
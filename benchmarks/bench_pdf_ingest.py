@@ -0,0 +1,227 @@
+"""Benchmark: ingesting PDF chord charts.
+
+Builds a 200-page songbook PDF (default): 50 four-page songs with a title block,
+section headers, chord lines over lyrics, repeat markers, running headers and
+CCLI footers. Then:
+
+  * whole songbook: extracted, parsed and timed in one process (what a single
+    job queue task does, `process_song_file`) against `ingest_pdf`, which splits
+    text extraction over the job queue's workers in page chunks;
+  * timecode generation for the songbook's parsed structure: the vectorized
+    generator against a per-line Python loop (checked to give the same result);
+  * OCR isolation (only with Tesseract installed): a scanned PDF's pages are
+    OCRed while small text charts keep arriving; text chart latency with the
+    scan OCRed on the job queue itself (inline, as a single task would) against
+    the separate OCR queue.
+
+Worker counts come from LYRICPILOT_PROCESSING_WORKERS / LYRICPILOT_OCR_WORKERS
+(or --workers); a page-parallel speedup needs as many free cores.
+
+Run from the project root:
+    python -m benchmarks.bench_pdf_ingest [--pages 200] [--workers 4] [--repeat 5] [--scanned-pages 8]
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+from uuid import uuid4
+
+import numpy as np
+
+WORDS = ("amazing grace love light river holy mercy morning glory shelter praise forever heart home night "
+         "sing come free hope rise mountain valley ocean fire wind spirit king kingdom crown cross faithful").split()
+CHORDS = "G D Em C Am D/F# Bm A7 Cmaj7 Dsus4".split()
+
+
+def chart_pages(rng, title, pages):
+    """The text of one song's chart pages."""
+    def lyric():
+        return " ".join(rng.choices(WORDS, k=rng.randint(4, 8))).capitalize()
+
+    def stanza(lines):
+        out = []
+        for _ in range(lines):
+            out += ["   ".join(rng.choices(CHORDS, k=rng.randint(2, 4))), lyric()]
+        return out
+
+    first = [title, "Traditional", "Key - G | Tempo - 76 | Time - 4/4", "", "Intro", "G  C  G  D", ""]
+    body = [first + ["Verse 1"] + stanza(6) + ["", "Chorus x2"] + stanza(4) + [f"{lyric()} (x2)"]]
+    for n in range(2, pages + 1):
+        body.append([title, f"Verse {n}"] + stanza(6) + ["", "Repeat Chorus", "", "Bridge"] + stanza(3) + ["x3"])
+    footer = "CCLI Song # 1234567 | © Public Domain | CCLI License # 7654321"
+    return ["\n".join(lines + ["", f"{i + 1}", footer]) for i, lines in enumerate(body)]
+
+
+def make_pdf(path, pages, scanned=False):
+    import pymupdf
+    doc = pymupdf.open()
+    for text in pages:
+        page = doc.new_page()
+        page.insert_text((54, 54), text, fontsize=9)
+        if scanned:
+            # Replace the page with a picture of itself: a scan, with no text layer
+            pixmap = page.get_pixmap(dpi=200)
+            doc.delete_page(-1)
+            doc.new_page().insert_image(pymupdf.Rect(0, 0, 595, 842), pixmap=pixmap)
+    doc.save(path)
+
+
+def stage(songs_dir, source):
+    """Copies a PDF into a new song directory, as an upload is stored."""
+    song_id = str(uuid4())
+    raw = os.path.join(songs_dir, song_id, "raw")
+    os.makedirs(raw)
+    path = os.path.join(raw, os.path.basename(source))
+    shutil.copyfile(source, path)
+    return song_id, path
+
+
+def loop_timecodes(structure, bpm, measures_per_section=None, beats_per_measure=None):
+    """The generator as a per-line loop building validated entries (as `lyrics_text_parser` does), for comparison."""
+    from backend.config import PDF_INSTRUMENTAL_MEASURES, PDF_MEASURES_PER_LINE
+    from backend.timecode_generator import TimecodeData, TimecodeEntry
+    beats_per_measure = beats_per_measure or structure.beats_per_measure or 4
+    beat = 60.0 / bpm
+    entries, start = [], 0.0
+    for section in structure.sections:
+        measures = measures_per_section or (len(section.lines) * PDF_MEASURES_PER_LINE if section.lines else PDF_INSTRUMENTAL_MEASURES)
+        duration = measures * beats_per_measure * beat
+        for _ in range(max(1, section.repeat)):
+            interval = duration / max(len(section.lines), 1)
+            for i, line in enumerate(section.lines):
+                offset = i * interval
+                if interval >= beat:
+                    offset = math.floor(offset / beat + 1e-9) * beat
+                entries.append(TimecodeEntry(time=start + offset, text=line))
+            start += duration
+    return TimecodeData(timecodes=entries)
+
+
+async def main(args):
+    data_dir = tempfile.mkdtemp(prefix="lyricpilot-bench-")
+    # Point the app at the scratch data directory (and set the pool sizes) before anything from backend is imported
+    os.environ["LYRICPILOT_DATA_DIR"] = data_dir
+    if args.workers:
+        os.environ["LYRICPILOT_PROCESSING_WORKERS"] = str(args.workers)
+    from backend.config import OCR_WORKERS, PDF_MIN_PAGES_PER_TASK, PROCESSING_WORKERS, SONGS_DIR
+    from backend.job_queue import job_queue, ocr_queue
+    from backend.pdf_ingest import ingest_pdf
+    from backend.pdf_parser import extract_text_from_pdf, ocr_page, parse_song_structure
+    from backend.song_loader import process_song_file
+    from backend.structure_timecode_generator import generate_timecodes_from_structure
+    from backend.timecode_store import ColumnarTimecodes
+
+    rng = random.Random(3)
+    songs = args.pages // 4
+    pages = [page for n in range(songs) for page in chart_pages(rng, f"Song {n + 1}", 4)]
+    songbook = os.path.join(data_dir, "songbook.pdf")
+    make_pdf(songbook, pages)
+    print(f"Songbook: {len(pages)} pages, {os.path.getsize(songbook) / 1e6:.1f} MB; "
+          f"{PROCESSING_WORKERS} job queue workers (chunks of at least {PDF_MIN_PAGES_PER_TASK} pages), {OCR_WORKERS} OCR worker(s)")
+
+    # Start the pools before timing anything
+    await asyncio.gather(*(job_queue.run(os.getpid) for _ in range(PROCESSING_WORKERS)))
+
+    async def serial():
+        song_id, path = stage(SONGS_DIR, songbook)
+        return await asyncio.to_thread(process_song_file, song_id, path)
+
+    async def parallel():
+        song_id, path = stage(SONGS_DIR, songbook)
+        return await ingest_pdf(song_id, path)
+
+    print(f"  {'whole songbook':<44} {'p50':>9} {'min':>9} {'pages/s':>9}")
+    timings = {}
+    for name, fn in (("one process (process_song_file)", serial), ("page chunks on the job queue (ingest_pdf)", parallel)):
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            timecode_path = await fn()
+            samples.append(time.perf_counter() - start)
+        timings[name] = samples
+        print(f"  {name:<44} {np.median(samples) * 1000:7.0f}ms {min(samples) * 1000:7.0f}ms {len(pages) / np.median(samples):9.0f}")
+    print(f"  -> {len(ColumnarTimecodes(timecode_path))} timed lines")
+
+    structure = parse_song_structure(extract_text_from_pdf(songbook))
+    vectorized = generate_timecodes_from_structure(structure)
+    reference = loop_timecodes(structure, structure.bpm)
+    assert [(e.time, e.text) for e in vectorized.timecodes] == [(e.time, e.text) for e in reference.timecodes]
+    print(f"  {'timecode generation':<44} {'p50':>9}")
+    for name, fn in (("per-line loop", lambda: loop_timecodes(structure, structure.bpm)),
+                     ("vectorized", lambda: generate_timecodes_from_structure(structure))):
+        samples = []
+        for _ in range(max(20, args.repeat)):
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+        print(f"  {name:<44} {np.median(samples) * 1000:7.2f}ms  ({len(reference.timecodes)} lines)")
+
+    ocr_ok = True
+    if args.scanned_pages:
+        scan = os.path.join(data_dir, "scan.pdf")
+        make_pdf(scan, pages[:args.scanned_pages], scanned=True)
+        try:
+            ocr_page(scan, 0)
+        except ValueError as e:
+            print(f"  OCR isolation skipped: {e}")
+            scan = None
+    if args.scanned_pages and scan:
+        chart = os.path.join(data_dir, "chart.pdf")
+        make_pdf(chart, pages[:4])
+
+        async def text_charts(count=12, interval=0.25):
+            latencies = []
+
+            async def one(delay):
+                await asyncio.sleep(delay)
+                song_id, path = stage(SONGS_DIR, chart)
+                start = time.perf_counter()
+                await ingest_pdf(song_id, path)
+                latencies.append(time.perf_counter() - start)
+            await asyncio.gather(*(one(i * interval) for i in range(count)))
+            return np.array(latencies)
+
+        async def with_scan(scan_fn):
+            scanning = asyncio.ensure_future(scan_fn())
+            await asyncio.sleep(0.2)
+            latencies = await text_charts()
+            await scanning
+            return latencies
+
+        async def scan_inline():
+            # Every scanned page OCRed inside one job queue task, as a single-process import would
+            song_id, path = stage(SONGS_DIR, scan)
+            await job_queue.run(process_song_file, song_id, path, 76.0)
+
+        async def scan_queued():
+            song_id, path = stage(SONGS_DIR, scan)
+            await ingest_pdf(song_id, path, 76.0)
+
+        print(f"  {'4-page text charts during a ' + str(args.scanned_pages) + '-page scan':<44} {'p50':>9} {'p99':>9}")
+        results = {}
+        for name, fn in (("no scan", text_charts), ("scan OCRed on the job queue", lambda: with_scan(scan_inline)),
+                         ("scan OCRed on the OCR queue", lambda: with_scan(scan_queued))):
+            latencies = await fn()
+            results[name] = latencies
+            print(f"  {name:<44} {np.median(latencies) * 1000:7.0f}ms {np.percentile(latencies, 99) * 1000:7.0f}ms")
+        ocr_ok = np.median(results["scan OCRed on the OCR queue"]) <= np.median(results["scan OCRed on the job queue"])
+
+    job_queue.shutdown()
+    ocr_queue.shutdown()
+    shutil.rmtree(data_dir, ignore_errors=True)
+    ok = ocr_ok and (min(PROCESSING_WORKERS, os.cpu_count() or 1) < 2 or np.median(timings["page chunks on the job queue (ingest_pdf)"])
+                     < np.median(timings["one process (process_song_file)"]))
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=0, help="job queue workers (default: LYRICPILOT_PROCESSING_WORKERS)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scanned-pages", type=int, default=8, help="pages of the scanned PDF for the OCR test; 0 skips it")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,138 @@
+"""Benchmark: memory allocated per lyric trigger, building payloads vs. the compiled playback plan.
+
+Writes a song of N lines (default 5,000, one line in ten sharing its timestamp
+with the next) as a columnar timecode file, loads it through the timecode
+cache and walks every line boundary, the way a playback session or a run of
+`/trigger_lyric` calls would. Each step produces the `lyric_update` (data plus
+serialized message):
+
+  * build: what the server did before the plan: look the window up in the
+    lyric index, build the payload dict and serialize it with `encode_message`;
+  * plan: PlaybackPlan frames, all encoded when the plan was compiled, with
+    only `at` and `position` spliced in per trigger.
+
+First the plan's compile time and the memory its encoded frames hold; then,
+with tracemalloc, per trigger: the memory a trigger allocates while it runs
+(peak above the starting point, the payload it returns included) and what is
+still held after a whole pass; then the time per trigger with tracemalloc off.
+
+Run from the project root:
+    python -m benchmarks.bench_playback_plan [--lines 5000]
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+
+def make_song(data_dir, lines):
+    from backend.timecode_store import TIMECODE_FILENAME, save_timecodes
+
+    path = os.path.join(data_dir, TIMECODE_FILENAME)
+    entries, t = [], 0.0
+    for i in range(lines):
+        entries.append({"time": round(t, 3), "text": f"Line {i}: and the words of the song go on like this"})
+        if i % 10 != 4:  # Line 5 of every ten shares its time with line 4 (a second voice)
+            t += 0.5
+    save_timecodes(path, entries)
+    return path
+
+
+def build_lyric_update(song_id, index, i, at, position):
+    """The payload as PlaybackSession.lyric_data and trigger_lyric built it on every trigger."""
+    from backend.trigger_interface import encode_message
+
+    data = {
+        "song_id": song_id,
+        "line_index": i,
+        "at": at,
+        "position": position,
+        "current_lyric": index.texts[i] if i >= 0 else None,
+        "next_lyrics": index.upcoming(i, 3),
+    }
+    return data, encode_message("lyric_update", data)
+
+
+def walks(song_id, plan):
+    """Callables producing the lyric_update for each boundary, per approach."""
+    index = plan.index
+    boundaries = list(plan.frame_lines)
+
+    def build():
+        for n, i in enumerate(boundaries):
+            yield lambda i=i, n=n: build_lyric_update(song_id, index, i, 1000.0 + n, n * 0.5)
+
+    def compiled():
+        frame = -1
+        for n, i in enumerate(boundaries):
+            frame = plan.frame_of(i, frame + 1)
+            yield lambda frame=frame, n=n: plan.lyric_update(frame, 1000.0 + n, n * 0.5)
+    return build, compiled
+
+
+def measure_memory(walk):
+    """(mean and max bytes allocated per trigger while it runs, bytes still held after the pass)."""
+    steps = list(walk())
+    peaks = np.zeros(len(steps))  # Allocated up front, so recording doesn't count as held
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for n, step in enumerate(steps):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = step()
+        peaks[n] = tracemalloc.get_traced_memory()[1] - before
+        del result
+    held = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return np.mean(peaks), np.max(peaks), held
+
+
+def measure_time(walk, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        steps = list(walk())
+        start = time.perf_counter()
+        for step in steps:
+            step()
+        best = min(best, (time.perf_counter() - start) / len(steps))
+    return best
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as data_dir:
+        # Nothing from backend may be imported before the data directory is set
+        os.environ["LYRICPILOT_DATA_DIR"] = data_dir
+        from backend.timecode_cache import TimecodeCache
+
+        path = make_song(data_dir, args.lines)
+        song_id = "plan-bench"
+        cache = TimecodeCache()
+        cache.get_index(song_id, path)  # Loaded first, so only the plan is measured
+        start = time.perf_counter()
+        plan = cache.get_plan(song_id, path)
+        compile_time = time.perf_counter() - start
+        cache.invalidate(song_id)
+        tracemalloc.start()
+        plan = cache.get_plan(song_id, path)
+        plan_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{len(plan.index)} lines, {len(plan)} frames; plan compiled in {compile_time * 1000:.2f}ms, "
+              f"holding {plan_bytes / 1024:.0f} KiB (timeline load included)")
+
+        build, compiled = walks(song_id, plan)
+        print(f"  {'approach':<20} {'allocated/trigger':>17} {'max':>8} {'held after pass':>15} {'time/trigger':>12}")
+        results = {}
+        for name, walk in (("build", build), ("plan", compiled)):
+            mean, peak, held = measure_memory(walk)
+            results[name] = mean, measure_time(walk)
+            print(f"  {name:<20} {mean:15.0f} B {peak:6.0f} B {held:13.0f} B {results[name][1] * 1e6:10.2f}us")
+    raise SystemExit(0 if results["plan"] < results["build"] else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=5000)
+    main(parser.parse_args())
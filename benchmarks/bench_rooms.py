@@ -0,0 +1,214 @@
+"""Load test: many rooms playing at once from one server.
+
+Starts the real app (uvicorn, in a child process, against a temporary data
+directory) with one song per room (a line every 0.25 s), connects N rooms x M
+displays (default 10 x 100) to `/ws?room=...` and starts every room's song.
+While they play, each display timestamps the `lyric_update`s it receives.
+
+Reported per room: delivery latency from the moment the room's playback timer
+dispatched a line (`at` minus PLAYBACK_DISPATCH_AHEAD, on the server's
+monotonic clock, which the displays share by running on the same host) until a
+display received it (p50/p99/max over all its displays), updates per display,
+messages that reached a display of another room (should be 0), and the
+server-side fan-out time per broadcast from `/broadcast/stats`.
+
+Then, in-process: the cost of one room broadcast among all N x M clients,
+through the room index against a filter over every connection.
+
+Run from the project root:
+    python -m benchmarks.bench_rooms [--rooms 10] [--clients 100] [--seconds 10]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+import websockets
+
+LINE_INTERVAL = 0.25
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def room_name(n):
+    return f"room-{n:02d}"
+
+
+async def make_songs(data_dir, rooms, seconds):
+    """One processed song per room, with a line every LINE_INTERVAL seconds."""
+    os.environ["LYRICPILOT_DATA_DIR"] = data_dir
+    from backend.database import AsyncSessionLocal, add_songs, async_engine, create_tables_async
+    from backend.timecode_store import TIMECODE_FILENAME, save_timecodes
+
+    await create_tables_async()
+    rows = []
+    for n in range(rooms):
+        song_id = f"song-{room_name(n)}"
+        song_dir = os.path.join(data_dir, "songs", song_id)
+        os.makedirs(song_dir, exist_ok=True)
+        path = os.path.join(song_dir, TIMECODE_FILENAME)
+        save_timecodes(path, [{"time": i * LINE_INTERVAL, "text": f"{room_name(n)} line {i}"}
+                              for i in range(int(seconds / LINE_INTERVAL) + 40)])
+        rows.append({"id": song_id, "title": f"Song for {room_name(n)}", "file_path": path, "processed": True,
+                     "timecode_path": path, "status": "done"})
+    async with AsyncSessionLocal() as db:
+        await add_songs(db, rows)
+    await async_engine.dispose()
+
+
+class Display:
+    def __init__(self, uri, room):
+        self.uri, self.room = uri, room
+        self.latencies = []
+        self.foreign = 0
+
+    async def run(self, connected: asyncio.Event, dispatch_ahead: float):
+        async with websockets.connect(f"{self.uri}?room={self.room}", ping_interval=None, max_size=None) as ws:
+            connected.set()
+            async for raw in ws:
+                received = time.monotonic()
+                message = json.loads(raw)
+                if message["type"] != "lyric_update":
+                    continue
+                data = message["data"]
+                if data.get("song_id") != f"song-{self.room}":
+                    self.foreign += 1
+                elif data.get("at") is not None:
+                    self.latencies.append(received - (data["at"] - dispatch_ahead))
+
+
+def post(url):
+    urllib.request.urlopen(urllib.request.Request(url, method="POST")).read()
+
+
+def get_json(url):
+    with urllib.request.urlopen(url) as response:
+        return json.loads(response.read())
+
+
+async def fanout_cost(rooms, clients, repeat=2000):
+    """Seconds per room broadcast among rooms x clients connections: room index vs. filtering every client."""
+    from backend.trigger_interface import TriggerInterface
+
+    class Socket:
+        # Just enough of a WebSocket for TriggerInterface.register; sends go nowhere
+        headers = {}
+
+        def __init__(self, n):
+            self.client = f"client-{n}"
+
+        async def send_text(self, text):
+            pass
+
+    interface = TriggerInterface()
+    for n in range(rooms * clients):
+        interface.register(Socket(n), room_name(n % rooms))
+    text = json.dumps({"type": "lyric_update", "data": {"current_lyric": "x"}})
+    target = room_name(0)
+
+    async def filtered():
+        for client in list(interface.clients.values()):
+            if client.room == target:
+                interface.send_text_to(client, "lyric_update", text)
+
+    results = {}
+    for name, fn in (("filter over all connections", filtered),
+                     ("room index", lambda: interface.broadcast("lyric_update", text, target))):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await fn()
+            samples.append(time.perf_counter() - start)
+            await asyncio.sleep(0)  # Lets the writers drain
+        results[name] = np.array(samples)
+    for websocket in list(interface.clients):
+        interface.unregister(websocket)
+    return results
+
+
+async def main(args):
+    raise_fd_limit()
+    with tempfile.TemporaryDirectory() as data_dir:
+        # Sets the data directory, so nothing from backend may be imported before it
+        await make_songs(data_dir, args.rooms, args.seconds)
+        from backend.config import PLAYBACK_DISPATCH_AHEAD
+        env = dict(os.environ, LYRICPILOT_DATA_DIR=data_dir)
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1",
+                                   "--port", str(args.port), "--log-level", "warning", "--backlog", "4096"],
+                                  env=env, stdout=subprocess.DEVNULL)
+        try:
+            base = f"http://127.0.0.1:{args.port}"
+            for _ in range(100):
+                try:
+                    await asyncio.to_thread(get_json, f"{base}/rooms")
+                    break
+                except OSError:
+                    await asyncio.sleep(0.1)
+
+            uri = base.replace("http", "ws") + "/ws"
+            displays = [Display(uri, room_name(n % args.rooms)) for n in range(args.rooms * args.clients)]
+            connected = [asyncio.Event() for _ in displays]
+            tasks = []
+            for display, event in zip(displays, connected):
+                tasks.append(asyncio.ensure_future(display.run(event, PLAYBACK_DISPATCH_AHEAD)))
+                await asyncio.sleep(0)
+            await asyncio.wait_for(asyncio.gather(*(event.wait() for event in connected)), 120)
+            rooms = await asyncio.to_thread(get_json, f"{base}/rooms")
+            print(f"{args.rooms} rooms x {args.clients} displays connected "
+                  f"({sum(room['connections'] for room in rooms)} sockets), a line every {LINE_INTERVAL}s, {args.seconds:.0f}s of playback")
+
+            for n in range(args.rooms):
+                await asyncio.to_thread(post, f"{base}/play_song/song-{room_name(n)}?room={room_name(n)}")
+                await asyncio.sleep(LINE_INTERVAL / args.rooms)  # Staggered, like rooms that don't start in step
+            await asyncio.sleep(args.seconds)
+            for n in range(args.rooms):
+                await asyncio.to_thread(post, f"{base}/playback/song-{room_name(n)}/stop?room={room_name(n)}")
+            await asyncio.sleep(0.5)
+            stats = await asyncio.to_thread(get_json, f"{base}/broadcast/stats")
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"  {'room':<8} {'delivery p50':>12} {'p99':>8} {'max':>8} {'updates/display':>15} {'other rooms':>11} "
+          f"{'fan-out p50':>11} {'p99':>8}")
+    foreign = 0
+    p99s = []
+    for n in range(args.rooms):
+        members = [d for d in displays if d.room == room_name(n)]
+        latencies = np.concatenate([d.latencies for d in members if d.latencies] or [np.zeros(0)])
+        foreign += sum(d.foreign for d in members)
+        fanout = stats["rooms"].get(room_name(n), {}).get("broadcast_latency", {})
+        p99s.append(np.percentile(latencies, 99) if len(latencies) else float("inf"))
+        print(f"  {room_name(n):<8} {np.median(latencies) * 1000:10.1f}ms {p99s[-1] * 1000:6.1f}ms {latencies.max() * 1000:6.1f}ms "
+              f"{len(latencies) / len(members):15.1f} {sum(d.foreign for d in members):11d} "
+              f"{fanout.get('p50_ms', float('nan')):9.3f}ms {fanout.get('p99_ms', float('nan')):6.3f}ms")
+    print(f"  dropped sends {stats['dropped_sends']}, dropped connections {stats['dropped_connections']}, "
+          f"coalesced {stats['coalesced']}")
+
+    costs = await fanout_cost(args.rooms, args.clients)
+    print(f"  one room's broadcast among {args.rooms * args.clients} connections (in-process):")
+    for name, samples in costs.items():
+        print(f"    {name:<30} p50 {np.median(samples) * 1e6:7.1f}us  p99 {np.percentile(samples, 99) * 1e6:7.1f}us")
+    raise SystemExit(0 if foreign == 0 and all(np.isfinite(p99s)) else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--clients", type=int, default=100, help="displays per room")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8780)
+    asyncio.run(main(parser.parse_args()))
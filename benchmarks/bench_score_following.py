@@ -0,0 +1,298 @@
+"""Benchmark: live score following against a MIDI reference.
+
+Builds a reference MIDI file (songs with verses and identical repeated
+choruses, a lyric line every two bars) and "recorded performances" of it as
+MIDI files: rubato (tempo swaying +-12% and drifting, a held note at the end
+of each section), timing jitter, dropped, extra and wrong notes, and an
+unscripted extra chorus. Each performance is replayed through MidiFileInput
+into the OnlineScoreAligner, and a LyricScheduler is driven from the position
+estimate:
+
+  * lyric switch error against when the band actually reached each line, for
+    the score follower and for a fixed clock at the reference tempo;
+  * per-onset update latency (p50/p99/max) on a 20k-onset reference;
+  * the same performance rendered as audio, followed through the beat
+    tracker's onset picker (no pitch information).
+
+Run from the project root:
+    python -m benchmarks.bench_score_following [--songs 4] [--onsets 20000]
+"""
+import argparse
+import asyncio
+import os
+import struct
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+from backend.audio_input import AudioInput
+from backend.beat_detector import BeatTrackingPipeline
+from backend.lyric_scheduler import LyricScheduler
+from backend.score_follower import _HOLD_MARGIN, MidiFileInput, OnlineScoreAligner, load_reference
+
+TICKS_PER_SECOND = 1920  # 960 PPQ at the default 120 BPM
+SAMPLE_RATE = 22050
+SECTIONS = ["verse", "chorus", "verse", "chorus", "bridge", "chorus", "chorus"]
+RHYTHMS = [[0.0], [0.0, 0.5], [0.0, 0.5], [0.0, 0.75], [0.0, 0.5, 0.75], [0.0, 0.25, 0.5]]
+
+
+def make_song(rng, start, bpm):
+    """One song from reference second `start`: (onset times, lowest pitches, section ids, line times).
+
+    Every chorus is the same notes; verses and the bridge are each their own.
+    """
+    beat = 60.0 / bpm
+    patterns = {}
+    times, pitches, section_ids, lines = [], [], [], []
+    t = start + 4 * beat
+    for s, kind in enumerate(SECTIONS):
+        if kind not in patterns or kind != "chorus":
+            melody = 60 + np.cumsum(rng.integers(-3, 4, 8 * 4)) % 19
+            patterns[kind] = [(b, offset, int(melody[b])) for b in range(32) for offset in RHYTHMS[rng.integers(len(RHYTHMS))]]
+        for b, offset, pitch in patterns[kind]:
+            if b % 8 == 0 and offset == 0.0:
+                lines.append(t + b * beat)
+            times.append(t + (b + offset) * beat)
+            pitches.append(36 + pitch % 12 if b % 4 == 0 and offset == 0.0 else pitch)  # Bass on each downbeat
+            section_ids.append(s)
+        t += 32 * beat
+    return times, pitches, section_ids, lines, t + 4 * beat
+
+
+def make_reference(rng, songs=None, onsets=None):
+    times, pitches, sections, lines, t, s = [], [], [], [], 0.0, 0
+    while (songs is not None and s < songs) or (onsets is not None and len(times) < onsets):
+        song = make_song(rng, t, float(rng.uniform(70, 130)))
+        times += song[0]
+        pitches += song[1]
+        sections += [s * len(SECTIONS) + i for i in song[2]]
+        lines += song[3]
+        t = song[4]
+        s += 1
+    return np.array(times), np.array(pitches), np.array(sections), np.array(lines)
+
+
+def perform(rng, times, pitches, sections, repeat_chorus=True):
+    """A rubato performance: (live times, pitches, true reference time of each live onset)."""
+    order = list(range(len(times)))
+    if repeat_chorus:
+        # After the last chorus of every song, the band sings it once more
+        last = sections.max() + 1
+        for section in range(len(SECTIONS) - 1, last, len(SECTIONS)):
+            members = [i for i in order if sections[i] == section]
+            at = order.index(members[-1]) + 1
+            order[at:at] = members
+    order = np.array(order)
+    ref = times[order]
+    gaps = np.diff(ref, prepend=ref[0])
+    gaps[gaps < 0] = 0.5  # Back to the top of the chorus
+    # Tempo: a slow sway, a drift, and a held note before each new section
+    t = np.cumsum(gaps)
+    tempo = (1.0 + 0.12 * np.sin(2 * np.pi * t / 40.0)) * np.exp(np.cumsum(rng.normal(0, 0.004, len(t))))
+    tempo = np.clip(tempo, 0.7, 1.4)
+    live_gaps = gaps / tempo
+    new_section = np.flatnonzero(np.diff(sections[order], prepend=sections[order][0]) != 0)
+    live_gaps[new_section] += rng.uniform(0.3, 1.2, len(new_section))
+    live = np.cumsum(live_gaps) + 1.0 + rng.normal(0, 0.012, len(t))
+    live = np.maximum.accumulate(live)
+    played_pitches = pitches[order].copy()
+    wrong = rng.random(len(t)) < 0.03
+    played_pitches[wrong] += rng.choice([-2, -1, 1, 2], wrong.sum())
+    keep = rng.random(len(t)) >= 0.04
+    extras = np.flatnonzero(rng.random(len(t)) < 0.03)
+    extra_times = live[extras] + rng.uniform(0.03, 0.15, len(extras))
+    all_times = np.concatenate((live[keep], extra_times))
+    all_pitches = np.concatenate((played_pitches[keep], rng.integers(40, 80, len(extras))))
+    truth = np.concatenate((ref[keep], ref[extras]))
+    is_real = np.concatenate((np.ones(keep.sum(), bool), np.zeros(len(extras), bool)))
+    s = np.argsort(all_times, kind="stable")
+    return all_times[s], all_pitches[s], truth[s], is_real[s], live, ref
+
+
+def write_midi(path, times, pitches):
+    def varlen(value):
+        out = [value & 0x7F]
+        value >>= 7
+        while value:
+            out.append(0x80 | (value & 0x7F))
+            value >>= 7
+        return bytes(reversed(out))
+
+    events = []
+    for t, pitch in zip(times, pitches):
+        tick = int(round(t * TICKS_PER_SECOND))
+        notes = [int(pitch)] + ([int(pitch) + 12] if pitch < 48 else [])  # Downbeats: a two-note chord
+        for p in notes:
+            events.append((tick, 1, p))
+            events.append((tick + TICKS_PER_SECOND // 10, 0, p))
+    events.sort()
+    body, last = bytearray(), 0
+    for tick, on, p in events:
+        body += varlen(tick - last) + bytes([0x90 if on else 0x80, p, 90 if on else 0])
+        last = tick
+    body += b"\x00\xff\x2f\x00"
+    with open(path, "wb") as f:
+        f.write(b"MThd" + struct.pack(">IHHH", 6, 0, 1, 960) + b"MTrk" + struct.pack(">I", len(body)) + bytes(body))
+
+
+def line_switches(positions_at, start, end, lines):
+    """Drives a LyricScheduler from a position function every 10 ms: [(time, line index)]."""
+    scheduler = LyricScheduler([{"time": float(t), "text": str(i)} for i, t in enumerate(lines)], lead_offset=0.0)
+    switches = []
+    for t in np.arange(start, end, 0.01):
+        line = scheduler.get_next_lyric(positions_at(t))
+        if line is not None:
+            switches.append((t, int(line["text"])))
+    return switches
+
+
+def switch_errors(switches, live, ref, lines):
+    """For every time the band reached a line, the error of the nearest switch to that line (inf if none within 2 s)."""
+    errors = []
+    by_line = {}
+    for t, i in switches:
+        by_line.setdefault(i, []).append(t)
+    for k, line_time in enumerate(lines):
+        for at in live[np.isclose(ref, line_time)]:
+            candidates = np.abs(np.array(by_line.get(k, [np.inf])) - at)
+            error = candidates.min()
+            errors.append(error if error <= 2.0 else np.inf)
+    return np.array(errors)
+
+
+async def replay(path, aligner):
+    trace = []
+    midi = MidiFileInput(path)
+
+    def on_onset(t, pitch):
+        aligner.update(t, pitch)
+        trace.append((t, aligner.index, aligner.tempo))
+
+    midi.start(on_onset, realtime=False)
+    await midi._task
+    return trace
+
+
+def traced_position(aligner, trace):
+    """A position function over the replay: the aligner's estimate as it was after the latest onset."""
+    times = np.array([t for t, _, _ in trace])
+    ref = aligner.times
+
+    def position_at(t):
+        k = int(np.searchsorted(times, t, side="right")) - 1
+        if k < 0:
+            return aligner.start_position
+        _, i, tempo = trace[k]
+        position = ref[i] + (t - times[k]) * tempo
+        return min(position, ref[i + 1] - _HOLD_MARGIN) if i + 1 < len(ref) else position
+    return position_at
+
+
+def summarize(name, errors):
+    finite = errors[np.isfinite(errors)]
+    print(f"  {name:<22} median {np.median(finite) * 1000:6.0f} ms  p90 {np.percentile(finite, 90) * 1000:6.0f} ms  "
+          f"within 100 ms {np.mean(errors <= 0.1) * 100:5.1f}%  missed {np.mean(~np.isfinite(errors)) * 100:5.1f}%")
+
+
+def render_audio(path, times, pitches, seconds):
+    n = np.arange(int(0.25 * SAMPLE_RATE)) / SAMPLE_RATE
+    audio = np.random.default_rng(3).normal(0, 0.002, int(seconds * SAMPLE_RATE) + len(n))
+    for t, pitch in zip(times, pitches):
+        if t >= seconds:
+            break
+        f = 440.0 * 2 ** ((pitch - 69) / 12)
+        tone = sum(np.sin(2 * np.pi * f * h * n) / h for h in (1, 2, 3)) * np.minimum(1, n / 0.004) * np.exp(-n * 8)
+        tone *= np.minimum(1, (n[-1] - n) / 0.03)
+        at = int(t * SAMPLE_RATE)
+        audio[at:at + len(n)] += 0.15 * tone
+    audio = audio[:int(seconds * SAMPLE_RATE)]
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes())
+
+
+async def follow_audio(path, aligner):
+    audio = AudioInput(sample_rate=SAMPLE_RATE, buffer_seconds=600)
+    await audio.start_capture(path, realtime=False)
+    trace = []
+
+    def on_state(state):
+        for onset in state.onsets:
+            aligner.update(onset)
+            trace.append((onset, aligner.index, aligner.tempo))
+
+    pipeline = BeatTrackingPipeline(audio, on_state)
+    pipeline.start()
+    await asyncio.to_thread(pipeline.finished.wait)
+    return trace
+
+
+async def main(args):
+    rng = np.random.default_rng(5)
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        reference_path, performance_path = os.path.join(tmp, "reference.mid"), os.path.join(tmp, "performance.mid")
+
+        times, pitches, sections, lines = make_reference(rng, songs=args.songs)
+        write_midi(reference_path, times, pitches)
+        ref_times, ref_pitches = load_reference(reference_path)
+        live_times, live_pitches, truth, is_real, live, ref = perform(rng, times, pitches, sections)
+        write_midi(performance_path, live_times, live_pitches)
+        print(f"Reference: {args.songs} songs, {len(ref_times)} onsets, {len(lines)} lyric lines, {times[-1] / 60:.1f} min; "
+              f"performance {live_times[-1] / 60:.1f} min with an extra chorus per song")
+
+        aligner = OnlineScoreAligner(ref_times, ref_pitches)
+        trace = await replay(performance_path, aligner)
+        estimate = np.array([ref_times[i] for _, i, _ in trace])
+        position_error = np.abs(estimate - truth)[is_real]
+        print(f"MIDI performance: onset position error median {np.median(position_error) * 1000:.0f} ms, "
+              f"{np.mean(position_error < 0.05) * 100:.1f}% within 50 ms, {aligner.relocations} relocations")
+        followed = switch_errors(line_switches(traced_position(aligner, trace), 0, live[-1] + 1, lines), live, ref, lines)
+        fixed = switch_errors(line_switches(lambda t: t - live[0] + times[0], 0, live[-1] + 1, lines), live, ref, lines)
+        print("Lyric switch error vs the band:")
+        summarize("score follower (MIDI)", followed)
+        summarize("fixed clock", fixed)
+        ok &= np.median(followed[np.isfinite(followed)]) < 0.1 and np.mean(np.isfinite(followed)) > 0.95
+
+        seconds = min(args.audio_seconds, live[-1])
+        wav_path = os.path.join(tmp, "performance.wav")
+        render_audio(wav_path, live_times, live_pitches, seconds)
+        audio_aligner = OnlineScoreAligner(ref_times)
+        audio_trace = await follow_audio(wav_path, audio_aligner)
+        within = live <= seconds - 2
+        audio_followed = switch_errors(line_switches(traced_position(audio_aligner, audio_trace), 0, seconds, lines),
+                                       live[within], ref[within], lines)
+        audio_fixed = switch_errors(line_switches(lambda t: t - live[0] + times[0], 0, seconds, lines), live[within], ref[within], lines)
+        print(f"Audio performance ({seconds:.0f}s, {len(audio_trace)} onsets picked for {np.sum(live_times < seconds)} played):")
+        summarize("score follower (audio)", audio_followed)
+        summarize("fixed clock", audio_fixed)
+
+        times, pitches, sections, _ = make_reference(rng, onsets=args.onsets)
+        write_midi(reference_path, times, pitches)
+        ref_times, ref_pitches = load_reference(reference_path)
+        live_times, live_pitches, truth, is_real, _, _ = perform(rng, times, pitches, sections)
+        aligner = OnlineScoreAligner(ref_times, ref_pitches)
+        elapsed = []
+        for t, pitch in zip(live_times, live_pitches):
+            start = time.perf_counter()
+            aligner.update(float(t), int(pitch))
+            elapsed.append(time.perf_counter() - start)
+        elapsed = np.array(elapsed) * 1000
+        error = np.abs(ref_times[[aligner.index]] - truth[-1])[0]
+        print(f"Update latency, {len(ref_times)}-onset reference, {len(live_times)} live onsets: p50 {np.median(elapsed):.3f} ms "
+              f"p99 {np.percentile(elapsed, 99):.3f} ms max {elapsed.max():.3f} ms "
+              f"({aligner.relocations} relocations, final position error {error * 1000:.0f} ms)")
+        ok &= np.percentile(elapsed, 99) < 5.0
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--songs", type=int, default=4)
+    parser.add_argument("--onsets", type=int, default=20000)
+    parser.add_argument("--audio-seconds", type=float, default=90.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,160 @@
+"""Benchmark: listing and searching a large song library.
+
+Builds a library of N songs (default 10,000), each with a title, BPM, source
+type and a short columnar timecode file of lyric lines, inserted through
+`add_songs` so the search index is filled as it would be in use. Then, through
+the real `/songs` endpoint (httpx over ASGI, in-process):
+
+  * first page, and a page 99% of the way down: the old handler (OFFSET query,
+    served from a /bench route) against the keyset cursor;
+  * searches for a title word, a lyric word, a word prefix and two words;
+  * a filtered listing (source type plus BPM range);
+  * a refresh with If-None-Match (ETag), answered 304;
+  * finding a song by a lyric word the old way: fetch the whole library (the
+    old endpoint had no search) and read every timecode file.
+
+Reports p50/p99 latency per request.
+
+Run from the project root:
+    python -m benchmarks.bench_song_library [--songs 10000] [--repeat 200]
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+WORDS = ("amazing grace love light river holy mercy morning glory shelter praise forever heart home night "
+         "sing come free hope rise mountain valley ocean fire wind spirit king kingdom crown cross faithful "
+         "wonderful beautiful great mighty everlasting name song voice hands feet dance joy peace").split()
+EXTENSIONS = (".mid", ".musicxml", ".txt", ".pdf", ".wav", ".json")
+
+
+def build_library(rng, songs_dir, count):
+    from backend.timecode_store import TIMECODE_FILENAME, save_timecodes
+    rows = []
+    for i in range(count):
+        song_id = f"song-{i:05d}"
+        song_dir = os.path.join(songs_dir, song_id)
+        os.makedirs(song_dir, exist_ok=True)
+        timecode_path = os.path.join(song_dir, TIMECODE_FILENAME)
+        lines = [" ".join(rng.choices(WORDS, k=rng.randint(4, 8))).capitalize() for _ in range(16)]
+        save_timecodes(timecode_path, [{"time": n * 3.0, "text": line} for n, line in enumerate(lines)])
+        title = " ".join(rng.choices(WORDS, k=rng.randint(2, 4))).title()
+        rows.append({"id": song_id, "title": title, "bpm": rng.randint(60, 180), "processed": True, "status": "done",
+                     "file_path": os.path.join(song_dir, "raw", f"song{rng.choice(EXTENSIONS)}"), "timecode_path": timecode_path})
+    return rows
+
+
+async def timed(repeat, fn):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    return np.array(samples)
+
+
+async def main(args):
+    data_dir = tempfile.mkdtemp(prefix="lyricpilot-bench-")
+    # Point the app at the scratch data directory before anything from backend is imported
+    os.environ["LYRICPILOT_DATA_DIR"] = data_dir
+    import httpx
+    from sqlalchemy import select
+
+    from backend.config import SONGS_DIR
+    from backend.database import AsyncSessionLocal, Song, add_songs
+    from backend.main import app, on_shutdown, on_startup
+    from backend.timecode_store import timecode_text
+
+    rng = random.Random(7)
+    await on_startup()
+    start = time.perf_counter()
+    rows = build_library(rng, SONGS_DIR, args.songs)
+    files_time = time.perf_counter() - start
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        for i in range(0, len(rows), 500):
+            await add_songs(db, rows[i:i + 500])
+    insert_time = time.perf_counter() - start
+    print(f"{args.songs:,} songs: timecode files written in {files_time:.1f}s, "
+          f"inserted and indexed in {insert_time:.1f}s ({insert_time / args.songs * 1e6:.0f} us/song)")
+
+    deep = int(args.songs * 0.99)
+    title_word = rows[deep]["title"].split()[0].lower()
+
+    @app.get("/bench/songs_offset")
+    async def old_list(skip: int = 0, limit: int = 100):
+        # The old GET /songs
+        async with AsyncSessionLocal() as db:
+            songs = (await db.execute(select(Song).offset(skip).limit(limit))).scalars().all()
+        return [{"id": song.id, "title": song.title, "bpm": song.bpm, "processed": song.processed, "status": song.status,
+                 "file_path": song.file_path, "timecode_path": song.timecode_path} for song in songs]
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def get(**params):
+            response = await client.get("/songs", params=params)
+            response.raise_for_status()
+            return response
+
+        # The cursor of the page 99% of the way down, found by walking the pages once
+        cursor, seen = None, 0
+        while seen < deep:
+            response = await get(limit=100, **({"cursor": cursor} if cursor else {}))
+            seen += len(response.json())
+            cursor = response.headers["X-Next-Cursor"]
+        etag = (await get(limit=100)).headers["ETag"]
+
+        async def old_page(skip, limit=100):
+            response = await client.get("/bench/songs_offset", params={"skip": skip, "limit": limit})
+            response.raise_for_status()
+            return response.json()
+
+        async def old_lyric_search(word):
+            # The old way to find a song by its words: the whole library, then every timecode file
+            songs = await old_page(0, args.songs)
+            texts = await asyncio.to_thread(lambda: [timecode_text(song["timecode_path"]) for song in songs])
+            return [song for song, text in zip(songs, texts) if word in text.lower()]
+
+        async def revalidate():
+            response = await client.get("/songs", params={"limit": 100}, headers={"If-None-Match": etag})
+            assert response.status_code == 304
+
+        cases = [
+            ("first page, OFFSET (old)", lambda: old_page(0), None),
+            ("first page, keyset", lambda: get(limit=100), None),
+            (f"page at {deep:,}, OFFSET (old)", lambda: old_page(deep), None),
+            (f"page at {deep:,}, keyset cursor", lambda: get(limit=100, cursor=cursor), None),
+            (f"search title word '{title_word}'", lambda: get(limit=100, q=title_word), None),
+            ("search lyric word 'mountain'", lambda: get(limit=100, q="mountain"), None),
+            ("search prefix 'everl'", lambda: get(limit=100, q="everl"), None),
+            ("search 'holy fire'", lambda: get(limit=100, q="holy fire"), None),
+            ("filter midi, 100-120 BPM", lambda: get(limit=100, source="midi", bpm_min=100, bpm_max=120), None),
+            ("refresh with If-None-Match (304)", revalidate, None),
+            ("lyric word, whole library + files (old)", lambda: old_lyric_search("mountain"), max(3, args.repeat // 40)),
+        ]
+        print(f"  {'request':<42} {'p50':>9} {'p99':>9}")
+        for name, fn, repeat in cases:
+            samples = await timed(repeat or args.repeat, fn)
+            results.append((name, samples))
+            print(f"  {name:<42} {np.median(samples) * 1000:7.2f}ms {np.percentile(samples, 99) * 1000:7.2f}ms")
+    await on_shutdown()
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+    p50 = {name: np.median(samples) for name, samples in results}
+    ok = p50[f"page at {deep:,}, keyset cursor"] < p50[f"page at {deep:,}, OFFSET (old)"] * 2 \
+        and p50["refresh with If-None-Match (304)"] < p50["first page, keyset"]
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--songs", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
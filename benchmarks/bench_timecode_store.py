@@ -0,0 +1,118 @@
+"""Benchmark: loading timecodes from `timecode.json` vs. the columnar format.
+
+For songs of 100, 10k and 1M lines, writes the same timecodes in both formats
+and, in fresh child processes, times how long it takes to go from a path to a
+ready lyric index and to answer one "what's showing now" lookup, reporting
+peak RSS growth. The JSON path parses the file into pydantic objects and builds
+the index from them (what the timecode cache did before); the columnar path
+memory-maps the file and indexes the mapped arrays directly. It checks that
+both answer every probe identically and that columnar loads are faster at
+every size.
+
+Run from the project root:
+    python -m benchmarks.bench_timecode_store [--runs 3]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SIZES = [100, 10_000, 1_000_000]
+PROBES = 200
+
+
+def peak_rss_kb():
+    # VmHWM is per address space; ru_maxrss would carry over the parent's peak (which held the test data) through exec
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def make_timecodes(count):
+    from backend.timecode_generator import TimecodeData, TimecodeEntry
+    return TimecodeData(timecodes=[TimecodeEntry(time=i * 2.5, text=f"Line {i}: amazing grace, how sweet the sound") for i in range(count)])
+
+
+def child(mode, path, out_path):
+    """Loads one file in this (fresh) process and writes timing, memory and probe answers as JSON."""
+    from backend.lyric_index import LyricTimelineIndex
+    from backend.timecode_generator import load_timecode_json
+    from backend.timecode_store import open_timecodes
+    base_rss = peak_rss_kb()
+    start = time.perf_counter()
+    if mode == "json":
+        index = LyricTimelineIndex.from_entries(load_timecode_json(path).timecodes)
+    else:
+        timecodes = open_timecodes(path)
+        index = LyricTimelineIndex(timecodes.times, timecodes.texts)
+    loaded = time.perf_counter()
+    first = index.window(len(index) * 1.25)
+    elapsed = time.perf_counter() - start
+    peak_rss = peak_rss_kb()
+
+    end = len(index) * 2.5
+    answers = [index.window(end * k / PROBES) for k in range(PROBES + 1)]
+    with open(out_path, "w") as f:
+        json.dump({"load_seconds": loaded - start, "seconds": elapsed, "rss_growth_kb": peak_rss - base_rss,
+                   "first": first, "answers": answers}, f)
+
+
+def run_child(mode, path):
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as out:
+        out_path = out.name
+    try:
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_timecode_store", "--child", mode, path, out_path],
+                       check=True, stdout=subprocess.DEVNULL)
+        with open(out_path) as f:
+            return json.load(f)
+    finally:
+        os.unlink(out_path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "PATH", "OUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    from backend.timecode_generator import save_timecode_json
+    from backend.timecode_store import save_timecodes
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in SIZES:
+            data = make_timecodes(count)
+            paths = {"json": os.path.join(tmp, "timecode.json"), "columnar": os.path.join(tmp, "timecodes.lptc")}
+            save_timecode_json(paths["json"], data)
+            save_timecodes(paths["columnar"], data)
+            del data
+            print(f"{count:,} lines (json {os.path.getsize(paths['json']) / 1024:,.0f} KiB, "
+                  f"columnar {os.path.getsize(paths['columnar']) / 1024:,.0f} KiB)")
+            results = {}
+            for mode, path in paths.items():
+                runs = [run_child(mode, path) for _ in range(args.runs)]
+                results[mode] = best = min(runs, key=lambda r: r["seconds"])
+                print(f"  {mode:<8} load {best['load_seconds'] * 1000:9.2f} ms  first lookup {best['seconds'] * 1000:9.2f} ms  "
+                      f"peak RSS +{best['rss_growth_kb'] / 1024:7.1f} MiB")
+            fast, slow = results["columnar"], results["json"]
+            same = fast["first"] == slow["first"] and fast["answers"] == slow["answers"]
+            speedup = slow["seconds"] / fast["seconds"]
+            ok &= same and speedup > 1
+            print(f"  speedup x{speedup:,.0f}; lookups {'match' if same else 'DIFFER'}")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Benchmark: time-to-first-lyric and bytes sent for song_start timelines.
+
+Starts the real app (uvicorn, in a child process, against a temporary data
+directory) with a MIDI-sized song of 40,000 lines, connects a room of displays
+through a byte-counting TCP proxy and plays the song. Each configuration is a
+timeline mode / encoding negotiated with `hello`, with and without the
+permessage-deflate extension offered by the client:
+
+  * full/plain is the old behaviour: the whole timeline in every song_start,
+  * stream/plain and stream/delta send a window plus chunks ahead of the playhead.
+
+Reported per configuration: time from the play request until every display has
+its first lyric (p50/max), time-to-first-lyric for a cold display joining
+mid-song, and total bytes on the wire to all displays for the start plus a few
+seconds of playback.
+
+Run from the project root:
+    python -m benchmarks.bench_timeline_stream [--displays 20] [--lines 40000] [--play 3]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import websockets
+
+CONFIGS = [
+    ("full", "plain", False),
+    ("full", "plain", True),
+    ("stream", "plain", False),
+    ("stream", "plain", True),
+    ("stream", "delta", False),
+    ("stream", "delta", True),
+]
+SONG_ID = "midi_arrangement"
+PITCHES = ["C", "D", "E-", "F#", "G", "A", "B-"]
+
+
+async def make_song(data_dir, lines):
+    """A dense, MIDI-derived looking timeline (notes and chords every ~15 ms) stored as a processed song."""
+    os.environ["LYRICPILOT_DATA_DIR"] = data_dir
+    from backend.database import AsyncSessionLocal, add_song, async_engine, create_tables_async
+    from backend.timecode_store import TIMECODE_FILENAME, save_timecodes
+
+    await create_tables_async()
+    song_dir = os.path.join(data_dir, "songs", SONG_ID)
+    os.makedirs(song_dir, exist_ok=True)
+    path = os.path.join(song_dir, TIMECODE_FILENAME)
+    entries = []
+    for i in range(lines):
+        pitch = f"{PITCHES[i % 7]}{3 + i % 3}"
+        text = f"Chord: {pitch}" if i % 4 == 0 else ("Rest" if i % 9 == 0 else f"Note: {pitch}")
+        entries.append({"time": i * 0.015 + (i % 3) * 0.001, "text": text})
+    save_timecodes(path, entries)
+    async with AsyncSessionLocal() as db:
+        await add_song(db, song_id=SONG_ID, title="MIDI arrangement", file_path=path, processed=True, timecode_path=path)
+    await async_engine.dispose()
+
+
+class CountingProxy:
+    """Forwards TCP connections to the server and counts the bytes sent back to clients."""
+
+    def __init__(self, target_port):
+        self.target_port = target_port
+        self.bytes_to_clients = 0
+
+    async def _pipe(self, reader, writer, count):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                if count:
+                    self.bytes_to_clients += len(data)
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, client_reader, client_writer):
+        try:
+            server_reader, server_writer = await asyncio.open_connection("127.0.0.1", self.target_port)
+        except OSError:  # Server not up yet
+            client_writer.close()
+            return
+        await asyncio.gather(self._pipe(client_reader, server_writer, False), self._pipe(server_reader, client_writer, True))
+
+
+class Display:
+    def __init__(self, uri, timeline, encoding, deflate):
+        self.uri, self.timeline, self.encoding, self.deflate = uri, timeline, encoding, deflate
+        self.first_lyric = asyncio.get_running_loop().create_future()
+        self.lines = 0
+
+    async def run(self, started: asyncio.Event):
+        async with websockets.connect(self.uri, compression="deflate" if self.deflate else None, max_size=None,
+                                      ping_interval=None) as ws:
+            await ws.send(json.dumps({"type": "hello", "timeline": self.timeline, "encoding": self.encoding}))
+            await ws.send(json.dumps({"type": "subscribe"}))
+            started.set()
+            async for raw in ws:
+                message = json.loads(raw)
+                if message["type"] in ("song_start", "timeline_chunk") and "timeline" in message["data"]:
+                    self.lines += len(message["data"]["timeline"]["texts"])
+                elif message["type"] == "lyric_update" and message["data"].get("current_lyric") and not self.first_lyric.done():
+                    self.first_lyric.set_result(time.perf_counter())
+
+
+def post(url):
+    urllib.request.urlopen(urllib.request.Request(url, method="POST")).read()
+
+
+async def run_config(base, proxy, timeline, encoding, deflate, displays, play_seconds):
+    uri = base.replace("http", "ws") + "/ws"
+    room = [Display(uri, timeline, encoding, deflate) for _ in range(displays)]
+    ready = [asyncio.Event() for _ in room]
+    tasks = [asyncio.ensure_future(d.run(e)) for d, e in zip(room, ready)]
+    await asyncio.gather(*(e.wait() for e in ready))
+    await asyncio.sleep(0.3)
+    proxy.bytes_to_clients = 0
+
+    start = time.perf_counter()
+    await asyncio.to_thread(post, f"{base}/play_song/{SONG_ID}")
+    firsts = sorted([await asyncio.wait_for(d.first_lyric, 60) - start for d in room])
+
+    await asyncio.sleep(1.0)
+    cold = Display(uri, timeline, encoding, deflate)
+    cold_start = time.perf_counter()
+    cold_task = asyncio.ensure_future(cold.run(asyncio.Event()))
+    cold_ttfl = await asyncio.wait_for(cold.first_lyric, 60) - cold_start
+
+    await asyncio.sleep(max(0.0, play_seconds - 1.0))
+    await asyncio.to_thread(post, f"{base}/playback/{SONG_ID}/stop")
+    await asyncio.sleep(0.3)
+    sent = proxy.bytes_to_clients
+    for task in tasks + [cold_task]:
+        task.cancel()
+    await asyncio.gather(*tasks, cold_task, return_exceptions=True)
+    return {"p50": firsts[len(firsts) // 2], "max": firsts[-1], "cold": cold_ttfl, "bytes": sent,
+            "lines": room[0].lines}
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as data_dir:
+        await make_song(data_dir, args.lines)
+        env = dict(os.environ, LYRICPILOT_DATA_DIR=data_dir)
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1",
+                                   "--port", str(args.port), "--log-level", "warning"], env=env, stdout=subprocess.DEVNULL)
+        try:
+            proxy = CountingProxy(args.port)
+            proxy_server = await asyncio.start_server(proxy.handle, "127.0.0.1", args.port + 1)
+            base = f"http://127.0.0.1:{args.port + 1}"
+            for _ in range(100):
+                try:
+                    await asyncio.to_thread(urllib.request.urlopen, f"{base}/songs")
+                    break
+                except OSError:
+                    await asyncio.sleep(0.1)
+
+            print(f"{args.lines:,}-line song, {args.displays} displays, {args.play:.0f}s of playback")
+            print(f"  {'timeline':<8} {'encoding':<8} {'deflate':<7} {'TTFL p50':>9} {'TTFL max':>9} {'cold TTFL':>10} "
+                  f"{'wire bytes':>12} {'lines/display':>14}")
+            results = {}
+            for timeline, encoding, deflate in CONFIGS:
+                r = await run_config(base, proxy, timeline, encoding, deflate, args.displays, args.play)
+                results[(timeline, encoding, deflate)] = r
+                print(f"  {timeline:<8} {encoding:<8} {'on' if deflate else 'off':<7} {r['p50'] * 1000:7.1f}ms {r['max'] * 1000:7.1f}ms "
+                      f"{r['cold'] * 1000:8.1f}ms {r['bytes']:>12,} {r['lines']:>14,}")
+            proxy_server.close()
+        finally:
+            server.terminate()
+            server.wait()
+
+    old, new = results[("full", "plain", False)], results[("stream", "delta", True)]
+    print(f"stream/delta/deflate vs full/plain: TTFL max x{old['max'] / new['max']:.1f} faster, "
+          f"cold TTFL x{old['cold'] / new['cold']:.1f} faster, x{old['bytes'] / new['bytes']:.1f} fewer bytes")
+    raise SystemExit(0 if new["max"] < old["max"] and new["bytes"] < old["bytes"] else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--displays", type=int, default=20)
+    parser.add_argument("--lines", type=int, default=40000)
+    parser.add_argument("--play", type=float, default=3.0)
+    parser.add_argument("--port", type=int, default=8770)
+    asyncio.run(main(parser.parse_args()))
@@ -7,71 +7,102 @@ const nextLyricElements = [
 
 // Declare variables at a higher scope
 let songListElement;
+let songSearchInput;
+let loadMoreSongsButton;
+let nextSongsCursor = null; // X-Next-Cursor of the last page of songs fetched
+const SONG_PAGE_SIZE = 50;
 let uploadForm;
 let uploadStatus;
 let youtubeForm;
 let youtubeStatus;
 let playPauseButton;
+let pendingUploadJobId = null; // Job id of the last upload, to show its job_progress messages
 
 // Progress bar elements
 let progressBar;
 let currentTimeDisplay;
 let totalDurationDisplay;
 
-const websocket = new WebSocket("ws://localhost:8000/ws"); // Adjust if your backend is on a different host/port
+// Room (named playback session) this page shows and controls, e.g. index.html?room=youth; the server's default room if absent
+const room = new URLSearchParams(window.location.search).get('room');
+const roomQuery = room ? `?room=${encodeURIComponent(room)}` : '';
+const websocket = new WebSocket(`ws://localhost:8000/ws${roomQuery}`); // Adjust if your backend is on a different host/port
 
-let currentSongTimecodes = [];
-let currentLyricIndex = -1;
-let playbackStartTime = 0;
+let currentSongId = null;
+let currentSongTimecodes = []; // Sparse: filled in from song_start and timeline_chunk messages as they arrive
 let animationFrameId = null;
-let isPlaying = true; // New state variable
-let lastFrameTime = 0; // To calculate elapsed time during pause/resume
+let isPlaying = false; // Mirrors the server-side playback clock
 let totalSongDuration = 0; // Total duration of the current song
 
+// The server owns the playhead; we only keep its last reported anchor to animate the progress bar
+let anchorPosition = 0;
+let anchorServerTime = 0;
+let tempoScale = 1.0;
+let playbackLimit = null; // Position the server's playhead waits at (score following), if any
+
+// Clock sync: estimated server clock minus local clock, from NTP-style ping/pong exchanges
+const CLOCK_SYNC_WINDOW = 16; // Keep in sync with CLOCK_SYNC_WINDOW in backend/config.py
+let clockSamples = [];
+let lastClockSample = null;
+let clockOffset = 0;
+let pendingLyricUpdates = []; // lyric_update messages waiting for their target time
+
 // --- WebSocket Logic ---
 websocket.onopen = (event) => {
     console.log("WebSocket connected!");
+    // Timelines arrive as a window in song_start plus chunks ahead of the playhead, with delta-coded times
+    websocket.send(JSON.stringify({ type: "hello", timeline: "stream", encoding: "delta" }));
+    // Ask the server to catch us up with whatever is currently playing
+    websocket.send(JSON.stringify({ type: "subscribe" }));
+    startClockSync();
 };
 
 websocket.onmessage = (event) => {
+    const receivedAt = localClock();
     try {
         const message = JSON.parse(event.data);
+
+        if (message.type === "pong") {
+            handlePong(message.data, receivedAt);
+            return;
+        }
         console.log("Received message:", message);
 
         if (message.type === "lyric_update") {
-            const { current_lyric, next_lyrics } = message.data;
-            updateLyrics(current_lyric, next_lyrics);
+            scheduleLyricUpdate(message.data);
+        } else if (message.type === "playback_state") {
+            const { song_id, playing, tempo_scale, anchor_position, anchor_time, limit } = message.data;
+            currentSongId = song_id;
+            isPlaying = playing;
+            tempoScale = tempo_scale;
+            playbackLimit = limit ?? null;
+            setPlaybackAnchor(anchor_position, anchor_time);
+            playPauseButton.textContent = isPlaying ? 'Pause' : 'Play';
+            if (isPlaying && !animationFrameId) {
+                animationFrameId = requestAnimationFrame(updateProgressDisplay);
+            }
+        } else if (message.type === "job_progress") {
+            handleJobProgress(message.data);
         } else if (message.type === "song_start") {
-            const { song_id, title, timecodes } = message.data;
+            const { song_id, title, duration, timeline } = message.data;
             console.log(`Starting song: ${title} (${song_id})`);
-            currentSongTimecodes = timecodes.sort((a, b) => a.time - b.time);
-            currentLyricIndex = -1;
-            
-            // Calculate total song duration
-            totalSongDuration = currentSongTimecodes.length > 0 ? currentSongTimecodes[currentSongTimecodes.length - 1].time : 0;
-            // Add a buffer to total duration if needed, or assume last timecode is end
-            if (currentSongTimecodes.length > 0) {
-                // Estimate duration of the last line and add it
-                const lastLyricTime = currentSongTimecodes[currentSongTimecodes.length - 1].time;
-                const secondLastLyricTime = currentSongTimecodes.length > 1 ? currentSongTimecodes[currentSongTimecodes.length - 2].time : 0;
-                const estimatedLastLineDuration = lastLyricTime - secondLastLyricTime; // Simple estimate
-                totalSongDuration = lastLyricTime + estimatedLastLineDuration; // Add estimated duration of last line
+            currentSongId = song_id;
+            currentSongTimecodes = [];
+            if (timeline) {
+                mergeTimeline(timeline);
             }
 
+            // The server sends the song's length; the full timeline may not be here yet
+            totalSongDuration = duration;
+
             // Initialize progress bar
             progressBar.max = totalSongDuration;
             totalDurationDisplay.textContent = formatTime(totalSongDuration);
-
-            // Reset playback state and start/resume
-            isPlaying = true;
-            playPauseButton.textContent = 'Pause';
-            playbackStartTime = performance.now(); // Reset start time for new song
-            lastFrameTime = playbackStartTime;
-
-            if (animationFrameId) {
-                cancelAnimationFrame(animationFrameId);
+            // Lyric changes and play/pause state arrive as lyric_update / playback_state messages
+        } else if (message.type === "timeline_chunk") {
+            if (message.data.song_id === currentSongId) {
+                mergeTimeline(message.data.timeline);
             }
-            animationFrameId = requestAnimationFrame(updateLyricDisplay);
         }
     } catch (error) {
         console.error("Error in WebSocket onmessage:", error);
@@ -80,6 +111,7 @@ websocket.onmessage = (event) => {
 
 websocket.onclose = (event) => {
     console.log("WebSocket disconnected.", event);
+    stopClockSync();
     if (animationFrameId) {
         cancelAnimationFrame(animationFrameId);
     }
@@ -92,6 +124,98 @@ websocket.onerror = (error) => {
     }
 };
 
+// Stores timeline lines (`plain`: times in seconds; `delta`: t0 plus millisecond steps) at their line indexes
+function mergeTimeline(timeline) {
+    let time = timeline.encoding === "delta" ? timeline.t0 : 0;
+    timeline.texts.forEach((text, k) => {
+        if (timeline.encoding === "delta") {
+            if (k > 0) {
+                time += timeline.dt[k - 1];
+            }
+            currentSongTimecodes[timeline.start + k] = { time: time / 1000, text };
+        } else {
+            currentSongTimecodes[timeline.start + k] = { time: timeline.times[k], text };
+        }
+    });
+}
+
+// --- Clock Synchronization ---
+let clockSyncBurstTimer = null;
+let clockSyncTimer = null;
+
+function localClock() {
+    return performance.now() / 1000;
+}
+
+function serverNow() {
+    return localClock() + clockOffset;
+}
+
+function sendClockPing() {
+    if (websocket.readyState !== WebSocket.OPEN) {
+        return;
+    }
+    // Report our previous raw sample so the server can publish per-client offset/RTT stats
+    websocket.send(JSON.stringify({ type: "ping", client_time: localClock(), sample: lastClockSample }));
+}
+
+function handlePong(data, receivedAt) {
+    const offset = ((data.server_receive - data.client_time) + (data.server_time - receivedAt)) / 2;
+    const rtt = (receivedAt - data.client_time) - (data.server_time - data.server_receive);
+    if (rtt < 0) {
+        return;
+    }
+    lastClockSample = { offset, rtt };
+    clockSamples.push(lastClockSample);
+    if (clockSamples.length > CLOCK_SYNC_WINDOW) {
+        clockSamples.shift();
+    }
+    // Trust the lowest-RTT sample in the window: its error is bounded by rtt / 2
+    clockOffset = clockSamples.reduce((best, sample) => (sample.rtt < best.rtt ? sample : best)).offset;
+}
+
+function startClockSync() {
+    // A quick burst to converge, then a slow refresh to track drift
+    let burstCount = 0;
+    clockSyncBurstTimer = setInterval(() => {
+        sendClockPing();
+        if (++burstCount >= CLOCK_SYNC_WINDOW) {
+            clearInterval(clockSyncBurstTimer);
+        }
+    }, 100);
+    clockSyncTimer = setInterval(sendClockPing, 5000);
+}
+
+function stopClockSync() {
+    clearInterval(clockSyncBurstTimer);
+    clearInterval(clockSyncTimer);
+}
+
+function scheduleLyricUpdate(data) {
+    const apply = () => {
+        updateLyrics(data.current_lyric, data.next_lyrics);
+        setPlaybackAnchor(data.position, data.at);
+    };
+    if (data.at === undefined || data.at === null) {
+        apply();
+        return;
+    }
+    // A seek can move the timeline back: drop updates that were due after this one
+    pendingLyricUpdates = pendingLyricUpdates.filter(pending => {
+        if (pending.at > data.at) {
+            clearTimeout(pending.handle);
+            return false;
+        }
+        return true;
+    });
+    const pending = { at: data.at };
+    pending.handle = setTimeout(() => {
+        pendingLyricUpdates = pendingLyricUpdates.filter(p => p !== pending);
+        apply();
+    }, Math.max(0, (data.at - serverNow()) * 1000));
+    pendingLyricUpdates.push(pending);
+}
+
 // --- Lyric Display Logic ---
 function updateLyrics(currentLyric, nextLyrics) {
     console.log("Updating lyrics:", currentLyric, currentLyricElement); // Debug log
@@ -102,61 +226,34 @@ function updateLyrics(currentLyric, nextLyrics) {
     });
 }
 
-function updateLyricDisplay(currentTime) {
+function setPlaybackAnchor(position, serverTime) {
+    anchorPosition = position;
+    anchorServerTime = serverTime;
+    updateProgressBar(Math.min(currentPlaybackPosition(), totalSongDuration || position));
+}
+
+function currentPlaybackPosition() {
     if (!isPlaying) {
-        // If paused, just update lastFrameTime and request next frame to check for resume
-        lastFrameTime = currentTime;
-        animationFrameId = requestAnimationFrame(updateLyricDisplay);
-        return;
+        return anchorPosition;
     }
+    const position = anchorPosition + Math.max(0, serverNow() - anchorServerTime) * tempoScale;
+    return playbackLimit === null ? position : Math.max(anchorPosition, Math.min(position, playbackLimit));
+}
 
-    // Calculate time elapsed since the song started, accounting for pauses
-    const elapsedSeconds = (currentTime - playbackStartTime) / 1000;
-    
-    // Update lastFrameTime for the next frame
-    lastFrameTime = currentTime;
-
-    try {
-        let newLyricFound = false;
-        for (let i = currentLyricIndex + 1; i < currentSongTimecodes.length; i++) {
-            if (elapsedSeconds >= currentSongTimecodes[i].time) {
-                currentLyricIndex = i;
-                newLyricFound = true;
-            } else {
-                break; // Timecodes are sorted, so no need to check further
-            }
-        }
-
-        if (newLyricFound) {
-            const currentLyric = currentSongTimecodes[currentLyricIndex] ? currentSongTimecodes[currentLyricIndex].text : '';
-            const nextLyrics = [];
-            for (let i = 1; i <= 3; i++) {
-                if (currentLyricIndex + i < currentSongTimecodes.length) {
-                    nextLyrics.push(currentSongTimecodes[currentLyricIndex + i].text);
-                }
-            }
-            updateLyrics(currentLyric, nextLyrics);
-        }
-
-        // Update progress bar
-        updateProgressBar(elapsedSeconds);
-
-        // Continue animation if playing and there are still lyrics to display
-        if (isPlaying && elapsedSeconds < totalSongDuration) { // Continue until total duration
-            animationFrameId = requestAnimationFrame(updateLyricDisplay);
-        } else if (elapsedSeconds >= totalSongDuration) { // End of song
-            cancelAnimationFrame(animationFrameId);
-            animationFrameId = null;
-            isPlaying = false; // Automatically pause at the end
-            playPauseButton.textContent = 'Play';
-            updateProgressBar(totalSongDuration); // Set to end
-        }
-    } catch (error) {
-        console.error("Error in updateLyricDisplay:", error);
-        if (animationFrameId) {
-            cancelAnimationFrame(animationFrameId);
-        }
+function updateProgressDisplay() {
+    // Only the progress bar is animated locally; lyric changes are pushed by the server clock
+    if (!isPlaying) {
+        animationFrameId = null;
+        return;
+    }
+    const elapsedSeconds = currentPlaybackPosition();
+    if (totalSongDuration && elapsedSeconds >= totalSongDuration) {
+        updateProgressBar(totalSongDuration);
+        animationFrameId = null;
+        return;
     }
+    updateProgressBar(elapsedSeconds);
+    animationFrameId = requestAnimationFrame(updateProgressDisplay);
 }
 
 // --- Progress Bar Logic ---
@@ -173,95 +270,99 @@ function updateProgressBar(elapsedSeconds) {
     currentTimeDisplay.textContent = formatTime(elapsedSeconds);
 }
 
-function seekToTime(newTimeSeconds) {
-    // Stop current animation
-    if (animationFrameId) {
-        cancelAnimationFrame(animationFrameId);
+async function sendPlaybackCommand(command, params = {}) {
+    if (!currentSongId) {
+        return;
     }
-
-    // Adjust playbackStartTime to simulate starting from newTimeSeconds
-    playbackStartTime = performance.now() - (newTimeSeconds * 1000);
-    lastFrameTime = performance.now(); // Reset lastFrameTime for accurate delta calculation
-
-    // Find the correct lyric index for the new time
-    currentLyricIndex = -1; // Reset to re-find from beginning
-    for (let i = 0; i < currentSongTimecodes.length; i++) {
-        if (newTimeSeconds >= currentSongTimecodes[i].time) {
-            currentLyricIndex = i;
-        } else {
-            break;
+    const query = new URLSearchParams(room ? { ...params, room } : params).toString();
+    try {
+        const response = await fetch(`/playback/${currentSongId}/${command}${query ? `?${query}` : ''}`, {
+            method: 'POST',
+            headers: {
+                'Accept': 'application/json',
+            },
+        });
+        if (!response.ok) {
+            const result = await response.json();
+            console.error(`Error sending playback command '${command}':`, result.detail);
         }
+        // The resulting playback_state / lyric_update messages arrive via WebSocket
+    } catch (error) {
+        console.error(`Error sending playback command '${command}':`, error);
     }
+}
+
+function seekToTime(newTimeSeconds) {
+    sendPlaybackCommand('seek', { position: newTimeSeconds });
+}
 
-    // Update lyrics display immediately
-    const currentLyric = currentSongTimecodes[currentLyricIndex] ? currentSongTimecodes[currentLyricIndex].text : '';
-    const nextLyrics = [];
-    for (let i = 1; i <= 3; i++) {
-        if (currentLyricIndex + i < currentSongTimecodes.length) {
-            nextLyrics.push(currentSongTimecodes[currentLyricIndex + i].text);
+// --- Song Management Logic ---
+function handleJobProgress(job) {
+    if (job.job_id === pendingUploadJobId) {
+        if (job.status === 'done') {
+            uploadStatus.textContent = job.processed ? `Processing finished (ID: ${job.song_id})` : `Upload stored, but no timecodes could be generated (ID: ${job.song_id})`;
+        } else if (job.status === 'failed') {
+            uploadStatus.textContent = `Processing failed: ${job.error}`;
+        } else if (job.ocr_pages) {
+            uploadStatus.textContent = `Processing ${job.status}, reading ${job.ocr_pages} scanned page(s)... (ID: ${job.song_id})`;
+        } else {
+            uploadStatus.textContent = `Processing ${job.status}... (ID: ${job.song_id})`;
         }
     }
-    updateLyrics(currentLyric, nextLyrics);
-
-    // Update progress bar UI
-    updateProgressBar(newTimeSeconds);
-
-    // Resume playback if it was playing
-    if (isPlaying) {
-        animationFrameId = requestAnimationFrame(updateLyricDisplay);
+    if (job.status === 'done' || job.status === 'failed') {
+        fetchSongs(); // Refresh song list
     }
 }
 
-// --- Song Management Logic ---
-async function fetchSongs() {
+// Fetches the first page of songs matching the search box, or with `append` the page after the last one fetched
+async function fetchSongs(append = false) {
     try {
-        const response = await fetch('/songs');
+        const params = new URLSearchParams({ limit: SONG_PAGE_SIZE });
+        const query = songSearchInput ? songSearchInput.value.trim() : '';
+        if (query) params.set('q', query);
+        if (append && nextSongsCursor) params.set('cursor', nextSongsCursor);
+        // Always revalidated: an unchanged library is answered 304 (ETag) and served from the browser cache
+        const response = await fetch(`/songs?${params}`, { cache: 'no-cache' });
         const songs = await response.json();
-        displaySongs(songs);
+        nextSongsCursor = response.headers.get('X-Next-Cursor');
+        displaySongs(songs, append, query);
     } catch (error) {
         console.error("Error fetching songs:", error);
     }
 }
 
-function displaySongs(songs) {
-    songListElement.innerHTML = ''; // Clear existing list
-    if (songs.length === 0) {
-        songListElement.innerHTML = '<li>No songs uploaded yet.</li>';
+function displaySongs(songs, append = false, query = '') {
+    if (!append) {
+        songListElement.innerHTML = ''; // Clear existing list
+    }
+    loadMoreSongsButton.hidden = !nextSongsCursor;
+    if (songs.length === 0 && !append) {
+        songListElement.innerHTML = query ? '<li>No songs match your search.</li>' : '<li>No songs uploaded yet.</li>';
         return;
     }
 
     songs.forEach(song => {
         const listItem = document.createElement('li');
         listItem.innerHTML = `
-            <span>${song.title} (ID: ${song.id})</span>
+            <span>${song.title} (ID: ${song.id})${song.status && song.status !== 'done' ? ` [${song.status}]` : ''}</span>
             <button data-song-id="${song.id}" class="play-button">Play</button>
             <button data-song-id="${song.id}" class="delete-button">Delete</button>
         `;
-        songListElement.appendChild(listItem);
-    });
-
-    // Add event listeners to play buttons
-    document.querySelectorAll('.play-button').forEach(button => {
-        button.addEventListener('click', async (event) => {
-            const songId = event.target.dataset.songId;
-            await playSong(songId);
+        listItem.querySelector('.play-button').addEventListener('click', async () => {
+            await playSong(song.id);
         });
-    });
-
-    // Add event listeners to delete buttons
-    document.querySelectorAll('.delete-button').forEach(button => {
-        button.addEventListener('click', async (event) => {
-            const songId = event.target.dataset.songId;
-            if (confirm(`Are you sure you want to delete song "${songId}"?`)) {
-                await deleteSong(songId);
+        listItem.querySelector('.delete-button').addEventListener('click', async () => {
+            if (confirm(`Are you sure you want to delete song "${song.id}"?`)) {
+                await deleteSong(song.id);
             }
         });
+        songListElement.appendChild(listItem);
     });
 }
 
 async function playSong(songId) {
     try {
-        const response = await fetch(`/play_song/${songId}`, {
+        const response = await fetch(`/play_song/${songId}${roomQuery}`, {
             method: 'POST',
             headers: {
                 'Accept': 'application/json',
@@ -300,20 +401,14 @@ async function deleteSong(songId) {
 }
 
 function togglePlayPause() {
-    isPlaying = !isPlaying;
-    if (isPlaying) {
-        playPauseButton.textContent = 'Pause';
-        // Resume animation from where it left off
-        animationFrameId = requestAnimationFrame(updateLyricDisplay);
-    } else {
-        playPauseButton.textContent = 'Play';
-        // Animation will naturally pause because isPlaying is false
-    }
+    sendPlaybackCommand(isPlaying ? 'pause' : 'resume');
 }
 
 // Initial setup when the DOM is fully loaded
 document.addEventListener('DOMContentLoaded', () => {
     songListElement = document.getElementById('song-list');
+    songSearchInput = document.getElementById('song-search');
+    loadMoreSongsButton = document.getElementById('load-more-songs');
     uploadForm = document.getElementById('upload-form');
     uploadStatus = document.getElementById('upload-status');
     youtubeForm = document.getElementById('youtube-form');
@@ -383,7 +478,8 @@ document.addEventListener('DOMContentLoaded', () => {
             const result = await response.json();
 
             if (response.ok) {
-                uploadStatus.textContent = `Upload successful: ${result.title} (ID: ${result.song_id})`;
+                pendingUploadJobId = result.job_id;
+                uploadStatus.textContent = `Upload successful, processing ${result.status}: ${result.title} (ID: ${result.song_id})`;
                 fileInput.value = ''; // Clear file input
                 titleInput.value = ''; // Clear title input
                 bpmInput.value = ''; // Clear BPM input
@@ -436,6 +532,14 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // Search as the user types (debounced), and page through results
+    let searchTimer = null;
+    songSearchInput.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => fetchSongs(), 250);
+    });
+    loadMoreSongsButton.addEventListener('click', () => fetchSongs(true));
+
     // Initial fetch of songs when the page loads
     fetchSongs();
 });